@@ -0,0 +1,461 @@
+"""
+Batch Evaluation Runner
+Runs the golden dataset concurrently against an in-process marketing agent
+
+Unlike evaluator.py (one case at a time against whatever LLM the environment
+configures), this runner:
+- executes cases concurrently (bounded by --concurrency)
+- drives the agent with ReplayChatModel:
+    mock   - deterministic offline LLM (tool call, then an answer built from the tool output)
+    record - call the real LLM and store every response on disk, keyed by prompt hash
+    replay - serve stored responses; misses fall back to the mock and are counted
+- can swap retrieval for an in-memory KB search (--offline-kb) so no
+  embeddings, Firestore or model downloads are needed
+- reports per-stage latency (retrieve, rerank, generate, reflect) next to the
+  evaluator's quality scores
+
+Usage:
+    python evaluation/batch_runner.py --mode mock --offline-kb --strict
+    python evaluation/batch_runner.py --mode record --concurrency 4
+    python evaluation/batch_runner.py --mode replay --offline-kb
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+# Add project root to path to allow importing from src
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.ai_agent.common.stage_timer import collect_stage_timings, stage
+from src.ai_agent.marketing.grounding import split_chunks, tokenize
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_DIR = Path(__file__).parent
+DEFAULT_DATASET = EVALUATION_DIR / "golden_dataset.json"
+DEFAULT_CACHE_DIR = EVALUATION_DIR / "llm_cache"
+LATENCY_STAGES = ("retrieve", "rerank", "generate", "reflect")
+
+MOCK_ANSWER_SENTENCES = 5
+MOCK_FOLLOW_UPS = [
+    "What services does EthosPrompt offer?",
+    "How does pricing work for a custom project?",
+    "How do I book a consultation?",
+]
+
+
+# ============================================================================
+# LLM: deterministic mock + on-disk prompt cache
+# ============================================================================
+
+def _serialize_message(message: BaseMessage) -> Dict[str, Any]:
+    data = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        data["tool_calls"] = [
+            {"name": call["name"], "args": call["args"], "id": call.get("id")}
+            for call in message.tool_calls
+        ]
+    if isinstance(message, ToolMessage):
+        data["tool_call_id"] = message.tool_call_id
+    return data
+
+
+def prompt_hash(messages: Sequence[BaseMessage], model_name: str, tool_names: Sequence[str] = ()) -> str:
+    """Stable key for one LLM call (model, bound tools and the full message list)"""
+    payload = {
+        "model": model_name,
+        "tools": sorted(tool_names),
+        "messages": [_serialize_message(m) for m in messages],
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """LLM responses on disk, one JSON file per prompt hash"""
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR):
+        self.directory = Path(directory)
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return AIMessage(content=data.get("content", ""), tool_calls=data.get("tool_calls", []))
+
+    def put(self, key: str, message: AIMessage):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_serialize_message(message), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        self.stats["writes"] += 1
+
+
+def _strip_markers(text: str) -> str:
+    return re.sub(r"^\[\d+\]\s*", "", text.strip())
+
+
+def mock_reply(messages: Sequence[BaseMessage], tool_names: Sequence[str], key: str) -> AIMessage:
+    """
+    Deterministic stand-in for the LLM.
+
+    - Grounding verification prompts get "Yes".
+    - A new user turn with search_kb bound gets a search_kb tool call.
+    - After tool results, the answer is the leading sentences of the retrieved
+      chunks plus the follow-up block the agent parses.
+    """
+    # The prompt callable appends per-request policies as trailing system messages
+    conversation = [m for m in messages if not isinstance(m, SystemMessage)]
+    last = conversation[-1] if conversation else None
+
+    if isinstance(last, HumanMessage):
+        text = str(last.content)
+        if text.startswith("Verify grounding"):
+            return AIMessage(content="Yes")
+        if "search_kb" in tool_names:
+            return AIMessage(content="", tool_calls=[{
+                "name": "search_kb",
+                "args": {"query": text},
+                "id": f"call_{key[:12]}",
+            }])
+
+    tool_output = "\n".join(str(m.content) for m in conversation if isinstance(m, ToolMessage))
+    sentences: List[str] = []
+    for chunk in split_chunks(tool_output) or [tool_output]:
+        body = _strip_markers(chunk).split(":", 1)[-1]
+        sentences.extend(s.strip() for s in re.split(r"(?<=[.!?])\s+", body) if len(s.split()) >= 4)
+        if len(sentences) >= MOCK_ANSWER_SENTENCES:
+            break
+
+    answer = " ".join(sentences[:MOCK_ANSWER_SENTENCES]) or (
+        "EthosPrompt builds intelligent applications and system integrations for Australian businesses."
+    )
+    follow_ups = "\n".join(f"{i}. {q}" for i, q in enumerate(MOCK_FOLLOW_UPS, 1))
+    return AIMessage(content=f"{answer}\n\nYou might also want to know:\n{follow_ups}")
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Chat model for offline evaluation (see module docstring for modes).
+
+    model_name is part of the prompt hash: use the real model's name when
+    recording and the same name when replaying.
+    """
+
+    mode: str = "mock"
+    model_name: str = "eval-mock"
+    delegate: Optional[Any] = None
+    prompt_cache: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "eval-replay"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.mode == "record":
+            raise NotImplementedError("record mode requires the async interface")
+        return self._respond(messages, kwargs.get("tools") or [])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tools = kwargs.get("tools") or []
+        with stage("generate"):
+            if self.mode != "record":
+                return self._respond(messages, tools)
+
+            key = prompt_hash(messages, self.model_name, self._tool_names(tools))
+            message = self.prompt_cache.get(key)
+            if message is None:
+                runnable = self.delegate.bind_tools(tools) if tools else self.delegate
+                result = await runnable.ainvoke(messages)
+                message = AIMessage(content=result.content, tool_calls=getattr(result, "tool_calls", []))
+                self.prompt_cache.put(key, message)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    @staticmethod
+    def _tool_names(tools: Sequence[Dict[str, Any]]) -> List[str]:
+        return [tool["function"]["name"] for tool in tools]
+
+    def _respond(self, messages: Sequence[BaseMessage], tools: Sequence[Dict[str, Any]]) -> ChatResult:
+        tool_names = self._tool_names(tools)
+        key = prompt_hash(messages, self.model_name, tool_names)
+        message = self.prompt_cache.get(key) if self.mode == "replay" and self.prompt_cache else None
+        if message is None:
+            message = mock_reply(messages, tool_names, key)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# ============================================================================
+# Offline retrieval
+# ============================================================================
+
+class OfflineKBSearch:
+    """Token-overlap search over the bundled KB content (no embeddings, no Firestore)"""
+
+    def __init__(self, documents: Sequence[Dict[str, Any]]):
+        self.chunks = []
+        for doc in documents:
+            paragraphs = [p.strip() for p in doc["content"].split("\n\n") if p.strip()]
+            for i, paragraph in enumerate(paragraphs):
+                self.chunks.append((doc, i, paragraph, tokenize(f"{doc['title']} {paragraph}")))
+
+    @classmethod
+    def from_kb(cls) -> "OfflineKBSearch":
+        from src.ai_agent.marketing.marketing_kb_content import get_all_kb_documents
+        return cls(get_all_kb_documents())
+
+    async def search(self, query: str, top_k: int, category_filter: Optional[str] = None):
+        from src.ai_agent.marketing.marketing_retriever import RetrievalResult
+
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        scored = []
+        for doc, index, text, tokens in self.chunks:
+            metadata = doc.get("metadata", {})
+            if category_filter and metadata.get("category") != category_filter:
+                continue
+            overlap = len(query_tokens & tokens)
+            if overlap:
+                scored.append((overlap / len(query_tokens), doc, index, text))
+        scored.sort(key=lambda item: (-item[0], item[1]["id"], item[2]))
+
+        return [
+            RetrievalResult(
+                text=text,
+                score=score,
+                document_id=doc["id"],
+                document_title=doc["title"],
+                category=doc.get("metadata", {}).get("category", ""),
+                page=doc.get("metadata", {}).get("page", ""),
+                chunk_index=index
+            )
+            for score, doc, index, text in scored[:top_k]
+        ]
+
+
+class OverlapReranker:
+    """Deterministic CrossEncoder stand-in: query/passage token overlap"""
+
+    def predict(self, pairs: Sequence[Sequence[str]]) -> List[float]:
+        scores = []
+        for query, passage in pairs:
+            query_tokens = tokenize(query)
+            scores.append(len(query_tokens & tokenize(passage)) / len(query_tokens) if query_tokens else 0.0)
+        return scores
+
+
+def install_offline_kb(retriever=None):
+    """Point the marketing retriever at the in-memory KB search and overlap reranker"""
+    if retriever is None:
+        from src.ai_agent.marketing.marketing_retriever import marketing_retriever as retriever
+    search = OfflineKBSearch.from_kb()
+    retriever._hybrid_search = search.search
+    retriever._semantic_search = search.search
+    retriever._cross_encoder = OverlapReranker()
+    return retriever
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+def _percentile(values: Sequence[float], percentile: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_latency(results: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """count / mean / p50 / p95 (ms) per stage and for the whole case"""
+    samples: Dict[str, List[float]] = {}
+    for result in results:
+        for name, value in result.get("latency_ms", {}).items():
+            samples.setdefault(name, []).append(value)
+
+    return {
+        name: {
+            "count": len(values),
+            "mean": round(statistics.fmean(values), 1),
+            "p50": round(_percentile(values, 50), 1),
+            "p95": round(_percentile(values, 95), 1),
+        }
+        for name, values in sorted(samples.items())
+    }
+
+
+class BatchEvaluationRunner:
+    """
+    Concurrent golden-dataset evaluation.
+
+    Scoring is MarketingAgentEvaluator.evaluate_single, so quality numbers
+    are comparable with evaluator.py runs.
+    """
+
+    def __init__(self, agent, dataset_path: Path = DEFAULT_DATASET, concurrency: int = 8):
+        from evaluation.evaluator import MarketingAgentEvaluator
+
+        self.evaluator = MarketingAgentEvaluator(agent, str(dataset_path))
+        self.dataset_path = Path(dataset_path)
+        self.concurrency = max(1, concurrency)
+        self.wall_time_s = 0.0
+
+    @property
+    def results(self) -> List[Dict[str, Any]]:
+        return self.evaluator.results
+
+    async def _run_case(self, test_case: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            start = time.perf_counter()
+            with collect_stage_timings() as timings:
+                result = await self.evaluator.evaluate_single(test_case)
+            result["latency_ms"] = {
+                "total": round((time.perf_counter() - start) * 1000, 1),
+                **{name: round(value, 1) for name, value in timings.items()},
+            }
+            return result
+
+    async def run(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Evaluate the dataset.
+
+        Args:
+            limit: Optional limit on number of test cases
+
+        Returns:
+            Evaluator aggregate plus 'latency_ms' and 'wall_time_s'
+        """
+        with open(self.dataset_path, "r") as f:
+            dataset = json.load(f)
+        if limit:
+            dataset = dataset[:limit]
+
+        logger.info(f"Evaluating {len(dataset)} test cases (concurrency={self.concurrency})...")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        self.evaluator.results = list(await asyncio.gather(
+            *(self._run_case(case, semaphore) for case in dataset)
+        ))
+        self.wall_time_s = round(time.perf_counter() - start, 2)
+
+        aggregated = self.evaluator._aggregate_metrics()
+        aggregated["latency_ms"] = summarize_latency(self.results)
+        aggregated["wall_time_s"] = self.wall_time_s
+        return aggregated
+
+    def save_results(self, output_path: str):
+        """Evaluator JSON + markdown report, plus latency_report.json"""
+        self.evaluator.save_results(output_path)
+        latency_path = Path(output_path) / "latency_report.json"
+        with open(latency_path, "w") as f:
+            json.dump({
+                "wall_time_s": self.wall_time_s,
+                "concurrency": self.concurrency,
+                "stages": summarize_latency(self.results),
+                "cases": {r["test_id"]: r.get("latency_ms", {}) for r in self.results},
+            }, f, indent=2)
+        logger.info(f"✓ Saved latency report to {latency_path}")
+
+
+def build_agent(mode: str, cache_dir: Path, model_name: Optional[str] = None, offline_kb: bool = False):
+    """In-process MarketingAgent driven by a ReplayChatModel"""
+    from src.ai_agent.marketing.marketing_agent import MarketingAgent
+
+    delegate = None
+    if mode == "record":
+        # The environment's real LLM (Granite / OpenRouter), wrapped for recording
+        delegate = MarketingAgent(db=None).llm
+        model_name = model_name or getattr(delegate, "model_name", None) or getattr(delegate, "model", "llm")
+
+    llm = ReplayChatModel(
+        mode=mode,
+        model_name=model_name or "eval-mock",
+        delegate=delegate,
+        prompt_cache=PromptCache(cache_dir) if mode in ("record", "replay") else None
+    )
+    if offline_kb:
+        install_offline_kb()
+    return MarketingAgent(db=None, llm=llm)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run the golden dataset concurrently against an in-process agent")
+    parser.add_argument("--mode", default="mock", choices=["mock", "record", "replay"],
+                       help="LLM mode (default: mock)")
+    parser.add_argument("--model-name", default=None,
+                       help="Model name used in prompt hashes (record/replay must match)")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR),
+                       help="Directory of recorded LLM responses")
+    parser.add_argument("--offline-kb", action="store_true",
+                       help="Use in-memory KB search instead of embeddings/Firestore")
+    parser.add_argument("--concurrency", type=int, default=8,
+                       help="Cases evaluated concurrently (default: 8)")
+    parser.add_argument("--limit", type=int, help="Limit number of test cases")
+    parser.add_argument("--output", default=str(EVALUATION_DIR / "results"),
+                       help="Results directory")
+    parser.add_argument("--strict", action="store_true",
+                       help="Exit 1 if the quality score is below --min-score")
+    parser.add_argument("--min-score", type=float, default=None,
+                       help="Strict-mode threshold (default: 0.85, or 0.1 in mock mode)")
+
+    args = parser.parse_args()
+
+    agent = build_agent(args.mode, Path(args.cache_dir), args.model_name, args.offline_kb)
+    runner = BatchEvaluationRunner(agent, concurrency=args.concurrency)
+    results = await runner.run(limit=args.limit)
+    runner.save_results(args.output)
+
+    quality_score = results["summary"]["overall_quality_score"]
+    print("\n" + "=" * 60)
+    print("BATCH EVALUATION SUMMARY")
+    print("=" * 60)
+    print(f"Mode: {args.mode}  Concurrency: {args.concurrency}  Wall time: {results['wall_time_s']:.2f}s")
+    print(f"Pass Rate: {results['summary']['pass_rate'] * 100:.1f}%")
+    print(f"Quality Score: {quality_score:.2f}")
+    for name in ("total",) + LATENCY_STAGES:
+        latency = results["latency_ms"].get(name)
+        if latency:
+            print(f"  {name:<9} p50={latency['p50']:>8.1f}ms  p95={latency['p95']:>8.1f}ms  (n={latency['count']})")
+    if args.mode != "mock":
+        print(f"LLM cache: {agent.llm.prompt_cache.stats}")
+    print("=" * 60)
+
+    if args.strict:
+        target_score = args.min_score if args.min_score is not None else (0.1 if args.mode == "mock" else 0.85)
+        if quality_score < target_score:
+            print(f"❌ FAILED: Quality score {quality_score:.2f} is below threshold {target_score}")
+            sys.exit(1)
+        print(f"✅ PASSED: Quality score {quality_score:.2f} meets threshold {target_score}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main())
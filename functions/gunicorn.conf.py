@@ -0,0 +1,36 @@
+"""
+Gunicorn server hooks for the Cloud Run API
+
+Command-line flags in the Dockerfile set workers, timeouts and binding; this
+file only adds the fork-after-load hooks (see src/api/preload.py).
+
+We do not use gunicorn's ``preload_app``: importing cloud_run_main creates a
+Firestore (gRPC) client, which must not cross a fork. Instead the master loads
+only read-only model/index state and each worker imports the app itself.
+"""
+import os
+
+from src.api.preload import (
+    PRELOAD_SHARED_STATE,
+    log_memory_usage,
+    preload_shared_state,
+    reset_worker_state,
+)
+
+
+def on_starting(server):
+    """Master, before any worker is forked"""
+    if PRELOAD_SHARED_STATE:
+        preload_shared_state()
+        log_memory_usage("master after preload")
+
+
+def post_fork(server, worker):
+    """Worker, immediately after fork and before the app is imported"""
+    if PRELOAD_SHARED_STATE:
+        reset_worker_state()
+
+
+def post_worker_init(worker):
+    """Worker, after the app has been imported"""
+    log_memory_usage(f"worker {os.getpid()} after init")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Chunk Deduplication Benchmark - MinHash LSH vs. pairwise Jaccard
+
+Compares deduplicate_chunks (src/rag/chunking_strategies.py) with the previous
+implementation, reproduced here as legacy_deduplicate_chunks: every chunk is
+compared with every kept chunk, re-tokenizing the kept chunk each time.
+
+The legacy function is quadratic, so by default it only runs on the first
+--legacy-limit chunks; its time for the full corpus is extrapolated as n^2.
+Both functions run on that prefix to check they keep the same chunks.
+
+Usage:
+    python scripts/benchmark_chunk_dedup.py
+    python scripts/benchmark_chunk_dedup.py --chunks 50000 --legacy-limit 5000
+"""
+
+import argparse
+import random
+import sys
+import time
+from hashlib import md5
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.rag.chunking_strategies import Chunk, MinHashLSH, _token_set, deduplicate_chunks
+
+
+def legacy_deduplicate_chunks(chunks, similarity_threshold=0.9):
+    """The replaced O(n^2) implementation"""
+    filtered = []
+    seen_hashes = set()
+
+    for ch in chunks:
+        content = ch.content or ""
+        h = md5(content.encode("utf-8", errors="ignore")).hexdigest()
+        if h in seen_hashes:
+            continue
+
+        duplicate = False
+        toks = _token_set(content)
+        for kept in filtered:
+            ktoks = _token_set(kept.content)
+            if not toks or not ktoks:
+                continue
+            inter = len(toks & ktoks)
+            union = len(toks | ktoks)
+            sim = inter / union if union else 0.0
+            if sim >= similarity_threshold:
+                duplicate = True
+                break
+
+        if not duplicate:
+            filtered.append(ch)
+            seen_hashes.add(h)
+
+    return filtered
+
+
+def make_chunks(count: int, words_per_chunk: int = 80, duplicate_rate: float = 0.15, seed: int = 7):
+    """Synthetic corpus: unique chunks plus exact and one-word-edited copies"""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(20000)]
+    texts = []
+    for i in range(count):
+        if texts and rng.random() < duplicate_rate:
+            words = rng.choice(texts).split()
+            if rng.random() < 0.5:
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            texts.append(" ".join(words))
+        else:
+            texts.append(" ".join(rng.choice(vocabulary) for _ in range(words_per_chunk)) + ".")
+    return [
+        Chunk(content=text, metadata={"chunk_index": i}, chunk_id=f"doc_chunk_{i:05d}",
+              start_index=0, end_index=len(text), token_count=words_per_chunk)
+        for i, text in enumerate(texts)
+    ]
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunk deduplication")
+    parser.add_argument("--chunks", type=int, default=50000, help="Corpus size")
+    parser.add_argument("--legacy-limit", type=int, default=2000, help="Chunks given to the legacy function")
+    parser.add_argument("--threshold", type=float, default=0.9, help="Jaccard similarity threshold")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    prefix = chunks[:args.legacy_limit]
+    index = MinHashLSH(args.threshold)
+    print(f"Corpus: {len(chunks)} chunks, threshold {args.threshold}, "
+          f"{index.bands} bands x {index.rows} rows ({index.num_perm} permutations)\n")
+
+    legacy_kept, legacy_time = timed(legacy_deduplicate_chunks, prefix, args.threshold)
+    lsh_prefix_kept, lsh_prefix_time = timed(deduplicate_chunks, prefix, args.threshold)
+    lsh_kept, lsh_time = timed(deduplicate_chunks, chunks, args.threshold)
+
+    legacy_ids = {c.chunk_id for c in legacy_kept}
+    lsh_ids = {c.chunk_id for c in lsh_prefix_kept}
+    missed = len(lsh_ids - legacy_ids)
+    extrapolated = legacy_time * (len(chunks) / len(prefix)) ** 2
+
+    print(f"{'variant':34} {'chunks':>7} {'kept':>7} {'seconds':>10}")
+    print(f"{'legacy pairwise Jaccard':34} {len(prefix):7d} {len(legacy_kept):7d} {legacy_time:10.2f}")
+    print(f"{'minhash lsh':34} {len(prefix):7d} {len(lsh_prefix_kept):7d} {lsh_prefix_time:10.2f}")
+    print(f"{'minhash lsh':34} {len(chunks):7d} {len(lsh_kept):7d} {lsh_time:10.2f}")
+    print(f"{'legacy (extrapolated n^2)':34} {len(chunks):7d} {'':>7} {extrapolated:10.0f}")
+    print(f"\nOn the {len(prefix)}-chunk prefix, duplicates missed by LSH: {missed}, "
+          f"extra removals: {len(legacy_ids - lsh_ids)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Compression Middleware Benchmark - pure-ASGI streaming vs. buffered gzip
+
+Compares CompressionMiddleware (src/api/middleware.py) with the previous
+implementation, reproduced here as LegacyBufferingGzip: buffer the whole body,
+then gzip.compress (level 9) on the event loop.
+
+Reports:
+- CPU ms per MB of response body (one-shot JSON)
+- p50/p99 latency of small requests while large responses compress concurrently
+- Time to first byte of a streamed (SSE) response
+
+Usage:
+    python scripts/benchmark_compression.py
+    python scripts/benchmark_compression.py --body-mb 4 --rounds 20
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.api.middleware import BROTLI_AVAILABLE, CompressionMiddleware
+
+
+class LegacyBufferingGzip:
+    """The removed BaseHTTPMiddleware behaviour, as plain ASGI"""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        start = None
+        body = b""
+
+        async def buffer(message):
+            nonlocal start, body
+            if message["type"] == "http.response.start":
+                start = message
+            else:
+                body += message.get("body", b"")
+
+        await self.app(scope, receive, buffer)
+        headers = list(start["headers"])
+        if len(body) >= self.minimum_size:
+            body = gzip.compress(body)
+            headers = [(k, v) for k, v in headers if k != b"content-length"]
+            headers += [(b"content-encoding", b"gzip"), (b"content-length", str(len(body)).encode())]
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def make_json_body(size_mb: float) -> bytes:
+    rows = []
+    while len(rows) * 120 < size_mb * 1024 * 1024:
+        i = len(rows)
+        rows.append({"id": i, "title": f"Prompt template {i}", "tags": ["marketing", "email", f"t{i % 50}"],
+                     "score": round(i * 0.37 % 5, 2)})
+    return json.dumps({"items": rows}).encode()
+
+
+def json_app(body: bytes):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+def sse_app(events: int, interval: float):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        for i in range(events):
+            await asyncio.sleep(interval)
+            await send({"type": "http.response.body", "body": f"data: token {i}\n\n".encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+
+async def call(app, encoding: str = "gzip", first_byte: list = None) -> int:
+    sent = 0
+    start = time.perf_counter()
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body" and message.get("body"):
+            if first_byte is not None and not sent:
+                first_byte.append(time.perf_counter() - start)
+            sent += len(message["body"])
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    await app({"type": "http", "method": "GET", "path": "/",
+               "headers": [(b"accept-encoding", encoding.encode())]}, receive, send)
+    return sent
+
+
+async def cpu_per_mb(app, body_mb: float, rounds: int, encoding: str = "gzip"):
+    cpu_start = time.process_time()
+    sent = 0
+    for _ in range(rounds):
+        sent = await call(app, encoding)
+    cpu_ms = (time.process_time() - cpu_start) * 1000
+    return cpu_ms / (body_mb * rounds), sent
+
+
+async def small_request_latency(wrap, body: bytes, rounds: int):
+    """Latency of small requests interleaved with large compressions"""
+    large = wrap(json_app(body))
+    small = wrap(json_app(b'{"status": "ok"}' * 100))
+    latencies = []
+
+    async def small_requests():
+        # Open-loop arrivals every 2ms: latency counts from the scheduled
+        # arrival, so time spent blocked behind a compression is included
+        start = time.perf_counter()
+        for i in range(rounds * 20):
+            arrival = start + i * 0.002
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            await call(small)
+            latencies.append((time.perf_counter() - arrival) * 1000)
+
+    async def large_requests():
+        for _ in range(rounds):
+            await call(large)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(small_requests(), large_requests(), large_requests())
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+async def sse_first_byte(wrap, events: int = 20, interval: float = 0.01):
+    first_byte = []
+    await call(wrap(sse_app(events, interval)), first_byte=first_byte)
+    return first_byte[0] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark response compression middleware")
+    parser.add_argument("--body-mb", type=float, default=2.0, help="Size of the large JSON response")
+    parser.add_argument("--rounds", type=int, default=10, help="Large responses per measurement")
+    args = parser.parse_args()
+
+    body = make_json_body(args.body_mb)
+    body_mb = len(body) / (1024 * 1024)
+    variants = {
+        "legacy (buffer + gzip.compress level 9)": lambda app: LegacyBufferingGzip(app),
+        "asgi gzip level 6": lambda app: CompressionMiddleware(app, compress_event_streams=True),
+    }
+
+    print(f"Body: {body_mb:.2f} MB JSON, {args.rounds} rounds, brotli available: {BROTLI_AVAILABLE}\n")
+    print(f"{'variant':42} {'CPU ms/MB':>10} {'ratio':>7} {'small p50':>10} {'small p99':>10} {'SSE TTFB':>10}")
+    for name, wrap in variants.items():
+        cpu, sent = await cpu_per_mb(wrap(json_app(body)), body_mb, args.rounds)
+        p50, p99 = await small_request_latency(wrap, body, args.rounds)
+        ttfb = await sse_first_byte(wrap)
+        print(f"{name:42} {cpu:10.1f} {len(body) / sent:7.1f} {p50:8.2f}ms {p99:8.2f}ms {ttfb:8.1f}ms")
+
+    if BROTLI_AVAILABLE:
+        cpu, sent = await cpu_per_mb(CompressionMiddleware(json_app(body)), body_mb, args.rounds, "br")
+        print(f"{'asgi br quality 4':42} {cpu:10.1f} {len(body) / sent:7.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
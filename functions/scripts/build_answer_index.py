@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Answer Index Build - Precompute answers for the most frequent questions
+
+Collects the top-N queries from the `query_embeddings` drift collection and
+the golden datasets, generates answers with the marketing agent, gates them
+with the response cache rules (PII / personalization / quality) and writes a
+versioned snapshot that containers load at startup (see src/rag/answer_index.py).
+
+Usage:
+    python scripts/build_answer_index.py --env staging
+    python scripts/build_answer_index.py --env production --top 200 --no-drift
+"""
+
+import asyncio
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import firebase_admin
+from firebase_admin import firestore
+
+if not firebase_admin._apps:
+    firebase_admin.initialize_app()
+
+from src.rag.answer_index import (
+    ANSWER_INDEX_DIR,
+    build_snapshot,
+    collect_drift_queries,
+    compute_kb_content_hash,
+    load_golden_queries,
+    merge_queries,
+    write_snapshot,
+)
+from src.rag.cache_manager import intelligent_response_cache
+
+GOLDEN_DATASETS = [
+    Path(__file__).parent.parent / "evaluation" / "golden_dataset.json",
+    Path(__file__).parent.parent / "src" / "ai_agent" / "marketing" / "scripts" / "golden_dataset.json",
+]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build the precomputed answer index")
+    parser.add_argument("--env", default="staging", choices=["staging", "production"],
+                       help="Environment to build for")
+    parser.add_argument("--top", type=int, default=100,
+                       help="Number of most frequent drift queries to include (default: 100)")
+    parser.add_argument("--no-drift", action="store_true",
+                       help="Only use the golden datasets")
+    parser.add_argument("--output", default=str(ANSWER_INDEX_DIR),
+                       help="Snapshot directory")
+    parser.add_argument("--throttle", type=int, default=1000,
+                       help="Milliseconds to wait between requests (default: 1000)")
+
+    args = parser.parse_args()
+    os.environ['ENVIRONMENT'] = args.env
+
+    print("=" * 60)
+    print("ANSWER INDEX BUILD")
+    print("=" * 60)
+
+    kb_hash = compute_kb_content_hash()
+    if not kb_hash:
+        print("❌ Marketing KB content unavailable, cannot version the snapshot")
+        return
+    print(f"KB hash: {kb_hash[:12]}")
+
+    try:
+        from src.ai_agent.marketing.marketing_agent import get_marketing_agent
+        db = firestore.client()
+        agent = get_marketing_agent(db=db)
+        print("✅ Marketing agent initialized")
+    except Exception as e:
+        print(f"❌ Failed to initialize agent: {e}")
+        return
+
+    drift_queries = []
+    if not args.no_drift:
+        drift_queries = [query for query, _ in collect_drift_queries(db, limit=args.top)]
+        print(f"Drift queries: {len(drift_queries)}")
+    golden_queries = load_golden_queries(GOLDEN_DATASETS)
+    print(f"Golden queries: {len(golden_queries)}")
+
+    queries = merge_queries(drift_queries, golden_queries)
+    print(f"Total unique queries: {len(queries)}")
+
+    async def answer(query: str) -> str:
+        context = {"conversation_id": f"answer-index-{abs(hash(query))}", "page_context": "unknown"}
+        response = await agent.chat(query, context)
+        await asyncio.sleep(args.throttle / 1000)
+        return response['response']
+
+    start_time = time.time()
+    snapshot = await build_snapshot(
+        queries,
+        answer,
+        intelligent_response_cache,
+        kb_hash=kb_hash,
+        embed=intelligent_response_cache._generate_embedding,
+        embedding_model=intelligent_response_cache._embedding_model_name,
+    )
+    path = write_snapshot(snapshot, Path(args.output))
+
+    print(f"\n{'=' * 60}")
+    print(f"Answers: {len(snapshot['entries'])}/{len(queries)}")
+    print(f"Rejected: {len(snapshot['rejected'])}")
+    print(f"Total Time: {(time.time() - start_time) / 60:.2f} minutes")
+    print(f"✅ Snapshot written: {path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
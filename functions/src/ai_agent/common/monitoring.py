@@ -3,6 +3,8 @@ import os
 import time
 from typing import Any, Dict, Optional
 
+from .telemetry import TelemetrySink, get_telemetry_sink
+
 logger = logging.getLogger(__name__)
 
 
@@ -12,6 +14,8 @@ class AgentMonitoring:
     These logs can be used to create Logs-based Metrics and Alerting policies
     without introducing new runtime dependencies in Cloud Run.
 
+    Entries are emitted through the telemetry sink, off the request path.
+
     Usage:
         mon = AgentMonitoring(service="marketing-api", environment=os.getenv("ENVIRONMENT", "unknown"))
         ctx = mon.start_request(agent_type="marketing", page_context="homepage")
@@ -24,9 +28,19 @@ class AgentMonitoring:
             raise
     """
 
-    def __init__(self, service: str, environment: str = "unknown") -> None:
+    def __init__(self, service: str, environment: str = "unknown", sink: Optional[TelemetrySink] = None) -> None:
         self.service = service
         self.environment = environment
+        self._sink = sink
+
+    @property
+    def sink(self) -> TelemetrySink:
+        # Looked up per use so a forked worker gets its own sink, not the parent's
+        return self._sink or get_telemetry_sink()
+
+    def _emit(self, level: int, payload: Dict[str, Any]) -> None:
+        # Errors are never sampled away under pressure
+        self.sink.log(logger, level, payload, priority=level >= logging.ERROR)
 
     def start_request(self, agent_type: str, page_context: Optional[str] = None) -> Dict[str, Any]:
         ctx = {
@@ -35,7 +49,7 @@ class AgentMonitoring:
             "page_context": page_context or "unknown",
         }
         # Emit a start log (info)
-        logger.info({
+        self._emit(logging.INFO, {
             "monitoring": {
                 "event": "agent_request_start",
                 "service": self.service,
@@ -61,10 +75,10 @@ class AgentMonitoring:
         }
         if extra_metadata:
             payload["monitoring"]["metadata"] = extra_metadata
-        logger.info(payload)
+        self._emit(logging.INFO, payload)
 
     def record_error(self, agent_type: str, error_type: str, details: Optional[str] = None, page_context: Optional[str] = None) -> None:
-        logger.error({
+        self._emit(logging.ERROR, {
             "monitoring": {
                 "event": "agent_error",
                 "service": self.service,
@@ -77,7 +91,7 @@ class AgentMonitoring:
         })
 
     def record_tool_usage(self, agent_type: str, tool_name: str, duration_ms: int, success: bool, page_context: Optional[str] = None) -> None:
-        logger.info({
+        self._emit(logging.INFO, {
             "monitoring": {
                 "event": "agent_tool_usage",
                 "service": self.service,
@@ -139,4 +153,4 @@ class AgentMonitoring:
         if model_name:
             payload["monitoring"]["model_name"] = model_name
 
-        logger.info(payload)
+        self._emit(logging.INFO, payload)
@@ -0,0 +1,201 @@
+"""
+Multi-pattern keyword matcher (Aho-Corasick)
+
+Intent classification, exit detection, drift categorisation, reflection
+policy checks and the streaming chunk filters all ask the same question:
+"which of these N phrases occur in this text?". Scanning with ``kw in text``
+per keyword costs O(N * len(text)); the automaton built here answers it for
+every phrase in one linear pass.
+
+Patterns are grouped under labels (e.g. intent names). A phrase may belong to
+several labels. Each hit records whether it starts and/or ends on a word
+boundary, so callers can choose substring or whole-word semantics per check.
+"""
+import logging
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+@dataclass(frozen=True)
+class PatternMatch:
+    """A single occurrence of a pattern in the scanned text"""
+    pattern: str
+    labels: Tuple[str, ...]
+    start: int
+    end: int
+    word_start: bool  # Preceded by a word boundary
+    word_end: bool  # Followed by a word boundary
+
+    @property
+    def whole_word(self) -> bool:
+        return self.word_start and self.word_end
+
+
+class PatternMatcher:
+    """
+    Compiled Aho-Corasick automaton over labelled patterns
+
+    Usage:
+        matcher = PatternMatcher({"pricing": ["price", "how much"], "greeting": ["hi"]})
+        matcher.labels("How much is it?")  # {"pricing"}
+        [m.pattern for m in matcher.find_all("hi, what's the price?") if m.whole_word]
+    """
+
+    def __init__(self, groups: Mapping[str, Iterable[str]], case_sensitive: bool = False):
+        """
+        Args:
+            groups: Label -> patterns to match for that label
+            case_sensitive: Match case exactly (default: lowercase text and patterns)
+        """
+        self.case_sensitive = case_sensitive
+
+        # Trie: per-state transitions, failure links and pattern outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        self._patterns: List[str] = []
+        self._labels: List[Tuple[str, ...]] = []
+        pattern_ids: Dict[str, int] = {}
+        pattern_labels: Dict[str, List[str]] = {}
+
+        for label, patterns in groups.items():
+            for pattern in patterns:
+                if not pattern:
+                    continue
+                key = pattern if case_sensitive else pattern.lower()
+                if key not in pattern_ids:
+                    pattern_ids[key] = len(self._patterns)
+                    self._patterns.append(key)
+                    pattern_labels[key] = []
+                if label not in pattern_labels[key]:
+                    pattern_labels[key].append(label)
+
+        self._labels = [tuple(pattern_labels[p]) for p in self._patterns]
+
+        for pattern_id, pattern in enumerate(self._patterns):
+            self._insert(pattern, pattern_id)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str, pattern_id: int) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append(pattern_id)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # Inherit outputs of the longest proper suffix state
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    @property
+    def patterns(self) -> List[str]:
+        return list(self._patterns)
+
+    def find_all(self, text: str) -> List[PatternMatch]:
+        """
+        Find every (possibly overlapping) pattern occurrence in one pass
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Matches in order of their end position
+        """
+        return list(self.iter_matches(text))
+
+    def iter_matches(self, text: str) -> Iterator[PatternMatch]:
+        """Lazily yield matches in order of their end position (allows early exit)"""
+        if not text or not self._patterns:
+            return
+        haystack = text if self.case_sensitive else text.lower()
+        length = len(haystack)
+
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, char in enumerate(haystack):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not out[state]:
+                continue
+
+            end = index + 1
+            for pattern_id in out[state]:
+                pattern = self._patterns[pattern_id]
+                start = end - len(pattern)
+                # A boundary only matters where the pattern edge is itself a word char
+                word_start = (
+                    start == 0
+                    or not _is_word_char(pattern[0])
+                    or not _is_word_char(haystack[start - 1])
+                )
+                word_end = (
+                    end == length
+                    or not _is_word_char(pattern[-1])
+                    or not _is_word_char(haystack[end])
+                )
+                yield PatternMatch(
+                    pattern=pattern,
+                    labels=self._labels[pattern_id],
+                    start=start,
+                    end=end,
+                    word_start=word_start,
+                    word_end=word_end
+                )
+
+    def labels(self, text: str, whole_word: bool = False) -> Set[str]:
+        """Labels with at least one hit in ``text``"""
+        return {
+            label
+            for match in self.find_all(text)
+            if match.whole_word or not whole_word
+            for label in match.labels
+        }
+
+    def search(self, text: str, whole_word: bool = False) -> Optional[PatternMatch]:
+        """First (leftmost-ending) hit in ``text``, or None"""
+        for match in self.iter_matches(text):
+            if match.whole_word or not whole_word:
+                return match
+        return None
+
+
+@lru_cache(maxsize=32)
+def _compile(groups: Tuple[Tuple[str, Tuple[str, ...]], ...], case_sensitive: bool) -> PatternMatcher:
+    return PatternMatcher(dict(groups), case_sensitive=case_sensitive)
+
+
+def get_matcher(groups: Mapping[str, Iterable[str]], case_sensitive: bool = False) -> PatternMatcher:
+    """
+    Get a compiled matcher for ``groups``, reusing a cached automaton
+
+    Term lists that come from config objects are rebuilt per call site; this
+    keeps the compilation to once per distinct set of lists.
+    """
+    key = tuple((label, tuple(patterns)) for label, patterns in groups.items())
+    return _compile(key, case_sensitive)
@@ -0,0 +1,51 @@
+"""
+Per-request stage timing
+
+Instrumented code wraps pipeline stages (retrieve, rerank, generate, reflect)
+in ``stage(name)``. Timings are only recorded inside a
+``collect_stage_timings()`` block, so production requests pay one
+perf_counter pair per stage and nothing else.
+
+The active timings dict lives in a ContextVar: concurrent requests on one
+event loop each see their own dict, while tasks and worker threads spawned
+from a request (asyncio.create_task / asyncio.to_thread copy the context)
+record into the request's dict.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Add the wall time of the block (ms) to stage ``name`` of the active collection"""
+    timings = _stage_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+@contextmanager
+def collect_stage_timings() -> Iterator[Dict[str, float]]:
+    """
+    Collect stage timings for the enclosed request.
+
+    Usage:
+        with collect_stage_timings() as timings:
+            await agent.chat(query)
+        timings  # {"retrieve": 41.2, "generate": 812.5, ...} in milliseconds
+    """
+    timings: Dict[str, float] = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
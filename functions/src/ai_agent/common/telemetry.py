@@ -0,0 +1,297 @@
+"""
+Off-request-path telemetry sink
+
+Observability writes (drift tracking, retrieval quality records, structured
+monitoring logs) are queued in memory and written by a background thread, so
+a chat turn never waits on Firestore or log I/O for them.
+
+- Bounded queue: when full, new events are dropped (and counted).
+- Under pressure (queue above a watermark) non-priority events are sampled.
+- Firestore documents are committed in write batches (<= 500 ops each).
+- Per-event ``prepare`` callbacks (e.g. PII redaction) run on the worker.
+- Log records are emitted in the context (contextvars, e.g. request id) that
+  queued them.
+- Remaining events are flushed on ``close()`` and at interpreter exit.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import random
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_MAX_QUEUE = int(os.getenv("TELEMETRY_MAX_QUEUE", "10000"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "200"))
+TELEMETRY_FLUSH_INTERVAL_S = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_S", "1.0"))
+# Above this fraction of TELEMETRY_MAX_QUEUE, non-priority events are sampled
+TELEMETRY_PRESSURE_WATERMARK = float(os.getenv("TELEMETRY_PRESSURE_WATERMARK", "0.8"))
+TELEMETRY_PRESSURE_SAMPLE_RATE = float(os.getenv("TELEMETRY_PRESSURE_SAMPLE_RATE", "0.1"))
+
+# Firestore write batch limit
+FIRESTORE_BATCH_LIMIT = 500
+
+
+@dataclass
+class TelemetryEvent:
+    """A queued Firestore document write or structured log record"""
+    kind: str  # "doc" | "log"
+    data: Any
+    db: Any = None
+    collection: Optional[str] = None
+    doc_id: Optional[str] = None
+    prepare: Optional[Callable[[Any], Any]] = None
+    log: Optional[logging.Logger] = None
+    level: int = logging.INFO
+    context: Optional[contextvars.Context] = None
+
+
+class TelemetrySink:
+    """
+    Bounded write-behind queue for telemetry
+
+    Usage:
+        sink = get_telemetry_sink()
+        sink.write(db, "query_embeddings", {...}, doc_id=query_id)
+        sink.log(logger, logging.INFO, {"monitoring": {...}})
+    """
+
+    def __init__(
+        self,
+        max_queue: int = TELEMETRY_MAX_QUEUE,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        flush_interval: float = TELEMETRY_FLUSH_INTERVAL_S,
+        pressure_watermark: float = TELEMETRY_PRESSURE_WATERMARK,
+        pressure_sample_rate: float = TELEMETRY_PRESSURE_SAMPLE_RATE
+    ):
+        self.max_queue = max(1, max_queue)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.pressure_depth = int(self.max_queue * pressure_watermark)
+        self.pressure_sample_rate = pressure_sample_rate
+
+        self._queue: Deque[TelemetryEvent] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sampled_out": 0,
+            "written": 0,
+            "logged": 0,
+            "errors": 0,
+        }
+
+    # ================================================================
+    # Producers (request path - never block on I/O)
+    # ================================================================
+
+    def write(
+        self,
+        db: Any,
+        collection: str,
+        data: Dict[str, Any],
+        doc_id: Optional[str] = None,
+        prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        priority: bool = False,
+        sample_rate: float = 1.0
+    ) -> bool:
+        """
+        Queue a Firestore document write
+
+        Args:
+            db: Firestore client
+            collection: Target collection
+            data: Document data
+            doc_id: Document ID (auto-generated on commit if None)
+            prepare: Optional transform applied on the worker before writing
+            priority: Exempt from pressure sampling
+            sample_rate: Fraction of events to keep in steady state
+
+        Returns:
+            True if the event was queued
+        """
+        if db is None:
+            return False
+        return self._enqueue(
+            TelemetryEvent(kind="doc", data=data, db=db, collection=collection, doc_id=doc_id, prepare=prepare),
+            priority,
+            sample_rate
+        )
+
+    def log(
+        self,
+        log: logging.Logger,
+        level: int,
+        payload: Any,
+        priority: bool = False,
+        sample_rate: float = 1.0
+    ) -> bool:
+        """
+        Queue a structured log record, emitted by ``log`` on the worker
+
+        Returns:
+            True if the event was queued
+        """
+        if not log.isEnabledFor(level):
+            return False
+        return self._enqueue(
+            TelemetryEvent(kind="log", data=payload, log=log, level=level, context=contextvars.copy_context()),
+            priority,
+            sample_rate
+        )
+
+    def _enqueue(self, event: TelemetryEvent, priority: bool, sample_rate: float) -> bool:
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            self.stats["sampled_out"] += 1
+            return False
+
+        with self._lock:
+            depth = len(self._queue)
+            if depth >= self.max_queue:
+                self.stats["dropped"] += 1
+                return False
+            if (
+                not priority
+                and depth >= self.pressure_depth
+                and random.random() >= self.pressure_sample_rate
+            ):
+                self.stats["sampled_out"] += 1
+                return False
+
+            self._queue.append(event)
+            self.stats["enqueued"] += 1
+            depth += 1
+
+        self._ensure_worker()
+        if depth >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def depth(self) -> int:
+        """Number of queued events"""
+        with self._lock:
+            return len(self._queue)
+
+    # ================================================================
+    # Consumer
+    # ================================================================
+
+    def flush(self) -> int:
+        """
+        Write everything queued so far (blocking)
+
+        Returns:
+            Number of events processed
+        """
+        processed = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        break
+                    count = min(len(self._queue), self.batch_size)
+                    batch = [self._queue.popleft() for _ in range(count)]
+                self._process(batch)
+                processed += len(batch)
+        return processed
+
+    def _process(self, batch: List[TelemetryEvent]) -> None:
+        docs: Dict[int, List[TelemetryEvent]] = {}
+        for event in batch:
+            if event.kind == "log":
+                try:
+                    # Filters and formatters on the worker see the request's contextvars
+                    event.context.run(event.log.log, event.level, event.data)
+                    self.stats["logged"] += 1
+                except Exception:
+                    self.stats["errors"] += 1
+                continue
+
+            if event.prepare is not None:
+                try:
+                    event.data = event.prepare(event.data)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logger.warning(f"Dropping telemetry for {event.collection}: prepare failed: {e}")
+                    continue
+            docs.setdefault(id(event.db), []).append(event)
+
+        for events in docs.values():
+            db = events[0].db
+            for start in range(0, len(events), FIRESTORE_BATCH_LIMIT):
+                chunk = events[start:start + FIRESTORE_BATCH_LIMIT]
+                try:
+                    write_batch = db.batch()
+                    for event in chunk:
+                        collection_ref = db.collection(event.collection)
+                        doc_ref = collection_ref.document(event.doc_id) if event.doc_id else collection_ref.document()
+                        write_batch.set(doc_ref, event.data)
+                    write_batch.commit()
+                    self.stats["written"] += len(chunk)
+                except Exception as e:
+                    # Telemetry is best-effort: count and move on rather than retry
+                    self.stats["errors"] += len(chunk)
+                    logger.error(f"Error writing {len(chunk)} telemetry documents: {e}")
+
+    def close(self):
+        """Stop the background worker and flush what is left"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._thread is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="telemetry-sink", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Telemetry sink flush failed: {e}")
+
+
+_telemetry_sink: Optional[TelemetrySink] = None
+_telemetry_sink_lock = threading.Lock()
+
+
+def get_telemetry_sink() -> TelemetrySink:
+    """Get the process-wide telemetry sink (singleton)"""
+    global _telemetry_sink
+    if _telemetry_sink is None:
+        with _telemetry_sink_lock:
+            if _telemetry_sink is None:
+                _telemetry_sink = TelemetrySink()
+    return _telemetry_sink
+
+
+def reset_telemetry_sink_after_fork():
+    """
+    Drop the inherited sink in a forked worker.
+
+    The parent's worker thread does not exist in the child and its locks may
+    have been held at fork time; the child builds a fresh sink on first use.
+    """
+    global _telemetry_sink, _telemetry_sink_lock
+    _telemetry_sink = None
+    _telemetry_sink_lock = threading.Lock()
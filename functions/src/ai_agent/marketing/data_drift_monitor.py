@@ -10,8 +10,20 @@ from datetime import datetime, timezone, timedelta
 from typing import Any, Dict, List, Optional, Tuple
 from collections import defaultdict
 
+from ..common.pattern_matcher import PatternMatcher
+from ..common.telemetry import TelemetrySink, get_telemetry_sink
+
 logger = logging.getLogger(__name__)
 
+# Query category keywords, in priority order (first matching category wins)
+DRIFT_CATEGORY_KEYWORDS = {
+    "pricing": ["price", "cost", "pricing", "quote", "$", "pay"],
+    "services": ["service", "solution", "offer", "integration", "assistant", "app"],
+    "technical": ["api", "rag", "embed", "technical", "architecture", "how does", "integrate"],
+    "consultation": ["consultation", "demo", "schedule", "meeting", "contact", "talk"],
+}
+DRIFT_CATEGORY_MATCHER = PatternMatcher(DRIFT_CATEGORY_KEYWORDS)
+
 
 class DataDriftMonitor:
     """
@@ -21,14 +33,16 @@ class DataDriftMonitor:
     Triggers alerts when drift exceeds threshold.
     """
 
-    def __init__(self, db: Any = None):
+    def __init__(self, db: Any = None, sink: Optional[TelemetrySink] = None):
         """
         Initialize drift monitor.
 
         Args:
             db: Firestore client for persistence
+            sink: Telemetry sink for off-request-path writes (shared sink if None)
         """
         self.db = db
+        self._sink = sink
         self.query_categories = [
             "pricing",
             "services",
@@ -46,6 +60,9 @@ class DataDriftMonitor:
         """
         Track a query for drift detection.
 
+        Only classifies and enqueues; PII redaction and the Firestore write
+        run on the telemetry sink's worker, off the request path.
+
         Args:
             query: User query text
             conversation_id: Conversation identifier
@@ -56,37 +73,30 @@ class DataDriftMonitor:
             return
 
         try:
-            # SEC-002 FIX: Redact PII before storing query
-            try:
-                from ..security.pii_detector import redact_pii_from_text
-                safe_query = redact_pii_from_text(query)
-            except ImportError:
-                # If PII detector not available, hash the query for privacy
-                safe_query = f"[query_hash:{hashlib.sha256(query.encode()).hexdigest()[:8]}]"
-                logger.warning("PII detector not available, using hash instead")
-
             # Classify query category (use original for classification accuracy)
             category = self._classify_query(query)
 
             # Generate query ID
+            now = datetime.now(timezone.utc)
             query_id = hashlib.sha256(
-                f"{query}{datetime.now(timezone.utc).isoformat()}".encode()
+                f"{query}{now.isoformat()}".encode()
             ).hexdigest()[:16]
 
-            # Store query metadata with PII-safe text
+            # Query text is redacted by _redact_query_doc before it is stored
             query_doc = {
-                "query_text": safe_query,  # Use redacted/safe query
+                "query_text": query,
                 "category": category,
                 "conversation_id": conversation_id,
-                "timestamp": datetime.now(timezone.utc),
+                "timestamp": now,
                 "embedding": embedding  # Can be None
             }
 
-            # CODE-003 FIX: Use asyncio.to_thread for sync Firestore call in async method
-            import asyncio
-            await asyncio.to_thread(
-                self.db.collection("query_embeddings").document(query_id).set,
-                query_doc
+            self.sink.write(
+                self.db,
+                "query_embeddings",
+                query_doc,
+                doc_id=query_id,
+                prepare=_redact_query_doc
             )
 
             logger.debug(f"Tracked query: category={category}, id={query_id}")
@@ -94,6 +104,11 @@ class DataDriftMonitor:
         except Exception as e:
             logger.error(f"Error tracking query for drift: {e}")
 
+    @property
+    def sink(self) -> TelemetrySink:
+        # Looked up per use so a forked worker gets its own sink, not the parent's
+        return self._sink or get_telemetry_sink()
+
     def _classify_query(self, query: str) -> str:
         """
         Classify query into category using keyword matching.
@@ -104,23 +119,12 @@ class DataDriftMonitor:
         Returns:
             Category name
         """
-        query_lower = query.lower()
-
-        # Pricing keywords
-        if any(word in query_lower for word in ["price", "cost", "pricing", "quote", "$", "pay"]):
-            return "pricing"
-
-        # Services keywords
-        if any(word in query_lower for word in ["service", "solution", "offer", "integration", "assistant", "app"]):
-            return "services"
-
-        # Technical keywords
-        if any(word in query_lower for word in ["api", "rag", "embed", "technical", "architecture", "how does", "integrate"]):
-            return "technical"
-
-        # Consultation keywords
-        if any(word in query_lower for word in ["consultation", "demo", "schedule", "meeting", "contact", "talk"]):
-            return "consultation"
+        # Categories are checked in priority order; substring hits count
+        # so that e.g. "embed" also catches "embedding"
+        hits = DRIFT_CATEGORY_MATCHER.labels(query)
+        for category in DRIFT_CATEGORY_KEYWORDS:
+            if category in hits:
+                return category
 
         return "general"
 
@@ -301,6 +305,19 @@ class DataDriftMonitor:
             return {"drift_detected": False, "error": str(e)}
 
 
+def _redact_query_doc(query_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """SEC-002 FIX: Redact PII from the query text before it is stored."""
+    query = query_doc["query_text"]
+    try:
+        from ..security.pii_detector import redact_pii_from_text
+        safe_query = redact_pii_from_text(query)
+    except ImportError:
+        # If PII detector not available, hash the query for privacy
+        safe_query = f"[query_hash:{hashlib.sha256(query.encode()).hexdigest()[:8]}]"
+        logger.warning("PII detector not available, using hash instead")
+    return {**query_doc, "query_text": safe_query}
+
+
 # Convenience function for easy integration
 async def track_query_for_drift(
     query: str,
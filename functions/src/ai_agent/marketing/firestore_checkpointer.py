@@ -5,17 +5,41 @@ Implements persistent state management using Firestore.
 Enables conversation history to survive Cloud Run instance restarts.
 
 Phase 5 Implementation - State Management
+
+Write path:
+- The latest checkpoint per thread lives in a bounded in-process LRU (hot tier),
+  so reads during a turn cost at most a head-version check, not a reload.
+- Intermediate step writes are coalesced: aput() only updates the hot tier and
+  (re)arms a per-thread flush timer, so a turn with tool calls ends up as a
+  single commit of its final state. Callers can force it with aflush().
+- List channels (the message history) are stored as append-only delta segments,
+  so each commit serializes only the messages added since the previous one.
+- Each commit is a transaction conditioned on the head document's version, and
+  a cached thread is revalidated against that version before it is read, so
+  instances sharing a thread never overwrite each other's newer checkpoints.
 """
+import asyncio
 import logging
-from typing import Any, Dict, Iterator, List, Optional, Tuple
-from datetime import datetime, timezone
-import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone, timedelta
 
 logger = logging.getLogger(__name__)
 
 # Check if LangGraph checkpoint interfaces are available
 try:
-    from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple
+    from langgraph.checkpoint.base import (
+        BaseCheckpointSaver,
+        Checkpoint,
+        CheckpointMetadata,
+        CheckpointTuple,
+        WRITES_IDX_MAP,
+        get_checkpoint_metadata,
+    )
     LANGGRAPH_CHECKPOINT_AVAILABLE = True
 except ImportError:
     LANGGRAPH_CHECKPOINT_AVAILABLE = False
@@ -26,6 +50,45 @@ except ImportError:
         pass
     class CheckpointMetadata:
         pass
+    CheckpointTuple = None
+    WRITES_IDX_MAP = {}
+
+try:
+    from google.cloud import firestore
+except ImportError:
+    firestore = None
+
+# Hot tier and coalescing knobs
+CHECKPOINT_CACHE_MAX_THREADS = int(os.getenv("CHECKPOINT_CACHE_MAX_THREADS", "1000"))
+CHECKPOINT_FLUSH_DELAY_S = float(os.getenv("CHECKPOINT_FLUSH_DELAY_S", "1.0"))
+CHECKPOINT_MAX_FLUSH_DELAY_S = float(os.getenv("CHECKPOINT_MAX_FLUSH_DELAY_S", "5.0"))
+# Delta segments allowed before the lists are rewritten into a single base segment
+CHECKPOINT_MAX_SEGMENTS = int(os.getenv("CHECKPOINT_MAX_SEGMENTS", "20"))
+# Failed background flushes retried (with backoff) before waiting for the next put
+CHECKPOINT_FLUSH_RETRIES = int(os.getenv("CHECKPOINT_FLUSH_RETRIES", "5"))
+
+
+class CheckpointConflictError(Exception):
+    """Another instance committed a newer checkpoint for the thread."""
+
+
+@dataclass
+class _ThreadEntry:
+    """Hot-tier state for one (thread_id, checkpoint_ns)."""
+    checkpoint_tuple: Optional[Any] = None
+    writes: Dict[Tuple[str, int], Tuple[str, str, Any]] = field(default_factory=dict)
+    # What Firestore currently holds for each list channel
+    persisted_lists: Dict[str, List[Any]] = field(default_factory=dict)
+    # Live segment doc ids, oldest (the base) first
+    segment_ids: List[str] = field(default_factory=list)
+    segment_seq: int = -1
+    # Head document version this entry was loaded from or last committed
+    version: int = 0
+    dirty: bool = False
+    dirty_since: float = 0.0
+    last_put: float = 0.0
+    flush_task: Optional[asyncio.Task] = None
+    persist_lock: threading.Lock = field(default_factory=threading.Lock)
 
 
 class FirestoreCheckpointer(BaseCheckpointSaver):
@@ -34,15 +97,19 @@ class FirestoreCheckpointer(BaseCheckpointSaver):
 
     Stores conversation checkpoints in Firestore for:
     - Cross-session persistence (survives Cloud Run restarts)
-    - Multi-instance consistency (shared state across pods)
+    - Multi-instance consistency: commits are transactions that fail if the
+      head version moved, and cached threads are revalidated before a read
     - Automatic TTL cleanup via Firestore TTL policies
 
     Collection structure:
-        agent_checkpoints/{thread_id}/checkpoints/{checkpoint_id}
+        agent_checkpoints/{thread_id}                             latest checkpoint (without list channels)
+        agent_checkpoints/{thread_id}/segments/{seq}-{checkpoint}  list channel deltas, replayed in segment_ids order
+
+    A commit that loses the race to another instance is dropped together with
+    the cached thread, and the next read loads the winner's checkpoint.
 
-    NOTE: Uses synchronous Firestore API intentionally because LangGraph's
-    BaseCheckpointSaver interface is synchronous. This is called infrequently
-    (once per conversation turn) so the blocking is acceptable.
+    Only the latest checkpoint per thread is kept, and pending writes stay in
+    memory: the agent never resumes from older checkpoints.
 
     Usage:
         from firestore_checkpointer import FirestoreCheckpointer
@@ -55,7 +122,11 @@ class FirestoreCheckpointer(BaseCheckpointSaver):
         self,
         db,
         collection_name: str = "agent_checkpoints",
-        ttl_days: int = 7
+        ttl_days: int = 7,
+        max_threads: int = CHECKPOINT_CACHE_MAX_THREADS,
+        flush_delay: float = CHECKPOINT_FLUSH_DELAY_S,
+        max_flush_delay: float = CHECKPOINT_MAX_FLUSH_DELAY_S,
+        max_segments: int = CHECKPOINT_MAX_SEGMENTS
     ):
         """
         Initialize Firestore checkpointer.
@@ -64,6 +135,10 @@ class FirestoreCheckpointer(BaseCheckpointSaver):
             db: Firestore client instance
             collection_name: Root collection for checkpoints
             ttl_days: Days before automatic cleanup (requires Firestore TTL policy)
+            max_threads: Threads kept in the in-process hot tier
+            flush_delay: Seconds without a new checkpoint before a thread is persisted
+            max_flush_delay: Upper bound on how long a dirty thread waits to be persisted
+            max_segments: Delta segments per thread before compaction
         """
         if not LANGGRAPH_CHECKPOINT_AVAILABLE:
             raise ImportError(
@@ -75,198 +150,576 @@ class FirestoreCheckpointer(BaseCheckpointSaver):
         self.db = db
         self.collection_name = collection_name
         self.ttl_days = ttl_days
-        logger.info(f"FirestoreCheckpointer initialized (collection={collection_name}, ttl={ttl_days}d)")
-
-    def _get_checkpoint_ref(self, thread_id: str, checkpoint_id: str):
-        """Get Firestore document reference for a checkpoint."""
-        return (
-            self.db.collection(self.collection_name)
-            .document(thread_id)
-            .collection("checkpoints")
-            .document(checkpoint_id)
+        self.max_threads = max(1, max_threads)
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max(flush_delay, max_flush_delay)
+        self.max_segments = max(1, max_segments)
+
+        self._hot: "OrderedDict[Tuple[str, str], _ThreadEntry]" = OrderedDict()
+        # Dirty entries pushed out of the LRU, kept until their flush completes
+        self._evicting: Dict[Tuple[str, str], _ThreadEntry] = {}
+        self._lock = threading.Lock()
+
+        logger.info(
+            f"FirestoreCheckpointer initialized (collection={collection_name}, ttl={ttl_days}d, "
+            f"hot_tier={self.max_threads}, flush_delay={flush_delay}s)"
         )
 
-    def _get_thread_ref(self, thread_id: str):
-        """Get Firestore document reference for thread metadata."""
-        return self.db.collection(self.collection_name).document(thread_id)
+    # ================================================================
+    # Firestore layout
+    # ================================================================
 
-    def get(
-        self,
-        config: Dict[str, Any]
-    ) -> Optional[Checkpoint]:
+    @staticmethod
+    def _key(config: Dict[str, Any]) -> Tuple[str, str]:
+        configurable = config.get("configurable", {})
+        thread_id = configurable.get("thread_id")
+        if not thread_id:
+            raise ValueError("thread_id is required in config.configurable")
+        return str(thread_id), configurable.get("checkpoint_ns", "") or ""
+
+    def _get_thread_ref(self, key: Tuple[str, str]):
+        """Get Firestore document reference for a thread's latest checkpoint."""
+        thread_id, checkpoint_ns = key
+        doc_id = thread_id if not checkpoint_ns else f"{thread_id}__{checkpoint_ns}"
+        return self.db.collection(self.collection_name).document(doc_id.replace("/", "_"))
+
+    def _get_segment_ref(self, key: Tuple[str, str], segment_id: str):
+        """Get Firestore document reference for a delta segment."""
+        return self._get_thread_ref(key).collection("segments").document(segment_id)
+
+    def _dump(self, value: Any) -> Dict[str, Any]:
+        type_, data = self.serde.dumps_typed(value)
+        return {"type": type_, "data": data}
+
+    def _load(self, blob: Dict[str, Any]) -> Any:
+        return self.serde.loads_typed((blob["type"], blob["data"]))
+
+    # ================================================================
+    # Hot tier
+    # ================================================================
+
+    def _cached_entry(self, key: Tuple[str, str]) -> Optional[_ThreadEntry]:
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is not None:
+                self._hot.move_to_end(key)
+                return entry
+            return self._evicting.get(key)
+
+    def _forget(self, key: Tuple[str, str], entry: _ThreadEntry) -> None:
+        """Drop an entry from the hot tier (if it is still the cached one)."""
+        with self._lock:
+            if self._hot.get(key) is entry:
+                del self._hot[key]
+            if self._evicting.get(key) is entry:
+                del self._evicting[key]
+
+    def _remember(self, key: Tuple[str, str], entry: _ThreadEntry) -> _ThreadEntry:
+        """Insert an entry into the LRU, returning the entry that ends up cached."""
+        evicted: List[Tuple[Tuple[str, str], _ThreadEntry]] = []
+        with self._lock:
+            existing = self._hot.get(key) or self._evicting.pop(key, None)
+            if existing is not None:
+                # A concurrent load won the race (or the entry is being evicted) - keep it
+                entry = existing
+            self._hot[key] = entry
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.max_threads:
+                old_key, old_entry = self._hot.popitem(last=False)
+                if old_entry.dirty:
+                    self._evicting[old_key] = old_entry
+                    evicted.append((old_key, old_entry))
+
+        for old_key, old_entry in evicted:
+            self._flush_evicted(old_key, old_entry)
+        return entry
+
+    def _flush_evicted(self, key: Tuple[str, str], entry: _ThreadEntry) -> None:
+        """Persist an entry that fell out of the LRU before forgetting it."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._persist_evicted(key, entry)
+            return
+        if entry.flush_task is None or entry.flush_task.done():
+            entry.flush_task = asyncio.create_task(self._flush_when_idle(key, entry, immediate=True))
+
+    def _persist_evicted(self, key: Tuple[str, str], entry: _ThreadEntry) -> None:
+        try:
+            self._persist(key, entry)
+        except Exception as e:
+            logger.error(f"Error persisting evicted checkpoint for thread {key[0]}: {e}")
+        finally:
+            with self._lock:
+                if self._evicting.get(key) is entry and not entry.dirty:
+                    del self._evicting[key]
+
+    def _load_entry(self, key: Tuple[str, str]) -> _ThreadEntry:
+        """Rebuild a thread's latest checkpoint from Firestore (blocking)."""
+        entry = _ThreadEntry()
+        snapshot = self._get_thread_ref(key).get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        # Thread docs written before the delta layout have no checkpoint blob
+        if not data or "checkpoint" not in data:
+            return entry
+
+        checkpoint = self._load(data["checkpoint"])
+        metadata = self._load(data["metadata"]) if data.get("metadata") else {}
+        list_lengths: Dict[str, int] = data.get("list_channels", {})
+        entry.segment_seq = data.get("segment_seq", -1)
+        entry.version = data.get("version", 0)
+        entry.segment_ids = data.get("segment_ids") or [
+            # Heads written before segment ids were recorded used bare sequence numbers
+            f"{seq:08d}" for seq in range(data.get("segment_base", 0), entry.segment_seq + 1)
+        ]
+
+        lists: Dict[str, List[Any]] = {channel: [] for channel in list_lengths}
+        if list_lengths and entry.segment_ids:
+            refs = [self._get_segment_ref(key, segment_id) for segment_id in entry.segment_ids]
+            found = {snap.id: snap.to_dict() for snap in self.db.get_all(refs) if snap.exists}
+            for segment_id in entry.segment_ids:
+                for channel, blob in found.get(segment_id, {}).get("values", {}).items():
+                    if channel in lists:
+                        lists[channel].extend(self._load(blob))
+
+        for channel, length in list_lengths.items():
+            if len(lists[channel]) != length:
+                logger.warning(
+                    f"Checkpoint segments for thread {key[0]} hold {len(lists[channel])} "
+                    f"items of '{channel}', expected {length}"
+                )
+            lists[channel] = lists[channel][:length]
+
+        checkpoint["channel_values"] = {**checkpoint.get("channel_values", {}), **lists}
+        entry.persisted_lists = {channel: list(values) for channel, values in lists.items()}
+
+        thread_id, checkpoint_ns = key
+        parent_id = data.get("parent_checkpoint_id")
+        entry.checkpoint_tuple = CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }},
+            checkpoint=checkpoint,
+            metadata=metadata,
+            parent_config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": parent_id,
+            }} if parent_id else None,
+            pending_writes=[]
+        )
+        logger.debug(f"Loaded checkpoint {checkpoint['id']} for thread {thread_id}")
+        return entry
+
+    def _is_current(self, key: Tuple[str, str], entry: _ThreadEntry) -> bool:
+        """
+        True unless the entry is settled and another instance has since
+        committed a newer checkpoint (blocking, reads only the head version).
         """
-        Get the latest checkpoint for a thread.
+        if entry.dirty or entry.persist_lock.locked():
+            # Our own write is pending; its transaction detects any conflict
+            return True
+        snapshot = self._get_thread_ref(key).get(field_paths=["version"])
+        stored = (snapshot.to_dict() or {}).get("version", 0) if snapshot.exists else 0
+        if stored == entry.version:
+            return True
+        logger.info(f"Checkpoint for thread {key[0]} changed on another instance, reloading")
+        self._forget(key, entry)
+        return False
+
+    def _get_entry(self, key: Tuple[str, str], revalidate: bool = False) -> _ThreadEntry:
+        entry = self._cached_entry(key)
+        if entry is not None and revalidate and not self._is_current(key, entry):
+            entry = None
+        if entry is None:
+            entry = self._remember(key, self._load_entry(key))
+        return entry
+
+    async def _aget_entry(self, key: Tuple[str, str], revalidate: bool = False) -> _ThreadEntry:
+        entry = self._cached_entry(key)
+        if entry is not None and revalidate and not await asyncio.to_thread(self._is_current, key, entry):
+            entry = None
+        if entry is None:
+            entry = self._remember(key, await asyncio.to_thread(self._load_entry, key))
+        return entry
 
-        Args:
-            config: Configuration dict with 'configurable' containing 'thread_id'
+    # ================================================================
+    # Persistence
+    # ================================================================
 
-        Returns:
-            Latest Checkpoint or None if not found
+    def _persist(self, key: Tuple[str, str], entry: _ThreadEntry) -> None:
         """
-        try:
-            thread_id = config.get("configurable", {}).get("thread_id")
-            if not thread_id:
-                return None
-
-            # Get latest checkpoint
-            checkpoints_ref = (
-                self.db.collection(self.collection_name)
-                .document(thread_id)
-                .collection("checkpoints")
-                .order_by("created_at", direction="DESCENDING")
-                .limit(1)
-            )
+        Write the entry's latest checkpoint in one Firestore transaction (blocking).
 
-            docs = list(checkpoints_ref.stream())
-            if not docs:
-                logger.debug(f"No checkpoint found for thread {thread_id}")
-                return None
-
-            doc = docs[0]
-            data = doc.to_dict()
-
-            # Deserialize checkpoint
-            checkpoint = Checkpoint(
-                v=data.get("v", 1),
-                ts=data.get("ts"),
-                channel_values=json.loads(data.get("channel_values", "{}")),
-                channel_versions=json.loads(data.get("channel_versions", "{}")),
-                versions_seen=json.loads(data.get("versions_seen", "{}"))
+        List channels that only grew since the last commit are written as a
+        delta segment; any other change rewrites them into a new base segment.
+        If another instance committed since this entry was loaded, nothing is
+        written and the entry is dropped so the next read reloads the thread.
+        """
+        with entry.persist_lock:
+            if not entry.dirty or entry.checkpoint_tuple is None:
+                return
+            snapshot = entry.checkpoint_tuple
+            entry.dirty = False
+
+            try:
+                checkpoint = snapshot.checkpoint
+                values = checkpoint["channel_values"]
+                lists = {ch: v for ch, v in values.items() if isinstance(v, list)}
+                scalars = {ch: v for ch, v in values.items() if not isinstance(v, list)}
+
+                seq = entry.segment_seq + 1
+                appends_only = set(lists) == set(entry.persisted_lists) and all(
+                    _extends(entry.persisted_lists[ch], v) for ch, v in lists.items()
+                )
+                rebase = not appends_only or len(entry.segment_ids) >= self.max_segments
+
+                if rebase:
+                    segment_values = {ch: v for ch, v in lists.items()}
+                else:
+                    segment_values = {
+                        ch: v[len(entry.persisted_lists[ch]):]
+                        for ch, v in lists.items()
+                        if len(v) > len(entry.persisted_lists[ch])
+                    }
+
+                now = datetime.now(timezone.utc)
+                ttl_timestamp = now + timedelta(days=self.ttl_days)
+                version = entry.version + 1
+                writes: List[Tuple[Any, Optional[Dict[str, Any]]]] = []
+
+                if rebase or segment_values:
+                    # Checkpoint ids are unique, so segment ids never collide across instances
+                    segment_id = f"{seq:08d}-{checkpoint['id']}"
+                    writes.append((self._get_segment_ref(key, segment_id), {
+                        "seq": seq,
+                        "values": {ch: self._dump(v) for ch, v in segment_values.items()},
+                        "created_at": now,
+                        "ttl": ttl_timestamp,
+                    }))
+                    segment_seq = seq
+                    segment_ids = [segment_id] if rebase else [*entry.segment_ids, segment_id]
+                else:
+                    segment_seq = entry.segment_seq
+                    segment_ids = entry.segment_ids
+
+                parent_config = snapshot.parent_config or {}
+                writes.append((self._get_thread_ref(key), {
+                    "thread_id": key[0],
+                    "checkpoint_ns": key[1],
+                    "checkpoint_id": checkpoint["id"],
+                    "parent_checkpoint_id": parent_config.get("configurable", {}).get("checkpoint_id"),
+                    "checkpoint": self._dump({**checkpoint, "channel_values": scalars}),
+                    "metadata": self._dump(snapshot.metadata),
+                    "list_channels": {ch: len(v) for ch, v in lists.items()},
+                    "segment_ids": segment_ids,
+                    "segment_seq": segment_seq,
+                    "version": version,
+                    "updated_at": now,
+                    "ttl": ttl_timestamp,
+                }))
+
+                # Segments superseded by a rebase are garbage
+                if rebase:
+                    writes.extend((self._get_segment_ref(key, old_id), None) for old_id in entry.segment_ids)
+
+                self._commit(key, entry.version, writes)
+            except CheckpointConflictError:
+                logger.warning(
+                    f"Checkpoint {snapshot.checkpoint['id']} for thread {key[0]} lost to a newer "
+                    f"checkpoint from another instance; discarding it"
+                )
+                self._forget(key, entry)
+                return
+            except Exception:
+                entry.dirty = True
+                raise
+
+            entry.persisted_lists = {ch: list(v) for ch, v in lists.items()}
+            entry.segment_ids = segment_ids
+            entry.segment_seq = segment_seq
+            entry.version = version
+            logger.debug(
+                f"Persisted checkpoint {checkpoint['id']} for thread {key[0]} "
+                f"({'rebase' if rebase else 'delta'}, {sum(len(v) for v in segment_values.values())} items)"
             )
 
-            logger.debug(f"Loaded checkpoint {doc.id} for thread {thread_id}")
-            return checkpoint
+    def _commit(
+        self,
+        key: Tuple[str, str],
+        expected_version: int,
+        writes: List[Tuple[Any, Optional[Dict[str, Any]]]]
+    ) -> None:
+        """Apply writes (data None means delete) if the head is still at expected_version."""
+        thread_ref = self._get_thread_ref(key)
+
+        @firestore.transactional
+        def _apply(transaction) -> None:
+            head = thread_ref.get(field_paths=["version"], transaction=transaction)
+            stored = (head.to_dict() or {}).get("version", 0) if head.exists else 0
+            if stored != expected_version:
+                raise CheckpointConflictError(
+                    f"thread {key[0]} is at version {stored}, expected {expected_version}"
+                )
+            for ref, data in writes:
+                if data is None:
+                    transaction.delete(ref)
+                else:
+                    transaction.set(ref, data)
+
+        _apply(self.db.transaction())
 
-        except Exception as e:
-            logger.error(f"Error getting checkpoint: {e}")
+    async def _flush_when_idle(self, key: Tuple[str, str], entry: _ThreadEntry, immediate: bool = False) -> None:
+        """
+        Persist a thread once it has been quiet for flush_delay (bounded by max_flush_delay).
+
+        Failed commits are retried with exponential backoff; after
+        CHECKPOINT_FLUSH_RETRIES the entry stays dirty for the next put or aflush().
+        """
+        failures = 0
+        try:
+            while entry.dirty:
+                if not immediate:
+                    wait = min(
+                        entry.last_put + self.flush_delay,
+                        entry.dirty_since + self.max_flush_delay
+                    ) - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                        continue
+                immediate = False
+                # Checkpoints put while this commit is in flight leave the entry
+                # dirty, so the loop picks them up on its next pass
+                try:
+                    await asyncio.to_thread(self._persist, key, entry)
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    if failures > CHECKPOINT_FLUSH_RETRIES:
+                        logger.error(f"Error saving checkpoint for thread {key[0]}, giving up for now: {e}")
+                        return
+                    backoff = min(self.max_flush_delay, self.flush_delay * 2 ** (failures - 1))
+                    logger.warning(f"Error saving checkpoint for thread {key[0]} (retry in {backoff:.1f}s): {e}")
+                    await asyncio.sleep(backoff)
+        finally:
+            with self._lock:
+                if self._evicting.get(key) is entry and not entry.dirty:
+                    del self._evicting[key]
+
+    async def aflush(self, config: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Persist coalesced checkpoints now.
+
+        Args:
+            config: Flush only this thread (all dirty threads if None)
+        """
+        with self._lock:
+            if config is not None:
+                key = self._key(config)
+                entry = self._hot.get(key) or self._evicting.get(key)
+                targets = [(key, entry)] if entry is not None else []
+            else:
+                targets = list(self._hot.items()) + list(self._evicting.items())
+
+        for key, entry in targets:
+            if entry.dirty:
+                await asyncio.to_thread(self._persist, key, entry)
+            with self._lock:
+                if self._evicting.get(key) is entry and not entry.dirty:
+                    del self._evicting[key]
+
+    def flush(self) -> None:
+        """Persist all coalesced checkpoints (blocking)."""
+        with self._lock:
+            targets = list(self._hot.items()) + list(self._evicting.items())
+        for key, entry in targets:
+            if entry.dirty:
+                self._persist(key, entry)
+
+    # ================================================================
+    # Checkpoint bookkeeping shared by the sync and async APIs
+    # ================================================================
+
+    def _entry_tuple(self, entry: _ThreadEntry, config: Dict[str, Any]) -> Optional[CheckpointTuple]:
+        checkpoint_tuple = entry.checkpoint_tuple
+        if checkpoint_tuple is None:
+            return None
+        # Only the latest checkpoint is kept
+        requested_id = config.get("configurable", {}).get("checkpoint_id")
+        if requested_id and requested_id != checkpoint_tuple.checkpoint["id"]:
             return None
+        return checkpoint_tuple._replace(pending_writes=list(entry.writes.values()))
 
-    def put(
+    def _apply_put(
         self,
+        entry: _ThreadEntry,
+        key: Tuple[str, str],
         config: Dict[str, Any],
         checkpoint: Checkpoint,
-        metadata: Optional[CheckpointMetadata] = None
+        metadata: CheckpointMetadata
     ) -> Dict[str, Any]:
+        thread_id, checkpoint_ns = key
+        parent_id = config.get("configurable", {}).get("checkpoint_id")
+        stored = {
+            **checkpoint,
+            "channel_values": {
+                ch: list(v) if isinstance(v, list) else v
+                for ch, v in checkpoint.get("channel_values", {}).items()
+            },
+        }
+        next_config = {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+        entry.checkpoint_tuple = CheckpointTuple(
+            config=next_config,
+            checkpoint=stored,
+            metadata=get_checkpoint_metadata(config, metadata or {}),
+            parent_config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": parent_id,
+            }} if parent_id else None,
+            pending_writes=[]
+        )
+        entry.writes = {}
+
+        now = time.monotonic()
+        if not entry.dirty:
+            entry.dirty_since = now
+        entry.dirty = True
+        entry.last_put = now
+        return next_config
+
+    @staticmethod
+    def _apply_writes(entry: _ThreadEntry, config: Dict[str, Any], writes: Sequence[Tuple[str, Any]], task_id: str) -> None:
+        checkpoint_tuple = entry.checkpoint_tuple
+        checkpoint_id = config.get("configurable", {}).get("checkpoint_id")
+        if checkpoint_tuple is None or checkpoint_id != checkpoint_tuple.checkpoint["id"]:
+            return
+        for idx, (channel, value) in enumerate(writes):
+            inner_key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+            if inner_key[1] >= 0 and inner_key in entry.writes:
+                continue
+            entry.writes[inner_key] = (task_id, channel, value)
+
+    @staticmethod
+    def _matches(checkpoint_tuple: CheckpointTuple, filter: Optional[Dict[str, Any]], before: Optional[Dict[str, Any]]) -> bool:
+        if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+            return False
+        before_id = (before or {}).get("configurable", {}).get("checkpoint_id")
+        if before_id and checkpoint_tuple.checkpoint["id"] >= before_id:
+            return False
+        return True
+
+    # ================================================================
+    # SYNC METHODS
+    # ================================================================
+
+    def get_tuple(self, config: Dict[str, Any]) -> Optional[CheckpointTuple]:
         """
-        Save a checkpoint.
+        Get the latest checkpoint tuple for a thread.
 
         Args:
             config: Configuration dict with 'configurable' containing 'thread_id'
-            checkpoint: Checkpoint to save (dict in LangGraph v0.2+)
-            metadata: Optional metadata
 
         Returns:
-            Updated config with checkpoint ID
+            CheckpointTuple or None if not found
         """
         try:
-            thread_id = config.get("configurable", {}).get("thread_id")
-            if not thread_id:
-                raise ValueError("thread_id is required in config.configurable")
-
-            # LangGraph v0.2+ passes checkpoint as dict, older versions as object
-            # Handle both formats for compatibility
-            if isinstance(checkpoint, dict):
-                cp_ts = checkpoint.get("ts", "")
-                cp_v = checkpoint.get("v", 1)
-                cp_channel_values = checkpoint.get("channel_values", {})
-                cp_channel_versions = checkpoint.get("channel_versions", {})
-                cp_versions_seen = checkpoint.get("versions_seen", {})
-            else:
-                cp_ts = getattr(checkpoint, "ts", "")
-                cp_v = getattr(checkpoint, "v", 1)
-                cp_channel_values = getattr(checkpoint, "channel_values", {})
-                cp_channel_versions = getattr(checkpoint, "channel_versions", {})
-                cp_versions_seen = getattr(checkpoint, "versions_seen", {})
-
-            # Generate checkpoint ID
-            checkpoint_id = f"cp_{cp_ts}_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
-
-            # Calculate TTL
-            from datetime import timedelta
-            ttl_timestamp = datetime.now(timezone.utc) + timedelta(days=self.ttl_days)
-
-            # Serialize and save
-            doc_ref = self._get_checkpoint_ref(thread_id, checkpoint_id)
-            doc_ref.set({
-                "v": cp_v,
-                "ts": cp_ts,
-                "channel_values": json.dumps(cp_channel_values, default=str),
-                "channel_versions": json.dumps(cp_channel_versions, default=str),
-                "versions_seen": json.dumps(cp_versions_seen, default=str),
-                "created_at": datetime.now(timezone.utc),
-                "ttl": ttl_timestamp,
-                "metadata": metadata if isinstance(metadata, dict) else (metadata.__dict__ if metadata else {})
-            })
-
-            # Update thread metadata
-            thread_ref = self._get_thread_ref(thread_id)
-            thread_ref.set({
-                "latest_checkpoint": checkpoint_id,
-                "updated_at": datetime.now(timezone.utc),
-            }, merge=True)
-
-            logger.debug(f"Saved checkpoint {checkpoint_id} for thread {thread_id}")
-
-            return {
-                **config,
-                "configurable": {
-                    **config.get("configurable", {}),
-                    "checkpoint_id": checkpoint_id
-                }
-            }
-
+            key = self._key(config)
+        except ValueError:
+            return None
+        try:
+            return self._entry_tuple(self._get_entry(key, revalidate=True), config)
         except Exception as e:
-            logger.error(f"Error saving checkpoint: {e}")
-            raise
+            logger.error(f"Error getting checkpoint: {e}")
+            return None
 
     def list(
         self,
-        config: Dict[str, Any],
+        config: Optional[Dict[str, Any]],
         *,
+        filter: Optional[Dict[str, Any]] = None,
         before: Optional[Dict[str, Any]] = None,
         limit: Optional[int] = None
-    ) -> Iterator[Tuple[Checkpoint, CheckpointMetadata]]:
+    ) -> Iterator[CheckpointTuple]:
         """
-        List checkpoints for a thread.
+        List checkpoints for a thread (only the latest is retained).
 
         Args:
             config: Configuration dict with thread_id
+            filter: Metadata fields the checkpoint must match
             before: Optional config to list checkpoints before
             limit: Maximum number to return
 
         Yields:
-            Tuples of (Checkpoint, CheckpointMetadata)
+            CheckpointTuple
         """
-        try:
-            thread_id = config.get("configurable", {}).get("thread_id")
-            if not thread_id:
-                return
+        checkpoint_tuple = self.get_tuple(config) if config else None
+        if checkpoint_tuple and limit != 0 and self._matches(checkpoint_tuple, filter, before):
+            yield checkpoint_tuple
 
-            query = (
-                self.db.collection(self.collection_name)
-                .document(thread_id)
-                .collection("checkpoints")
-                .order_by("created_at", direction="DESCENDING")
-            )
+    def put(
+        self,
+        config: Dict[str, Any],
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Save a checkpoint and persist it immediately (no coalescing without an event loop).
 
-            if limit:
-                query = query.limit(limit)
-
-            for doc in query.stream():
-                data = doc.to_dict()
-                checkpoint = Checkpoint(
-                    v=data.get("v", 1),
-                    ts=data.get("ts"),
-                    channel_values=json.loads(data.get("channel_values", "{}")),
-                    channel_versions=json.loads(data.get("channel_versions", "{}")),
-                    versions_seen=json.loads(data.get("versions_seen", "{}"))
-                )
-                metadata = CheckpointMetadata(**data.get("metadata", {}))
-                yield (checkpoint, metadata)
+        Args:
+            config: Configuration dict with 'configurable' containing 'thread_id'
+            checkpoint: Checkpoint to save
+            metadata: Checkpoint metadata
+            new_versions: Channel version updates (unused, the delta is derived from the values)
 
-        except Exception as e:
-            logger.error(f"Error listing checkpoints: {e}")
-            return
+        Returns:
+            Updated config with checkpoint ID
+        """
+        key = self._key(config)
+        entry = self._get_entry(key)
+        next_config = self._apply_put(entry, key, config, checkpoint, metadata)
+        self._persist(key, entry)
+        return next_config
+
+    def put_writes(
+        self,
+        config: Dict[str, Any],
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        """
+        Store pending writes for the latest checkpoint (in memory only).
+
+        Args:
+            config: Configuration dict with thread_id and checkpoint_id
+            writes: List of (channel_name, value) tuples to write
+            task_id: Identifier for the current task
+            task_path: Path of the task creating the writes
+        """
+        entry = self._cached_entry(self._key(config))
+        if entry is not None:
+            self._apply_writes(entry, config, writes, task_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete a thread's checkpoint and segments."""
+        key = (thread_id, "")
+        with self._lock:
+            self._hot.pop(key, None)
+            self._evicting.pop(key, None)
+        thread_ref = self._get_thread_ref(key)
+        for segment in thread_ref.collection("segments").stream():
+            segment.reference.delete()
+        thread_ref.delete()
 
     # ================================================================
     # ASYNC METHODS (Required by LangGraph ainvoke)
@@ -274,8 +727,8 @@ class FirestoreCheckpointer(BaseCheckpointSaver):
 
     async def aget_tuple(self, config: Dict[str, Any]) -> Optional[CheckpointTuple]:
         """
-        Async version of get() that returns CheckpointTuple.
-        Required by LangGraph's ainvoke().
+        Get the latest checkpoint tuple, served from the hot tier when cached
+        and still at the version Firestore holds.
 
         Args:
             config: Configuration dict with 'configurable' containing 'thread_id'
@@ -283,107 +736,75 @@ class FirestoreCheckpointer(BaseCheckpointSaver):
         Returns:
             CheckpointTuple or None if not found
         """
-        import asyncio
         try:
-            # Run sync get() in thread pool
-            checkpoint = await asyncio.to_thread(self.get, config)
-            if checkpoint is None:
-                return None
-
-            thread_id = config.get("configurable", {}).get("thread_id")
-            checkpoint_id = f"latest_{thread_id}"
-
-            # Return proper CheckpointTuple namedtuple (LangGraph v0.2+ requirement)
-            return CheckpointTuple(
-                config={
-                    "configurable": {
-                        **config.get("configurable", {}),
-                        "checkpoint_id": checkpoint_id
-                    }
-                },
-                checkpoint=checkpoint,
-                metadata=CheckpointMetadata() if not isinstance(checkpoint, dict) else {},
-                parent_config=None,
-                pending_writes=None
-            )
-
+            key = self._key(config)
+        except ValueError:
+            return None
+        try:
+            return self._entry_tuple(await self._aget_entry(key, revalidate=True), config)
         except Exception as e:
             logger.error(f"Error in aget_tuple: {e}")
             return None
 
+    async def alist(
+        self,
+        config: Optional[Dict[str, Any]],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[CheckpointTuple]:
+        """Async version of list()."""
+        checkpoint_tuple = await self.aget_tuple(config) if config else None
+        if checkpoint_tuple and limit != 0 and self._matches(checkpoint_tuple, filter, before):
+            yield checkpoint_tuple
+
     async def aput(
         self,
         config: Dict[str, Any],
         checkpoint: Checkpoint,
-        metadata: Optional[CheckpointMetadata] = None,
-        new_versions: Optional[Dict[str, Any]] = None  # LangGraph v0.2+ compatibility
+        metadata: CheckpointMetadata,
+        new_versions: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        Async version of put().
-        Required by LangGraph's ainvoke().
+        Save a checkpoint to the hot tier and schedule a coalesced Firestore write.
 
         Args:
             config: Configuration dict
             checkpoint: Checkpoint to save
-            metadata: Optional metadata
-            new_versions: Channel version updates (LangGraph v0.2+)
+            metadata: Checkpoint metadata
+            new_versions: Channel version updates (unused, the delta is derived from the values)
 
         Returns:
             Updated config with checkpoint ID
         """
-        import asyncio
-        try:
-            # Run sync put() in thread pool (new_versions not used in Firestore storage)
-            return await asyncio.to_thread(self.put, config, checkpoint, metadata)
-        except Exception as e:
-            logger.error(f"Error in aput: {e}")
-            raise
+        key = self._key(config)
+        entry = await self._aget_entry(key)
+        next_config = self._apply_put(entry, key, config, checkpoint, metadata)
+        if entry.flush_task is None or entry.flush_task.done():
+            entry.flush_task = asyncio.create_task(self._flush_when_idle(key, entry))
+        return next_config
 
     async def aput_writes(
         self,
         config: Dict[str, Any],
-        writes: List[Tuple[str, Any]],
-        task_id: str
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = ""
     ) -> None:
-        """
-        Async method to store pending writes (LangGraph v0.2+ requirement).
-
-        This method is called to persist intermediate channel writes before
-        the checkpoint is finalized. For simplicity, we store these as part
-        of the thread's pending writes document.
-
-        Args:
-            config: Configuration dict with thread_id
-            writes: List of (channel_name, value) tuples to write
-            task_id: Identifier for the current task
-        """
-        import asyncio
-        try:
-            thread_id = config.get("configurable", {}).get("thread_id")
-            if not thread_id:
-                logger.warning("aput_writes called without thread_id, skipping")
-                return
+        """Async version of put_writes()."""
+        self.put_writes(config, writes, task_id, task_path)
 
-            # Store pending writes in a subcollection
-            def _store_writes():
-                writes_ref = (
-                    self.db.collection(self.collection_name)
-                    .document(thread_id)
-                    .collection("pending_writes")
-                    .document(task_id)
-                )
-                writes_ref.set({
-                    "writes": json.dumps([(ch, str(val)) for ch, val in writes], default=str),
-                    "task_id": task_id,
-                    "created_at": datetime.now(timezone.utc)
-                })
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Async version of delete_thread()."""
+        await asyncio.to_thread(self.delete_thread, thread_id)
 
-            await asyncio.to_thread(_store_writes)
-            logger.debug(f"Stored {len(writes)} pending writes for task {task_id}")
 
-        except Exception as e:
-            logger.error(f"Error in aput_writes: {e}")
-            # Don't raise - writes are not critical for basic operation
+def _extends(previous: List[Any], current: List[Any]) -> bool:
+    """True if current is previous with items appended."""
+    if len(current) < len(previous):
+        return False
+    return all(a is b or a == b for a, b in zip(previous, current))
 
 
 def get_firestore_checkpointer(db, collection_name: str = "agent_checkpoints") -> Optional[FirestoreCheckpointer]:
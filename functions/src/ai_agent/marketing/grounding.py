@@ -0,0 +1,219 @@
+"""
+KB Grounding Scorer
+
+Local scoring of how well a response is supported by the retrieved KB
+context, used by MarketingAgent before it escalates to an LLM check.
+
+- Token sets are computed once per retrieved chunk and cached by chunk id
+  (a digest of the chunk text), so repeated KB chunks are never re-tokenised.
+- The local score combines content-word coverage, per-sentence support and
+  a penalty for figures (prices, percentages) that are absent from the context.
+- Only scores in the inconclusive band between GROUNDING_REJECT_SCORE and
+  GROUNDING_ACCEPT_SCORE need the LLM verification round trip.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable, List, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+GROUNDING_CACHE_SIZE = int(os.getenv("GROUNDING_CACHE_SIZE", "1024"))
+# Local scores at or above this are accepted without an LLM check
+GROUNDING_ACCEPT_SCORE = float(os.getenv("GROUNDING_ACCEPT_SCORE", "0.45"))
+# Local scores below this are rejected without an LLM check
+GROUNDING_REJECT_SCORE = float(os.getenv("GROUNDING_REJECT_SCORE", "0.15"))
+
+# Sentences with fewer content words than this make no checkable claim
+MIN_CLAIM_TOKENS = 3
+# A sentence is supported when this fraction of its content words is in context
+SENTENCE_SUPPORT_RATIO = 0.5
+
+# Figures ($1,500 / 30% / 4.5) or words
+_TOKEN_PATTERN = re.compile(r"\$?\d[\d,]*(?:\.\d+)?%?|[a-z][a-z'-]*[a-z]|[a-z]")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+# format_context emits one "[N] Title: text" line per retrieved chunk
+_CHUNK_MARKER = re.compile(r"(?m)^(?=\[\d+\]\s)")
+
+_STOPWORDS = frozenset({
+    "a", "about", "after", "all", "also", "an", "and", "any", "are", "as", "at",
+    "be", "been", "but", "by", "can", "could", "do", "does", "for", "from", "had",
+    "has", "have", "how", "i", "if", "in", "into", "is", "it", "its", "just",
+    "may", "me", "more", "most", "my", "no", "not", "of", "on", "or", "our",
+    "out", "so", "some", "such", "than", "that", "the", "their", "them", "then",
+    "there", "these", "they", "this", "those", "to", "up", "us", "very", "was",
+    "we", "were", "what", "when", "which", "who", "will", "with", "would", "you",
+    "your", "here", "help", "happy", "let", "like", "want", "know", "get",
+})
+
+
+def _is_figure(token: str) -> bool:
+    return token[0].isdigit() or token[0] == "$"
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """Content tokens of ``text`` (lowercased, stopwords removed, figures normalised)"""
+    tokens = set()
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if _is_figure(token):
+            # Bare single digits are mostly list numbering, not claims
+            if len(token) > 1:
+                tokens.add(token.lstrip("$").replace(",", ""))
+        elif token not in _STOPWORDS:
+            tokens.add(token)
+    return frozenset(tokens)
+
+
+def split_chunks(context: str) -> List[str]:
+    """Split a formatted tool result into its retrieved chunks"""
+    return [part.strip() for part in _CHUNK_MARKER.split(context) if part.strip()]
+
+
+def chunk_id(text: str) -> str:
+    """Content-addressed id for a retrieved chunk"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class GroundingResult:
+    """Local grounding assessment of one response"""
+    score: float
+    coverage: float = 0.0
+    sentence_support: float = 0.0
+    unsupported_figures: List[str] = field(default_factory=list)
+    conclusive: bool = True
+
+
+class GroundingScorer:
+    """
+    Cached local grounding scorer
+
+    Usage:
+        scorer = get_grounding_scorer()
+        result = scorer.score(response_text, [tool_message.content, ...])
+        if not result.conclusive:
+            ...  # escalate to LLM verification
+    """
+
+    def __init__(
+        self,
+        max_chunks: int = GROUNDING_CACHE_SIZE,
+        accept_score: float = GROUNDING_ACCEPT_SCORE,
+        reject_score: float = GROUNDING_REJECT_SCORE
+    ):
+        self.max_chunks = max(1, max_chunks)
+        self.accept_score = accept_score
+        self.reject_score = reject_score
+        self._chunks: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def chunk_tokens(self, text: str) -> FrozenSet[str]:
+        """Token set for one retrieved chunk (LRU cached by chunk id)"""
+        key = chunk_id(text)
+        with self._lock:
+            tokens = self._chunks.get(key)
+            if tokens is not None:
+                self._chunks.move_to_end(key)
+                self.stats["hits"] += 1
+                return tokens
+
+        tokens = tokenize(text)
+        with self._lock:
+            self.stats["misses"] += 1
+            self._chunks[key] = tokens
+            self._chunks.move_to_end(key)
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return tokens
+
+    def context_tokens(self, context: Union[str, Iterable[str]]) -> Set[str]:
+        """
+        Union of chunk token sets for the retrieved context
+
+        Args:
+            context: One formatted context string or the individual tool outputs
+        """
+        messages = [context] if isinstance(context, str) else context
+        tokens: Set[str] = set()
+        for message in messages:
+            for chunk in split_chunks(str(message)):
+                tokens |= self.chunk_tokens(chunk)
+        return tokens
+
+    def score(self, response: str, context: Union[str, Iterable[str]]) -> GroundingResult:
+        """
+        Score how well ``response`` is supported by ``context``
+
+        Args:
+            response: Generated response
+            context: Retrieved KB context (string or list of tool outputs)
+
+        Returns:
+            GroundingResult; ``conclusive`` is False when an LLM check should decide
+        """
+        context_tokens = self.context_tokens(context)
+        if not response or not context_tokens:
+            return GroundingResult(score=0.0)
+
+        response_tokens = tokenize(response)
+        if not response_tokens:
+            return GroundingResult(score=1.0)
+
+        coverage = len(response_tokens & context_tokens) / len(response_tokens)
+        unsupported_figures = sorted(
+            token for token in response_tokens
+            if _is_figure(token) and token not in context_tokens
+        )
+
+        claims = 0
+        supported = 0
+        for sentence in _SENTENCE_PATTERN.split(response):
+            sentence_tokens = tokenize(sentence)
+            if len(sentence_tokens) < MIN_CLAIM_TOKENS:
+                continue
+            claims += 1
+            if len(sentence_tokens & context_tokens) / len(sentence_tokens) >= SENTENCE_SUPPORT_RATIO:
+                supported += 1
+
+        if not claims and not unsupported_figures:
+            # Small talk / clarifying question: nothing to ground
+            return GroundingResult(score=1.0, coverage=coverage, sentence_support=1.0)
+
+        sentence_support = supported / claims if claims else coverage
+        score = 0.5 * coverage + 0.5 * sentence_support
+        if unsupported_figures:
+            # Invented prices are the costliest hallucination for this agent
+            score *= 0.5
+
+        # Figures missing from the context are never auto-accepted
+        if score >= self.accept_score and not unsupported_figures:
+            # Same boost the keyword check always applied to high-overlap answers
+            return GroundingResult(
+                score=min(score * 1.5, 1.0),
+                coverage=coverage,
+                sentence_support=sentence_support,
+                unsupported_figures=unsupported_figures
+            )
+        return GroundingResult(
+            score=score,
+            coverage=coverage,
+            sentence_support=sentence_support,
+            unsupported_figures=unsupported_figures,
+            conclusive=score < self.reject_score
+        )
+
+
+_grounding_scorer: Optional[GroundingScorer] = None
+
+
+def get_grounding_scorer() -> GroundingScorer:
+    """Get the process-wide grounding scorer (singleton, shares the chunk cache)"""
+    global _grounding_scorer
+    if _grounding_scorer is None:
+        _grounding_scorer = GroundingScorer()
+    return _grounding_scorer
@@ -4,10 +4,15 @@ Intent Classification Helper for Marketing Agent
 Lightweight intent classification to improve query understanding
 and retrieval targeting. Not a full classifier - just keyword-based
 hints to optimize downstream components.
+
+All keyword lists are compiled into one Aho-Corasick automaton, so a query
+is scanned once regardless of how many keywords there are.
 """
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import logging
 
+from ..common.pattern_matcher import PatternMatcher
+
 logger = logging.getLogger(__name__)
 
 # Intent categories with associated keywords
@@ -79,6 +84,36 @@ HIGH_CONFIDENCE = 0.8
 MEDIUM_CONFIDENCE = 0.5
 LOW_CONFIDENCE = 0.3
 
+# Compiled once at import; shared by every classifier call
+INTENT_MATCHER = PatternMatcher(INTENT_KEYWORDS)
+
+# For greetings require a whole-word match to avoid "HIPAA" matching "hi"
+_WHOLE_WORD_INTENTS = frozenset({"greeting"})
+
+
+def _score_intents(query_lower: str, whole_word_intents: frozenset = frozenset()) -> Dict[str, int]:
+    """
+    Keyword match points per intent from a single scan of the query.
+
+    Each keyword counts once: 2 points for a whole-word hit, 1 for a
+    substring hit. Intents keep the INTENT_KEYWORDS order so ties resolve
+    as before.
+    """
+    points: Dict[Tuple[str, str], int] = {}
+    for match in INTENT_MATCHER.find_all(query_lower):
+        value = 2 if match.whole_word else 1
+        for intent in match.labels:
+            if intent in whole_word_intents and not match.whole_word:
+                continue
+            key = (intent, match.pattern)
+            if value > points.get(key, 0):
+                points[key] = value
+
+    totals: Dict[str, int] = {}
+    for (intent, _), value in points.items():
+        totals[intent] = totals.get(intent, 0) + value
+    return {intent: totals[intent] for intent in INTENT_KEYWORDS if intent in totals}
+
 
 def classify_intent(query: str) -> Tuple[str, float]:
     """
@@ -96,27 +131,11 @@ def classify_intent(query: str) -> Tuple[str, float]:
     query_lower = query.lower().strip()
     query_words = set(query_lower.split())
 
-    # Score each intent category
-    intent_scores = {}
-
-    for intent, keywords in INTENT_KEYWORDS.items():
-        # Count keyword matches
-        matches = 0
-        for keyword in keywords:
-            # For greeting intent, require exact word match to avoid "HIPAA" matching "hi"
-            if intent == "greeting":
-                if keyword in query_words:
-                    matches += 2
-            elif keyword in query_lower:
-                # Boost for exact word match vs substring
-                if keyword in query_words:
-                    matches += 2
-                else:
-                    matches += 1
-
-        if matches > 0:
-            # Normalize score (more matches = higher confidence)
-            intent_scores[intent] = min(matches * 0.3, 1.0)
+    # Score each intent category (normalize: more matches = higher confidence)
+    intent_scores = {
+        intent: min(matches * 0.3, 1.0)
+        for intent, matches in _score_intents(query_lower, _WHOLE_WORD_INTENTS).items()
+    }
 
     if not intent_scores:
         return ("general", LOW_CONFIDENCE)
@@ -149,23 +168,13 @@ def get_intents(query: str, threshold: float = 0.3) -> List[Tuple[str, float]]:
         return [("general", 0.0)]
 
     query_lower = query.lower().strip()
-    query_words = set(query_lower.split())
 
     intent_scores = []
 
-    for intent, keywords in INTENT_KEYWORDS.items():
-        matches = 0
-        for keyword in keywords:
-            if keyword in query_lower:
-                if keyword in query_words:
-                    matches += 2
-                else:
-                    matches += 1
-
-        if matches > 0:
-            score = min(matches * 0.3, 1.0)
-            if score >= threshold:
-                intent_scores.append((intent, score))
+    for intent, matches in _score_intents(query_lower).items():
+        score = min(matches * 0.3, 1.0)
+        if score >= threshold:
+            intent_scores.append((intent, score))
 
     if not intent_scores:
         return [("general", LOW_CONFIDENCE)]
@@ -224,21 +233,9 @@ def is_exit_signal(query: str) -> bool:
     if any(query_lower.startswith(prefix) for prefix in negative_prefixes):
         return False
 
-    # Remove punctuation for better matching
-    query_clean = ''.join(c if c.isalnum() or c.isspace() else ' ' for c in query_lower)
-    query_words = set(query_clean.split())
-
-    # Check for exit_satisfaction intent
-    exit_phrases = INTENT_KEYWORDS.get("exit_satisfaction", [])
-
-    # Single word matches - strong signals
-    single_word_exits = {"cheers", "thanks", "ta", "bye", "goodbye", "legend", "beauty", "perfect", "understood"}
-    if query_words & single_word_exits:
-        return True
-
-    # Multi-word phrase matches
-    for phrase in exit_phrases:
-        if phrase in query_lower or phrase in query_clean:
+    # Exit phrases must match whole words, so "ta" does not fire on "data"
+    for match in INTENT_MATCHER.iter_matches(query_lower):
+        if match.whole_word and "exit_satisfaction" in match.labels:
             return True
 
     # Also check if message starts with common exit patterns
@@ -10,7 +10,7 @@ Performance Optimizations (Week 5):
 """
 import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime, timezone
 
 # ============================================================================
@@ -30,18 +30,26 @@ except ImportError:
 # Import lightweight dependencies immediately
 from ..common.base_agent import BaseAgent, AgentResponse
 from .marketing_retriever import marketing_retriever, RetrievalResult
-from langchain_core.messages import AIMessage, ToolMessage, HumanMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage, HumanMessage
 from .marketing_kb_content import get_kb_documents_by_category, get_kb_documents_by_subcategory
 from ..common.monitoring import AgentMonitoring
+from ..common.stage_timer import stage
 from .config import get_config, MarketingAgentConfig
+from .grounding import get_grounding_scorer
 # Import centralized prompts (single source of truth for system prompt)
-from .prompts.marketing_prompts import get_system_prompt, get_dynamic_policies
+from .prompts.marketing_prompts import (
+    build_prompt_messages, get_prefix_tracker
+)
 # Import error handling utilities (circuit breakers, backoff)
 from .error_handling import get_context_aware_fallback, watsonx_circuit_breaker, kb_circuit_breaker
 # PERF-003 FIX: Import validation module
 from .validation import validate_marketing_response
 
 logger = logging.getLogger(__name__)
+
+# Graph nodes whose model output is streamed to the user:
+# "agent" for create_react_agent, "llm" for the custom StateGraph workflow
+STREAM_MODEL_NODES = ("agent", "llm")
 # Monitoring helper (logs-based metrics; no extra deps)
 _mon = AgentMonitoring(service="marketing-api", environment=os.getenv("ENVIRONMENT", "unknown"))
 
@@ -117,8 +125,9 @@ def get_http_client():
 # ============================================================================
 # PERFORMANCE OPTIMIZATION: System Prompt Caching (Week 5, Task 1.1.1)
 # System prompt is now centralized in prompts/marketing_prompts.py
-# The get_system_prompt() function is imported from there (single source of truth)
-# Dynamic policy injection is handled by get_dynamic_policies() from prompts module
+# build_prompt_messages() keeps the static part (system prompt and few-shot
+# examples) as a byte-identical prefix and appends dynamic policies last, so
+# provider-side prefix caching is not defeated by per-request content
 # ============================================================================
 
 
@@ -142,7 +151,21 @@ class MarketingAgent(BaseAgent):
     - Singleton pattern for agent reuse (Task 1.3.3)
     """
 
-    def __init__(self, db=None, openrouter_api_key: Optional[str] = None, config: Optional[MarketingAgentConfig] = None):
+    def __init__(
+        self,
+        db=None,
+        openrouter_api_key: Optional[str] = None,
+        config: Optional[MarketingAgentConfig] = None,
+        llm: Optional[Any] = None
+    ):
+        """
+        Args:
+            db: Firestore client
+            openrouter_api_key: OpenRouter key (OpenRouter mode only)
+            config: Agent configuration (defaults to get_config())
+            llm: Pre-built chat model, e.g. the evaluation runner's replay model;
+                skips provider initialization
+        """
         super().__init__()
         self.name = "marketing_agent"
         self.db = db
@@ -187,14 +210,14 @@ class MarketingAgent(BaseAgent):
 
         # Get API key (only required for OpenRouter mode)
         self.api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
-        if not self.use_granite and not self.api_key:
+        if llm is None and not self.use_granite and not self.api_key:
             raise ValueError("OPENROUTER_API_KEY is required when USE_GRANITE_LLM is not enabled")
 
         # Check if mock mode
         self.use_mock = os.getenv("OPENROUTER_USE_MOCK", "false").lower() == "true"
 
         # Initialize LLM with config
-        self.llm = self._initialize_llm()
+        self.llm = llm if llm is not None else self._initialize_llm()
 
         # BIZ-001 FIX: Try FirestoreCheckpointer, fallback to MemorySaver
         self.checkpointer = self._initialize_checkpointer()
@@ -202,16 +225,26 @@ class MarketingAgent(BaseAgent):
         # Define tools
         self.tools = self._define_tools()
 
-        # Create agent with cached system prompt
+        # Create agent with a prefix-stable prompt (static prefix + per-request suffix)
         self.agent = self._create_react_agent(
             self.llm,
             self.tools,
-            prompt=get_system_prompt(),  # Use cached system prompt
+            prompt=self._build_prompt,
             checkpointer=self.checkpointer
         )
 
         logger.info(f"Marketing Agent initialized (mock_mode={self.use_mock})")
 
+    def _build_prompt(self, state: Dict[str, Any]) -> List:
+        """
+        Agent prompt callable: static prefix, conversation, then per-request policies.
+
+        Tool schemas are not rendered into the prompt: providers that bind
+        tools natively receive them via the API, and Granite ignores bound
+        tools, so advertising them would invite calls that never execute.
+        """
+        return build_prompt_messages(state["messages"])
+
     def _initialize_checkpointer(self):
         """
         Initialize checkpointer with FirestoreCheckpointer or MemorySaver fallback.
@@ -236,6 +269,22 @@ class MarketingAgent(BaseAgent):
         logger.info("Using MemorySaver (conversations will not persist across restarts)")
         return self._MemorySaver()
 
+    async def _flush_checkpoint(self, config: Dict[str, Any]) -> None:
+        """
+        Persist the final state of the turn.
+
+        FirestoreCheckpointer coalesces the per-step checkpoints of a turn in
+        memory; flushing here writes them once instead of on a timer.
+        """
+        aflush = getattr(self.checkpointer, "aflush", None)
+        if aflush is None:
+            return
+        try:
+            await aflush(config)
+        except Exception as e:
+            # Non-blocking - the checkpointer retries on its next flush
+            logger.warning(f"Checkpoint flush failed (non-blocking): {e}")
+
     def _initialize_llm(self):
         """
         Initialize LLM (IBM Granite 4.0 H-Small or OpenRouter).
@@ -360,16 +409,17 @@ Answer only: Yes or No"""
             logger.warning(f"Lightweight verification failed: {e}")
             return True  # Fail open - don't block on verification errors
 
-    async def _check_hallucination(self, response: str, context: str) -> float:
+    async def _check_hallucination(self, response: str, context: Union[str, List[str]]) -> float:
         """
         Granite Guardian-style hallucination detection.
 
         Returns a grounding score between 0.0 (hallucinated) and 1.0 (grounded).
-        Uses simple keyword overlap + semantic check pattern.
+        Scores locally first (cached per-chunk token sets, sentence support,
+        unsupported figures) and only escalates inconclusive cases to the LLM.
 
         Args:
             response: Generated response to check
-            context: Retrieved KB context
+            context: Retrieved KB context, or the individual tool outputs
 
         Returns:
             Float score 0.0-1.0 indicating grounding level
@@ -377,23 +427,22 @@ Answer only: Yes or No"""
         if not response or not context:
             return 0.0
 
-        # Quick keyword overlap check (fast, no LLM call)
-        response_words = set(response.lower().split())
-        context_words = set(context.lower().split())
-        overlap = len(response_words & context_words)
-        keyword_score = min(overlap / max(len(response_words), 1), 1.0)
-
-        # If keyword overlap is high, likely grounded
-        if keyword_score > 0.3:
-            return min(keyword_score * 1.5, 1.0)  # Boost for high overlap
+        with stage("reflect"):
+            # Local check (fast, no LLM call)
+            result = get_grounding_scorer().score(response, context)
+            if result.conclusive:
+                return result.score
 
-        # For low overlap, use LLM verification
-        try:
-            is_grounded = await self._lightweight_verify(response, context)
-            return 0.8 if is_grounded else 0.2
-        except Exception as e:
-            logger.debug(f"Verification failed: {e}")
-            return 0.5  # Uncertain
+            # Inconclusive: use LLM verification
+            if result.unsupported_figures:
+                logger.info(f"Grounding: figures not in KB context {result.unsupported_figures[:5]}, verifying")
+            try:
+                context_text = context if isinstance(context, str) else "\n\n".join(context)
+                is_grounded = await self._lightweight_verify(response, context_text)
+                return 0.8 if is_grounded else 0.2
+            except Exception as e:
+                logger.debug(f"Verification failed: {e}")
+                return 0.5  # Uncertain
 
     def _define_tools(self) -> List:
         """
@@ -829,6 +878,7 @@ Would you like to schedule a consultation to discuss a custom solution for your
                 )
                 # Record success for circuit breaker
                 watsonx_circuit_breaker._on_success()
+                await self._flush_checkpoint(config)
             except Exception as llm_error:
                 watsonx_circuit_breaker._on_failure()
                 logger.error(f"LLM call failed: {llm_error}")
@@ -889,6 +939,14 @@ Would you like to schedule a consultation to discuss a custom solution for your
                 except Exception as e:
                     logger.error(f"Fallback KB retrieval failed: {e}")
 
+            # ================================================================
+            # KB GROUNDING VALIDATION (FIX: Activate hallucination detection)
+            # Extract KB context from tool messages; the grounding check itself
+            # runs just before the response is finalised
+            # ================================================================
+            kb_chunks = [str(msg.content) for msg in messages if isinstance(msg, ToolMessage)]
+            kb_context = "".join(chunk + "\n\n" for chunk in kb_chunks)
+
             # Extract follow-up questions from response
             follow_up_questions = self._extract_follow_up_questions(response_text)
 
@@ -929,60 +987,6 @@ Would you like to schedule a consultation to discuss a custom solution for your
                 follow_up_questions = follow_up_questions[:2]
                 logger.info(f"Extracted {len(follow_up_questions)} follow-up questions from LLM response")
 
-            # ================================================================
-            # KB GROUNDING VALIDATION (FIX: Activate hallucination detection)
-            # Extract KB context from tool messages and validate grounding
-            # ================================================================
-            kb_context = ""
-            for msg in messages:
-                if isinstance(msg, ToolMessage):
-                    kb_context += msg.content + "\n\n"
-
-            # Initialize grounding score for monitoring
-            grounding_score = 1.0  # Default: assume grounded if no KB context to check
-
-            # Check KB grounding if we have substantial context
-            if kb_context and len(kb_context.strip()) > 50:
-                try:
-                    grounding_score = await self._check_hallucination(response_text, kb_context)
-                    logger.info(f"✓ KB grounding score: {grounding_score:.2f}")
-
-                    # If grounding is low, retrieve KB content directly and reformulate
-                    # BIZ-004 FIX: Use config threshold instead of hardcoded 0.6
-                    if grounding_score < self.config.grounding_threshold:
-                        logger.warning(
-                            f"⚠️ Response failed KB grounding check (score: {grounding_score:.2f}), "
-                            f"retrieving KB content directly for query: '{message[:50]}...'"
-                        )
-                        # Fallback: retrieve KB content and provide grounded response
-                        try:
-                            retrieval_results = await marketing_retriever.retrieve(
-                                query=message,
-                                top_k=5,
-                                category_filter=None,
-                                use_hybrid=True
-                            )
-                            if retrieval_results:
-                                kb_text = marketing_retriever.format_context(retrieval_results, max_tokens=1500)
-                                response_text = f"""Based on our knowledge base:
-
-{kb_text}
-
-For more specific information, I'd recommend visiting our contact page at /contact or scheduling a consultation with our team."""
-                                logger.info("✓ KB fallback retrieval successful, response reformulated from KB")
-                                grounding_score = 1.0  # Mark as grounded since we used direct KB content
-
-                                # Re-clean the response after reformulation
-                                clean_response = response_text.strip()
-                        except Exception as fallback_error:
-                            logger.error(f"KB fallback retrieval failed: {fallback_error}")
-                            # Keep original response but log the issue
-                except Exception as grounding_error:
-                    logger.warning(f"KB grounding check failed (non-blocking): {grounding_error}")
-                    grounding_score = 0.5  # Uncertain
-            # ================================================================
-
-
             # ================================================================
             # PERF-001 FIX: Extract sources from tool messages instead of redundant KB call
             # The tool already retrieved KB content - reuse it for source citations
@@ -1062,6 +1066,51 @@ For more specific information, I'd recommend visiting our contact page at /conta
             except Exception as metrics_error:
                 logger.warning(f"RAG metrics logging failed (non-blocking): {metrics_error}")
 
+            # Initialize grounding score for monitoring
+            grounding_score = 1.0  # Default: assume grounded if no KB context to check
+
+            # Validate response against KB context. The local scorer is CPU-bound
+            # and only an inconclusive result awaits the LLM, so it runs inline
+            if kb_context and len(kb_context.strip()) > 50:
+                try:
+                    grounding_score = await self._check_hallucination(response_text, kb_chunks)
+                    logger.info(f"✓ KB grounding score: {grounding_score:.2f}")
+
+                    # If grounding is low, retrieve KB content directly and reformulate
+                    # BIZ-004 FIX: Use config threshold instead of hardcoded 0.6
+                    if grounding_score < self.config.grounding_threshold:
+                        logger.warning(
+                            f"⚠️ Response failed KB grounding check (score: {grounding_score:.2f}), "
+                            f"retrieving KB content directly for query: '{message[:50]}...'"
+                        )
+                        # Fallback: retrieve KB content and provide grounded response
+                        try:
+                            retrieval_results = await marketing_retriever.retrieve(
+                                query=message,
+                                top_k=5,
+                                category_filter=None,
+                                use_hybrid=True
+                            )
+                            if retrieval_results:
+                                kb_text = marketing_retriever.format_context(retrieval_results, max_tokens=1500)
+                                response_text = f"""Based on our knowledge base:
+
+{kb_text}
+
+For more specific information, I'd recommend visiting our contact page at /contact or scheduling a consultation with our team."""
+                                logger.info("✓ KB fallback retrieval successful, response reformulated from KB")
+                                grounding_score = 1.0  # Mark as grounded since we used direct KB content
+
+                                # Re-clean the response after reformulation
+                                clean_response = response_text.strip()
+                        except Exception as fallback_error:
+                            logger.error(f"KB fallback retrieval failed: {fallback_error}")
+                            # Keep original response but log the issue
+                except Exception as grounding_error:
+                    logger.warning(f"KB grounding check failed (non-blocking): {grounding_error}")
+                    grounding_score = 0.5  # Uncertain
+            # ================================================================
+
             # FIX #1: Clean sources to remove scores before user sees them
             clean_sources = self._clean_sources(sources) if sources else []
 
@@ -1101,7 +1150,8 @@ For more specific information, I'd recommend visiting our contact page at /conta
                     "response_length": len(clean_response.split()),  # Word count for monitoring
                     "token_usage": token_usage,
                     "estimated_cost_usd": estimated_cost_usd,
-                    "tool_calls": tool_calls_count
+                    "tool_calls": tool_calls_count,
+                    "prompt_prefix": get_prefix_tracker().stats()["current_fingerprint"]
                 }
             }
 
@@ -1147,7 +1197,8 @@ For more specific information, I'd recommend visiting our contact page at /conta
                     "response_words": len(clean_response.split()),
                     "sources_count": len(sources),
                     "tool_calls": tool_calls_count,
-                    "total_tokens": token_usage.get("total_tokens", 0) if token_usage else 0
+                    "total_tokens": token_usage.get("total_tokens", 0) if token_usage else 0,
+                    "prompt_prefix_stability": get_prefix_tracker().stats()["prefix_stability"]
                 })
             except Exception as e:
                 # Monitoring must not break user flow
@@ -1171,14 +1222,20 @@ For more specific information, I'd recommend visiting our contact page at /conta
         context: Optional[Dict[str, Any]] = None
     ):
         """
-        Stream chat responses from the marketing agent.
+        Stream chat responses from the marketing agent token by token.
+
+        Uses LangGraph's "messages" stream mode so AIMessageChunks from the
+        model node are yielded as the LLM produces them. Tool-call turns and
+        ToolMessages are never yielded. Once the answer is complete, the KB
+        grounding check from chat() runs post-hoc and a final chunk carries
+        its score.
 
         Args:
             message: User message
             context: Optional context dict
 
         Yields:
-            Chunks of the response
+            {"content": str} chunks, then a final {"content": "", "grounding_score": float}
         """
         try:
             # Extract context
@@ -1187,34 +1244,90 @@ For more specific information, I'd recommend visiting our contact page at /conta
             # Configure checkpointing
             config = {"configurable": {"thread_id": conversation_id}}
 
-            # Stream agent responses
-            # Use "updates" mode to ensure we get the final response after tool execution
-            # Note: Watsonx API returns full response in one chunk (no token-streaming),
-            # so responses will arrive as single chunks. This is a Watsonx limitation.
-            async for update in self.agent.astream(
+            streamed_ids = set()
+            response_parts: List[str] = []
+            kb_chunks: List[str] = []
+            grounding_scorer = get_grounding_scorer()
+
+            async for msg, metadata in self.agent.astream(
                 {"messages": [("user", message)]},
                 config,
-                stream_mode="updates"
+                stream_mode="messages"
             ):
-                # Extract content from state updates
-                # Update format: {'node_name': {'messages': [...]}}
-                for node_update in update.values():
-                    if isinstance(node_update, dict) and "messages" in node_update:
-                        messages = node_update["messages"]
-                        if not isinstance(messages, list):
-                            messages = [messages]
-
-                        for msg in messages:
-                            # FIX #4 (CRITICAL): Only yield AI messages, NOT ToolMessages
-                            # This prevents raw RAG context (with markers/scores) from leaking to users
-                            if isinstance(msg, AIMessage) and hasattr(msg, 'content') and msg.content:
-                                # Check if it's a tool call (which might have empty content but tool_calls)
-                                if not (hasattr(msg, 'tool_calls') and msg.tool_calls and not msg.content):
-                                    yield {"content": msg.content}
+                # FIX #4 (CRITICAL): Never yield ToolMessages - raw RAG context
+                # (with markers/scores) must not leak to users. Keep it for grounding.
+                if isinstance(msg, ToolMessage):
+                    kb_chunks.append(str(msg.content))
+                    # Tokenise the retrieved chunks now, while the model is still
+                    # generating, so the post-hoc check only scores the answer
+                    grounding_scorer.context_tokens(kb_chunks[-1])
+                    continue
+
+                # Only the model node produces user-facing text
+                if metadata.get("langgraph_node") not in STREAM_MODEL_NODES:
+                    continue
+
+                text = self._stream_text(msg, streamed_ids)
+                if text:
+                    response_parts.append(text)
+                    yield {"content": text}
+
+            await self._flush_checkpoint(config)
+
+            # Post-hoc reflection: same grounding check as chat(), run once the
+            # full answer has been streamed so it never delays the first token
+            grounding_score = 1.0
+            response_text = "".join(response_parts)
+            if sum(len(chunk.strip()) for chunk in kb_chunks) > 50:
+                try:
+                    grounding_score = await self._check_hallucination(response_text, kb_chunks)
+                    if grounding_score < self.config.grounding_threshold:
+                        logger.warning(
+                            f"⚠️ Streamed response failed KB grounding check (score: {grounding_score:.2f}) "
+                            f"for query: '{message[:50]}...'"
+                        )
+                except Exception as grounding_error:
+                    logger.warning(f"KB grounding check failed (non-blocking): {grounding_error}")
+                    grounding_score = 0.5  # Uncertain
+
+            yield {"content": "", "grounding_score": grounding_score}
 
         except Exception as e:
             logger.error(f"Error in marketing agent stream: {e}")
             raise
+
+    @staticmethod
+    def _stream_text(msg: Any, streamed_ids: set) -> Optional[str]:
+        """
+        Extract user-facing text from a message emitted in "messages" stream mode.
+
+        Args:
+            msg: AIMessageChunk (token) or AIMessage (non-streaming model / node output)
+            streamed_ids: Ids of messages already delivered as chunks (updated in place)
+
+        Returns:
+            Text to yield, or None if the message is a tool-call turn or already streamed
+        """
+        if not isinstance(msg, AIMessage):
+            return None
+        # Tool-call turns are internal reasoning, not part of the answer
+        if msg.tool_calls or getattr(msg, "tool_call_chunks", None):
+            return None
+        if isinstance(msg, AIMessageChunk):
+            streamed_ids.add(msg.id)
+        elif msg.id in streamed_ids:
+            # Final message for a response already delivered token by token
+            return None
+
+        content = msg.content
+        if isinstance(content, list):
+            content = "".join(
+                part.get("text", "") if isinstance(part, dict) else str(part)
+                for part in content
+            )
+        return content or None
+
+
 _marketing_agent_instance = None
 
 def get_marketing_agent(db=None, openrouter_api_key: Optional[str] = None) -> MarketingAgent:
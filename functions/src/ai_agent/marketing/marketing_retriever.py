@@ -2,13 +2,17 @@
 Marketing Knowledge Base Retriever
 Implements hybrid search (semantic + BM25) for marketing content
 """
+import asyncio
 import logging
 import os
+import re
 from typing import Any, Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
 
 from .kb_indexer import marketing_kb_indexer
 from .rag_quality_metrics import RAGQualityMetrics  # Phase 3
+from .retrieval_budget import RetrievalBudget
+from ..common.stage_timer import stage
 from src.rag.hybrid_search_engine import hybrid_search_engine, SearchType
 from src.rag.bm25_search_engine import bm25_search_engine
 from src.rag.embedding_service import embedding_service
@@ -70,8 +74,23 @@ class MarketingRetriever:
         # Initialize RAG Quality Metrics (Phase 3)
         self.quality_metrics = RAGQualityMetrics(db=db)
 
+        # Per-query fetch_k / rerank / BM25 decisions under load
+        self.budget = RetrievalBudget()
+
         logger.info("Marketing Retriever initialized")
 
+    def reset_after_fork(self):
+        """
+        Re-create per-worker mutable state in a forked child.
+
+        The CrossEncoder weights loaded by a preloading parent are kept (shared
+        copy-on-write); the result cache and rerank budget are per process.
+        quality_metrics resolves the telemetry sink on each write, so it picks
+        up the worker's sink after reset_telemetry_sink_after_fork.
+        """
+        self._cache = TTLCache(maxsize=100, ttl=3600)
+        self.budget = RetrievalBudget()
+
     def prewarm_models(self) -> bool:
         """
         PERF-002 FIX: Pre-warm heavy models at startup to avoid cold start latency.
@@ -106,17 +125,18 @@ class MarketingRetriever:
             return False
 
     def _get_cross_encoder(self) -> Optional[Any]:
-        """Lazy load CrossEncoder model"""
+        """Lazy load CrossEncoder model (or return an injected reranker)"""
+        if self._cross_encoder is not None:
+            return self._cross_encoder
         if not SENTENCE_TRANSFORMERS_AVAILABLE:
             return None
 
-        if self._cross_encoder is None:
-            try:
-                logger.info("Loading CrossEncoder model for re-ranking...")
-                self._cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-            except Exception as e:
-                logger.error(f"Failed to load CrossEncoder: {e}")
-                return None
+        try:
+            logger.info("Loading CrossEncoder model for re-ranking...")
+            self._cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+        except Exception as e:
+            logger.error(f"Failed to load CrossEncoder: {e}")
+            return None
         return self._cross_encoder
 
     def _get_cache_key(self, query: str, top_k: int, category_filter: Optional[str]) -> str:
@@ -170,31 +190,44 @@ class MarketingRetriever:
         if top_k is None:
             top_k = self._get_adaptive_top_k(query)
 
-        logger.info(f"Retrieving marketing content for query: '{query[:50]}...' (top_k={top_k})")
+        # Retrieval budget: intent, cache warmth and rerank queue depth decide the work
+        plan = self.budget.plan(
+            query,
+            top_k,
+            use_hybrid=use_hybrid,
+            reranker_available=SENTENCE_TRANSFORMERS_AVAILABLE or self._cross_encoder is not None,
+            reranker_loaded=self._cross_encoder is not None
+        )
+        logger.info(f"Retrieval plan for '{query[:50]}...': {plan.describe()}")
+        if plan.skip:
+            return []
 
         # 1. Check Cache (Rec #9) - Using TTLCache (zero cost)
         cache_key = self._get_cache_key(query, top_k, category_filter)
-        if cache_key in self._cache:
+        cached = self._cache.get(cache_key)
+        self.budget.record_cache_lookup(cached is not None)
+        if cached is not None:
             logger.info("Cache HIT for query")
-            return self._cache[cache_key]
+            return cached
 
-        # 2. Retrieve Candidates (Fetch more for re-ranking)
-        # If re-ranking is enabled, fetch 3x candidates to re-rank
-        fetch_k = top_k * 3 if SENTENCE_TRANSFORMERS_AVAILABLE else top_k
-
-        if use_hybrid:
-            results = await self._hybrid_search(query, fetch_k, category_filter)
-        else:
-            results = await self._semantic_search(query, fetch_k, category_filter)
+        # 2. Retrieve Candidates (fetch_k > top_k only when re-ranking)
+        with stage("retrieve"):
+            if plan.use_bm25:
+                results = await self._hybrid_search(query, plan.fetch_k, category_filter)
+            else:
+                results = await self._semantic_search(query, plan.fetch_k, category_filter)
 
         # 3. Re-rank Results (Rec #7)
-        cross_encoder = self._get_cross_encoder()
+        cross_encoder = self._get_cross_encoder() if plan.rerank else None
         if cross_encoder and len(results) > 0:
             try:
                 logger.info(f"Re-ranking {len(results)} results...")
                 # Prepare pairs for cross-encoder
                 pairs = [[query, r.text] for r in results]
-                scores = cross_encoder.predict(pairs)
+                # Bounded slots in a worker thread; waiting requests count as queue depth
+                with stage("rerank"):
+                    async with self.budget.rerank_slot():
+                        scores = await asyncio.to_thread(cross_encoder.predict, pairs)
 
                 # Update scores and sort
                 for i, result in enumerate(results):
@@ -215,7 +248,8 @@ class MarketingRetriever:
         logger.info(f"Retrieved {len(results)} results")
 
         # 4. Update Cache (Rec #9) - TTLCache auto-expires after 1 hour
-        if results:
+        # Degraded plans are not cached so load spikes don't pin lower-quality rankings
+        if results and plan.reason not in ("degraded", "cold_reranker"):
             self._cache[cache_key] = results
             logger.debug(f"Cached {len(results)} results (cache size: {len(self._cache)})")
 
@@ -8,6 +8,8 @@ import math
 from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timezone
 
+from ..common.telemetry import TelemetrySink, get_telemetry_sink
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,14 +22,21 @@ class RAGQualityMetrics:
     - NDCG (Normalized Discounted Cumulative Gain): Quality-weighted ranking
     """
 
-    def __init__(self, db: Any = None):
+    def __init__(self, db: Any = None, sink: Optional[TelemetrySink] = None):
         """
         Initialize metrics calculator.
 
         Args:
             db: Firestore client for persistence
+            sink: Telemetry sink for off-request-path writes (shared sink if None)
         """
         self.db = db
+        self._sink = sink
+
+    @property
+    def sink(self) -> TelemetrySink:
+        # Looked up per use so a forked worker gets its own sink, not the parent's
+        return self._sink or get_telemetry_sink()
 
     def calculate_mrr(
         self,
@@ -127,6 +136,9 @@ class RAGQualityMetrics:
         """
         Log retrieval quality metrics to Firestore.
 
+        The record is queued on the telemetry sink; the returned id is
+        allocated locally, so this never waits on Firestore.
+
         Args:
             query: Search query
             results: Retrieval results
@@ -176,16 +188,13 @@ class RAGQualityMetrics:
                 "labeled": relevance_labels is not None
             }
 
-            # Store in Firestore (sync call wrapped for async context)
-            import asyncio
-            doc_ref = await asyncio.to_thread(
-                self.db.collection("retrieval_quality").add,
-                quality_record
-            )
+            # Auto-ID is generated client-side, no round trip
+            doc_id = self.db.collection("retrieval_quality").document().id
+            self.sink.write(self.db, "retrieval_quality", quality_record, doc_id=doc_id)
             logger.info(f"Logged retrieval quality: MRR={mrr}, NDCG@5={ndcg}")
 
             return {
-                "id": doc_ref[1].id,
+                "id": doc_id,
                 "mrr": mrr,
                 "ndcg_at_5": ndcg
             }
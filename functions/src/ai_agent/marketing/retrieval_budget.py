@@ -0,0 +1,215 @@
+"""
+Retrieval Budget Controller
+
+Chooses a per-query retrieval plan for MarketingRetriever instead of always
+fetching 3x candidates and cross-encoding all of them.
+
+Inputs:
+- Intent (classify_intent plus whole-word intent hits): queries made up
+  entirely of greetings, exit signals and confirmations skip retrieval;
+  keyword-heavy intents (pricing, technical, ...) keep BM25.
+- Cache warmth: recent retrieval cache hit ratio and whether the CrossEncoder
+  is loaded. A cold cache means a miss storm, so load limits tighten.
+- Rerank queue depth: reranks waiting or running. Under load, simple queries
+  skip the rerank (and BM25) instead of queueing behind full reranks.
+"""
+import asyncio
+import logging
+import os
+import re
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from .intent_classifier import INTENT_MATCHER, classify_intent
+
+logger = logging.getLogger(__name__)
+
+# Reranks allowed to run concurrently (CrossEncoder runs in a worker thread)
+RERANK_CONCURRENCY = int(os.getenv("RETRIEVAL_RERANK_CONCURRENCY", "2"))
+# Queue depth (waiting + running reranks) at which simple queries degrade
+RERANK_QUEUE_HIGH = int(os.getenv("RETRIEVAL_RERANK_QUEUE_HIGH", "2"))
+# Candidates fetched per result when reranking (normal / under load)
+RERANK_FETCH_MULTIPLIER = 3
+RERANK_FETCH_MULTIPLIER_LOADED = 2
+# Queries up to this many words are "simple"
+SIMPLE_QUERY_WORDS = 8
+# Recent cache lookups used to estimate warmth; below COLD_CACHE_HIT_RATIO is cold
+CACHE_WARMTH_WINDOW = 50
+COLD_CACHE_HIT_RATIO = 0.1
+
+# Small talk: nothing in the KB to retrieve
+SKIP_INTENTS = frozenset({"greeting", "exit_satisfaction", "confirmation"})
+# Words allowed around small-talk phrases ("hi there", "thanks so much")
+SMALL_TALK_FILLERS = frozenset({"there", "so", "much", "very", "again", "mate", "all", "everyone", "guys", "please"})
+_WORD_PATTERN = re.compile(r"\w+(?:'\w+)*")
+# Intents whose queries hinge on exact terms (prices, acronyms, product names)
+KEYWORD_INTENTS = frozenset({"pricing", "technical", "comparison", "prompt_library"})
+
+
+@dataclass
+class RetrievalPlan:
+    """How much retrieval work to spend on one query"""
+    intent: str
+    top_k: int
+    fetch_k: int
+    rerank: bool
+    use_bm25: bool
+    skip: bool = False
+    reason: str = "full"
+
+    def describe(self) -> str:
+        if self.skip:
+            return f"skip (intent={self.intent})"
+        return (
+            f"{self.reason} (intent={self.intent}, top_k={self.top_k}, fetch_k={self.fetch_k}, "
+            f"rerank={self.rerank}, bm25={self.use_bm25})"
+        )
+
+
+class RetrievalBudget:
+    """
+    Latency-aware retrieval planner shared by all retrieve() calls.
+
+    Usage:
+        plan = budget.plan(query, top_k, reranker_available=True, reranker_loaded=True)
+        if plan.rerank:
+            async with budget.rerank_slot():
+                ...
+    """
+
+    def __init__(
+        self,
+        rerank_concurrency: int = RERANK_CONCURRENCY,
+        rerank_queue_high: int = RERANK_QUEUE_HIGH,
+        warmth_window: int = CACHE_WARMTH_WINDOW
+    ):
+        self.rerank_concurrency = max(1, rerank_concurrency)
+        self.rerank_queue_high = max(1, rerank_queue_high)
+        self._rerank_semaphore: Optional[asyncio.Semaphore] = None
+        self._rerank_pending = 0
+        self._cache_lookups: deque = deque(maxlen=warmth_window)
+        self.stats = {"skip": 0, "full": 0, "degraded": 0, "cold_reranker": 0, "no_reranker": 0}
+
+    @property
+    def rerank_queue_depth(self) -> int:
+        """Reranks currently waiting for or holding a slot"""
+        return self._rerank_pending
+
+    def record_cache_lookup(self, hit: bool):
+        self._cache_lookups.append(hit)
+
+    @property
+    def cache_hit_ratio(self) -> Optional[float]:
+        """Recent retrieval cache hit ratio (None until the window has filled)"""
+        if len(self._cache_lookups) < self._cache_lookups.maxlen:
+            return None
+        return sum(self._cache_lookups) / len(self._cache_lookups)
+
+    def _queue_limit(self) -> int:
+        hit_ratio = self.cache_hit_ratio
+        if hit_ratio is not None and hit_ratio < COLD_CACHE_HIT_RATIO:
+            # Cold cache: nearly every query pays a full retrieval, degrade earlier
+            return max(1, self.rerank_queue_high - 1)
+        return self.rerank_queue_high
+
+    def plan(
+        self,
+        query: str,
+        top_k: int,
+        use_hybrid: bool = True,
+        reranker_available: bool = True,
+        reranker_loaded: bool = True
+    ) -> RetrievalPlan:
+        """
+        Choose fetch_k, rerank and BM25 for ``query``.
+
+        Args:
+            query: User query
+            top_k: Results to return
+            use_hybrid: Caller allows BM25 (hybrid search)
+            reranker_available: A CrossEncoder can be used at all
+            reranker_loaded: The CrossEncoder is already in memory
+
+        Returns:
+            RetrievalPlan
+        """
+        intent, _ = classify_intent(query)
+        # Whole words only, so "know" is not a "no" and "this" is not a "hi"
+        detected = INTENT_MATCHER.labels(query.lower(), whole_word=True)
+        if detected and detected <= SKIP_INTENTS and self._is_small_talk(query):
+            self.stats["skip"] += 1
+            return RetrievalPlan(intent=intent, top_k=0, fetch_k=0, rerank=False, use_bm25=False, skip=True,
+                                 reason="skip")
+
+        simple = len(query.split()) <= SIMPLE_QUERY_WORDS
+        under_load = self.rerank_queue_depth >= self._queue_limit()
+        keyword_query = bool(detected & KEYWORD_INTENTS)
+
+        if not reranker_available:
+            reason, rerank, multiplier = "no_reranker", False, 1
+        elif simple and under_load:
+            # Serve first-stage ranking rather than queue behind full reranks
+            reason, rerank, multiplier = "degraded", False, 1
+        elif simple and not reranker_loaded:
+            # Don't make a simple query pay the CrossEncoder load
+            reason, rerank, multiplier = "cold_reranker", False, 1
+        elif under_load:
+            reason, rerank, multiplier = "degraded", True, RERANK_FETCH_MULTIPLIER_LOADED
+        else:
+            reason, rerank, multiplier = "full", True, RERANK_FETCH_MULTIPLIER
+
+        # BM25 earns its cost on exact-term queries; conversational ones go semantic-only under load
+        use_bm25 = use_hybrid and (keyword_query or not under_load)
+
+        self.stats[reason] += 1
+        return RetrievalPlan(
+            intent=intent,
+            top_k=top_k,
+            fetch_k=top_k * multiplier,
+            rerank=rerank,
+            use_bm25=use_bm25,
+            reason=reason
+        )
+
+    @staticmethod
+    def _is_small_talk(query: str) -> bool:
+        """
+        Every word of a short query is part of a small-talk match (or a filler)
+
+        "thanks, got it" is small talk; "sure, walk me through setup" also hits
+        only small-talk keywords but still needs the KB.
+        """
+        text = query.lower()
+        words = [(m.start(), m.end(), m.group()) for m in _WORD_PATTERN.finditer(text)]
+        if not words or len(words) > SIMPLE_QUERY_WORDS:
+            return False
+        covered = [
+            (match.start, match.end)
+            for match in INTENT_MATCHER.iter_matches(text)
+            if match.whole_word and SKIP_INTENTS.intersection(match.labels)
+        ]
+        return all(
+            word in SMALL_TALK_FILLERS or any(start <= ws and we <= end for start, end in covered)
+            for ws, we, word in words
+        )
+
+    @asynccontextmanager
+    async def rerank_slot(self):
+        """Hold one of the rerank slots; waiting callers count towards queue depth"""
+        if self._rerank_semaphore is None:
+            self._rerank_semaphore = asyncio.Semaphore(self.rerank_concurrency)
+        self._rerank_pending += 1
+        try:
+            async with self._rerank_semaphore:
+                yield
+        finally:
+            self._rerank_pending -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "rerank_queue_depth": self.rerank_queue_depth,
+            "cache_hit_ratio": self.cache_hit_ratio,
+        }
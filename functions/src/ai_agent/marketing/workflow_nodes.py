@@ -6,19 +6,22 @@ Individual node functions for StateGraph workflow
 import logging
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from langchain_core.messages import AIMessage, ToolMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from .agent_state import MarketingAgentState
 from .config import MarketingAgentConfig
+from ..common.pattern_matcher import get_matcher
 
 logger = logging.getLogger(__name__)
 
 
-async def llm_node(state: MarketingAgentState, llm: Any = None) -> Dict[str, Any]:
+async def llm_node(state: MarketingAgentState, llm: Any = None, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
     """
     LLM reasoning node - generates response or requests tool calls
 
     Args:
         state: Current agent state
         llm: Injected LLM instance
+        config: Runnable config from LangGraph (carries the stream callbacks)
 
     Returns:
         State updates with new messages and next action
@@ -27,8 +30,9 @@ async def llm_node(state: MarketingAgentState, llm: Any = None) -> Dict[str, Any
         raise ValueError("LLM instance not provided to llm_node")
 
     # Invoke LLM with conversation history
+    # Passing config through lets stream_mode="messages" see tokens from this node
     messages = state["messages"]
-    response = await llm.ainvoke(messages)
+    response = await llm.ainvoke(messages, config)
 
     # Check if LLM requested tool calls
     if hasattr(response, 'tool_calls') and response.tool_calls:
@@ -203,13 +207,32 @@ async def reflection_node(state: MarketingAgentState, llm: Any = None, config: O
     if len(response_text) > config.max_response_length:
         issues.append(f"Response too long (max: {config.max_response_length} chars) - should be concise (<3 paragraphs)")
 
+    # Checks 4, 6 and 7 share one scan of the response over every config term
+    policy_matcher = get_matcher({
+        "hallucination": config.hallucination_terms,
+        "forbidden": config.forbidden_words,
+        "pricing": config.pricing_keywords,
+        "cta": config.cta_keywords,
+    })
+    response_hits: Dict[str, List[str]] = {}
+    for match in policy_matcher.find_all(response_text):
+        # Hits must start on a word boundary: "plans" counts, "explanation" does not
+        if not match.word_start:
+            continue
+        for label in match.labels:
+            hits = response_hits.setdefault(label, [])
+            if match.pattern not in hits:
+                hits.append(match.pattern)
+
     # Check 4: No obvious hallucinations
     # Look for references to old content that was removed
     tools_output_str = str(state.get("tools_output", [])).lower()
 
-    for term in config.hallucination_terms:
-        if term in response_text.lower() and term not in tools_output_str:
-            issues.append(f"Possible hallucination: mentioned '{term}' not in retrieved content")
+    if "hallucination" in response_hits:
+        retrieved_terms = {m.pattern for m in policy_matcher.find_all(tools_output_str)}
+        for term in response_hits["hallucination"]:
+            if term not in retrieved_terms:
+                issues.append(f"Possible hallucination: mentioned '{term}' not in retrieved content")
 
     # Check 5: Advanced Hallucination Detection (Prices)
     import re
@@ -221,15 +244,13 @@ async def reflection_node(state: MarketingAgentState, llm: Any = None, config: O
                  issues.append(f"Potential hallucination: Price '{price}' not found in retrieved content")
 
     # Check 6: Brand Voice (Forbidden words)
-    for word in config.forbidden_words:
-        if word in response_text.lower():
-             issues.append(f"Brand voice violation: Avoid using '{word}'")
+    for word in response_hits.get("forbidden", []):
+        issues.append(f"Brand voice violation: Avoid using '{word}'")
 
     # Check 7: Completeness (Call to Action)
     # If discussing pricing or services, should suggest consultation
-    if any(k in response_text.lower() for k in config.pricing_keywords):
-        if not any(k in response_text.lower() for k in config.cta_keywords):
-             issues.append("Missing Call to Action: Suggest a consultation when discussing pricing")
+    if "pricing" in response_hits and "cta" not in response_hits:
+        issues.append("Missing Call to Action: Suggest a consultation when discussing pricing")
 
     # Check 9: Formatting & Structure
     # Ensure use of bullet points for readability
@@ -0,0 +1,219 @@
+"""
+Metric catalog for time series discovery
+
+One small document per metric holds its tag keys, a bounded set of values per
+key, the first time it was seen and the last day it was written. The catalog
+is updated on write, but only for first sightings: an in-process "seen" set
+(seeded once from the catalog) filters out everything already recorded, so
+steady-state writes add no catalog traffic.
+
+Cardinality limits (metrics, tag keys per metric, values per tag key) reject
+points that would grow the catalog past them, which also keeps per-series
+rollup accumulators bounded when a tag is fed unbounded values (user IDs,
+request IDs...).
+
+Updates are applied with merge_catalog_update against the stored document, so
+a process whose seen set is stale can never move first_seen later or
+last_seen_date backwards.
+"""
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from .rollups import to_utc_naive
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MAX_METRICS = int(os.getenv("CATALOG_MAX_METRICS", "1000"))
+CATALOG_MAX_TAG_KEYS = int(os.getenv("CATALOG_MAX_TAG_KEYS", "20"))
+CATALOG_MAX_TAG_VALUES = int(os.getenv("CATALOG_MAX_TAG_VALUES", "200"))
+
+
+@dataclass
+class CatalogEntry:
+    """What this process knows has already been recorded for one metric"""
+    tags: Dict[str, Set[str]] = field(default_factory=dict)
+    first_seen: Optional[datetime] = None
+    last_seen_date: Optional[str] = None  # ISO date
+
+
+def catalog_doc_id(metric_name: str) -> str:
+    """Firestore-safe document ID for a metric name"""
+    return quote(metric_name, safe="") or "_"
+
+
+class MetricCatalog:
+    """
+    In-process view of the metric catalog.
+
+    Usage:
+        catalog.load(existing_docs)  # once per process
+        admitted, update = catalog.observe(name, tags, timestamp)
+        if update:
+            ...  # merge-write update into catalog_doc_id(name)
+    """
+
+    def __init__(
+        self,
+        max_metrics: int = CATALOG_MAX_METRICS,
+        max_tag_keys: int = CATALOG_MAX_TAG_KEYS,
+        max_tag_values: int = CATALOG_MAX_TAG_VALUES
+    ):
+        self.max_metrics = max_metrics
+        self.max_tag_keys = max_tag_keys
+        self.max_tag_values = max_tag_values
+        self.loaded = False
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._warned: Set[Tuple[str, Optional[str]]] = set()
+        self.stats = {"rejected": 0, "updates": 0}
+
+    def load(self, docs: List[Dict[str, Any]]):
+        """Seed the seen set from existing catalog documents"""
+        for doc in docs:
+            name = doc.get("metric_name")
+            if not name:
+                continue
+            self._entries[name] = CatalogEntry(
+                tags={key: set(values) for key, values in (doc.get("tags") or {}).items()},
+                first_seen=doc.get("first_seen"),
+                last_seen_date=doc.get("last_seen_date"),
+            )
+        self.loaded = True
+
+    def observe(self, metric_name: str, tags: Dict[str, Any],
+                timestamp: datetime) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Check a point against the catalog.
+
+        Args:
+            metric_name: Point metric
+            tags: Point tags
+            timestamp: Point time
+
+        Returns:
+            (admitted, update): ``admitted`` is False if the point would exceed
+            a cardinality limit. ``update`` holds only what is new: new tag
+            values per key, first_seen for a new metric and last_seen_date
+            when the point is on a later day; None if nothing is new.
+        """
+        entry = self._entries.get(metric_name)
+        tags = {key: str(value) for key, value in (tags or {}).items()}
+
+        if entry is None and len(self._entries) >= self.max_metrics:
+            return self._reject(metric_name, None, f"metric limit ({self.max_metrics}) reached")
+
+        known_tags = entry.tags if entry else {}
+        new_tags: Dict[str, List[str]] = {}
+        new_keys = [key for key in tags if key not in known_tags]
+        if len(known_tags) + len(new_keys) > self.max_tag_keys:
+            return self._reject(metric_name, None, f"tag key limit ({self.max_tag_keys}) reached")
+        for key, value in tags.items():
+            values = known_tags.get(key, set())
+            if value in values:
+                continue
+            if len(values) >= self.max_tag_values:
+                return self._reject(metric_name, key, f"value limit ({self.max_tag_values}) reached")
+            new_tags[key] = [value]
+
+        day = timestamp.date().isoformat() if isinstance(timestamp, (datetime, date)) else None
+        update: Dict[str, Any] = {}
+        if entry is None:
+            entry = self._entries[metric_name] = CatalogEntry(first_seen=timestamp)
+            update["first_seen"] = timestamp
+        if new_tags:
+            for key, values in new_tags.items():
+                entry.tags.setdefault(key, set()).update(values)
+            update["tags"] = new_tags
+        if day and (entry.last_seen_date is None or day > entry.last_seen_date):
+            entry.last_seen_date = day
+            update["last_seen_date"] = day
+
+        if not update:
+            return True, None
+        self.stats["updates"] += 1
+        return True, {"metric_name": metric_name, **update}
+
+    def as_updates(self) -> List[Dict[str, Any]]:
+        """One full catalog update per known metric (used by the backfill)"""
+        updates = []
+        for name, entry in self._entries.items():
+            update: Dict[str, Any] = {"metric_name": name}
+            if entry.first_seen is not None:
+                update["first_seen"] = entry.first_seen
+            if entry.tags:
+                update["tags"] = {key: sorted(values) for key, values in entry.tags.items()}
+            if entry.last_seen_date:
+                update["last_seen_date"] = entry.last_seen_date
+            updates.append(update)
+        return updates
+
+    def _reject(self, metric_name: str, tag_key: Optional[str], reason: str) -> Tuple[bool, None]:
+        self.stats["rejected"] += 1
+        if (metric_name, tag_key) not in self._warned:
+            self._warned.add((metric_name, tag_key))
+            target = f"{metric_name}.{tag_key}" if tag_key else metric_name
+            logger.warning(f"Rejecting time series points for {target}: {reason}")
+        return False, None
+
+
+def merge_catalog_update(stored: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fields to merge into a catalog document so it reflects ``update``.
+
+    Args:
+        stored: Current document ({} if it does not exist)
+        update: Update from MetricCatalog.observe or as_updates
+
+    Returns:
+        Merge data: first_seen only if the document has none or the update is
+        earlier, last_seen_date only if it is later, and only tag values not
+        already stored; {} if nothing changes
+    """
+    data: Dict[str, Any] = {}
+    first_seen = update.get("first_seen")
+    stored_first = stored.get("first_seen")
+    if isinstance(first_seen, datetime) and (
+        not isinstance(stored_first, datetime) or to_utc_naive(first_seen) < to_utc_naive(stored_first)
+    ):
+        data["first_seen"] = first_seen
+
+    day = update.get("last_seen_date")
+    if day and (not stored.get("last_seen_date") or day > stored["last_seen_date"]):
+        data["last_seen_date"] = day
+
+    stored_tags = stored.get("tags") or {}
+    new_tags = {
+        key: [value for value in values if value not in set(stored_tags.get(key) or [])]
+        for key, values in (update.get("tags") or {}).items()
+    }
+    new_tags = {key: values for key, values in new_tags.items() if values}
+    if new_tags:
+        data["tags"] = new_tags
+
+    if data and not stored.get("metric_name"):
+        data["metric_name"] = update["metric_name"]
+    return data
+
+
+def metric_names_in_range(docs: List[Dict[str, Any]], start_time: Optional[datetime] = None,
+                          end_time: Optional[datetime] = None) -> List[str]:
+    """
+    Metric names from catalog documents, optionally limited to metrics
+    written within [start_time, end_time] (day resolution).
+    """
+    names = set()
+    for doc in docs:
+        name = doc.get("metric_name")
+        if not name:
+            continue
+        last_seen = doc.get("last_seen_date")
+        if start_time and last_seen and last_seen < start_time.date().isoformat():
+            continue
+        first_seen = doc.get("first_seen")
+        if end_time and first_seen and first_seen.date() > end_time.date():
+            continue
+        names.add(name)
+    return sorted(names)
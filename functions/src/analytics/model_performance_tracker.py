@@ -7,7 +7,9 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone, timedelta
 from dataclasses import dataclass, asdict
 from enum import Enum
-import statistics
+from urllib.parse import quote
+
+from .rollups import DDSketch
 
 try:
     from firebase_admin import firestore
@@ -27,6 +29,7 @@ class PerformanceMetric(Enum):
     USER_RATING = "user_rating"
     ERROR_RATE = "error_rate"
     THROUGHPUT = "throughput"
+    QUALITY_SCORE = "quality_score"
 
 @dataclass
 class ModelPerformanceRecord:
@@ -108,6 +111,140 @@ class ModelPerformanceStats:
     data_from: datetime
     data_to: datetime
 
+class PerformanceAggregate:
+    """
+    Mergeable execution counters and latency sketch for one model.
+
+    Hourly bucket documents hold exactly these fields, updated with atomic
+    increments by record_execution; window stats merge the buckets in range.
+    """
+    
+    # Counter attributes, in bucket document field order
+    COUNTERS = (
+        "executions", "successes", "failures",
+        "latency_sum_ms", "cost_sum_usd",
+        "input_tokens", "output_tokens", "total_tokens",
+        "rating_sum", "rating_count",
+    )
+    
+    def __init__(self):
+        self.executions: int = 0
+        self.successes: int = 0
+        self.failures: int = 0
+        self.latency_sum_ms: float = 0
+        self.cost_sum_usd: float = 0
+        self.input_tokens: int = 0
+        self.output_tokens: int = 0
+        self.total_tokens: int = 0
+        self.rating_sum: float = 0
+        self.rating_count: int = 0
+        self.ratings: Dict[int, int] = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        self.latency_sketch = DDSketch()
+    
+    def add_record(self, record: Dict[str, Any]):
+        """Fold in one raw execution record"""
+        success = bool(record.get('success', False))
+        self.executions += 1
+        self.successes += int(success)
+        self.failures += int(not success)
+        self.latency_sum_ms += record.get('latency_ms', 0)
+        self.cost_sum_usd += record.get('cost_usd', 0)
+        self.input_tokens += record.get('input_tokens', 0)
+        self.output_tokens += record.get('output_tokens', 0)
+        self.total_tokens += record.get('total_tokens', 0)
+        self.latency_sketch.add(record.get('latency_ms', 0))
+        if record.get('user_rating') is not None:
+            self.add_rating(record['user_rating'])
+    
+    def add_rating(self, rating: float, weight: int = 1):
+        self.rating_sum += rating * weight
+        self.rating_count += weight
+        self.ratings[int(rating)] = self.ratings.get(int(rating), 0) + weight
+    
+    def merge_bucket(self, doc: Dict[str, Any]):
+        """Merge an hourly bucket document"""
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + (doc.get(name) or 0))
+        for star, count in (doc.get('ratings') or {}).items():
+            self.ratings[int(star)] = self.ratings.get(int(star), 0) + count
+        if doc.get('latency_sketch'):
+            self.latency_sketch.merge(DDSketch.from_dict(doc['latency_sketch']))
+    
+    def to_bucket_fields(self) -> Dict[str, Any]:
+        """Bucket document fields (also the increments for a single record)"""
+        return {
+            **{name: getattr(self, name) for name in self.COUNTERS},
+            'ratings': {str(star): count for star, count in self.ratings.items() if count},
+            'latency_sketch': self.latency_sketch.to_dict(),
+        }
+    
+    def to_stats(
+        self,
+        model_id: str,
+        model_name: str,
+        time_period: str,
+        start_time: datetime,
+        end_time: datetime
+    ) -> ModelPerformanceStats:
+        """Finalize into ModelPerformanceStats"""
+        executions = self.executions
+        
+        # Calculate efficiency metrics
+        total_time_seconds = self.latency_sum_ms / 1000
+        tokens_per_second = self.total_tokens / total_time_seconds if total_time_seconds > 0 else 0
+        
+        cost_per_1k_tokens = (self.cost_sum_usd / self.total_tokens * 1000) if self.total_tokens > 0 else 0
+        cost_efficiency_score = cost_per_1k_tokens  # Lower is better
+        
+        # Quality score (0-100)
+        success_rate = self.successes / executions if executions > 0 else 0
+        avg_rating = self.rating_sum / self.rating_count if self.rating_count else None
+        quality_score = (success_rate * 50) + ((avg_rating / 5 * 50) if avg_rating else 0)
+        
+        return ModelPerformanceStats(
+            model_id=model_id,
+            model_name=model_name,
+            time_period=time_period,
+            total_executions=executions,
+            successful_executions=self.successes,
+            failed_executions=self.failures,
+            success_rate=success_rate,
+            avg_latency_ms=self.latency_sum_ms / executions if executions > 0 else 0,
+            median_latency_ms=self.latency_sketch.quantile(0.5) or 0,
+            p95_latency_ms=self.latency_sketch.quantile(0.95) or 0,
+            p99_latency_ms=self.latency_sketch.quantile(0.99) or 0,
+            total_cost_usd=self.cost_sum_usd,
+            avg_cost_per_execution=self.cost_sum_usd / executions if executions > 0 else 0,
+            cost_per_1k_tokens=cost_per_1k_tokens,
+            total_tokens=self.total_tokens,
+            avg_tokens_per_execution=self.total_tokens / executions if executions > 0 else 0,
+            avg_input_tokens=self.input_tokens / executions if executions > 0 else 0,
+            avg_output_tokens=self.output_tokens / executions if executions > 0 else 0,
+            avg_user_rating=avg_rating,
+            total_ratings=self.rating_count,
+            rating_distribution={star: self.ratings.get(star, 0) for star in range(1, 6)},
+            tokens_per_second=tokens_per_second,
+            cost_efficiency_score=cost_efficiency_score,
+            quality_score=quality_score,
+            calculated_at=datetime.now(timezone.utc),
+            data_from=start_time,
+            data_to=end_time
+        )
+
+def hour_start(timestamp: datetime) -> datetime:
+    """Start of the UTC hour containing ``timestamp``"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def window_start(time_period: str, now: datetime) -> Optional[datetime]:
+    """Start of a stats window (None for "all")"""
+    if time_period == "24h":
+        return now - timedelta(hours=24)
+    if time_period == "7d":
+        return now - timedelta(days=7)
+    if time_period == "30d":
+        return now - timedelta(days=30)
+    return None
+
 class ModelPerformanceTracker:
     """
     Service for tracking and analyzing model performance
@@ -117,6 +254,9 @@ class ModelPerformanceTracker:
         self.db = db or (firestore.client() if FIREBASE_AVAILABLE else None)
         self.collection_name = "model_performance"
         self.stats_collection_name = "model_performance_stats"
+        # Per-model hourly aggregates: window stats merge these instead of
+        # re-reading every execution record
+        self.buckets_collection_name = "model_performance_hourly"
         
         logger.info("Model performance tracker initialized")
     
@@ -182,7 +322,13 @@ class ModelPerformanceTracker:
         
         try:
             doc_ref = self.db.collection(self.collection_name).document()
-            doc_ref.set(asdict(record))
+            aggregate = PerformanceAggregate()
+            aggregate.add_record(asdict(record))
+            
+            batch = self.db.batch()
+            batch.set(doc_ref, asdict(record))
+            self._increment_bucket(batch, model_id, model_name, record.timestamp, aggregate.to_bucket_fields())
+            batch.commit()
             
             logger.info(f"Recorded performance for model {model_id}: {execution_id}")
             return doc_ref.id
@@ -209,11 +355,27 @@ class ModelPerformanceTracker:
             
             docs = query.stream()
             for doc in docs:
-                doc.reference.update({
+                data = doc.to_dict() or {}
+                batch = self.db.batch()
+                batch.update(doc.reference, {
                     'user_rating': user_rating,
                     'user_feedback': user_feedback,
                     'feedback_updated_at': firestore.SERVER_TIMESTAMP
                 })
+                
+                # Move the execution's rating in its hourly bucket
+                rating_change = PerformanceAggregate()
+                rating_change.add_rating(user_rating)
+                if data.get('user_rating') is not None:
+                    rating_change.add_rating(data['user_rating'], weight=-1)
+                fields = rating_change.to_bucket_fields()
+                self._increment_bucket(batch, data['model_id'], data.get('model_name', data['model_id']),
+                                       data['timestamp'], {
+                                           'rating_sum': fields['rating_sum'],
+                                           'rating_count': fields['rating_count'],
+                                           'ratings': fields['ratings'],
+                                       })
+                batch.commit()
                 logger.info(f"Updated feedback for execution {execution_id}")
                 return True
             
@@ -236,6 +398,9 @@ class ModelPerformanceTracker:
         """
         Calculate aggregated statistics for a model
         
+        Merges the model's hourly buckets in the window (at most 720 documents
+        for 30d) rather than streaming every execution record.
+        
         Args:
             model_id: Model identifier
             time_period: Time period (24h, 7d, 30d, all)
@@ -246,41 +411,22 @@ class ModelPerformanceTracker:
         if not self.db:
             return None
         
-        # Calculate time range
         now = datetime.now(timezone.utc)
-        if time_period == "24h":
-            start_time = now - timedelta(hours=24)
-        elif time_period == "7d":
-            start_time = now - timedelta(days=7)
-        elif time_period == "30d":
-            start_time = now - timedelta(days=30)
-        else:  # "all"
-            start_time = datetime.min.replace(tzinfo=timezone.utc)
+        start_time = window_start(time_period, now)
         
         try:
-            # Query performance records
-            query = self.db.collection(self.collection_name).where(
-                'model_id', '==', model_id
-            ).where(
-                'timestamp', '>=', start_time
-            ).order_by('timestamp')
+            query = self.db.collection(self.buckets_collection_name).where('model_id', '==', model_id)
+            if start_time:
+                query = query.where('hour_start', '>=', hour_start(start_time))
             
-            records = []
-            model_name = None
+            stats = self._stats_from_buckets(
+                (doc.to_dict() for doc in query.stream()), time_period, start_time, now
+            ).get(model_id)
             
-            for doc in query.stream():
-                data = doc.to_dict()
-                records.append(data)
-                if not model_name:
-                    model_name = data.get('model_name', model_id)
-            
-            if not records:
+            if not stats:
                 logger.info(f"No performance data found for model {model_id}")
                 return None
             
-            # Calculate statistics
-            stats = self._calculate_statistics(records, model_id, model_name, time_period, start_time, now)
-            
             # Store stats in Firestore
             await self._store_stats(stats)
             
@@ -290,6 +436,28 @@ class ModelPerformanceTracker:
             logger.error(f"Failed to calculate stats: {e}")
             return None
     
+    def _stats_from_buckets(
+        self,
+        buckets,
+        time_period: str,
+        start_time: Optional[datetime],
+        end_time: datetime
+    ) -> Dict[str, ModelPerformanceStats]:
+        """Merge hourly bucket documents into per-model window stats"""
+        aggregates: Dict[str, PerformanceAggregate] = {}
+        names: Dict[str, str] = {}
+        for bucket in buckets:
+            model_id = bucket['model_id']
+            aggregates.setdefault(model_id, PerformanceAggregate()).merge_bucket(bucket)
+            names.setdefault(model_id, bucket.get('model_name', model_id))
+        
+        data_from = start_time or datetime.min.replace(tzinfo=timezone.utc)
+        return {
+            model_id: aggregate.to_stats(model_id, names[model_id], time_period, data_from, end_time)
+            for model_id, aggregate in aggregates.items()
+            if aggregate.executions
+        }
+    
     def _calculate_statistics(
         self,
         records: List[Dict[str, Any]],
@@ -299,72 +467,89 @@ class ModelPerformanceTracker:
         start_time: datetime,
         end_time: datetime
     ) -> ModelPerformanceStats:
-        """Calculate statistics from records"""
-        
-        total_executions = len(records)
-        successful = [r for r in records if r.get('success', False)]
-        failed = [r for r in records if not r.get('success', False)]
-        
-        # Latency stats
-        latencies = [r.get('latency_ms', 0) for r in records]
-        latencies.sort()
+        """Calculate statistics from raw records"""
+        aggregate = PerformanceAggregate()
+        for record in records:
+            aggregate.add_record(record)
+        return aggregate.to_stats(model_id, model_name, time_period, start_time, end_time)
+    
+    def _bucket_ref(self, model_id: str, timestamp: datetime):
+        bucket_id = f"{quote(model_id, safe='')}_{hour_start(timestamp).strftime('%Y%m%d%H')}"
+        return self.db.collection(self.buckets_collection_name).document(bucket_id)
+    
+    def _increment_bucket(
+        self,
+        batch,
+        model_id: str,
+        model_name: str,
+        timestamp: datetime,
+        fields: Dict[str, Any]
+    ):
+        """
+        Add ``fields`` to the model's bucket for ``timestamp`` with atomic
+        increments, so concurrent workers never overwrite each other. Sketch
+        bins are counters too, so they increment like any other field.
+        """
+        def increments(value):
+            # Empty maps are skipped: with merge=True they would replace the stored map
+            if isinstance(value, dict):
+                return {key: increments(item) for key, item in value.items() if item != {}}
+            return firestore.Increment(value)
         
-        # Cost stats
-        costs = [r.get('cost_usd', 0) for r in records]
-        total_cost = sum(costs)
+        data = {
+            'model_id': model_id,
+            'model_name': model_name,
+            'hour_start': hour_start(timestamp),
+            **increments({key: value for key, value in fields.items() if key != 'latency_sketch'}),
+        }
+        if 'latency_sketch' in fields:
+            sketch = fields['latency_sketch']
+            data['latency_sketch'] = {
+                'relative_accuracy': sketch['relative_accuracy'],
+                **increments({key: sketch[key] for key in ('positive', 'negative', 'zero_count')}),
+            }
+        batch.set(self._bucket_ref(model_id, timestamp), data, merge=True)
+    
+    async def backfill_hourly_buckets(self, since: Optional[datetime] = None) -> int:
+        """
+        Build hourly buckets from raw execution records (one full scan).
         
-        # Token stats
-        total_tokens = sum(r.get('total_tokens', 0) for r in records)
-        input_tokens = [r.get('input_tokens', 0) for r in records]
-        output_tokens = [r.get('output_tokens', 0) for r in records]
+        Run once for history recorded before buckets existed; it overwrites the
+        buckets of the hours it covers, so run it before new executions land in
+        those hours.
         
-        # User ratings
-        ratings = [r.get('user_rating') for r in records if r.get('user_rating') is not None]
-        rating_dist = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        for rating in ratings:
-            rating_dist[int(rating)] = rating_dist.get(int(rating), 0) + 1
+        Returns:
+            Number of bucket documents written
+        """
+        if not self.db:
+            return 0
         
-        # Calculate efficiency metrics
-        total_time_seconds = sum(latencies) / 1000
-        tokens_per_second = total_tokens / total_time_seconds if total_time_seconds > 0 else 0
+        query = self.db.collection(self.collection_name)
+        if since:
+            query = query.where('timestamp', '>=', since)
         
-        cost_per_1k_tokens = (total_cost / total_tokens * 1000) if total_tokens > 0 else 0
-        cost_efficiency_score = cost_per_1k_tokens  # Lower is better
+        aggregates: Dict[tuple, PerformanceAggregate] = {}
+        names: Dict[str, str] = {}
+        for doc in query.stream():
+            record = doc.to_dict() or {}
+            key = (record['model_id'], hour_start(record['timestamp']))
+            aggregates.setdefault(key, PerformanceAggregate()).add_record(record)
+            names.setdefault(record['model_id'], record.get('model_name', record['model_id']))
         
-        # Quality score (0-100)
-        success_rate = len(successful) / total_executions if total_executions > 0 else 0
-        avg_rating = statistics.mean(ratings) if ratings else None
-        quality_score = (success_rate * 50) + ((avg_rating / 5 * 50) if avg_rating else 0)
+        items = list(aggregates.items())
+        for offset in range(0, len(items), 500):
+            batch = self.db.batch()
+            for (model_id, hour), aggregate in items[offset:offset + 500]:
+                batch.set(self._bucket_ref(model_id, hour), {
+                    'model_id': model_id,
+                    'model_name': names[model_id],
+                    'hour_start': hour,
+                    **aggregate.to_bucket_fields(),
+                })
+            batch.commit()
         
-        return ModelPerformanceStats(
-            model_id=model_id,
-            model_name=model_name,
-            time_period=time_period,
-            total_executions=total_executions,
-            successful_executions=len(successful),
-            failed_executions=len(failed),
-            success_rate=success_rate,
-            avg_latency_ms=statistics.mean(latencies) if latencies else 0,
-            median_latency_ms=statistics.median(latencies) if latencies else 0,
-            p95_latency_ms=latencies[int(len(latencies) * 0.95)] if latencies else 0,
-            p99_latency_ms=latencies[int(len(latencies) * 0.99)] if latencies else 0,
-            total_cost_usd=total_cost,
-            avg_cost_per_execution=total_cost / total_executions if total_executions > 0 else 0,
-            cost_per_1k_tokens=cost_per_1k_tokens,
-            total_tokens=total_tokens,
-            avg_tokens_per_execution=total_tokens / total_executions if total_executions > 0 else 0,
-            avg_input_tokens=statistics.mean(input_tokens) if input_tokens else 0,
-            avg_output_tokens=statistics.mean(output_tokens) if output_tokens else 0,
-            avg_user_rating=avg_rating,
-            total_ratings=len(ratings),
-            rating_distribution=rating_dist,
-            tokens_per_second=tokens_per_second,
-            cost_efficiency_score=cost_efficiency_score,
-            quality_score=quality_score,
-            calculated_at=datetime.now(timezone.utc),
-            data_from=start_time,
-            data_to=end_time
-        )
+        logger.info(f"Backfilled {len(items)} hourly performance buckets")
+        return len(items)
     
     async def _store_stats(self, stats: ModelPerformanceStats) -> bool:
         """Store calculated statistics in Firestore"""
@@ -416,11 +601,28 @@ class ModelPerformanceTracker:
         self,
         time_period: str = "24h"
     ) -> List[ModelPerformanceStats]:
-        """Get statistics for all models"""
+        """
+        Get statistics for all models
+        
+        Computed from the hourly buckets in the window; falls back to the stored
+        stats documents when no buckets exist yet (history not backfilled).
+        """
         if not self.db:
             return []
         
         try:
+            now = datetime.now(timezone.utc)
+            start_time = window_start(time_period, now)
+            bucket_query = self.db.collection(self.buckets_collection_name)
+            if start_time:
+                bucket_query = bucket_query.where('hour_start', '>=', hour_start(start_time))
+            
+            stats_by_model = self._stats_from_buckets(
+                (doc.to_dict() for doc in bucket_query.stream()), time_period, start_time, now
+            )
+            if stats_by_model:
+                return sorted(stats_by_model.values(), key=lambda x: x.quality_score, reverse=True)
+            
             query = self.db.collection(self.stats_collection_name).where(
                 'time_period', '==', time_period
             ).order_by('quality_score', direction=firestore.Query.DESCENDING)
@@ -2,12 +2,16 @@
 Model Recommendation Algorithm
 Recommends best AI models based on historical performance, user preferences, and constraints
 """
+import json
 import logging
+import os
 from typing import Dict, Any, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
 import math
 
+from cachetools import TTLCache
+
 from .model_performance_tracker import (
     ModelPerformanceTracker,
     ModelPerformanceStats,
@@ -16,6 +20,9 @@ from .model_performance_tracker import (
 
 logger = logging.getLogger(__name__)
 
+# Recommendations sit on the routing path: serve repeats from memory for a short while
+RECOMMENDATION_CACHE_TTL_S = float(os.getenv("RECOMMENDATION_CACHE_TTL_S", "60"))
+
 class TaskType(Enum):
     """Types of tasks for model selection"""
     CREATIVE_WRITING = "creative_writing"
@@ -76,9 +83,16 @@ class ModelRecommendationEngine:
     Engine for recommending AI models based on multiple factors
     """
     
-    def __init__(self, performance_tracker: Optional[ModelPerformanceTracker] = None):
+    def __init__(
+        self,
+        performance_tracker: Optional[ModelPerformanceTracker] = None,
+        cache_ttl: float = RECOMMENDATION_CACHE_TTL_S
+    ):
         self.performance_tracker = performance_tracker or ModelPerformanceTracker()
         
+        # Short-TTL cache of per-period stats and of recommendation results
+        self._cache = TTLCache(maxsize=256, ttl=cache_ttl) if cache_ttl > 0 else None
+        
         # Task-specific model preferences (based on general knowledge)
         self.task_model_affinity = {
             TaskType.CREATIVE_WRITING: {
@@ -141,8 +155,12 @@ class ModelRecommendationEngine:
         if context is None:
             context = {}
         
+        cache_key = self._recommendation_cache_key(task_type, user_preferences, context, time_period, top_k)
+        if self._cache is not None and cache_key in self._cache:
+            return self._copy_recommendations(self._cache[cache_key])
+        
         # Get performance stats for all models
-        all_stats = await self.performance_tracker.get_all_models_stats(time_period)
+        all_stats = await self._get_all_models_stats(time_period)
         
         if not all_stats:
             logger.warning("No performance stats available for recommendations")
@@ -199,6 +217,9 @@ class ModelRecommendationEngine:
         for i, rec in enumerate(recommendations):
             rec.rank = i + 1
         
+        if self._cache is not None:
+            self._cache[cache_key] = recommendations[:top_k]
+            return self._copy_recommendations(recommendations[:top_k])
         return recommendations[:top_k]
     
     def _calculate_model_score(
@@ -364,6 +385,53 @@ class ModelRecommendationEngine:
         
         return recommendations
     
+    # =========================================================================
+    # CACHING
+    # =========================================================================
+    
+    async def _get_all_models_stats(self, time_period: str) -> List[ModelPerformanceStats]:
+        """Per-period model stats, shared by all cached recommendation keys"""
+        cache_key = ("stats", time_period)
+        if self._cache is not None and cache_key in self._cache:
+            return self._cache[cache_key]
+        
+        all_stats = await self.performance_tracker.get_all_models_stats(time_period)
+        if self._cache is not None and all_stats:
+            self._cache[cache_key] = all_stats
+        return all_stats
+    
+    def _recommendation_cache_key(
+        self,
+        task_type: TaskType,
+        user_preferences: UserPreferences,
+        context: Dict[str, Any],
+        time_period: str,
+        top_k: int
+    ) -> tuple:
+        return (
+            "recommend",
+            task_type.value,
+            tuple(user_preferences.preferred_models),
+            tuple(user_preferences.excluded_models),
+            user_preferences.max_cost_per_execution,
+            user_preferences.max_latency_ms,
+            user_preferences.min_quality_score,
+            user_preferences.optimization_goal.value,
+            json.dumps(context, sort_keys=True, default=str),
+            time_period,
+            top_k,
+        )
+    
+    @staticmethod
+    def _copy_recommendations(recommendations: List[ModelRecommendation]) -> List[ModelRecommendation]:
+        """Callers may mutate results (rank, score, reasoning); never hand out cached objects"""
+        return [replace(rec, reasoning=list(rec.reasoning)) for rec in recommendations]
+    
+    def invalidate_cache(self):
+        """Drop cached stats and recommendations (e.g. after a model is disabled)"""
+        if self._cache is not None:
+            self._cache.clear()
+    
     # =========================================================================
     # UTILITY METHODS
     # =========================================================================
@@ -389,7 +457,7 @@ class ModelRecommendationEngine:
         time_period: str = "7d"
     ) -> List[ModelRecommendation]:
         """Compare specific models"""
-        all_stats = await self.performance_tracker.get_all_models_stats(time_period)
+        all_stats = await self._get_all_models_stats(time_period)
         
         # Filter to requested models
         filtered_stats = [s for s in all_stats if s.model_id in model_ids]
@@ -0,0 +1,331 @@
+"""
+Streaming time series rollups
+
+Points are folded into in-memory accumulators keyed by (metric, tags, bucket)
+as they are written. Each accumulator holds count/sum/min/max and a DDSketch,
+a mergeable quantile sketch with bounded relative error. When a bucket closes,
+its accumulator is emitted once as a rollup document and merged into the
+enclosing bucket of the next granularity (minute -> hour -> day), so no
+rollup is ever recomputed from raw points.
+
+Rollup documents from several writers (processes) or late flushes of the same
+bucket are partials: readers merge them per bucket with ``merge_rollup_docs``.
+"""
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+ROLLUP_RELATIVE_ACCURACY = float(os.getenv("ROLLUP_RELATIVE_ACCURACY", "0.01"))
+ROLLUP_MAX_BINS = int(os.getenv("ROLLUP_MAX_BINS", "2048"))
+# How long after a bucket ends late points are still accepted before flushing
+ROLLUP_FLUSH_GRACE_S = float(os.getenv("ROLLUP_FLUSH_GRACE_S", "10"))
+
+GRANULARITIES = ("minute", "hour", "day")
+NEXT_GRANULARITY = {"minute": "hour", "hour": "day"}
+BUCKET_SIZES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+QUANTILE_AGGREGATIONS = {"p50": 0.5, "p90": 0.9, "p95": 0.95, "p99": 0.99}
+
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...], datetime]
+
+
+def to_utc_naive(timestamp: datetime) -> datetime:
+    """Firestore returns aware UTC datetimes; points are written as naive UTC"""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the ``granularity`` bucket containing ``timestamp``"""
+    timestamp = to_utc_naive(timestamp)
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+class DDSketch:
+    """
+    Quantile sketch with relative accuracy guarantees (DDSketch).
+
+    Values are counted in logarithmic bins of ratio gamma, so any quantile is
+    returned within ``relative_accuracy`` of the true value, and two sketches
+    with the same accuracy merge exactly by adding bin counts.
+    """
+
+    # Magnitudes below this are counted as zero
+    MIN_INDEXABLE = 1e-9
+
+    def __init__(self, relative_accuracy: float = ROLLUP_RELATIVE_ACCURACY, max_bins: int = ROLLUP_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max(1, max_bins)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # Midpoint (in relative terms) of the bin (gamma^(key-1), gamma^key]
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, weight: int = 1):
+        if value > self.MIN_INDEXABLE:
+            store = self.positive
+            key = self._key(value)
+        elif value < -self.MIN_INDEXABLE:
+            store = self.negative
+            key = self._key(-value)
+        else:
+            self.zero_count += weight
+            self.count += weight
+            return
+        store[key] = store.get(key, 0) + weight
+        self.count += weight
+        if len(store) > self.max_bins:
+            self._collapse(store)
+
+    def _collapse(self, store: Dict[int, int]):
+        """Fold the lowest-magnitude bins together to stay within max_bins"""
+        keys = sorted(store)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        store[excess[-1]] = sum(store.pop(key) for key in excess[:-1]) + store[excess[-1]]
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for store in (self.positive, self.negative):
+            if len(store) > self.max_bins:
+                self._collapse(store)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile ``q`` (0..1), or None if the sketch is empty"""
+        if self.count == 0 or not 0 <= q <= 1:
+            return None
+        rank = round(q * (self.count - 1))  # Nearest rank, as for raw points
+        seen = 0
+        # Ascending order: most negative first, then zero, then positives
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Firestore map keys must be strings
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positive": {str(key): count for key, count in self.positive.items()},
+            "negative": {str(key): count for key, count in self.negative.items()},
+            "zero_count": self.zero_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DDSketch":
+        sketch = cls(relative_accuracy=data.get("relative_accuracy", ROLLUP_RELATIVE_ACCURACY))
+        sketch.positive = {int(key): int(count) for key, count in data.get("positive", {}).items()}
+        sketch.negative = {int(key): int(count) for key, count in data.get("negative", {}).items()}
+        sketch.zero_count = int(data.get("zero_count", 0))
+        sketch.count = sum(sketch.positive.values()) + sum(sketch.negative.values()) + sketch.zero_count
+        return sketch
+
+
+class RollupAccumulator:
+    """count/sum/min/max plus a quantile sketch for one series bucket"""
+
+    def __init__(self, relative_accuracy: float = ROLLUP_RELATIVE_ACCURACY):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = DDSketch(relative_accuracy)
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other: "RollupAccumulator"):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def value(self, aggregation: Optional[str]) -> Optional[float]:
+        """Aggregate value ('avg', 'sum', 'min', 'max', 'count', 'p50', 'p90', 'p95', 'p99')"""
+        if self.count == 0:
+            return None
+        if aggregation == "sum":
+            return self.sum
+        if aggregation == "min":
+            return self.min
+        if aggregation == "max":
+            return self.max
+        if aggregation == "count":
+            return self.count
+        if aggregation in QUANTILE_AGGREGATIONS:
+            return self.sketch.quantile(QUANTILE_AGGREGATIONS[aggregation])
+        return self.sum / self.count  # Default to average
+
+    def to_fields(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            # Average, so readers that only look at "value" keep working
+            "value": self.sum / self.count if self.count else 0.0,
+            "sketch": self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_fields(cls, data: Dict[str, Any]) -> "RollupAccumulator":
+        accumulator = cls()
+        accumulator.count = int(data.get("count", 0))
+        accumulator.sum = float(data.get("sum", 0.0))
+        accumulator.min = float(data.get("min", math.inf))
+        accumulator.max = float(data.get("max", -math.inf))
+        if data.get("sketch"):
+            accumulator.sketch = DDSketch.from_dict(data["sketch"])
+        return accumulator
+
+
+class StreamingRollups:
+    """
+    Open minute/hour/day accumulators for all series.
+
+    Usage:
+        rollups.add("latency_ms", {"model": "m"}, timestamp, 120.0)
+        for granularity, docs in rollups.collect_closed(now).items():
+            ...  # batch-write docs to the granularity's collection
+    """
+
+    def __init__(self, flush_grace_seconds: float = ROLLUP_FLUSH_GRACE_S,
+                 relative_accuracy: float = ROLLUP_RELATIVE_ACCURACY):
+        self.flush_grace = timedelta(seconds=flush_grace_seconds)
+        self.relative_accuracy = relative_accuracy
+        self._open: Dict[str, Dict[SeriesKey, RollupAccumulator]] = {g: {} for g in GRANULARITIES}
+        self._tags: Dict[Tuple[Tuple[str, str], ...], Dict[str, str]] = {}
+        self.stats = {"points": 0, "flushed": {g: 0 for g in GRANULARITIES}}
+
+    def _accumulator(self, granularity: str, key: SeriesKey) -> RollupAccumulator:
+        accumulators = self._open[granularity]
+        accumulator = accumulators.get(key)
+        if accumulator is None:
+            accumulator = accumulators[key] = RollupAccumulator(self.relative_accuracy)
+        return accumulator
+
+    def add(self, metric_name: str, tags: Dict[str, str], timestamp: datetime, value: float):
+        """Fold one raw point into its minute bucket"""
+        tag_key = tuple(sorted((tags or {}).items()))
+        self._tags.setdefault(tag_key, dict(tags or {}))
+        key = (metric_name, tag_key, bucket_start(timestamp, "minute"))
+        self._accumulator("minute", key).add(float(value))
+        self.stats["points"] += 1
+
+    def open_buckets(self) -> Dict[str, int]:
+        return {granularity: len(accumulators) for granularity, accumulators in self._open.items()}
+
+    def collect_closed(self, now: Optional[datetime] = None, force: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Pop every closed bucket as a rollup document.
+
+        A closed bucket is merged into its enclosing bucket of the next
+        granularity before that one is checked, so one call can close a
+        minute, its hour and its day together.
+
+        Args:
+            now: Current UTC time
+            force: Close all buckets regardless of time (shutdown)
+
+        Returns:
+            Granularity -> rollup documents
+        """
+        now = to_utc_naive(now or datetime.utcnow())
+        closed: Dict[str, List[Dict[str, Any]]] = {}
+
+        for granularity in GRANULARITIES:
+            accumulators = self._open[granularity]
+            cutoff = now - BUCKET_SIZES[granularity] - self.flush_grace
+            keys = [key for key in accumulators if force or key[2] <= cutoff]
+            if not keys:
+                continue
+
+            docs = closed.setdefault(granularity, [])
+            parent = NEXT_GRANULARITY.get(granularity)
+            for key in keys:
+                accumulator = accumulators.pop(key)
+                metric_name, tag_key, start = key
+                docs.append({
+                    "metric_name": metric_name,
+                    "tags": self._tags.get(tag_key, dict(tag_key)),
+                    "timestamp": start,
+                    "granularity": granularity,
+                    **accumulator.to_fields(),
+                })
+                if parent:
+                    parent_key = (metric_name, tag_key, bucket_start(start, parent))
+                    self._accumulator(parent, parent_key).merge(accumulator)
+            self.stats["flushed"][granularity] += len(keys)
+
+        return closed
+
+
+def merge_rollup_docs(docs: List[Dict[str, Any]], aggregation: Optional[str],
+                      granularity: str) -> List[Tuple[datetime, float]]:
+    """
+    Merge rollup documents (partials of the same bucket, or finer buckets)
+    into one value per ``granularity`` bucket.
+
+    Args:
+        docs: Rollup documents (any granularity at or below ``granularity``)
+        aggregation: Aggregation applied to each merged bucket
+        granularity: Output bucket size
+
+    Returns:
+        Sorted (bucket_start, value) pairs
+    """
+    buckets: Dict[datetime, RollupAccumulator] = {}
+    for doc in docs:
+        start = bucket_start(doc["timestamp"], granularity)
+        accumulator = RollupAccumulator.from_fields(doc)
+        if start in buckets:
+            buckets[start].merge(accumulator)
+        else:
+            buckets[start] = accumulator
+
+    return [
+        (start, buckets[start].value(aggregation))
+        for start in sorted(buckets)
+        if buckets[start].count
+    ]
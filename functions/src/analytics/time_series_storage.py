@@ -2,7 +2,10 @@
 Time Series Data Storage and Retrieval for Analytics
 """
 import asyncio
+import hashlib
 import logging
+import os
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Tuple, Union
 from dataclasses import dataclass
@@ -13,8 +16,18 @@ import statistics
 from google.cloud import firestore
 from google.cloud.firestore import AsyncClient
 
+from .metric_catalog import MetricCatalog, catalog_doc_id, merge_catalog_update, metric_names_in_range
+from .rollups import BUCKET_SIZES, QUANTILE_AGGREGATIONS, StreamingRollups, merge_rollup_docs
+
 logger = logging.getLogger(__name__)
 
+# How often closed rollup buckets are flushed (minute buckets close every 60s)
+ROLLUP_FLUSH_INTERVAL_S = float(os.getenv("ROLLUP_FLUSH_INTERVAL_S", "60"))
+# Firestore write batch limit
+FIRESTORE_BATCH_LIMIT = 500
+# Rollup documents held for retry per granularity after failed commits (oldest dropped beyond this)
+ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "50000"))
+
 @dataclass
 class TimeSeriesPoint:
     """Single time series data point"""
@@ -31,7 +44,7 @@ class TimeSeriesQuery:
     start_time: datetime
     end_time: datetime
     tags: Optional[Dict[str, str]] = None
-    aggregation: Optional[str] = None  # 'avg', 'sum', 'max', 'min', 'count'
+    aggregation: Optional[str] = None  # 'avg', 'sum', 'max', 'min', 'count', 'p50', 'p90', 'p95', 'p99'
     granularity: Optional[str] = None  # 'minute', 'hour', 'day'
 
 @dataclass
@@ -68,6 +81,21 @@ class TimeSeriesStorage:
             "day": 1095    # Keep day aggregates for 3 years
         }
         
+        # Metric names / tag values for discovery, written on first sighting only
+        self.catalog_collection = "timeseries_catalog"
+        self.catalog = MetricCatalog()
+        
+        # Streaming rollups: points are folded into minute/hour/day accumulators
+        # on write and each bucket is written once when it closes. Document IDs
+        # carry a writer ID so partials from several processes never collide.
+        self.rollups = StreamingRollups()
+        self._writer_id = uuid.uuid4().hex[:12]
+        self._flush_seq = 0
+        # Closed buckets whose commit failed: granularity -> [(doc_id, doc)].
+        # They are already merged into their parent buckets, so they must be
+        # written eventually rather than re-collected
+        self._pending_rollups: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+
         # Background tasks
         self._aggregation_task = None
         self._cleanup_task = None
@@ -100,11 +128,19 @@ class TimeSeriesStorage:
             except asyncio.CancelledError:
                 pass
         
+        # Write out buckets that are still open so no rollup data is lost
+        await self.flush_rollups(force=True)
+        
         logger.info("Time series background tasks stopped")
     
     async def write_point(self, point: TimeSeriesPoint):
         """Write a single time series point"""
         try:
+            await self._ensure_catalog_loaded()
+            admitted, catalog_update = self.catalog.observe(point.metric_name, point.tags, point.timestamp)
+            if not admitted:
+                return
+            
             doc_data = {
                 "timestamp": point.timestamp,
                 "metric_name": point.metric_name,
@@ -121,6 +157,9 @@ class TimeSeriesStorage:
             
             doc_ref = self.firestore_client.collection(self.collections["raw"]).document(doc_id)
             await doc_ref.set(doc_data)
+            self.rollups.add(point.metric_name, point.tags, point.timestamp, point.value)
+            if catalog_update:
+                await self._apply_catalog_updates([catalog_update])
             
             logger.debug(f"Wrote time series point: {point.metric_name} = {point.value}")
             
@@ -130,9 +169,19 @@ class TimeSeriesStorage:
     async def write_points(self, points: List[TimeSeriesPoint]):
         """Write multiple time series points in batch"""
         try:
+            await self._ensure_catalog_loaded()
             batch = self.firestore_client.batch()
             
+            admitted_points = []
+            catalog_updates = []
             for point in points:
+                admitted, catalog_update = self.catalog.observe(point.metric_name, point.tags, point.timestamp)
+                if not admitted:
+                    continue
+                admitted_points.append(point)
+                if catalog_update:
+                    catalog_updates.append(catalog_update)
+                
                 doc_data = {
                     "timestamp": point.timestamp,
                     "metric_name": point.metric_name,
@@ -148,8 +197,20 @@ class TimeSeriesStorage:
                 doc_ref = self.firestore_client.collection(self.collections["raw"]).document(doc_id)
                 batch.set(doc_ref, doc_data)
             
-            await batch.commit()
-            logger.debug(f"Wrote {len(points)} time series points")
+            if not admitted_points:
+                return
+            
+            try:
+                await batch.commit()
+            except Exception:
+                # The seen set already records this batch's sightings; re-read
+                # the catalog before the next write so they are not lost
+                self.catalog = MetricCatalog()
+                raise
+            for point in admitted_points:
+                self.rollups.add(point.metric_name, point.tags, point.timestamp, point.value)
+            await self._apply_catalog_updates(catalog_updates)
+            logger.debug(f"Wrote {len(admitted_points)} time series points")
             
         except Exception as e:
             logger.error(f"Error writing time series points: {e}")
@@ -176,13 +237,25 @@ class TimeSeriesStorage:
             
             # Execute query
             docs = await firestore_query.get()
-            raw_points = [(doc.to_dict()["timestamp"], doc.to_dict()["value"]) for doc in docs]
             
-            # Apply aggregation if requested
-            if query.aggregation and query.granularity:
-                aggregated_points = self._aggregate_points(raw_points, query.aggregation, query.granularity)
+            if collection_name != self.collections["raw"]:
+                # Rollups: merge per-writer partials (and finer buckets) per output
+                # bucket, reading O(buckets) documents instead of O(points)
+                source_granularity = next(g for g, c in self.collections.items() if c == collection_name)
+                target_granularity = query.granularity if query.granularity in BUCKET_SIZES else source_granularity
+                aggregated_points = merge_rollup_docs(
+                    [doc.to_dict() for doc in docs],
+                    query.aggregation,
+                    target_granularity
+                )
             else:
-                aggregated_points = raw_points
+                raw_points = [(doc.to_dict()["timestamp"], doc.to_dict()["value"]) for doc in docs]
+                
+                # Apply aggregation if requested
+                if query.aggregation and query.granularity:
+                    aggregated_points = self._aggregate_points(raw_points, query.aggregation, query.granularity)
+                else:
+                    aggregated_points = raw_points
             
             return TimeSeriesResult(
                 metric_name=query.metric_name,
@@ -204,45 +277,28 @@ class TimeSeriesStorage:
     
     async def get_metric_names(self, start_time: Optional[datetime] = None,
                              end_time: Optional[datetime] = None) -> List[str]:
-        """Get list of available metric names"""
+        """Get list of available metric names (from the catalog, day resolution)"""
         try:
-            query = self.firestore_client.collection(self.collections["raw"])
-            
-            if start_time:
-                query = query.where("timestamp", ">=", start_time)
-            if end_time:
-                query = query.where("timestamp", "<=", end_time)
-            
-            docs = await query.get()
-            metric_names = set()
-            
-            for doc in docs:
-                metric_names.add(doc.to_dict()["metric_name"])
-            
-            return sorted(list(metric_names))
+            docs = await self.firestore_client.collection(self.catalog_collection).get()
+            return metric_names_in_range([doc.to_dict() for doc in docs], start_time, end_time)
             
         except Exception as e:
             logger.error(f"Error getting metric names: {e}")
             return []
     
     async def get_metric_tags(self, metric_name: str) -> Dict[str, List[str]]:
-        """Get available tags for a metric"""
+        """Get available tags for a metric (from the catalog)"""
         try:
-            query = (
-                self.firestore_client.collection(self.collections["raw"])
-                .where("metric_name", "==", metric_name)
-                .limit(1000)  # Limit to avoid large queries
+            doc = await (
+                self.firestore_client.collection(self.catalog_collection)
+                .document(catalog_doc_id(metric_name))
+                .get()
             )
+            if not doc.exists:
+                return {}
             
-            docs = await query.get()
-            tag_values = defaultdict(set)
-            
-            for doc in docs:
-                tags = doc.to_dict().get("tags", {})
-                for tag_key, tag_value in tags.items():
-                    tag_values[tag_key].add(tag_value)
-            
-            return {key: sorted(list(values)) for key, values in tag_values.items()}
+            tags = doc.to_dict().get("tags", {})
+            return {key: sorted(values) for key, values in tags.items()}
             
         except Exception as e:
             logger.error(f"Error getting metric tags: {e}")
@@ -273,15 +329,94 @@ class TimeSeriesStorage:
                     
                     logger.info(f"Deleted {len(docs)} points for metric {metric_name} from {collection_name}")
             
+            if not start_time and not end_time:
+                await self.firestore_client.collection(self.catalog_collection).document(
+                    catalog_doc_id(metric_name)
+                ).delete()
+                # Re-read the catalog before the next write
+                self.catalog = MetricCatalog()
+            
         except Exception as e:
             logger.error(f"Error deleting metric data: {e}")
     
+    async def _ensure_catalog_loaded(self):
+        """Seed the in-process seen set from the catalog (once per process)"""
+        if self.catalog.loaded:
+            return
+        try:
+            docs = await self.firestore_client.collection(self.catalog_collection).get()
+            self.catalog.load([doc.to_dict() for doc in docs])
+        except Exception as e:
+            logger.warning(f"Could not load metric catalog, starting empty: {e}")
+            self.catalog.load([])
+    
+    async def _apply_catalog_update(self, update: Dict[str, Any]):
+        """Merge a sighting into the metric's catalog document (transaction)"""
+        doc_ref = self.firestore_client.collection(self.catalog_collection).document(
+            catalog_doc_id(update["metric_name"])
+        )
+        
+        @firestore.async_transactional
+        async def _apply(transaction):
+            snapshot = await doc_ref.get(transaction=transaction)
+            data = merge_catalog_update(snapshot.to_dict() if snapshot.exists else {}, update)
+            if not data:
+                return
+            if data.get("tags"):
+                data["tags"] = {key: firestore.ArrayUnion(values) for key, values in data["tags"].items()}
+            transaction.set(doc_ref, data, merge=True)
+        
+        await _apply(self.firestore_client.transaction())
+    
+    async def _apply_catalog_updates(self, updates: List[Dict[str, Any]]):
+        """Apply catalog updates after their points are written"""
+        for update in updates:
+            try:
+                await self._apply_catalog_update(update)
+            except Exception as e:
+                logger.warning(f"Catalog update for {update['metric_name']} failed: {e}")
+                # The seen set already records this sighting; re-read the
+                # catalog before the next write so it is retried
+                self.catalog = MetricCatalog()
+    
+    async def backfill_catalog(self, since: Optional[datetime] = None) -> int:
+        """
+        Build catalog documents from stored points (one full scan).
+        
+        Run once for metrics written before the catalog existed. Day rollups
+        cover history beyond the raw retention and raw points the most recent
+        days; both are scanned in timestamp order through a fresh
+        MetricCatalog, so the same cardinality limits apply. Documents are
+        merged monotonically, so running it while writes continue is safe.
+        
+        Returns:
+            Number of metrics merged into the catalog
+        """
+        catalog = MetricCatalog()
+        catalog.load([])
+        for granularity in ("day", "raw"):
+            query = self.firestore_client.collection(self.collections[granularity])
+            if since:
+                query = query.where("timestamp", ">=", since)
+            async for doc in query.order_by("timestamp").stream():
+                data = doc.to_dict()
+                if data.get("metric_name") and data.get("timestamp"):
+                    catalog.observe(data["metric_name"], data.get("tags") or {}, data["timestamp"])
+        
+        updates = catalog.as_updates()
+        for update in updates:
+            await self._apply_catalog_update(update)
+        # Re-read the catalog before the next write
+        self.catalog = MetricCatalog()
+        
+        logger.info(f"Backfilled catalog for {len(updates)} metrics")
+        return len(updates)
+    
     def _generate_doc_id(self, point: TimeSeriesPoint) -> str:
         """Generate unique document ID for deduplication"""
         # Create ID based on timestamp, metric name, and tags
-        tag_str = "_".join(f"{k}:{v}" for k, v in sorted(point.tags.items()))
         timestamp_str = point.timestamp.strftime("%Y%m%d_%H%M%S_%f")
-        return f"{point.metric_name}_{timestamp_str}_{hash(tag_str) % 10000:04d}"
+        return f"{point.metric_name}_{timestamp_str}_{self._tags_digest(point.tags)}"
     
     def _select_optimal_collection(self, query: TimeSeriesQuery) -> str:
         """Select the optimal collection for a query based on time range and granularity"""
@@ -353,6 +488,9 @@ class TimeSeriesStorage:
                 agg_value = min(values)
             elif aggregation == "count":
                 agg_value = len(values)
+            elif aggregation in QUANTILE_AGGREGATIONS:
+                ordered = sorted(values)
+                agg_value = ordered[round(QUANTILE_AGGREGATIONS[aggregation] * (len(ordered) - 1))]
             else:
                 agg_value = statistics.mean(values)  # Default to average
             
@@ -365,12 +503,12 @@ class TimeSeriesStorage:
         while True:
             try:
                 await self._perform_aggregation()
-                await asyncio.sleep(300)  # Run every 5 minutes
+                await asyncio.sleep(ROLLUP_FLUSH_INTERVAL_S)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in aggregation loop: {e}")
-                await asyncio.sleep(300)
+                await asyncio.sleep(ROLLUP_FLUSH_INTERVAL_S)
     
     async def _cleanup_loop(self):
         """Background task for data cleanup"""
@@ -386,25 +524,82 @@ class TimeSeriesStorage:
     
     async def _perform_aggregation(self):
         """Perform time series data aggregation"""
-        now = datetime.utcnow()
+        written = await self.flush_rollups(datetime.utcnow())
+        
+        logger.debug(f"Time series aggregation completed ({written} rollup documents)")
+    
+    async def flush_rollups(self, now: Optional[datetime] = None, force: bool = False) -> int:
+        """
+        Write closed minute/hour/day buckets to their rollup collections.
+        
+        Hour and day rollups are produced by merging the closed minute and hour
+        accumulators (including their quantile sketches), never by re-reading
+        raw points. Documents from a failed commit keep their IDs and are
+        retried on the next flush.
         
-        # Aggregate raw data to minute buckets
-        await self._aggregate_to_granularity("raw", "minute", now - timedelta(hours=1), now)
+        Args:
+            now: Current UTC time
+            force: Flush open buckets too (shutdown)
         
-        # Aggregate minute data to hour buckets
-        await self._aggregate_to_granularity("minute", "hour", now - timedelta(days=1), now)
+        Returns:
+            Number of rollup documents written
+        """
+        closed = self.rollups.collect_closed(now, force=force)
+        pending, self._pending_rollups = self._pending_rollups, {}
+        if closed:
+            self._flush_seq += 1
+        for granularity, docs in closed.items():
+            pending.setdefault(granularity, []).extend(
+                (self._rollup_doc_id(doc), {
+                    **doc,
+                    "writer": self._writer_id,
+                    "date": doc["timestamp"].date().isoformat(),
+                })
+                for doc in docs
+            )
+        if not pending:
+            return 0
         
-        # Aggregate hour data to day buckets
-        await self._aggregate_to_granularity("hour", "day", now - timedelta(days=7), now)
+        written = 0
+        for granularity, items in pending.items():
+            collection = self.firestore_client.collection(self.collections[granularity])
+            for offset in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+                chunk = items[offset:offset + FIRESTORE_BATCH_LIMIT]
+                try:
+                    batch = self.firestore_client.batch()
+                    for doc_id, doc in chunk:
+                        batch.set(collection.document(doc_id), doc)
+                    await batch.commit()
+                    written += len(chunk)
+                except Exception as e:
+                    logger.error(f"Error writing {len(chunk)} {granularity} rollups, will retry: {e}")
+                    self._requeue_rollups(granularity, chunk)
         
-        logger.debug("Time series aggregation completed")
+        logger.debug(f"Flushed {written} rollup documents: { {g: len(d) for g, d in pending.items()} }")
+        return written
+    
+    def _requeue_rollups(self, granularity: str, items: List[Tuple[str, Dict[str, Any]]]):
+        """Hold rollup documents from a failed commit for the next flush"""
+        queue = self._pending_rollups.setdefault(granularity, [])
+        queue.extend(items)
+        overflow = len(queue) - ROLLUP_MAX_PENDING
+        if overflow > 0:
+            del queue[:overflow]
+            logger.error(f"Rollup retry queue full, dropped {overflow} oldest {granularity} rollups")
+    
+    def _rollup_doc_id(self, doc: Dict[str, Any]) -> str:
+        """Rollup document ID: series, bucket, writer and flush sequence"""
+        bucket_str = doc["timestamp"].strftime("%Y%m%d_%H%M")
+        return (
+            f"{doc['metric_name']}_{bucket_str}_{self._tags_digest(doc['tags'])}"
+            f"_{self._writer_id}_{self._flush_seq}"
+        )
     
-    async def _aggregate_to_granularity(self, source_granularity: str, target_granularity: str,
-                                      start_time: datetime, end_time: datetime):
-        """Aggregate data from one granularity to another"""
-        # This would implement the actual aggregation logic
-        # For now, just log the operation
-        logger.debug(f"Aggregating {source_granularity} to {target_granularity}")
+    @staticmethod
+    def _tags_digest(tags: Dict[str, str]) -> str:
+        """Stable digest of a tag set (built-in hash() is salted per process)"""
+        tag_str = "_".join(f"{k}:{v}" for k, v in sorted(tags.items()))
+        return hashlib.sha1(tag_str.encode("utf-8")).hexdigest()
     
     async def _cleanup_old_data(self):
         """Clean up old time series data based on retention policies"""
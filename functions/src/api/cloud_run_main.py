@@ -6,7 +6,7 @@ import logging
 import os
 import uuid
 import html
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime, timezone
 
 from fastapi import FastAPI, HTTPException, Request, Header, Depends
@@ -55,13 +55,56 @@ logger = logging.getLogger(__name__)
 # Estimated impact: -50-100ms per response (210-350 operations saved)
 # ============================================================================
 import re
-_INTERNAL_CHUNK_PATTERN = re.compile(
-    r'\b(AIMessageChunk|ToolMessage|HumanMessage|SystemMessage)\('
-    r'|^id='
-    r'|ValidationError:|pydantic.*ValidationError',
-    re.IGNORECASE
-)
-_TOOL_CALL_PATTERN = re.compile(r'Call (search_kb|get_pricing|request_consultation)\(')
+from src.ai_agent.common.pattern_matcher import PatternMatcher
+
+# Internal-data markers for the SSE chunk filters, matched in a single pass
+_INTERNAL_CHUNK_MATCHER = PatternMatcher({
+    "message_repr": ["AIMessageChunk(", "ToolMessage(", "HumanMessage(", "SystemMessage("],
+    "marker": [
+        "ValidationError:",
+        "Call search_kb(", "Call get_pricing(", "Call request_consultation(",
+        "additional_kwargs=", "response_metadata=",
+    ],
+    "pydantic": ["pydantic"],
+    "validation_error": ["ValidationError"],
+})
+_KB_MARKER_PATTERN = re.compile(r'^\*[a-z_]+\s+knowledge\s+base\*', re.IGNORECASE)
+
+
+def _is_internal_chunk(text: str, include_kb_markers: bool = False) -> bool:
+    """
+    Check whether a streamed chunk is internal data (message reprs, tool calls,
+    validation errors) rather than answer text.
+
+    Args:
+        text: Extracted chunk text
+        include_kb_markers: Also treat "*<category> knowledge base*" headers as internal
+
+    Returns:
+        True if the chunk should be skipped
+    """
+    if text[:3].lower() == "id=" or text.strip() == "please fix your mistakes":
+        return True
+    if include_kb_markers and _KB_MARKER_PATTERN.match(text):
+        return True
+
+    pydantic_end = None
+    for match in _INTERNAL_CHUNK_MATCHER.iter_matches(text):
+        if "pydantic" in match.labels:
+            if pydantic_end is None:
+                pydantic_end = match.end
+        elif "validation_error" in match.labels:
+            # "pydantic ... ValidationError"
+            if pydantic_end is not None and match.start >= pydantic_end:
+                return True
+        elif "message_repr" in match.labels:
+            if match.word_start:
+                return True
+        else:
+            return True
+    return False
+
+
 START_TIME = datetime.now(timezone.utc)
 
 # Initialize intelligent response cache
@@ -72,6 +115,39 @@ except Exception as cache_init_err:
     logger.warning(f"Failed to initialize cache: {cache_init_err}")
     intelligent_response_cache = None
 
+# Precomputed answers for high-frequency questions (loaded at startup)
+try:
+    from rag.answer_index import ANSWER_INDEX_ENABLED, answer_index, compute_kb_content_hash
+except Exception as index_init_err:
+    logger.warning(f"Failed to import answer index: {index_init_err}")
+    answer_index = None
+    ANSWER_INDEX_ENABLED = False
+
+
+def _lookup_precomputed_answer(message: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Precomputed answer for ``message`` (exact or semantic), or None.
+
+    Blocking (the semantic path embeds the query), so run it in a thread.
+    Also returns the query embedding if one was computed, so the response
+    cache lookup that follows a miss does not embed the message again.
+    """
+    if not (answer_index and answer_index.loaded):
+        return None, None
+    embedded: List[Optional[List[float]]] = []
+
+    def embed(text: str) -> Optional[List[float]]:
+        embedded.append(intelligent_response_cache._generate_embedding(text))
+        return embedded[-1]
+
+    hit = answer_index.lookup(message, embed=embed if intelligent_response_cache else None)
+    return hit, (embedded[0] if embedded else None)
+
+
+def _response_cache_embedding_model() -> Optional[str]:
+    """Model behind the runtime query embedder (answer index snapshots must match it)"""
+    return intelligent_response_cache._embedding_model_name if intelligent_response_cache else None
+
 # Optional: Initialize Sentry if DSN provided
 try:
     import sentry_sdk
@@ -99,6 +175,7 @@ app = FastAPI(
 
 # Include routers
 from src.api import roi_config
+from src.api.preload import memory_report, preloaded_components
 app.include_router(roi_config.router)
 
 # Security Dependency
@@ -148,8 +225,27 @@ async def startup_warmup():
         "cross_encoder": False,
         "kb_retriever": False,
         "llm_test_inference": False,
+        "answer_index": False,
     }
 
+    # Components loaded by a preloading gunicorn master are already in memory
+    # (shared copy-on-write); loading them again would un-share the pages
+    preloaded = preloaded_components()
+    if preloaded:
+        logger.info(f"[WARMUP] Using state preloaded before fork: {preloaded}")
+
+    # 0. Load precomputed answers (independent of the agent, so done first)
+    if answer_index and answer_index.loaded:
+        warmup_results["answer_index"] = True
+    elif answer_index and ANSWER_INDEX_ENABLED:
+        try:
+            warmup_results["answer_index"] = answer_index.load_latest(
+                kb_hash=compute_kb_content_hash(),
+                embedding_model=_response_cache_embedding_model()
+            )
+        except Exception as index_err:
+            logger.warning(f"[WARMUP] Answer index load failed (non-blocking): {index_err}")
+
     try:
         # 1. Pre-warm the marketing agent singleton (loads LangGraph, LLM config)
         from ai_agent.marketing.marketing_agent import get_marketing_agent
@@ -437,6 +533,13 @@ async def health_check(request: Request):
         "uptime_seconds": uptime
     }
 
+# Admin endpoint: shared (copy-on-write) vs private memory per gunicorn process
+@app.get("/api/admin/memory")
+async def memory_usage(admin_key: str = Depends(verify_admin_key)):
+    """Shared vs private memory of the gunicorn master and its workers"""
+    return memory_report()
+
+
 # Admin endpoint to force re-index KB
 @app.post("/api/admin/reindex-kb")
 async def reindex_kb(request: Request, admin_key: str = Depends(verify_admin_key)):
@@ -826,12 +929,36 @@ async def marketing_chat_stream_endpoint(request: Request, chat_request: Marketi
 
           # Real mode: Intelligent caching + agent streaming
 
-            # 1. CHECK CACHE FIRST (with semantic similarity)
+            # 1a. Precomputed answer index (no LLM, no Firestore)
+            try:
+                precomputed, query_embedding = await asyncio.to_thread(
+                    _lookup_precomputed_answer, chat_request.message
+                )
+            except Exception as index_err:
+                logger.warning(f"Answer index lookup failed: {index_err}")
+                precomputed, query_embedding = None, None
+            if precomputed:
+                logger.info(f"Answer index HIT ({precomputed['similarity']:.2f}) for: {chat_request.message[:50]}...")
+                precomputed_text = precomputed['response']
+                yield f"data: {json.dumps({'type': 'content', 'chunk': precomputed_text})}\n\n"
+                done_payload = {
+                    "type": "done",
+                    "token_count": len(precomputed_text),
+                    "finish_reason": "stop",
+                    "cached": True,
+                    "precomputed": True,
+                }
+                yield f"data: {json.dumps(done_payload)}\n\n"
+                yield "data: [DONE]\n\n"
+                return
+
+            # 1b. CHECK CACHE FIRST (with semantic similarity)
             if intelligent_response_cache:
                 try:
                     cached_data = intelligent_response_cache.get_similar_cached_response(
                         query=chat_request.message,
-                        page_context=chat_request.page_context or "unknown"
+                        page_context=chat_request.page_context or "unknown",
+                        query_embedding=query_embedding
                     )
                     if cached_data:
                         logger.info(f"âœ“ Cache HIT for: {chat_request.message[:50]}...")
@@ -877,19 +1004,16 @@ async def marketing_chat_stream_endpoint(request: Request, chat_request: Marketi
             last_flush = datetime.now(timezone.utc)
             total_content_length = 0  # Track total content sent for verification
             full_response_text = ""  # Collect full response for caching
+            grounding_score = None  # Post-hoc KB grounding score from the agent's final chunk
 
             async for chunk in agent.chat_stream(chat_request.message, context):
+                if isinstance(chunk, dict) and "grounding_score" in chunk:
+                    grounding_score = chunk["grounding_score"]
                 text = _extract_text_from_chunk(chunk)
                 if text:
-                    # Filter only EXACT internal patterns using pre-compiled regex (Phase 1, Fix #2)
+                    # Filter only EXACT internal patterns using the pre-compiled matcher (Phase 1, Fix #2)
                     # This prevents legitimate content from being incorrectly filtered
-                    if (
-                        _INTERNAL_CHUNK_PATTERN.search(text)
-                        or _TOOL_CALL_PATTERN.search(text)
-                        or 'additional_kwargs=' in text
-                        or 'response_metadata=' in text
-                        or text.strip() == 'please fix your mistakes'
-                    ):
+                    if _is_internal_chunk(text):
                         logger.debug(f"Skipping internal chunk: {text[:50]}...")
                         continue  # Skip this chunk - it's internal data
 
@@ -919,8 +1043,13 @@ async def marketing_chat_stream_endpoint(request: Request, chat_request: Marketi
                     f"likely truncation. Check max_tokens configuration and LLM completion status. "
                     f"Query: '{chat_request.message[:50]}...'"
                 )
+            # Ungrounded answers were already streamed, but must not be served again from cache
+            grounded = grounding_score is None or grounding_score >= agent.config.grounding_threshold
+            if not grounded:
+                logger.warning(f"Skipping cache for ungrounded response (score: {grounding_score:.2f})")
+
             # 3. Save to cache after generation (if valid)
-            if intelligent_response_cache and full_response_text and total_content_length >= MIN_EXPECTED_LENGTH:
+            if intelligent_response_cache and full_response_text and total_content_length >= MIN_EXPECTED_LENGTH and grounded:
                 try:
                     cache_success = intelligent_response_cache.cache_response_safe(
                         query=chat_request.message,
@@ -940,7 +1069,8 @@ async def marketing_chat_stream_endpoint(request: Request, chat_request: Marketi
                 "type": "done",
                 "token_count": total_content_length,
                 "finish_reason": "stop" if total_content_length >= MIN_EXPECTED_LENGTH else "length",
-                "cached": False
+                "cached": False,
+                "grounding_score": grounding_score
             }
             yield f"data: {json.dumps(done_payload)}\n\n"
             yield "data: [DONE]\n\n"
@@ -1006,6 +1136,18 @@ async def marketing_chat_stream_get(request: Request, message: str, conversation
                 yield "data: [DONE]\n\n"
                 return
 
+            # Precomputed answer index (no LLM, no Firestore)
+            try:
+                precomputed, query_embedding = await asyncio.to_thread(_lookup_precomputed_answer, message)
+            except Exception as index_err:
+                logger.warning(f"Answer index lookup failed (GET): {index_err}")
+                precomputed, query_embedding = None, None
+            if precomputed:
+                logger.info(f"Answer index HIT (GET, {precomputed['similarity']:.2f}) for: {message[:50]}...")
+                yield f"data: {json.dumps({'type': 'content', 'chunk': precomputed['response']})}\n\n"
+                yield "data: [DONE]\n\n"
+                return
+
             # ========================================================================
             # CRITICAL FIX (Phase 1, Fix #1): Check cache first in GET endpoint
             # Frontend uses EventSource (GET only), so cache MUST be in GET endpoint
@@ -1015,7 +1157,8 @@ async def marketing_chat_stream_get(request: Request, message: str, conversation
                 try:
                     cached_data = intelligent_response_cache.get_similar_cached_response(
                         query=message,
-                        page_context=page_context or "unknown"
+                        page_context=page_context or "unknown",
+                        query_embedding=query_embedding
                     )
                     if cached_data:
                         logger.info(f"âœ“ Cache HIT (GET) for: {message[:50]}...")
@@ -1052,16 +1195,9 @@ async def marketing_chat_stream_get(request: Request, message: str, conversation
             async for chunk in agent.chat_stream(message, ctx):
                 text = _extract_text_from_chunk(chunk)
                 if text:
-                    # Filter only EXACT internal patterns using pre-compiled regex (Phase 1, Fix #2)
+                    # Filter only EXACT internal patterns using the pre-compiled matcher (Phase 1, Fix #2)
                     # This prevents legitimate content from being incorrectly filtered
-                    if (
-                        _INTERNAL_CHUNK_PATTERN.search(text)
-                        or _TOOL_CALL_PATTERN.search(text)
-                        or 'additional_kwargs=' in text
-                        or 'response_metadata=' in text
-                        or re.match(r'^\*[a-z_]+\s+knowledge\s+base\*', text, re.IGNORECASE)
-                        or text.strip() == 'please fix your mistakes'
-                    ):
+                    if _is_internal_chunk(text, include_kb_markers=True):
                         continue  # Skip this chunk - it's internal data
 
                     normalized = _normalize_text(text)
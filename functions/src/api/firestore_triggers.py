@@ -284,8 +284,8 @@ def register_custom_handlers():
             from ..cache.cache_invalidation_service import cache_invalidation_service, InvalidationReason
             from ..cache.ttl_config import DataType
             
-            await cache_invalidation_service.invalidate_pattern(
-                pattern="marketplace:prompts:*",
+            await cache_invalidation_service.invalidate_tag(
+                tag="marketplace:prompts",
                 data_type=DataType.PROMPT_CONTENT,
                 reason=InvalidationReason.DEPENDENCY_CHANGED
             )
@@ -55,7 +55,7 @@ app.add_middleware(RequestLoggingMiddleware)
 if redis_manager:
     app.add_middleware(
         CacheMiddleware,
-        redis_client=redis_manager.get_sync_client(),
+        redis_manager=redis_manager,
         default_ttl=300
     )
     app.add_middleware(
@@ -3,17 +3,41 @@ FastAPI Middleware for Performance Optimization
 """
 import time
 import uuid
+import hashlib
 import logging
-from typing import Callable, Dict, Any
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
 import redis
 import asyncio
-from datetime import datetime, timedelta
 import json
 
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Compression tuning: level 6 / quality 4 are the usual speed/ratio sweet
+# spots for dynamic responses (gzip.compress defaults to 9)
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+# Bodies/chunks at least this large are compressed in a worker thread
+COMPRESSION_THREAD_THRESHOLD = int(os.getenv("COMPRESSION_THREAD_THRESHOLD", str(256 * 1024)))
+COMPRESS_EVENT_STREAMS = os.getenv("COMPRESS_EVENT_STREAMS", "false").lower() == "true"
+
+# Response cache: seconds a stale entry may still be served while it is
+# refreshed, and how long a worker waits for another worker's computation
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", "60"))
+CACHE_LOCK_WAIT_S = float(os.getenv("CACHE_LOCK_WAIT_S", "2.0"))
+
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     """Middleware for request logging and timing"""
     
@@ -153,13 +177,36 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             logger.error(f"Error getting remaining requests: {e}")
             return self.requests_per_minute
 
-class CacheMiddleware(BaseHTTPMiddleware):
-    """Response caching middleware"""
-    
-    def __init__(self, app, redis_client=None, default_ttl: int = 300):
-        super().__init__(app)
-        self.redis_client = redis_client
+class CacheMiddleware:
+    """
+    Shared response cache for a few expensive GET endpoints (pure ASGI)
+
+    - Keys are a SHA-256 digest of path, caller identity, sorted query string
+      and negotiated content encoding, so every worker computes the same key.
+    - Entries are stored as raw bytes through the async Redis client and carry
+      an ETag; a matching ``If-None-Match`` gets a 304 with no body.
+    - Concurrent misses for a key in one process share a single downstream
+      call, and a Redis lock keeps other workers waiting for that result
+      instead of recomputing it.
+    - Entries stay in Redis for ``stale_ttl`` seconds past ``default_ttl``;
+      a stale hit is served immediately while one background call refreshes it.
+    """
+
+    def __init__(
+        self,
+        app,
+        redis_client=None,
+        default_ttl: int = 300,
+        stale_ttl: int = CACHE_STALE_TTL,
+        redis_manager=None,
+        lock_wait: float = CACHE_LOCK_WAIT_S
+    ):
+        self.app = app
+        self.redis_client = redis_client  # redis.asyncio client
+        self.redis_manager = redis_manager
         self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_wait = lock_wait
         self.cacheable_methods = {"GET"}
         self.cacheable_paths = {
             "/api/ai/system-status",
@@ -167,135 +214,403 @@ class CacheMiddleware(BaseHTTPMiddleware):
             "/health",
             "/health/detailed"
         }
-    
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        # Only cache GET requests for specific paths
-        if (request.method not in self.cacheable_methods or 
-            request.url.path not in self.cacheable_paths or
-            not self.redis_client):
-            return await call_next(request)
-        
-        # Generate cache key
-        cache_key = self._generate_cache_key(request)
-        
-        # Try to get cached response
-        cached_response = await self._get_cached_response(cache_key)
-        if cached_response:
-            logger.debug(f"Cache hit for {request.url.path}")
-            response = Response(
-                content=cached_response["content"],
-                status_code=cached_response["status_code"],
-                headers=cached_response["headers"]
-            )
-            response.headers["X-Cache"] = "HIT"
-            return response
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Cache successful responses
-        if response.status_code == 200:
-            await self._cache_response(cache_key, response)
-            response.headers["X-Cache"] = "MISS"
-        
-        return response
-    
-    def _generate_cache_key(self, request: Request) -> str:
-        """Generate cache key for request"""
-        # Include user ID if authenticated for user-specific caching
-        user_id = getattr(request.state, "user_id", "anonymous")
-        query_string = str(request.query_params) if request.query_params else ""
-        return f"cache:{request.url.path}:{user_id}:{hash(query_string)}"
-    
-    async def _get_cached_response(self, cache_key: str) -> Dict[str, Any]:
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or
+            scope["method"] not in self.cacheable_methods or
+            scope["path"] not in self.cacheable_paths or
+            not (self.redis_client or self.redis_manager)):
+            await self.app(scope, receive, send)
+            return
+
+        cache_key = self._generate_cache_key(scope)
+        if_none_match = Headers(scope=scope).get("if-none-match")
+
+        entry = await self._get_cached_response(cache_key)
+        if entry is not None:
+            if entry.age() < self.default_ttl:
+                logger.debug(f"Cache hit for {scope['path']}")
+                await entry.send(send, if_none_match, "HIT")
+                return
+            self._revalidate(cache_key, scope)
+            await entry.send(send, if_none_match, "STALE")
+            return
+
+        entry = await self._single_flight(cache_key, scope, wait_for_peers=True)
+        if entry is None:
+            # Joined a background refresh that another worker is doing
+            await self.app(scope, receive, send)
+            return
+        await entry.send(send, if_none_match, "MISS" if entry.status_code == 200 else None)
+
+    def _generate_cache_key(self, scope) -> str:
+        """Stable cache key for a request (identical across processes)"""
+        headers = Headers(scope=scope)
+        # Auth runs in route dependencies, after middleware, so state.user_id
+        # is rarely set here; fall back to a digest of the credentials
+        user_id = scope.get("state", {}).get("user_id")
+        if user_id:
+            identity = f"user:{user_id}"
+        elif headers.get("authorization"):
+            identity = "auth:" + hashlib.sha256(headers["authorization"].encode()).hexdigest()
+        else:
+            identity = "anonymous"
+        query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+        # CompressionMiddleware runs inside this one, so cached bodies are encoded
+        encoding = CompressionMiddleware._negotiate_encoding(headers.get("accept-encoding", "")) or "identity"
+
+        digest = hashlib.sha256("\n".join((scope["path"], identity, query, encoding)).encode()).hexdigest()
+        return f"cache:{digest}"
+
+    async def _redis(self):
+        if self.redis_client is None:
+            self.redis_client = await self.redis_manager.get_async_client()
+        return self.redis_client
+
+    async def _get_cached_response(self, cache_key: str) -> Optional["_CachedResponse"]:
         """Get cached response"""
         try:
-            cached_data = self.redis_client.get(cache_key)
+            cached_data = await (await self._redis()).get(cache_key)
             if cached_data:
-                return json.loads(cached_data)
+                return _CachedResponse.from_bytes(cached_data)
         except Exception as e:
             logger.error(f"Cache retrieval error: {e}")
         return None
-    
-    async def _cache_response(self, cache_key: str, response: Response):
-        """Cache response"""
+
+    async def _cache_response(self, cache_key: str, entry: "_CachedResponse"):
+        """Cache response until it is past its stale window"""
         try:
-            # Read response body
-            body = b""
-            async for chunk in response.body_iterator:
-                body += chunk
-            
-            # Prepare cache data
-            cache_data = {
-                "content": body.decode("utf-8"),
-                "status_code": response.status_code,
-                "headers": dict(response.headers),
-                "cached_at": datetime.utcnow().isoformat()
-            }
-            
-            # Store in cache
-            self.redis_client.setex(
-                cache_key,
-                self.default_ttl,
-                json.dumps(cache_data)
-            )
-            
-            # Recreate response body iterator
-            response.body_iterator = self._create_body_iterator(body)
-            
+            await (await self._redis()).set(cache_key, entry.to_bytes(), ex=self.default_ttl + self.stale_ttl)
         except Exception as e:
             logger.error(f"Cache storage error: {e}")
-    
-    def _create_body_iterator(self, body: bytes):
-        """Create body iterator from bytes"""
-        async def generate():
-            yield body
-        return generate()
-
-class CompressionMiddleware(BaseHTTPMiddleware):
-    """Response compression middleware"""
-    
-    def __init__(self, app, minimum_size: int = 1024):
-        super().__init__(app)
+
+    def _single_flight(self, cache_key: str, scope, wait_for_peers: bool = False) -> asyncio.Future:
+        """Join the in-flight computation for a key, or start one"""
+        # Shield so a disconnecting client doesn't cancel the shared call
+        return asyncio.shield(self._inflight_task(cache_key, scope, wait_for_peers))
+
+    def _inflight_task(self, cache_key: str, scope, wait_for_peers: bool) -> asyncio.Task:
+        task = self._inflight.get(cache_key)
+        if task is None:
+            scope = {**scope, "state": dict(scope.get("state", {}))}
+            task = asyncio.create_task(self._compute(cache_key, scope, wait_for_peers))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda done: self._finish(cache_key, done))
+        return task
+
+    def _finish(self, cache_key: str, task: asyncio.Task):
+        self._inflight.pop(cache_key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Cache computation failed for {cache_key}: {task.exception()}")
+
+    def _revalidate(self, cache_key: str, scope):
+        """Refresh a stale entry in the background (once per key)"""
+        self._inflight_task(cache_key, scope, wait_for_peers=False)
+
+    async def _compute(self, cache_key: str, scope, wait_for_peers: bool) -> "_CachedResponse":
+        lock_key = f"{cache_key}:lock"
+        locked = await self._acquire_lock(lock_key)
+        if not locked:
+            if not wait_for_peers:
+                # Another worker is already revalidating this entry
+                return None
+            entry = await self._wait_for_peer(cache_key)
+            if entry is not None:
+                return entry
+        try:
+            entry = await self._call_app(scope)
+            if entry.status_code == 200:
+                await self._cache_response(cache_key, entry)
+            return entry
+        finally:
+            if locked:
+                await self._release_lock(lock_key)
+
+    async def _acquire_lock(self, lock_key: str) -> bool:
+        try:
+            ttl_ms = max(1, int(self.lock_wait * 1000)) * 2
+            return bool(await (await self._redis()).set(lock_key, b"1", nx=True, px=ttl_ms))
+        except Exception as e:
+            logger.error(f"Cache lock error: {e}")
+            return True  # No Redis, no coordination: compute locally
+
+    async def _release_lock(self, lock_key: str):
+        try:
+            await (await self._redis()).delete(lock_key)
+        except Exception as e:
+            logger.error(f"Cache lock error: {e}")
+
+    async def _wait_for_peer(self, cache_key: str) -> Optional["_CachedResponse"]:
+        """Poll for the entry another worker is computing"""
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await self._get_cached_response(cache_key)
+            if entry is not None:
+                return entry
+        return None
+
+    async def _call_app(self, scope) -> "_CachedResponse":
+        """Run the downstream app and capture its response"""
+        start = {}
+        body = bytearray()
+
+        async def receive():
+            # Cacheable requests are bodiless GETs; don't tie the shared call
+            # to whichever client happened to start it
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() not in _UNCACHED_HEADERS]
+        return _CachedResponse(start.get("status", 500), headers, bytes(body))
+
+
+_UNCACHED_HEADERS = {b"set-cookie", b"x-request-id", b"x-process-time", b"etag"}
+
+
+@dataclass
+class _CachedResponse:
+    """A captured response, stored in Redis as a length-prefixed JSON header plus raw body"""
+
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    stored_at: float = field(default_factory=time.time)
+    etag: str = ""
+
+    def __post_init__(self):
+        if not self.etag:
+            self.etag = '"%s"' % hashlib.blake2b(self.body, digest_size=16).hexdigest()
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def to_bytes(self) -> bytes:
+        meta = json.dumps({
+            "status_code": self.status_code,
+            "headers": [[k.decode("latin-1"), v.decode("latin-1")] for k, v in self.headers],
+            "stored_at": self.stored_at,
+            "etag": self.etag
+        }).encode()
+        return len(meta).to_bytes(4, "big") + meta + self.body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "_CachedResponse":
+        meta_length = int.from_bytes(data[:4], "big")
+        meta = json.loads(data[4:4 + meta_length])
+        return cls(
+            status_code=meta["status_code"],
+            headers=[(k.encode("latin-1"), v.encode("latin-1")) for k, v in meta["headers"]],
+            body=data[4 + meta_length:],
+            stored_at=meta["stored_at"],
+            etag=meta["etag"]
+        )
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match or self.status_code != 200:
+            return False
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or self.etag in candidates
+
+    async def send(self, send, if_none_match: Optional[str], cache_status: Optional[str]):
+        headers = MutableHeaders(raw=list(self.headers))
+        if self.status_code == 200:
+            headers["etag"] = self.etag
+        if cache_status:
+            headers["x-cache"] = cache_status
+            headers["age"] = str(int(self.age()))
+
+        if self.matches(if_none_match):
+            # 304 keeps validators and caching headers, drops the representation
+            for name in ("content-length", "content-type", "content-encoding"):
+                if name in headers:
+                    del headers[name]
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": self.body})
+
+class CompressionMiddleware:
+    """
+    Response compression middleware (pure ASGI)
+
+    - Negotiates ``br`` (when the brotli package is installed) or ``gzip``
+      from Accept-Encoding, honouring q-values.
+    - Single-message bodies below ``minimum_size`` are sent unchanged; larger
+      ones are compressed in one call, in a worker thread above
+      ``thread_threshold`` so the event loop keeps serving other requests.
+    - Streaming bodies are compressed chunk by chunk and each chunk is flushed
+      (zlib Z_SYNC_FLUSH / brotli flush), so every chunk the app sends is
+      decodable by the client as soon as it arrives.
+    - ``text/event-stream`` is left alone unless ``compress_event_streams``.
+    """
+
+    COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+        compress_event_streams: bool = COMPRESS_EVENT_STREAMS,
+        thread_threshold: int = COMPRESSION_THREAD_THRESHOLD
+    ):
+        self.app = app
         self.minimum_size = minimum_size
-    
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        response = await call_next(request)
-        
-        # Check if client accepts gzip
-        accept_encoding = request.headers.get("accept-encoding", "")
-        if "gzip" not in accept_encoding.lower():
-            return response
-        
-        # Check content type
-        content_type = response.headers.get("content-type", "")
-        if not any(ct in content_type for ct in ["application/json", "text/", "application/javascript"]):
-            return response
-        
-        # Get response body
-        body = b""
-        async for chunk in response.body_iterator:
-            body += chunk
-        
-        # Compress if body is large enough
-        if len(body) >= self.minimum_size:
-            import gzip
-            compressed_body = gzip.compress(body)
-            
-            # Update headers
-            response.headers["content-encoding"] = "gzip"
-            response.headers["content-length"] = str(len(compressed_body))
-            
-            # Create new response with compressed body
-            response.body_iterator = self._create_body_iterator(compressed_body)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.compress_event_streams = compress_event_streams
+        self.thread_threshold = thread_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    @staticmethod
+    def _negotiate_encoding(accept_encoding: str):
+        """Preferred supported encoding ('br' or 'gzip'), or None"""
+        weights = {}
+        for part in accept_encoding.lower().split(","):
+            name, _, params = part.strip().partition(";")
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            weights[name.strip()] = q
+
+        candidates = ["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"]
+        wildcard = weights.get("*", 0.0)
+        best = max(candidates, key=lambda name: weights.get(name, wildcard))
+        return best if weights.get(best, wildcard) > 0 else None
+
+    def _should_compress(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("text/event-stream"):
+            return self.compress_event_streams
+        return any(ct in content_type for ct in self.COMPRESSIBLE_TYPES)
+
+    def _compressor(self, encoding: str):
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+    async def _run(self, func, data: bytes) -> bytes:
+        # Large bodies are compressed off the event loop
+        if len(data) >= self.thread_threshold:
+            return await asyncio.to_thread(func, data)
+        return func(data)
+
+
+class _GzipStream:
+    """Incremental gzip: ``chunk`` output is decodable up to that point"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class _CompressionResponder:
+    """Per-response send wrapper for CompressionMiddleware"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start_message = None
+        self._stream = None
+        self._passthrough = False
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if self.middleware._should_compress(headers):
+                # Hold the start message until the first body chunk decides
+                # between one-shot and streaming compression
+                self._start_message = message
+            else:
+                self._passthrough = True
+                await self._send(message)
+            return
+
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start_message is not None:
+            start, self._start_message = self._start_message, None
+            if not more_body:
+                if len(body) < self.middleware.minimum_size:
+                    self._passthrough = True
+                    await self._send(start)
+                    await self._send(message)
+                    return
+                compressed = await self.middleware._run(self.middleware._compressor(self.encoding).finish, body)
+                await self._send(self._compressed_start(start, len(compressed)))
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            self._stream = self.middleware._compressor(self.encoding)
+            await self._send(self._compressed_start(start, None))
+
+        if more_body:
+            data = await self.middleware._run(self._stream.chunk, body) if body else b""
         else:
-            # Recreate original body iterator
-            response.body_iterator = self._create_body_iterator(body)
-        
-        return response
-    
-    def _create_body_iterator(self, body: bytes):
-        """Create body iterator from bytes"""
-        async def generate():
-            yield body
-        return generate()
+            data = await self.middleware._run(self._stream.finish, body)
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _compressed_start(self, start, content_length):
+        headers = MutableHeaders(raw=list(start["headers"]))
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            if "content-length" in headers:
+                del headers["content-length"]
+        else:
+            headers["content-length"] = str(content_length)
+        return {**start, "headers": headers.raw}
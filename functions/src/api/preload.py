@@ -0,0 +1,235 @@
+"""
+Fork-after-load preloading for multi-worker deployments
+
+With PRELOAD_SHARED_STATE=true the gunicorn master (see gunicorn.conf.py)
+loads read-only heavy state once, before workers are forked:
+
+- CrossEncoder reranker weights
+- BM25 engine resources (stopword list, stemmer, spell-check dictionary)
+- Precomputed answer index (entries + normalized embedding matrix)
+- Static system prompt templates
+
+Workers then share those pages copy-on-write instead of each loading its own
+copy. ``gc.freeze()`` moves the preloaded objects out of the collector's
+generations so a worker's GC passes do not write to (and un-share) them.
+
+Only import-safe, read-only state is loaded here: no Firestore/gRPC clients,
+no threads, no event loop objects and no model inference, none of which
+survive a fork. Per-worker mutable state (caches, counters, locks, the
+telemetry thread) is re-created after fork by ``reset_worker_state()``.
+
+The memory report reads /proc/<pid>/smaps_rollup (Linux) and splits each
+process into shared and private pages; Pss is the fair per-process share.
+"""
+import gc
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_SHARED_STATE = os.getenv("PRELOAD_SHARED_STATE", "false").lower() == "true"
+# Set in the master so workers (and the admin endpoint) can find their siblings
+MASTER_PID_ENV = "SHARED_STATE_MASTER_PID"
+
+PROC_ROOT = Path("/proc")
+
+# smaps_rollup fields (kB) used by the report
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+_preloaded: Dict[str, bool] = {}
+
+
+def preload_shared_state() -> Dict[str, bool]:
+    """
+    Load read-only heavy state into the current (master) process.
+
+    Module names match the ones cloud_run_main imports, so workers reuse the
+    same module objects after fork. Every component is best-effort: a failure
+    leaves it to the worker's own lazy load.
+
+    Returns:
+        Component -> loaded
+    """
+    start = time.perf_counter()
+    results = {
+        "cross_encoder": False,
+        "bm25_engine": False,
+        "answer_index": False,
+        "prompt_templates": False,
+    }
+
+    try:
+        # Importing the retriever builds the hybrid/BM25 singletons
+        from ai_agent.marketing.marketing_retriever import marketing_retriever
+        results["bm25_engine"] = True
+        # Weights only: inference in the master would start BLAS/OpenMP thread
+        # pools that are not fork-safe
+        marketing_retriever.prewarm_models()
+        results["cross_encoder"] = marketing_retriever._cross_encoder is not None
+    except Exception as e:
+        logger.warning(f"[PRELOAD] Retriever preload failed (workers load lazily): {e}")
+
+    try:
+        # Not rag.cache_manager: importing it builds the Firestore-backed
+        # response cache singleton, which must be created in the worker
+        from rag.answer_index import (
+            ANSWER_INDEX_ENABLED, EMBEDDING_MODEL_NAME, answer_index, compute_kb_content_hash
+        )
+        if ANSWER_INDEX_ENABLED:
+            results["answer_index"] = answer_index.load_latest(
+                kb_hash=compute_kb_content_hash(),
+                embedding_model=EMBEDDING_MODEL_NAME
+            )
+    except Exception as e:
+        logger.warning(f"[PRELOAD] Answer index preload failed: {e}")
+
+    try:
+        from ai_agent.marketing.prompts.marketing_prompts import get_static_prefix, get_system_prompt
+        get_system_prompt()
+        get_static_prefix()
+        results["prompt_templates"] = True
+    except Exception as e:
+        logger.warning(f"[PRELOAD] Prompt template preload failed: {e}")
+
+    # Collect garbage from loading, then keep everything left out of future
+    # collections so workers never touch these objects' GC headers
+    gc.collect()
+    gc.freeze()
+
+    os.environ[MASTER_PID_ENV] = str(os.getpid())
+    _preloaded.clear()
+    _preloaded.update(results)
+
+    logger.info(
+        f"[PRELOAD] Shared state loaded in {time.perf_counter() - start:.2f}s: {results} "
+        f"(frozen objects: {gc.get_freeze_count()})"
+    )
+    return results
+
+
+def preloaded_components() -> Dict[str, bool]:
+    """Components loaded by the master before fork (empty when not preloading)"""
+    return dict(_preloaded)
+
+
+def reset_worker_state():
+    """
+    Re-create per-worker mutable state after fork.
+
+    Only touches modules that are already imported: anything not loaded by
+    the master is created fresh in the worker anyway.
+    """
+    retriever_module = sys.modules.get("ai_agent.marketing.marketing_retriever")
+    if retriever_module is not None:
+        retriever_module.marketing_retriever.reset_after_fork()
+
+    for name in ("rag.answer_index", "src.rag.answer_index"):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.answer_index.reset_after_fork()
+
+    for name in ("ai_agent.common.telemetry", "src.ai_agent.common.telemetry"):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.reset_telemetry_sink_after_fork()
+
+
+# ============================================================================
+# Shared vs private memory report
+# ============================================================================
+
+def read_memory_usage(pid: Any = "self", proc_root: Path = PROC_ROOT) -> Optional[Dict[str, int]]:
+    """
+    Shared/private memory of one process from smaps_rollup.
+
+    Args:
+        pid: Process id (or "self")
+        proc_root: procfs mount point
+
+    Returns:
+        Dict of rss_kb, pss_kb, shared_kb, private_kb, or None if unavailable
+    """
+    try:
+        text = (Path(proc_root) / str(pid) / "smaps_rollup").read_text()
+    except OSError:
+        return None
+
+    fields: Dict[str, int] = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(":")
+        if name in _SMAPS_FIELDS:
+            fields[name] = int(value.split()[0])
+    if "Rss" not in fields:
+        return None
+
+    return {
+        "rss_kb": fields["Rss"],
+        "pss_kb": fields.get("Pss", fields["Rss"]),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def child_pids(pid: int, proc_root: Path = PROC_ROOT) -> List[int]:
+    """Direct children of ``pid`` (the gunicorn workers, for the master)"""
+    try:
+        text = (Path(proc_root) / str(pid) / "task" / str(pid) / "children").read_text()
+    except OSError:
+        return []
+    return [int(child) for child in text.split()]
+
+
+def memory_report(master_pid: Optional[int] = None, proc_root: Path = PROC_ROOT) -> Dict[str, Any]:
+    """
+    Shared vs private memory across the master and its workers.
+
+    Args:
+        master_pid: Gunicorn master pid (defaults to the preloading master, or
+            this process when not running under a preloading master)
+        proc_root: procfs mount point
+
+    Returns:
+        Per-process usage plus totals. ``total_pss_kb`` is the real combined
+        footprint; ``total_rss_kb - total_pss_kb`` is what sharing saved.
+    """
+    if master_pid is None:
+        master_pid = int(os.getenv(MASTER_PID_ENV, os.getpid()))
+
+    processes = {}
+    master = read_memory_usage(master_pid, proc_root)
+    if master is not None:
+        processes[str(master_pid)] = {"role": "master", **master}
+    for pid in child_pids(master_pid, proc_root):
+        usage = read_memory_usage(pid, proc_root)
+        if usage is not None:
+            processes[str(pid)] = {"role": "worker", **usage}
+
+    workers = [usage for usage in processes.values() if usage["role"] == "worker"]
+    total_rss = sum(usage["rss_kb"] for usage in processes.values())
+    total_pss = sum(usage["pss_kb"] for usage in processes.values())
+    return {
+        "available": bool(processes),
+        "master_pid": master_pid,
+        "preloaded": preloaded_components(),
+        "processes": processes,
+        "total_rss_kb": total_rss,
+        "total_pss_kb": total_pss,
+        "shared_savings_kb": total_rss - total_pss,
+        "worker_shared_kb": sum(usage["shared_kb"] for usage in workers),
+        "worker_private_kb": sum(usage["private_kb"] for usage in workers),
+    }
+
+
+def log_memory_usage(label: str, pid: Any = "self"):
+    """Log one process's shared/private split"""
+    usage = read_memory_usage(pid)
+    if usage is None:
+        return
+    logger.info(
+        f"[MEMORY] {label}: rss={usage['rss_kb'] / 1024:.1f}MB pss={usage['pss_kb'] / 1024:.1f}MB "
+        f"shared={usage['shared_kb'] / 1024:.1f}MB private={usage['private_kb'] / 1024:.1f}MB"
+    )
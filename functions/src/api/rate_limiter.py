@@ -1,29 +1,150 @@
 """
 Rate Limiting Middleware
 Per-user rate limiting for API endpoints
+
+Uses a sliding-window counter: each user has a counter for the current fixed
+window and remembers the previous window's count, and the effective usage is
+``current + previous * (1 - elapsed_fraction)``. Every check is a single
+atomic increment on the backend (Redis MULTI, or a Firestore Increment on one
+of a few sharded counter docs followed by a read of the shards), so
+concurrent requests cannot over-admit and state stays O(1) per user. Denied attempts are counted too, which keeps callers that
+hammer the API limited.
 """
 
+from abc import ABC, abstractmethod
 from firebase_admin import firestore
 from firebase_functions import https_fn
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
+import asyncio
 import logging
+import os
+import random
+import threading
+import time
 
 from .models import RateLimitInfo
 
 logger = logging.getLogger(__name__)
 
+# Counter shards per user and window; each shard doc sustains about one write/s
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "4"))
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for sliding-window counters
+
+    ``increment`` must atomically add one to the counter for ``window_id``
+    and return (current_window_count, previous_window_count).
+    """
+
+    @abstractmethod
+    async def increment(self, key: str, window_id: int, window_seconds: int) -> Tuple[int, int]:
+        ...
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Process-local backend for tests and single-instance development"""
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, int, int]] = {}  # key -> (window_id, count, prev_count)
+        self._lock = threading.Lock()
+
+    async def increment(self, key: str, window_id: int, window_seconds: int) -> Tuple[int, int]:
+        with self._lock:
+            stored_window, count, prev_count = self._counters.get(key, (window_id, 0, 0))
+            if stored_window == window_id:
+                count += 1
+            elif stored_window == window_id - 1:
+                prev_count, count = count, 1
+            else:
+                prev_count, count = 0, 1
+            self._counters[key] = (window_id, count, prev_count)
+            return count, prev_count
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Redis backend: one INCR per check, in the same MULTI as the read of the
+    previous window's counter (keys expire after two windows)
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client  # redis.asyncio client
+
+    async def increment(self, key: str, window_id: int, window_seconds: int) -> Tuple[int, int]:
+        current_key = f"rate_limit:{key}:{window_id}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, window_seconds * 2)
+            pipe.get(f"rate_limit:{key}:{window_id - 1}")
+            count, _, prev_count = await pipe.execute()
+        return int(count), int(prev_count or 0)
+
+
+class FirestoreRateLimitBackend(RateLimitBackend):
+    """
+    Firestore backend: sharded counter docs per user and window
+
+    A check adds one to a random shard of the current window with an atomic
+    Increment (no transaction, so concurrent requests do not contend or
+    retry), then reads every shard of the current and previous windows in one
+    batched get. A request's read follows its own committed increment, so the
+    k-th request of a window always sees at least k. Each shard doc sustains
+    about one write/s, so a user is limited to roughly ``shards`` checks per
+    second. Shard docs carry ``expiresAt`` for a Firestore TTL policy.
+    """
+
+    def __init__(self, db: firestore.Client, collection: str = 'rate_limits', shards: int = RATE_LIMIT_SHARDS):
+        self.db = db
+        self.collection = collection
+        self.shards = max(1, shards)
+
+    async def increment(self, key: str, window_id: int, window_seconds: int) -> Tuple[int, int]:
+        # Firestore client calls are blocking; keep them off the event loop
+        return await asyncio.to_thread(self._increment_sync, key, window_id, window_seconds)
+
+    def _shard_ref(self, key: str, window_id: int, shard: int):
+        return self.db.collection(self.collection).document(f"{key}__{window_id}__{shard}")
+
+    def _increment_sync(self, key: str, window_id: int, window_seconds: int) -> Tuple[int, int]:
+        shard = random.randrange(self.shards)
+        self._shard_ref(key, window_id, shard).set({
+            'userId': key,
+            'windowId': window_id,
+            'count': firestore.Increment(1),
+            'expiresAt': datetime.utcfromtimestamp((window_id + 2) * window_seconds)
+        }, merge=True)
+
+        refs = [
+            self._shard_ref(key, window, n)
+            for window in (window_id, window_id - 1) for n in range(self.shards)
+        ]
+        counts = {window_id: 0, window_id - 1: 0}
+        for snapshot in self.db.get_all(refs):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict() or {}
+            if data.get('windowId') in counts:
+                counts[data['windowId']] += int(data.get('count', 0))
+        return counts[window_id], counts[window_id - 1]
+
 
 class RateLimiter:
     """
-    Per-user rate limiter using Firestore for state storage
+    Per-user sliding-window rate limiter
+
+    Defaults to Firestore for state storage; pass a RedisRateLimitBackend for
+    hot paths or an InMemoryRateLimitBackend in tests.
     """
     
     def __init__(
         self,
         db: firestore.Client,
         limit: int = 100,
-        window_hours: int = 1
+        window_hours: int = 1,
+        backend: Optional[RateLimitBackend] = None
     ):
         """
         Initialize rate limiter
@@ -32,10 +153,13 @@ class RateLimiter:
             db: Firestore client
             limit: Maximum requests per window
             window_hours: Time window in hours
+            backend: Counter storage (defaults to Firestore)
         """
         self.db = db
         self.limit = limit
         self.window_hours = window_hours
+        self.window_seconds = int(window_hours * 3600)
+        self.backend = backend or FirestoreRateLimitBackend(db)
     
     async def check_rate_limit(self, user_id: str) -> Tuple[bool, Optional[RateLimitInfo]]:
         """
@@ -50,72 +174,37 @@ class RateLimiter:
             - rate_limit_info: Rate limit information (None if allowed)
         """
         try:
-            # Get user's rate limit document
-            rate_limit_ref = self.db.collection('rate_limits').document(user_id)
-            rate_limit_doc = rate_limit_ref.get()
-            
-            now = datetime.utcnow()
-            window_start = now - timedelta(hours=self.window_hours)
-            
-            if not rate_limit_doc.exists:
-                # First request - create document
-                rate_limit_ref.set({
-                    'userId': user_id,
-                    'requests': [{
-                        'timestamp': now,
-                        'count': 1
-                    }],
-                    'createdAt': now,
-                    'updatedAt': now
-                })
-                
-                return True, None
-            
-            # Get existing data
-            data = rate_limit_doc.to_dict()
-            requests = data.get('requests', [])
-            
-            # Filter requests within the window
-            recent_requests = [
-                r for r in requests
-                if isinstance(r.get('timestamp'), datetime) and r['timestamp'] >= window_start
-            ]
-            
-            # Count total requests in window
-            total_requests = sum(r.get('count', 1) for r in recent_requests)
-            
-            if total_requests >= self.limit:
-                # Rate limit exceeded
-                oldest_request = min(recent_requests, key=lambda r: r['timestamp'])
-                reset_at = oldest_request['timestamp'] + timedelta(hours=self.window_hours)
-                retry_after = int((reset_at - now).total_seconds())
-                
+            now = time.time()
+            window_id = int(now // self.window_seconds)
+            elapsed_fraction = (now % self.window_seconds) / self.window_seconds
+
+            count, prev_count = await self.backend.increment(user_id, window_id, self.window_seconds)
+
+            # Weighted usage including this request
+            weighted = count + prev_count * (1 - elapsed_fraction)
+
+            if weighted > self.limit:
+                # Rate limit exceeded. If the current window alone is over
+                # the limit, wait for it to end; otherwise wait until enough
+                # of the previous window has slid out.
+                if count > self.limit or prev_count == 0:
+                    retry_after = self.window_seconds * (1 - elapsed_fraction)
+                else:
+                    needed_fraction = 1 - (self.limit - count) / prev_count
+                    retry_after = (needed_fraction - elapsed_fraction) * self.window_seconds
+
+                retry_after = int(max(retry_after, 0))
                 rate_limit_info = RateLimitInfo(
                     limit=self.limit,
                     remaining=0,
-                    reset_at=reset_at,
+                    reset_at=datetime.utcfromtimestamp(now) + timedelta(seconds=retry_after),
                     retry_after=max(retry_after, 60)  # Minimum 60 seconds
                 )
                 
-                logger.warning(f"Rate limit exceeded for user {user_id}: {total_requests}/{self.limit}")
+                logger.warning(f"Rate limit exceeded for user {user_id}: {weighted:.1f}/{self.limit}")
                 return False, rate_limit_info
             
-            # Add this request
-            recent_requests.append({
-                'timestamp': now,
-                'count': 1
-            })
-            
-            # Update document
-            rate_limit_ref.update({
-                'requests': recent_requests,
-                'updatedAt': now
-            })
-            
-            # Calculate remaining
-            remaining = self.limit - (total_requests + 1)
-            
-            logger.info(f"Rate limit check passed for user {user_id}: {total_requests + 1}/{self.limit}")
+            logger.info(f"Rate limit check passed for user {user_id}: {weighted:.1f}/{self.limit}")
             return True, None
             
         except Exception as e:
@@ -125,7 +214,8 @@ class RateLimiter:
     
     async def cleanup_old_requests(self, user_id: str):
         """
-        Clean up old request records to prevent document bloat
+        Remove the legacy per-request ``requests`` array from a user's
+        rate limit document (counter docs no longer grow)
         
         Args:
             user_id: User ID to clean up
@@ -134,25 +224,14 @@ class RateLimiter:
             rate_limit_ref = self.db.collection('rate_limits').document(user_id)
             rate_limit_doc = rate_limit_ref.get()
             
-            if not rate_limit_doc.exists:
+            if not rate_limit_doc.exists or 'requests' not in (rate_limit_doc.to_dict() or {}):
                 return
-            
-            data = rate_limit_doc.to_dict()
-            requests = data.get('requests', [])
-            
-            # Keep only requests from the last 2 windows
-            cutoff = datetime.utcnow() - timedelta(hours=self.window_hours * 2)
-            recent_requests = [
-                r for r in requests
-                if isinstance(r.get('timestamp'), datetime) and r['timestamp'] >= cutoff
-            ]
-            
-            if len(recent_requests) < len(requests):
-                rate_limit_ref.update({
-                    'requests': recent_requests,
-                    'updatedAt': datetime.utcnow()
-                })
-                logger.info(f"Cleaned up {len(requests) - len(recent_requests)} old requests for user {user_id}")
+
+            rate_limit_ref.update({
+                'requests': firestore.DELETE_FIELD,
+                'updatedAt': datetime.utcnow()
+            })
+            logger.info(f"Removed legacy request log for user {user_id}")
                 
         except Exception as e:
             logger.error(f"Error cleaning up rate limit data: {e}")
@@ -162,7 +241,8 @@ async def check_rate_limit(
     user_id: str,
     db: firestore.Client,
     limit: int = 100,
-    window_hours: int = 1
+    window_hours: int = 1,
+    backend: Optional[RateLimitBackend] = None
 ) -> Tuple[bool, Optional[RateLimitInfo]]:
     """
     Convenience function to check rate limit
@@ -172,11 +252,12 @@ async def check_rate_limit(
         db: Firestore client
         limit: Maximum requests per window
         window_hours: Time window in hours
+        backend: Counter storage (defaults to Firestore)
     
     Returns:
         Tuple of (is_allowed, rate_limit_info)
     """
-    rate_limiter = RateLimiter(db, limit, window_hours)
+    rate_limiter = RateLimiter(db, limit, window_hours, backend=backend)
     return await rate_limiter.check_rate_limit(user_id)
 
 
@@ -3,7 +3,7 @@ Cache module - Unified interface for different cache backends
 """
 import os
 import logging
-from typing import Optional, Any, Dict, Union
+from typing import Optional, Any, Dict, Union, Callable, Tuple
 from .firebase_cache import firebase_cache, FirebaseCache, FIREBASE_AVAILABLE
 
 logger = logging.getLogger(__name__)
@@ -44,6 +44,17 @@ class LocalMemoryCache:
         self._counters[key] = new_value
         return new_value
 
+    async def atomic_update(
+        self,
+        key: str,
+        update: Callable[[Optional[Any]], Tuple[Any, Any]],
+        ttl_seconds: int = 3600
+    ) -> Any:
+        """Read-modify-write a value (atomic within one event loop)"""
+        new_value, result = update(self._cache.get(key))
+        self._cache[key] = new_value
+        return result
+
     async def cleanup_expired(self) -> int:
         """No-op for memory cache"""
         return 0
@@ -106,6 +117,15 @@ class CacheManager:
         """Increment a counter"""
         return await self.backend.increment(key, amount, ttl_seconds)
 
+    async def atomic_update(
+        self,
+        key: str,
+        update: Callable[[Optional[Any]], Tuple[Any, Any]],
+        ttl_seconds: int = 3600
+    ) -> Any:
+        """Atomically replace a value with update(current); returns update's result"""
+        return await self.backend.atomic_update(key, update, ttl_seconds)
+
     async def cleanup_expired(self) -> int:
         """Clean up expired entries"""
         return await self.backend.cleanup_expired()
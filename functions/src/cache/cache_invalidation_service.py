@@ -2,19 +2,27 @@
 Cache Invalidation Service
 Handles TTL-based and event-based cache invalidation across all cache layers
 """
+import os
+import re
+import json
 import logging
 import asyncio
-from typing import Optional, List, Dict, Any, Set
+from typing import Optional, List, Dict, Any, Set, Iterable
 from datetime import datetime, timezone, timedelta
 from dataclasses import dataclass
 from enum import Enum
 
 from .ttl_config import DataType, CacheLayer, get_ttl_policy, get_ttl
 from .firebase_cache import FirebaseCache
-from ..rag.cache_manager import LRUCache, RedisCache
+from ..rag.cache_manager import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Redis tag sets outlive the longest Redis TTL in ttl_config (24h), so a
+# member never outlives the index that invalidates it
+CACHE_TAG_INDEX_TTL = int(os.getenv("CACHE_TAG_INDEX_TTL", "86400"))
+REDIS_UNLINK_BATCH = 500
+
 class InvalidationReason(Enum):
     """Reasons for cache invalidation"""
     TTL_EXPIRED = "ttl_expired"
@@ -39,12 +47,21 @@ class CacheInvalidationService:
     """
     Unified cache invalidation service
     Handles TTL-based and event-based invalidation across all cache layers
+
+    Entries can be written with tags (e.g. ``user:123``, ``prompt:abc``).
+    Each layer keeps a tag -> keys index (a dict of sets in memory, a Redis
+    set per tag, a ``tags`` array on Firestore cache docs), so
+    ``invalidate_tag`` deletes exactly the tagged keys without scanning.
     """
     
-    def __init__(self):
+    def __init__(self, redis_client=None):
         self.memory_cache = LRUCache(max_size=1000, max_memory_mb=100)
         self.firestore_cache = FirebaseCache()
-        self.redis_cache = None  # Initialize if Redis is available
+        self.redis_cache = redis_client  # redis.asyncio client, if Redis is available
+        
+        # In-process tag index for the memory layer
+        self.tag_index: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, Set[str]] = {}
         
         # Invalidation tracking
         self.invalidation_history: List[InvalidationEvent] = []
@@ -65,7 +82,8 @@ class CacheInvalidationService:
         key: str,
         value: Any,
         data_type: DataType,
-        layers: Optional[List[CacheLayer]] = None
+        layers: Optional[List[CacheLayer]] = None,
+        tags: Optional[Iterable[str]] = None
     ) -> bool:
         """
         Set value in cache with appropriate TTL based on data type
@@ -75,6 +93,7 @@ class CacheInvalidationService:
             value: Value to cache
             data_type: Type of data (determines TTL)
             layers: Cache layers to use (default: all available)
+            tags: Tags to index the key under, for invalidate_tag
         
         Returns:
             True if successful
@@ -83,12 +102,14 @@ class CacheInvalidationService:
             layers = [CacheLayer.MEMORY, CacheLayer.FIRESTORE]
         
         policy = get_ttl_policy(data_type)
+        tags = sorted(set(tags or ()))
         success = True
         
         # Set in memory cache
         if CacheLayer.MEMORY in layers and policy.memory_ttl:
             try:
                 self.memory_cache.put(key, value, ttl_seconds=policy.memory_ttl)
+                self._index_memory_key(key, tags)
                 logger.debug(f"Cached {key} in memory with TTL {policy.memory_ttl}s")
             except Exception as e:
                 logger.error(f"Failed to cache {key} in memory: {e}")
@@ -97,7 +118,7 @@ class CacheInvalidationService:
         # Set in Firestore cache
         if CacheLayer.FIRESTORE in layers and policy.firestore_ttl:
             try:
-                await self.firestore_cache.set(key, value, ttl_seconds=policy.firestore_ttl)
+                await self.firestore_cache.set(key, value, ttl_seconds=policy.firestore_ttl, tags=tags)
                 logger.debug(f"Cached {key} in Firestore with TTL {policy.firestore_ttl}s")
             except Exception as e:
                 logger.error(f"Failed to cache {key} in Firestore: {e}")
@@ -106,7 +127,12 @@ class CacheInvalidationService:
         # Set in Redis cache (if available)
         if CacheLayer.REDIS in layers and self.redis_cache and policy.redis_ttl:
             try:
-                self.redis_cache.put(key, value, ttl_seconds=policy.redis_ttl)
+                async with self.redis_cache.pipeline(transaction=False) as pipe:
+                    pipe.set(key, json.dumps(value, default=str), ex=policy.redis_ttl)
+                    for tag in tags:
+                        pipe.sadd(self._redis_tag_key(tag), key)
+                        pipe.expire(self._redis_tag_key(tag), CACHE_TAG_INDEX_TTL)
+                    await pipe.execute()
                 logger.debug(f"Cached {key} in Redis with TTL {policy.redis_ttl}s")
             except Exception as e:
                 logger.error(f"Failed to cache {key} in Redis: {e}")
@@ -152,7 +178,7 @@ class CacheInvalidationService:
         
         # Try Redis cache (if available)
         if self.redis_cache and policy.redis_ttl:
-            value = self.redis_cache.get(key)
+            value = await self._redis_get(key)
             if value is not None:
                 logger.debug(f"Redis cache hit for {key}")
                 # Populate higher-level caches
@@ -180,6 +206,14 @@ class CacheInvalidationService:
         
         return None
     
+    async def _redis_get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self.redis_cache.get(key)
+            return json.loads(raw) if raw is not None else None
+        except Exception as e:
+            logger.error(f"Failed to read {key} from Redis: {e}")
+            return None
+    
     async def _get_stale_data(self, key: str) -> Optional[Any]:
         """Get stale data from any cache layer (ignoring TTL)"""
         # This would require modifying cache implementations to support
@@ -222,9 +256,7 @@ class CacheInvalidationService:
         # Invalidate memory cache
         if CacheLayer.MEMORY in layers:
             try:
-                # LRUCache doesn't have delete method, so we'll clear the key
-                if key in self.memory_cache.cache:
-                    del self.memory_cache.cache[key]
+                self._delete_from_memory(key)
                 logger.debug(f"Invalidated {key} from memory cache")
             except Exception as e:
                 logger.error(f"Failed to invalidate {key} from memory: {e}")
@@ -242,7 +274,7 @@ class CacheInvalidationService:
         # Invalidate Redis cache (if available)
         if CacheLayer.REDIS in layers and self.redis_cache:
             try:
-                self.redis_cache.delete(key)
+                await self.redis_cache.unlink(key)
                 logger.debug(f"Invalidated {key} from Redis cache")
             except Exception as e:
                 logger.error(f"Failed to invalidate {key} from Redis: {e}")
@@ -261,6 +293,159 @@ class CacheInvalidationService:
         
         return success
     
+    async def invalidate_tag(
+        self,
+        tag: str,
+        data_type: DataType,
+        reason: InvalidationReason = InvalidationReason.DEPENDENCY_CHANGED,
+        layers: Optional[List[CacheLayer]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """
+        Invalidate every key written with a tag, across cache layers
+        
+        Args:
+            tag: Tag given to set_with_ttl (e.g. "user:123", "prompt:abc")
+            data_type: Type of data
+            reason: Reason for invalidation
+            layers: Cache layers to invalidate (default: all)
+            metadata: Additional metadata about invalidation
+        
+        Returns:
+            Number of distinct keys invalidated
+        """
+        if layers is None:
+            layers = [CacheLayer.MEMORY, CacheLayer.FIRESTORE, CacheLayer.REDIS]
+        
+        keys = await self._delete_everywhere(set(), {tag}, layers)
+        
+        self._record_invalidation(InvalidationEvent(
+            data_type=data_type,
+            key=f"tag:{tag}",
+            reason=reason,
+            timestamp=datetime.now(timezone.utc),
+            metadata={**(metadata or {}), 'tag': tag, 'keys': len(keys)},
+            affected_layers=layers
+        ))
+        
+        logger.info(f"Invalidated {len(keys)} keys tagged {tag}")
+        return len(keys)
+    
+    async def invalidate_many(
+        self,
+        keys: Iterable[str],
+        tags: Iterable[str],
+        data_type: DataType,
+        reason: InvalidationReason = InvalidationReason.DATA_UPDATED,
+        layers: Optional[List[CacheLayer]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """
+        Invalidate a set of keys and tags in one pass per cache layer
+        
+        Redis gets one MULTI for all tag sets and one pipeline of UNLINKs,
+        Firestore one query per 30 tags plus batched deletes, and a single
+        event is recorded for the whole set.
+        
+        Args:
+            keys: Cache keys to invalidate
+            tags: Tags whose keys to invalidate
+            data_type: Type of data
+            reason: Reason for invalidation
+            layers: Cache layers to invalidate (default: all)
+            metadata: Additional metadata about invalidation
+        
+        Returns:
+            Number of distinct keys invalidated
+        """
+        if layers is None:
+            layers = [CacheLayer.MEMORY, CacheLayer.FIRESTORE, CacheLayer.REDIS]
+        keys, tags = set(keys), set(tags)
+        
+        invalidated = await self._delete_everywhere(keys, tags, layers)
+        
+        self._record_invalidation(InvalidationEvent(
+            data_type=data_type,
+            key=f"batch:{len(keys)} keys,{len(tags)} tags",
+            reason=reason,
+            timestamp=datetime.now(timezone.utc),
+            metadata={**(metadata or {}), 'keys': len(invalidated), 'tags': sorted(tags)},
+            affected_layers=layers
+        ))
+        return len(invalidated)
+    
+    async def _delete_everywhere(self, keys: Set[str], tags: Set[str], layers: List[CacheLayer]) -> Set[str]:
+        """Delete keys and tagged keys from each layer; returns what was targeted"""
+        invalidated = set(keys)
+        
+        if CacheLayer.FIRESTORE in layers:
+            try:
+                invalidated.update(await self.firestore_cache.delete_entries(keys, tags))
+            except Exception as e:
+                logger.error(f"Failed to invalidate {len(keys)} keys/{len(tags)} tags in Firestore: {e}")
+        
+        if CacheLayer.REDIS in layers and self.redis_cache:
+            try:
+                invalidated.update(await self._invalidate_redis(keys, tags))
+            except Exception as e:
+                logger.error(f"Failed to invalidate {len(keys)} keys/{len(tags)} tags in Redis: {e}")
+        
+        # Last, so memory copies filled from the shared layers (which carry
+        # no tags locally) go too
+        if CacheLayer.MEMORY in layers:
+            for tag in tags:
+                invalidated.update(self.tag_index.pop(tag, set()))
+            for key in invalidated:
+                self._delete_from_memory(key)
+        
+        return invalidated
+    
+    async def _invalidate_redis(self, keys: Set[str], tags: Set[str]) -> Set[str]:
+        """Delete keys and tag members with pipelined UNLINK"""
+        keys = set(keys)
+        if tags:
+            # Read and drop the indexes atomically, so keys tagged while we
+            # delete land in a fresh set instead of being forgotten
+            async with self.redis_cache.pipeline(transaction=True) as pipe:
+                for tag in sorted(tags):
+                    pipe.smembers(self._redis_tag_key(tag))
+                    pipe.unlink(self._redis_tag_key(tag))
+                results = await pipe.execute()
+            for members in results[::2]:
+                keys.update(m.decode() if isinstance(m, bytes) else m for m in members)
+        
+        if keys:
+            ordered = sorted(keys)
+            async with self.redis_cache.pipeline(transaction=False) as pipe:
+                for i in range(0, len(ordered), REDIS_UNLINK_BATCH):
+                    pipe.unlink(*ordered[i:i + REDIS_UNLINK_BATCH])
+                await pipe.execute()
+        return keys
+    
+    @staticmethod
+    def _redis_tag_key(tag: str) -> str:
+        return f"cache_tag:{tag}"
+    
+    def _index_memory_key(self, key: str, tags: List[str]):
+        """Record a memory-layer key under its tags"""
+        for tag in tags:
+            self.tag_index.setdefault(tag, set()).add(key)
+        if tags:
+            self._key_tags.setdefault(key, set()).update(tags)
+    
+    def _delete_from_memory(self, key: str):
+        """Remove a key from the memory cache and the memory tag index"""
+        with self.memory_cache.lock:
+            entry = self.memory_cache.cache.pop(key, None)
+            if entry is not None:
+                self.memory_cache.stats['total_size_bytes'] -= entry.size_bytes
+        for tag in self._key_tags.pop(key, ()):
+            members = self.tag_index.get(tag)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self.tag_index[tag]
+    
     async def invalidate_pattern(
         self,
         pattern: str,
@@ -268,7 +453,10 @@ class CacheInvalidationService:
         reason: InvalidationReason = InvalidationReason.MANUAL
     ) -> int:
         """
-        Invalidate all keys matching a pattern
+        Invalidate all memory-cache keys matching a glob pattern
+        
+        Scans every key in the memory cache and never reaches Firestore or
+        Redis; prefer tags and invalidate_tag for cross-layer invalidation.
         
         Args:
             pattern: Key pattern (e.g., "user:*", "prompt:123:*")
@@ -282,32 +470,23 @@ class CacheInvalidationService:
         
         # Invalidate from memory cache
         keys_to_delete = [
-            key for key in self.memory_cache.cache.keys()
+            key for key in list(self.memory_cache.cache.keys())
             if self._matches_pattern(key, pattern)
         ]
         for key in keys_to_delete:
             await self.invalidate(key, data_type, reason, [CacheLayer.MEMORY])
             count += 1
         
-        # Note: Firestore and Redis pattern matching would require
-        # additional implementation
-        
         logger.info(f"Invalidated {count} keys matching pattern {pattern}")
         return count
     
     def _matches_pattern(self, key: str, pattern: str) -> bool:
-        """Check if key matches pattern (simple wildcard matching)"""
+        """Check if key matches pattern ('*' matches any run of characters)"""
         if '*' not in pattern:
             return key == pattern
         
-        # Convert pattern to regex-like matching
-        parts = pattern.split('*')
-        if not key.startswith(parts[0]):
-            return False
-        if not key.endswith(parts[-1]):
-            return False
-        
-        return True
+        regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+        return re.fullmatch(regex, key, flags=re.DOTALL) is not None
     
     # =========================================================================
     # PERIODIC CLEANUP
@@ -349,6 +528,10 @@ class CacheInvalidationService:
         # Firestore cleanup (handled by get() method)
         # Redis cleanup (handled by Redis TTL)
         
+        # Drop memory tag index entries for keys the LRU has evicted
+        for key in [k for k in self._key_tags if k not in self.memory_cache.cache]:
+            self._delete_from_memory(key)
+        
         # Trim invalidation history
         if len(self.invalidation_history) > self.max_history_size:
             self.invalidation_history = self.invalidation_history[-self.max_history_size:]
@@ -381,6 +564,7 @@ class CacheInvalidationService:
             'by_reason': by_reason,
             'by_data_type': by_data_type,
             'memory_cache_stats': self.memory_cache.get_stats(),
+            'memory_tags': len(self.tag_index),
         }
 
 # Global instance
@@ -2,11 +2,12 @@
 Event-Based Cache Invalidation
 Handles cache invalidation triggered by data mutations using Firestore triggers and pub/sub
 """
+import os
 import logging
 import asyncio
-from typing import Dict, Any, List, Optional, Set, Callable
+from typing import Dict, Any, List, Optional, Set, Callable, Tuple
 from datetime import datetime, timezone
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
 from .cache_invalidation_service import cache_invalidation_service, InvalidationReason
@@ -14,6 +15,11 @@ from .ttl_config import DataType
 
 logger = logging.getLogger(__name__)
 
+# The worker collects queued events for this long after the first one and
+# invalidates the deduplicated keys/tags in one pass
+INVALIDATION_COALESCE_WINDOW_MS = int(os.getenv("INVALIDATION_COALESCE_WINDOW_MS", "50"))
+INVALIDATION_MAX_BATCH = int(os.getenv("INVALIDATION_MAX_BATCH", "5000"))
+
 class EventType(Enum):
     """Types of data mutation events"""
     CREATE = "create"
@@ -21,19 +27,41 @@ class EventType(Enum):
     DELETE = "delete"
     BATCH_UPDATE = "batch_update"
 
+@dataclass
+class InvalidationPlan:
+    """Deduplicated keys and tags to invalidate, grouped by data type"""
+    keys: Dict[DataType, Set[str]] = field(default_factory=dict)
+    tags: Dict[DataType, Set[str]] = field(default_factory=dict)
+    requested: int = 0  # keys + tags before deduplication
+
+    def add(self, data_type: DataType, key: str, tags: List[str]):
+        self.keys.setdefault(data_type, set()).add(key)
+        self.tags.setdefault(data_type, set()).update(tags)
+        self.requested += 1 + len(tags)
+
+    @property
+    def unique(self) -> int:
+        return sum(len(keys) for keys in self.keys.values()) + sum(len(tags) for tags in self.tags.values())
+
 @dataclass
 class InvalidationRule:
-    """Rule for cache invalidation based on events"""
+    """
+    Rule for cache invalidation based on events
+
+    Dependent entries are found by tag: writers pass the same tags to
+    ``set_with_ttl`` (e.g. a chunk of document X is tagged ``document:X`` and
+    ``document:X:chunks``), and the rule invalidates those tags.
+    """
     event_type: EventType
     collection: str
     data_type: DataType
     key_pattern: str  # Pattern to generate cache key from document
     invalidate_dependencies: bool = True
-    dependency_patterns: Optional[List[str]] = None  # Patterns for dependent cache keys
+    dependency_tags: Optional[List[str]] = None  # Tag patterns for dependent cache keys
     
     def __post_init__(self):
-        if self.dependency_patterns is None:
-            self.dependency_patterns = []
+        if self.dependency_tags is None:
+            self.dependency_tags = []
 
 class EventBasedInvalidationService:
     """
@@ -41,12 +69,29 @@ class EventBasedInvalidationService:
     Listens to Firestore changes and invalidates related caches
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        coalesce_window_ms: int = INVALIDATION_COALESCE_WINDOW_MS,
+        max_batch: int = INVALIDATION_MAX_BATCH
+    ):
         self.rules: Dict[str, List[InvalidationRule]] = {}
         self.event_handlers: Dict[str, List[Callable]] = {}
         self.invalidation_queue: asyncio.Queue = asyncio.Queue()
         self.worker_task: Optional[asyncio.Task] = None
         self.is_running = False
+        self.coalesce_window = coalesce_window_ms / 1000
+        self.max_batch = max_batch
+        
+        # Coalescing metrics (see get_metrics)
+        self.metrics = {
+            'events_queued': 0,
+            'events_processed': 0,
+            'windows': 0,
+            'requested': 0,
+            'unique': 0,
+            'keys_invalidated': 0,
+            'plan_errors': 0,
+        }
         
         # Register default rules
         self._register_default_rules()
@@ -67,9 +112,9 @@ class EventBasedInvalidationService:
             data_type=DataType.USER_PROFILE,
             key_pattern="user:{doc_id}:profile",
             invalidate_dependencies=True,
-            dependency_patterns=[
+            dependency_tags=[
                 "user:{doc_id}:preferences",
-                "user:{doc_id}:sessions:*"
+                "user:{doc_id}:sessions"
             ]
         ))
         
@@ -80,10 +125,10 @@ class EventBasedInvalidationService:
             data_type=DataType.PROMPT_CONTENT,
             key_pattern="prompt:{doc_id}",
             invalidate_dependencies=True,
-            dependency_patterns=[
+            dependency_tags=[
                 "prompt:{doc_id}:metadata",
-                "prompt:{doc_id}:executions:*",
-                "user:{user_id}:prompts:*"
+                "prompt:{doc_id}:executions",
+                "user:{user_id}:prompts"
             ]
         ))
         
@@ -93,9 +138,9 @@ class EventBasedInvalidationService:
             data_type=DataType.PROMPT_CONTENT,
             key_pattern="prompt:{doc_id}",
             invalidate_dependencies=True,
-            dependency_patterns=[
-                "prompt:{doc_id}:*",
-                "user:{user_id}:prompts:*"
+            dependency_tags=[
+                "prompt:{doc_id}",
+                "user:{user_id}:prompts"
             ]
         ))
         
@@ -106,11 +151,11 @@ class EventBasedInvalidationService:
             data_type=DataType.DOCUMENT_CONTENT,
             key_pattern="document:{doc_id}",
             invalidate_dependencies=True,
-            dependency_patterns=[
-                "document:{doc_id}:chunks:*",
-                "document:{doc_id}:embeddings:*",
+            dependency_tags=[
+                "document:{doc_id}:chunks",
+                "document:{doc_id}:embeddings",
                 "document:{doc_id}:metadata",
-                "user:{user_id}:documents:*"
+                "user:{user_id}:documents"
             ]
         ))
         
@@ -120,10 +165,10 @@ class EventBasedInvalidationService:
             data_type=DataType.DOCUMENT_CONTENT,
             key_pattern="document:{doc_id}",
             invalidate_dependencies=True,
-            dependency_patterns=[
-                "document:{doc_id}:*",
-                "user:{user_id}:documents:*",
-                "vector_index:*"  # Invalidate vector index
+            dependency_tags=[
+                "document:{doc_id}",
+                "user:{user_id}:documents",
+                "vector_index"  # Invalidate vector index
             ]
         ))
         
@@ -134,10 +179,10 @@ class EventBasedInvalidationService:
             data_type=DataType.PROMPT_EXECUTIONS,
             key_pattern="execution:{doc_id}",
             invalidate_dependencies=True,
-            dependency_patterns=[
-                "prompt:{prompt_id}:executions:*",
-                "user:{user_id}:executions:*",
-                "analytics:executions:*"
+            dependency_tags=[
+                "prompt:{prompt_id}:executions",
+                "user:{user_id}:executions",
+                "analytics:executions"
             ]
         ))
         
@@ -148,9 +193,9 @@ class EventBasedInvalidationService:
             data_type=DataType.MODEL_PERFORMANCE,
             key_pattern="model:{model_id}:performance",
             invalidate_dependencies=True,
-            dependency_patterns=[
-                "model:{model_id}:stats:*",
-                "analytics:models:*"
+            dependency_tags=[
+                "model:{model_id}:stats",
+                "analytics:models"
             ]
         ))
         
@@ -229,8 +274,7 @@ class EventBasedInvalidationService:
         old_data: Optional[Dict[str, Any]]
     ):
         """Process a single invalidation rule"""
-        # Generate cache key from pattern
-        cache_key = self._generate_key(rule.key_pattern, doc_id, data)
+        cache_key, tags = self._resolve_rule(rule, doc_id, data)
         
         # Invalidate primary cache key
         await cache_invalidation_service.invalidate(
@@ -247,23 +291,58 @@ class EventBasedInvalidationService:
         logger.debug(f"Invalidated cache key: {cache_key}")
         
         # Invalidate dependencies
-        if rule.invalidate_dependencies and rule.dependency_patterns:
-            for pattern in rule.dependency_patterns:
-                dep_pattern = self._generate_key(pattern, doc_id, data)
-                count = await cache_invalidation_service.invalidate_pattern(
-                    pattern=dep_pattern,
-                    data_type=rule.data_type,
-                    reason=InvalidationReason.DEPENDENCY_CHANGED
-                )
-                logger.debug(f"Invalidated {count} dependent keys matching: {dep_pattern}")
+        for tag in tags:
+            count = await cache_invalidation_service.invalidate_tag(
+                tag=tag,
+                data_type=rule.data_type,
+                reason=InvalidationReason.DEPENDENCY_CHANGED
+            )
+            logger.debug(f"Invalidated {count} dependent keys tagged: {tag}")
+    
+    def _resolve_rule(self, rule: InvalidationRule, doc_id: str, data: Dict[str, Any]) -> Tuple[str, List[str]]:
+        """Cache key and dependency tags a rule targets for a document"""
+        cache_key = self._generate_key(rule.key_pattern, doc_id, data)
+        tags = []
+        if rule.invalidate_dependencies:
+            for tag_pattern in rule.dependency_tags:
+                tag = self._generate_key(tag_pattern, doc_id, data)
+                if "{" in tag:
+                    # Placeholder missing from the document data
+                    logger.debug(f"Skipping unresolved dependency tag: {tag}")
+                    continue
+                tags.append(tag)
+        return cache_key, tags
+    
+    def _plan_event(self, plan: InvalidationPlan, event_type: EventType, collection: str, doc_id: str,
+                    data: Dict[str, Any]):
+        """Add the keys and tags an event's rules target to a plan"""
+        for rule in self.rules.get(f"{collection}:{event_type.value}", []):
+            cache_key, tags = self._resolve_rule(rule, doc_id, data)
+            plan.add(rule.data_type, cache_key, tags)
+    
+    async def _execute_plan(self, plan: InvalidationPlan, metadata: Dict[str, Any]) -> int:
+        """One multi-layer delete per data type for everything in the plan"""
+        count = 0
+        for data_type in plan.keys.keys() | plan.tags.keys():
+            count += await cache_invalidation_service.invalidate_many(
+                keys=plan.keys.get(data_type, set()),
+                tags=plan.tags.get(data_type, set()),
+                data_type=data_type,
+                reason=InvalidationReason.DATA_UPDATED,
+                metadata=metadata
+            )
+        self.metrics['requested'] += plan.requested
+        self.metrics['unique'] += plan.unique
+        self.metrics['keys_invalidated'] += count
+        return count
     
     def _generate_key(self, pattern: str, doc_id: str, data: Dict[str, Any]) -> str:
         """Generate cache key from pattern and document data"""
         key = pattern.replace("{doc_id}", doc_id)
         
         # Replace other placeholders from document data
-        for field, value in data.items():
-            placeholder = f"{{{field}}}"
+        for name, value in data.items():
+            placeholder = f"{{{name}}}"
             if placeholder in key:
                 key = key.replace(placeholder, str(value))
         
@@ -282,6 +361,7 @@ class EventBasedInvalidationService:
         old_data: Optional[Dict[str, Any]] = None
     ):
         """Queue an invalidation event for async processing"""
+        self.metrics['events_queued'] += 1
         await self.invalidation_queue.put({
             'event_type': event_type,
             'collection': collection,
@@ -329,16 +409,13 @@ class EventBasedInvalidationService:
                     timeout=1.0
                 )
                 
-                # Process event
-                await self.handle_firestore_event(
-                    event_type=event['event_type'],
-                    collection=event['collection'],
-                    doc_id=event['doc_id'],
-                    data=event['data'],
-                    old_data=event.get('old_data')
-                )
-                
-                self.invalidation_queue.task_done()
+                # Coalesce whatever else arrives within the window
+                events = [event] + await self._drain_window()
+                try:
+                    await self._process_window(events)
+                finally:
+                    for _ in events:
+                        self.invalidation_queue.task_done()
                 
             except asyncio.TimeoutError:
                 # No events in queue, continue
@@ -351,6 +428,61 @@ class EventBasedInvalidationService:
         
         logger.info("Invalidation worker stopped")
     
+    async def _drain_window(self) -> List[Dict[str, Any]]:
+        """Events queued within the coalescing window (up to max_batch)"""
+        events = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.coalesce_window
+        while len(events) < self.max_batch - 1:
+            try:
+                events.append(self.invalidation_queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                events.append(await asyncio.wait_for(self.invalidation_queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return events
+    
+    async def _process_window(self, events: List[Dict[str, Any]]):
+        """Invalidate the deduplicated keys/tags of a window, then run custom handlers"""
+        plan = InvalidationPlan()
+        for event in events:
+            # One bad event must not cost the rest of the window its deletes
+            try:
+                self._plan_event(plan, event['event_type'], event['collection'], event['doc_id'], event['data'])
+            except Exception as e:
+                self.metrics['plan_errors'] += 1
+                logger.error(f"Error planning invalidation for {event.get('collection')}/{event.get('doc_id')}: {e}")
+        
+        count = await self._execute_plan(plan, {'events': len(events), 'coalesced': True})
+        self.metrics['windows'] += 1
+        self.metrics['events_processed'] += len(events)
+        logger.debug(f"Coalesced {len(events)} events into {plan.unique} keys/tags, {count} keys invalidated")
+        
+        for event in events:
+            for handler in self.event_handlers.get(event['collection'], []):
+                try:
+                    if asyncio.iscoroutinefunction(handler):
+                        await handler(event['event_type'], event['doc_id'], event['data'], event.get('old_data'))
+                    else:
+                        handler(event['event_type'], event['doc_id'], event['data'], event.get('old_data'))
+                except Exception as e:
+                    logger.error(f"Error in custom event handler: {e}")
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Queue depth and how much coalescing saved"""
+        unique = self.metrics['unique']
+        return {
+            **self.metrics,
+            'queue_depth': self.invalidation_queue.qsize(),
+            'coalescing_ratio': self.metrics['requested'] / unique if unique else 1.0,
+        }
+    
     # =========================================================================
     # BATCH OPERATIONS
     # =========================================================================
@@ -363,35 +495,14 @@ class EventBasedInvalidationService:
         """Handle batch update events efficiently"""
         logger.info(f"Handling batch update for {collection}: {len(updates)} documents")
         
-        # Group by data type for efficient invalidation
-        keys_by_type: Dict[DataType, Set[str]] = {}
-        
+        # One deduplicated multi-layer delete for the whole batch
+        plan = InvalidationPlan()
         for update in updates:
-            doc_id = update.get('doc_id')
-            data = update.get('data', {})
-            
-            # Get applicable rules
-            rule_key = f"{collection}:{EventType.UPDATE.value}"
-            rules = self.rules.get(rule_key, [])
-            
-            for rule in rules:
-                cache_key = self._generate_key(rule.key_pattern, doc_id, data)
-                
-                if rule.data_type not in keys_by_type:
-                    keys_by_type[rule.data_type] = set()
-                keys_by_type[rule.data_type].add(cache_key)
+            self._plan_event(plan, EventType.UPDATE, collection, update.get('doc_id'), update.get('data', {}))
         
-        # Invalidate all keys by type
-        for data_type, keys in keys_by_type.items():
-            for key in keys:
-                await cache_invalidation_service.invalidate(
-                    key=key,
-                    data_type=data_type,
-                    reason=InvalidationReason.DATA_UPDATED,
-                    metadata={'batch': True, 'collection': collection}
-                )
+        count = await self._execute_plan(plan, {'batch': True, 'collection': collection, 'events': len(updates)})
         
-        logger.info(f"Batch invalidation complete: {sum(len(keys) for keys in keys_by_type.values())} keys")
+        logger.info(f"Batch invalidation complete: {plan.unique} keys/tags, {count} keys")
 
 # Global instance
 event_based_invalidation_service = EventBasedInvalidationService()
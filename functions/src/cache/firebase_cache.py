@@ -5,8 +5,8 @@ import os
 import json
 import hashlib
 import logging
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Iterable, List, Callable, Tuple
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
@@ -20,6 +20,20 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+
+def _is_expired(data: Dict[str, Any]) -> bool:
+    """Whether a cache document's expires_at has passed
+
+    Firestore returns timezone-aware UTC timestamps; naive values are treated
+    as UTC so both compare without raising.
+    """
+    expires_at = data.get('expires_at')
+    if not expires_at:
+        return False
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at < datetime.now(timezone.utc)
+
 class FirebaseCache:
     """
     Firebase Firestore-based cache service
@@ -81,13 +95,13 @@ class FirebaseCache:
             # No event loop running, create new one
             return asyncio.run(coro)
 
-    async def set(self, key: str, value: Any, ttl_seconds: int = 3600) -> bool:
-        """Set a value with TTL"""
+    async def set(self, key: str, value: Any, ttl_seconds: int = 3600, tags: Optional[Iterable[str]] = None) -> bool:
+        """Set a value with TTL, optionally indexed under tags (see delete_by_tag)"""
         if not self.db:
             return False
 
         try:
-            expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
 
             doc_data = {
                 'key': key,
@@ -96,6 +110,8 @@ class FirebaseCache:
                 'expires_at': expires_at,
                 'ttl_seconds': ttl_seconds
             }
+            if tags:
+                doc_data['tags'] = sorted(set(tags))
 
             # Use thread pool for Firestore operations
             db = self.db
@@ -132,7 +148,7 @@ class FirebaseCache:
                 data = doc.to_dict()
 
                 # Check if expired
-                if data.get('expires_at') and data['expires_at'] < datetime.now():
+                if _is_expired(data):
                     # Delete expired document
                     doc_ref.delete()
                     return None
@@ -184,6 +200,58 @@ class FirebaseCache:
             logger.error(f"Failed to delete cache key {key}: {e}")
             return False
 
+    async def delete_by_tag(self, tag: str) -> List[str]:
+        """
+        Delete every entry written with a tag
+
+        Returns:
+            Keys of the deleted entries
+        """
+        return await self.delete_entries((), (tag,))
+
+    async def delete_entries(self, keys: Iterable[str], tags: Iterable[str] = ()) -> List[str]:
+        """
+        Delete entries by key and by tag in batched writes
+
+        Tagged entries are found through Firestore's automatic array index on
+        ``tags`` (array-contains-any, up to 30 tags per query), so the cost is
+        proportional to the matching entries, not the collection.
+
+        Returns:
+            Keys of the deleted entries
+        """
+        if not self.db:
+            return []
+
+        keys, tags = set(keys), sorted(set(tags))
+        try:
+            db = self.db
+            def _delete():
+                refs = {key: db.collection('cache').document(key) for key in keys}
+                for i in range(0, len(tags), 30):
+                    query = db.collection('cache').where('tags', 'array_contains_any', tags[i:i + 30])
+                    for doc in query.select([]).stream():
+                        refs[doc.id] = doc.reference
+                # Firestore batches are limited to 500 writes
+                ordered = sorted(refs)
+                for i in range(0, len(ordered), 500):
+                    batch = db.batch()
+                    for key in ordered[i:i + 500]:
+                        batch.delete(refs[key])
+                    batch.commit()
+                return ordered
+
+            deleted = await asyncio.get_event_loop().run_in_executor(
+                self.executor, _delete
+            )
+
+            logger.debug(f"Deleted {len(deleted)} cache entries ({len(tags)} tags)")
+            return deleted
+
+        except Exception as e:
+            logger.error(f"Failed to delete {len(keys)} keys/{len(tags)} tags from cache: {e}")
+            return []
+
     async def exists(self, key: str) -> bool:
         """Check if key exists and is not expired"""
         result = await self.get(key)
@@ -204,7 +272,7 @@ class FirebaseCache:
                 if doc.exists:
                     data = doc.to_dict()
                     # Check if expired
-                    if data.get('expires_at') and data['expires_at'] < datetime.now():
+                    if _is_expired(data):
                         current_value = 0
                     else:
                         try:
@@ -213,7 +281,7 @@ class FirebaseCache:
                             current_value = 0
 
                 new_value = current_value + amount
-                expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+                expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
 
                 doc_ref.set({
                     'key': key,
@@ -236,6 +304,54 @@ class FirebaseCache:
             logger.error(f"Failed to increment key {key}: {e}")
             return amount
 
+    async def atomic_update(
+        self,
+        key: str,
+        update: Callable[[Optional[Any]], Tuple[Any, Any]],
+        ttl_seconds: int = 3600
+    ) -> Any:
+        """
+        Read-modify-write a value inside a Firestore transaction
+
+        ``update`` receives the current value (None if missing or expired) and
+        returns (new_value, result); ``result`` is returned once the write
+        commits. Firestore may call ``update`` more than once on contention, so
+        it must not have side effects. Unlike the other methods, failures are
+        raised: nothing was written, and the caller decides how to degrade.
+        """
+        if not self.db:
+            raise RuntimeError("Firestore cache is not initialized")
+
+        db = self.db
+        def _update_doc():
+            doc_ref = db.collection('cache').document(key)
+
+            @firestore.transactional
+            def _apply(transaction):
+                doc = doc_ref.get(transaction=transaction)
+                current = None
+                if doc.exists:
+                    data = doc.to_dict()
+                    if not _is_expired(data):
+                        try:
+                            current = json.loads(data.get('value', 'null'))
+                        except (json.JSONDecodeError, TypeError):
+                            current = None
+
+                new_value, result = update(current)
+                transaction.set(doc_ref, {
+                    'key': key,
+                    'value': json.dumps(new_value),
+                    'created_at': firestore.SERVER_TIMESTAMP,
+                    'expires_at': datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+                    'ttl_seconds': ttl_seconds
+                })
+                return result
+
+            return _apply(db.transaction())
+
+        return await asyncio.get_event_loop().run_in_executor(self.executor, _update_doc)
+
     async def cleanup_expired(self) -> int:
         """Clean up expired cache entries"""
         if not self.db:
@@ -244,7 +360,7 @@ class FirebaseCache:
         try:
             db = self.db
             def _cleanup():
-                now = datetime.now()
+                now = datetime.now(timezone.utc)
                 expired_docs = db.collection('cache').where('expires_at', '<', now).limit(100).get()
 
                 count = 0
@@ -10,6 +10,7 @@ from datetime import datetime
 from enum import Enum
 
 from src.common.monitoring import AgentMonitoring, PROMETHEUS_AVAILABLE
+from src.ai_agent.common.telemetry import TelemetrySink, get_telemetry_sink
 
 if PROMETHEUS_AVAILABLE:
     from prometheus_client import Histogram, Counter, Gauge
@@ -157,13 +158,17 @@ class MetricsTracker:
     - Response quality metrics
     - User engagement metrics
     - Cache performance
+
+    Structured logs are emitted through the telemetry sink, off the request path.
     """
 
-    def __init__(self, agent_type: str = "marketing"):
+    def __init__(self, agent_type: str = "marketing", sink: Optional[TelemetrySink] = None):
         self.agent_type = agent_type
+        self.sink = sink or get_telemetry_sink()
         self.base_monitoring = AgentMonitoring(
             service="marketing-api",
-            environment="production"
+            environment="production",
+            sink=self.sink
         )
         self.prometheus_enabled = PROMETHEUS_AVAILABLE
 
@@ -172,6 +177,9 @@ class MetricsTracker:
         self.current_validation = ValidationMetrics()
         self.current_quality = QualityMetrics()
 
+    def _emit(self, level: int, payload: Dict[str, Any]) -> None:
+        self.sink.log(logger, level, payload)
+
     # ========================================================================
     # Latency Tracking
     # ========================================================================
@@ -186,7 +194,7 @@ class MetricsTracker:
                 model=model
             ).observe(duration_ms / 1000.0)
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "llm_latency",
             "agent_type": self.agent_type,
             "model": model,
@@ -203,7 +211,7 @@ class MetricsTracker:
                 category=category
             ).observe(duration_ms / 1000.0)
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "kb_retrieval_latency",
             "agent_type": self.agent_type,
             "category": category,
@@ -226,7 +234,7 @@ class MetricsTracker:
         """Track validation latency"""
         self.current_latency.validation_ms += duration_ms
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "validation_latency",
             "agent_type": self.agent_type,
             "duration_ms": duration_ms
@@ -258,7 +266,7 @@ class MetricsTracker:
                 field=field
             ).inc()
 
-        logger.warning({
+        self._emit(logging.WARNING, {
             "metric": "validation_error",
             "agent_type": self.agent_type,
             "validation_type": validation_type,
@@ -270,7 +278,7 @@ class MetricsTracker:
         """Track successful validation"""
         self.current_validation.total_validations += 1
 
-        logger.debug({
+        self._emit(logging.DEBUG, {
             "metric": "validation_success",
             "agent_type": self.agent_type,
             "validation_type": validation_type
@@ -300,7 +308,7 @@ class MetricsTracker:
                 agent_type=self.agent_type
             ).observe(len(response_text))
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "response_quality",
             "agent_type": self.agent_type,
             "response_length_chars": len(response_text),
@@ -321,7 +329,7 @@ class MetricsTracker:
                 agent_type=self.agent_type
             ).observe(turn_number)
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "conversation_turn",
             "agent_type": self.agent_type,
             "conversation_id": conversation_id,
@@ -340,7 +348,7 @@ class MetricsTracker:
                 cache_type=cache_type
             ).inc()
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "cache_hit",
             "agent_type": self.agent_type,
             "cache_type": cache_type
@@ -354,7 +362,7 @@ class MetricsTracker:
                 cache_type=cache_type
             ).inc()
 
-        logger.info({
+        self._emit(logging.INFO, {
             "metric": "cache_miss",
             "agent_type": self.agent_type,
             "cache_type": cache_type
@@ -382,7 +390,7 @@ class MetricsTracker:
         """Log comprehensive request summary"""
         summary = self.get_request_summary()
 
-        logger.info({
+        self._emit(logging.INFO, {
             "event": "request_summary",
             "agent_type": self.agent_type,
             "conversation_id": conversation_id,
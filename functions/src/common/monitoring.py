@@ -9,6 +9,8 @@ from typing import Any, Dict, Optional
 from functools import wraps
 import asyncio
 
+from src.ai_agent.common.telemetry import TelemetrySink, get_telemetry_sink
+
 logger = logging.getLogger(__name__)
 
 # Try to import Prometheus client (optional dependency)
@@ -100,18 +102,24 @@ class AgentMonitoring:
     and Cloud Logging structured logs.
 
     Supports both Prometheus metrics (when available) and log-based metrics.
+    Structured logs are emitted through the telemetry sink, off the request path.
     """
 
-    def __init__(self, service: str, environment: str = "unknown") -> None:
+    def __init__(self, service: str, environment: str = "unknown", sink: Optional[TelemetrySink] = None) -> None:
         self.service = service
         self.environment = environment
         self.prometheus_enabled = PROMETHEUS_AVAILABLE
+        self.sink = sink or get_telemetry_sink()
 
         if self.prometheus_enabled:
             logger.info("Prometheus metrics enabled")
         else:
             logger.info("Using log-based metrics only (Prometheus not available)")
 
+    def _emit(self, level: int, payload: Dict[str, Any]) -> None:
+        # Errors are never sampled away under pressure
+        self.sink.log(logger, level, payload, priority=level >= logging.ERROR)
+
     def start_request(self, agent_type: str, page_context: Optional[str] = None) -> Dict[str, Any]:
         """Start tracking a request"""
         ctx = {
@@ -125,7 +133,7 @@ class AgentMonitoring:
             ACTIVE_REQUESTS.labels(agent_type=agent_type).inc()
 
         # Emit structured log
-        logger.info({
+        self._emit(logging.INFO, {
             "monitoring": {
                 "event": "agent_request_start",
                 "service": self.service,
@@ -182,7 +190,7 @@ class AgentMonitoring:
         if extra_metadata:
             payload["monitoring"]["metadata"] = extra_metadata
 
-        logger.info(payload)
+        self._emit(logging.INFO, payload)
 
     def record_error(
         self,
@@ -201,7 +209,7 @@ class AgentMonitoring:
             ).inc()
 
         # Emit structured log
-        logger.error({
+        self._emit(logging.ERROR, {
             "monitoring": {
                 "event": "agent_error",
                 "service": self.service,
@@ -239,7 +247,7 @@ class AgentMonitoring:
             ).observe(duration_seconds)
 
         # Emit structured log
-        logger.info({
+        self._emit(logging.INFO, {
             "monitoring": {
                 "event": "agent_tool_usage",
                 "service": self.service,
@@ -314,7 +322,7 @@ class AgentMonitoring:
         if model_name:
             payload["monitoring"]["model_name"] = model_name
 
-        logger.info(payload)
+        self._emit(logging.INFO, payload)
 
 
 # ============================================================================
@@ -1,17 +1,26 @@
 """
 Cost Tracker - Real-time cost tracking with usage metrics and billing integration
 """
+import atexit
 import logging
-import asyncio
-from typing import Dict, Any, Optional, List
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Any, Optional, List, Set
 from dataclasses import dataclass, asdict
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal, ROUND_HALF_UP
-import json
 
 # Import free models configuration
 from .free_models_config import get_model_by_id
 
+try:
+    from firebase_admin import firestore
+except ImportError:  # pragma: no cover - firebase is optional for local tooling
+    firestore = None
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -51,6 +60,209 @@ class CostLimit:
     per_request_limit: Decimal
     enabled: bool = True
 
+# Firestore rejects commits with more than 500 operations. Each cost entry
+# can touch up to two rollup docs (day + month) besides its own doc, so
+# commit at most 150 entries per transaction to keep entry + rollup writes atomic.
+FIRESTORE_MAX_BATCH_WRITES = 500
+COST_LEDGER_COMMIT_CHUNK = 150
+
+COST_ROLLUP_COLLECTION = 'cost_rollups'
+
+
+def _merge_counts(target: Dict[str, Any], delta: Dict[str, Any]):
+    """Add a (nested) dict of counters into target in place"""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            _merge_counts(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _as_increments(delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap a (nested) dict of counters in Firestore Increment transforms"""
+    return {
+        key: _as_increments(value) if isinstance(value, dict) else firestore.Increment(value)
+        for key, value in delta.items()
+    }
+
+
+def _day_key(ts: datetime) -> str:
+    return f"day_{ts.strftime('%Y-%m-%d')}"
+
+
+def _month_key(ts: datetime) -> str:
+    return f"month_{ts.strftime('%Y-%m')}"
+
+
+class CostLedger:
+    """
+    Write-behind buffer for cost entries
+
+    Entries are queued in memory (deduplicated by request_id) and committed by
+    a background thread whenever ``batch_size`` entries are pending or
+    ``flush_interval`` seconds have passed, so callers never wait on
+    Firestore. Remaining entries are flushed on ``close()`` and at interpreter
+    exit.
+
+    The queue is bounded by ``max_pending``. When it is full (e.g. Firestore
+    is down and failed batches keep being requeued) the oldest entry is
+    dropped and counted in ``stats["dropped"]``; the caller never commits
+    inline. After a failed flush the worker waits ``flush_interval`` before
+    retrying.
+    """
+
+    def __init__(
+        self,
+        commit: Callable[[List[CostEntry]], None],
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_pending: int = 10000,
+        dedupe_window: int = 50000
+    ):
+        self._commit = commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending: "OrderedDict[str, CostEntry]" = OrderedDict()
+        self._inflight: List[CostEntry] = []
+        # Recently committed request_ids, so late retries are not re-written
+        self._recent_ids: Set[str] = set()
+        self._recent_order: Deque[str] = deque(maxlen=dedupe_window)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"enqueued": 0, "duplicates": 0, "flushed": 0, "flush_errors": 0, "dropped": 0}
+
+    def enqueue(self, entry: CostEntry) -> bool:
+        """
+        Queue an entry for writing
+
+        Returns False if an entry with the same request_id is already pending
+        or was recently committed.
+        """
+        with self._lock:
+            if entry.request_id in self._pending or entry.request_id in self._recent_ids:
+                self.stats["duplicates"] += 1
+                return False
+
+            dropped = None
+            if len(self._pending) >= self.max_pending:
+                _, dropped = self._pending.popitem(last=False)
+                self.stats["dropped"] += 1
+            self._pending[entry.request_id] = entry
+            self.stats["enqueued"] += 1
+            pending = len(self._pending)
+
+        self._ensure_worker()
+
+        if dropped is not None:
+            logger.error(
+                f"Cost ledger full ({pending} pending), dropped entry {dropped.request_id} "
+                f"({self.stats['dropped']} dropped so far)"
+            )
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+        return True
+
+    def pending_entries(self) -> List[CostEntry]:
+        """Snapshot of entries not yet committed (including an in-flight flush)"""
+        with self._lock:
+            return self._inflight + list(self._pending.values())
+
+    def flush(self) -> int:
+        """
+        Commit all pending entries now
+
+        Returns the number of entries written. On failure the entries are put
+        back at the front of the queue for the next attempt.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._inflight = batch
+
+            committed = 0
+            try:
+                for start in range(0, len(batch), COST_LEDGER_COMMIT_CHUNK):
+                    chunk = batch[start:start + COST_LEDGER_COMMIT_CHUNK]
+                    self._commit(chunk)
+                    committed += len(chunk)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Error flushing cost entries: {e}")
+
+            with self._lock:
+                # Only the uncommitted remainder goes back on the queue, so
+                # committed chunks are never counted twice
+                if committed < len(batch):
+                    requeued = OrderedDict(
+                        (entry.request_id, entry) for entry in batch[committed:]
+                    )
+                    requeued.update(self._pending)
+                    self._pending = requeued
+
+                for entry in batch[:committed]:
+                    if len(self._recent_order) == self._recent_order.maxlen:
+                        self._recent_ids.discard(self._recent_order[0])
+                    self._recent_order.append(entry.request_id)
+                    self._recent_ids.add(entry.request_id)
+                self._inflight = []
+                self.stats["flushed"] += committed
+
+            if committed:
+                logger.info(f"Flushed {committed} cost entries to Firestore")
+            return committed
+
+    def close(self):
+        """Stop the background worker and flush what is left"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._thread is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="cost-ledger-flusher", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+
+            with self._lock:
+                pending = len(self._pending)
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if pending and (pending >= self.batch_size or due):
+                errors = self.stats["flush_errors"]
+                self.flush()
+                last_flush = time.monotonic()
+                if self.stats["flush_errors"] > errors:
+                    # Back off instead of retrying on every enqueue wakeup
+                    self._stopped.wait(self.flush_interval)
+            elif due:
+                last_flush = time.monotonic()
+
+
 class CostTracker:
     """
     Real-time cost tracking with usage metrics and billing integration
@@ -58,8 +270,16 @@ class CostTracker:
 
     def __init__(self, firestore_client=None):
         self.db = firestore_client
-        self.cost_entries = []  # Local cache for batch operations
-        self.batch_size = 100
+        self.batch_size = int(os.getenv("COST_LEDGER_BATCH_SIZE", "100"))
+
+        # Write-behind ledger: track_usage only enqueues, a background
+        # thread batch-commits to Firestore
+        self.ledger = CostLedger(
+            self._commit_cost_entries,
+            batch_size=self.batch_size,
+            flush_interval=float(os.getenv("COST_LEDGER_FLUSH_INTERVAL_S", "5")),
+            max_pending=int(os.getenv("COST_LEDGER_MAX_PENDING", "10000"))
+        )
 
         # Cost rates per provider/model (in USD per 1K tokens)
         self.cost_rates = {
@@ -190,21 +410,14 @@ class CostTracker:
             tokens_used=total_tokens,
             cost=cost,
             timestamp=datetime.now(timezone.utc),
-            request_id=request_id or f"req_{int(datetime.now().timestamp())}",
+            request_id=request_id or f"req_{uuid.uuid4().hex}",
             endpoint=endpoint,
             metadata=enhanced_metadata
         )
 
-        # Add to local cache
-        self.cost_entries.append(cost_entry)
-
-        # Batch write to Firestore if cache is full
-        if len(self.cost_entries) >= self.batch_size:
-            self._flush_cost_entries()
-
-        # Save individual entry to Firestore immediately for real-time tracking
+        # Hand off to the write-behind ledger (no Firestore I/O on this path)
         if self.db:
-            self._save_cost_entry(cost_entry)
+            self.ledger.enqueue(cost_entry)
 
         model_type = "FREE" if is_free else "PAID"
         logger.info(f"Tracked usage ({model_type}): {user_id}, {provider}/{model}, {total_tokens} tokens, ${cost}")
@@ -214,17 +427,12 @@ class CostTracker:
     async def track_cost_async(self, cost_entry: CostEntry):
         """
         Async version of cost tracking
-        Saves cost entry to Firestore asynchronously
+        Queues the cost entry for the write-behind ledger
         """
         try:
-            # Add to local cache
-            self.cost_entries.append(cost_entry)
-
-            # Save to Firestore in background
+            # Queue for the background batch writer
             if self.db:
-                # Run sync method in executor to avoid blocking
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(None, self._save_cost_entry, cost_entry)
+                self.ledger.enqueue(cost_entry)
 
             logger.info(f"Tracked cost async: {cost_entry.user_id}, ${cost_entry.cost}")
         except Exception as e:
@@ -240,14 +448,22 @@ class CostTracker:
             return {"within_limits": True, "limits_checked": False}
 
         now = datetime.now(timezone.utc)
-
-        # Get daily usage
         daily_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        daily_usage = self._get_usage_for_period(user_id, daily_start, now)
-
-        # Get monthly usage
         monthly_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_usage = self._get_usage_for_period(user_id, monthly_start, now)
+
+        # Two rollup docs (today + this month) in one read, plus the
+        # unflushed tail - independent of how much history the user has
+        rollups = self._read_rollups(user_id, [_day_key(now), _month_key(now)])
+        daily_totals = rollups.get(_day_key(now), {})
+        monthly_totals = rollups.get(_month_key(now), {})
+        for entry in self._pending_for_user(user_id, monthly_start, now):
+            delta = self._rollup_delta(entry)
+            _merge_counts(monthly_totals, delta)
+            if entry.timestamp >= daily_start:
+                _merge_counts(daily_totals, delta)
+
+        daily_usage = self._stats_from_totals(daily_totals)
+        monthly_usage = self._stats_from_totals(monthly_totals)
 
         # Check limits
         daily_exceeded = daily_usage.total_cost >= limits.daily_limit
@@ -295,168 +511,274 @@ class CostTracker:
     ) -> UsageStats:
         """
         Get usage statistics for a specific period
+
+        Served from the per-user daily/monthly rollup docs plus entries still
+        waiting in the ledger. Rollups are day-granular: a period starting
+        mid-day counts that whole day. History committed before rollups
+        existed is only counted after backfill_rollups() has run.
         """
         if not self.db:
             # Return empty stats if no database
-            return UsageStats(
-                total_requests=0,
-                total_tokens=0,
-                total_cost=Decimal("0"),
-                requests_by_provider={},
-                tokens_by_provider={},
-                cost_by_provider={},
-                requests_by_model={},
-                average_cost_per_request=Decimal("0"),
-                average_tokens_per_request=0.0,
-                free_requests=0,
-                free_tokens=0,
-                paid_requests=0,
-                paid_tokens=0,
-                cost_savings=Decimal("0.00")
-            )
+            return self._stats_from_totals({})
 
         try:
-            # Query Firestore for cost entries in the period
-            cost_collection = self.db.collection('cost_tracking')
-            query = cost_collection.where('user_id', '==', user_id)\
-                                  .where('timestamp', '>=', start_date)\
-                                  .where('timestamp', '<=', end_date)
-
-            entries = query.stream()
-
-            # Aggregate statistics
-            total_requests = 0
-            total_tokens = 0
-            total_cost = Decimal("0")
-            requests_by_provider: Dict[str, int] = {}
-            tokens_by_provider: Dict[str, int] = {}
-            cost_by_provider: Dict[str, Decimal] = {}
-            requests_by_model: Dict[str, int] = {}
-
-            # Free vs Paid tracking
-            free_requests = 0
-            free_tokens = 0
-            paid_requests = 0
-            paid_tokens = 0
-            cost_savings = Decimal("0.00")
-
-            for entry_doc in entries:
-                entry_data = entry_doc.to_dict()
-
-                total_requests += 1
-                tokens_used = entry_data.get('tokens_used', 0)
-                cost = Decimal(str(entry_data.get('cost', 0)))
-                total_tokens += tokens_used
-                total_cost += cost
-
-                provider = entry_data.get('provider', 'unknown')
-                model = entry_data.get('model', 'unknown')
-
-                # Check if this is a free model
-                metadata = entry_data.get('metadata', {})
-                is_free = metadata.get('is_free_model', False) or self.is_free_model(model)
-
-                if is_free:
-                    free_requests += 1
-                    free_tokens += tokens_used
-                    # Estimate cost savings (assume GPT-3.5-turbo pricing as baseline)
-                    estimated_cost = Decimal(str(tokens_used)) * Decimal("0.001") / Decimal("1000")
-                    cost_savings += estimated_cost
-                else:
-                    paid_requests += 1
-                    paid_tokens += tokens_used
-
-                # By provider
-                requests_by_provider[provider] = requests_by_provider.get(provider, 0) + 1
-                tokens_by_provider[provider] = tokens_by_provider.get(provider, 0) + tokens_used
-                cost_by_provider[provider] = cost_by_provider.get(provider, Decimal("0")) + cost
-
-                # By model
-                requests_by_model[model] = requests_by_model.get(model, 0) + 1
-
-            # Calculate averages
-            avg_cost_per_request = total_cost / total_requests if total_requests > 0 else Decimal("0")
-            avg_tokens_per_request = total_tokens / total_requests if total_requests > 0 else 0.0
-
-            return UsageStats(
-                total_requests=total_requests,
-                total_tokens=total_tokens,
-                total_cost=total_cost,
-                requests_by_provider=requests_by_provider,
-                tokens_by_provider=tokens_by_provider,
-                cost_by_provider=cost_by_provider,
-                requests_by_model=requests_by_model,
-                average_cost_per_request=avg_cost_per_request,
-                average_tokens_per_request=avg_tokens_per_request,
-                free_requests=free_requests,
-                free_tokens=free_tokens,
-                paid_requests=paid_requests,
-                paid_tokens=paid_tokens,
-                cost_savings=cost_savings
-            )
+            totals: Dict[str, Any] = {}
+            rollups = self._read_rollups(user_id, self._rollup_keys_for_period(start_date, end_date))
+            for counts in rollups.values():
+                _merge_counts(totals, counts)
+
+            for entry in self._pending_for_user(user_id, start_date, end_date):
+                _merge_counts(totals, self._rollup_delta(entry))
+
+            return self._stats_from_totals(totals)
 
         except Exception as e:
             logger.error(f"Error getting usage stats: {e}")
-            return UsageStats(
-                total_requests=0,
-                total_tokens=0,
-                total_cost=Decimal("0"),
-                requests_by_provider={},
-                tokens_by_provider={},
-                cost_by_provider={},
-                requests_by_model={},
-                average_cost_per_request=Decimal("0"),
-                average_tokens_per_request=0.0,
-                free_requests=0,
-                free_tokens=0,
-                paid_requests=0,
-                paid_tokens=0,
-                cost_savings=Decimal("0.00")
-            )
+            return self._stats_from_totals({})
 
-    def _save_cost_entry(self, cost_entry: CostEntry):
+    @staticmethod
+    def _rollup_keys_for_period(start_date: datetime, end_date: datetime) -> List[str]:
         """
-        Save cost entry to Firestore
+        Smallest set of rollup keys covering [start_date, end_date]
+
+        Whole months use the monthly doc; the current month counts as whole
+        when the period runs up to now, since there is no future usage.
         """
-        if not self.db:
-            return
+        today = datetime.now(timezone.utc).date()
+        first_day = start_date.astimezone(timezone.utc).date()
+        last_day = end_date.astimezone(timezone.utc).date()
+
+        keys: List[str] = []
+        day = first_day
+        while day <= last_day:
+            if day.day == 1:
+                next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+                month_end = next_month - timedelta(days=1)
+                if month_end <= last_day or last_day >= today:
+                    keys.append(f"month_{day.strftime('%Y-%m')}")
+                    day = next_month
+                    continue
+            keys.append(f"day_{day.strftime('%Y-%m-%d')}")
+            day += timedelta(days=1)
+        return keys
+
+    def _read_rollups(self, user_id: str, period_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch rollup docs for the given period keys in a single round trip"""
+        if not self.db or not period_keys:
+            return {}
+
+        collection = self.db.collection(COST_ROLLUP_COLLECTION)
+        refs = [collection.document(f"{user_id}__{key}") for key in period_keys]
+
+        rollups: Dict[str, Dict[str, Any]] = {}
+        for doc in self.db.get_all(refs):
+            if doc.exists:
+                data = doc.to_dict() or {}
+                rollups[data.get('period', doc.id.split('__')[-1])] = data.get('counts', {})
+        return rollups
+
+    def _pending_for_user(
+        self,
+        user_id: str,
+        start_date: datetime,
+        end_date: datetime
+    ) -> List[CostEntry]:
+        return [
+            entry for entry in self.ledger.pending_entries()
+            if entry.user_id == user_id and start_date <= entry.timestamp <= end_date
+        ]
 
-        try:
-            cost_data = asdict(cost_entry)
-            cost_data['cost'] = float(cost_entry.cost)  # Convert Decimal to float for Firestore
-            cost_data['timestamp'] = cost_entry.timestamp  # Firestore handles datetime
+    def _rollup_delta(self, cost_entry: CostEntry) -> Dict[str, Any]:
+        """Counter increments contributed by a single cost entry"""
+        tokens_used = cost_entry.tokens_used
+        cost = float(cost_entry.cost)
+        is_free = (cost_entry.metadata or {}).get('is_free_model', False) or self.is_free_model(cost_entry.model)
 
-            self.db.collection('cost_tracking').add(cost_data)
+        # Estimate cost savings (assume GPT-3.5-turbo pricing as baseline)
+        cost_savings = float(Decimal(str(tokens_used)) * Decimal("0.001") / Decimal("1000")) if is_free else 0.0
 
-        except Exception as e:
-            logger.error(f"Error saving cost entry: {e}")
+        return {
+            'total_requests': 1,
+            'total_tokens': tokens_used,
+            'total_cost': cost,
+            'free_requests': 1 if is_free else 0,
+            'free_tokens': tokens_used if is_free else 0,
+            'paid_requests': 0 if is_free else 1,
+            'paid_tokens': 0 if is_free else tokens_used,
+            'cost_savings': cost_savings,
+            'providers': {
+                cost_entry.provider: {'requests': 1, 'tokens': tokens_used, 'cost': cost}
+            },
+            'models': {cost_entry.model: {'requests': 1}}
+        }
 
-    def _flush_cost_entries(self):
+    @staticmethod
+    def _stats_from_totals(totals: Dict[str, Any]) -> UsageStats:
+        """Build UsageStats from (merged) rollup counters"""
+        total_requests = int(totals.get('total_requests', 0))
+        total_tokens = int(totals.get('total_tokens', 0))
+        total_cost = Decimal(str(totals.get('total_cost', 0)))
+        providers = totals.get('providers', {})
+        models = totals.get('models', {})
+
+        return UsageStats(
+            total_requests=total_requests,
+            total_tokens=total_tokens,
+            total_cost=total_cost,
+            requests_by_provider={p: int(v.get('requests', 0)) for p, v in providers.items()},
+            tokens_by_provider={p: int(v.get('tokens', 0)) for p, v in providers.items()},
+            cost_by_provider={p: Decimal(str(v.get('cost', 0))) for p, v in providers.items()},
+            requests_by_model={m: int(v.get('requests', 0)) for m, v in models.items()},
+            average_cost_per_request=total_cost / total_requests if total_requests > 0 else Decimal("0"),
+            average_tokens_per_request=total_tokens / total_requests if total_requests > 0 else 0.0,
+            free_requests=int(totals.get('free_requests', 0)),
+            free_tokens=int(totals.get('free_tokens', 0)),
+            paid_requests=int(totals.get('paid_requests', 0)),
+            paid_tokens=int(totals.get('paid_tokens', 0)),
+            cost_savings=Decimal(str(totals.get('cost_savings', 0)))
+        )
+
+    @property
+    def cost_entries(self) -> List[CostEntry]:
+        """Cost entries tracked but not yet committed to Firestore"""
+        return self.ledger.pending_entries()
+
+    @staticmethod
+    def _cost_entry_to_doc(cost_entry: CostEntry) -> Dict[str, Any]:
+        cost_data = asdict(cost_entry)
+        cost_data['cost'] = float(cost_entry.cost)  # Convert Decimal to float for Firestore
+        cost_data['timestamp'] = cost_entry.timestamp  # Firestore handles datetime
+        return cost_data
+
+    def _commit_cost_entries(self, entries: List[CostEntry]):
         """
-        Flush cached cost entries to Firestore in batch
+        Commit a batch of cost entries to Firestore
+
+        Runs in a transaction that first reads the entries' docs (keyed by
+        request_id) and only writes and counts the ones that do not exist
+        yet. A retry after an ambiguous failure (timeout or UNAVAILABLE after
+        the server applied the commit) therefore finds its entries already
+        written and leaves the day and month rollups alone.
         """
-        if not self.db or not self.cost_entries:
+        if not self.db or not entries:
             return
 
-        try:
-            batch = self.db.batch()
-
-            for cost_entry in self.cost_entries:
-                cost_data = asdict(cost_entry)
-                cost_data['cost'] = float(cost_entry.cost)
-                cost_data['timestamp'] = cost_entry.timestamp
+        collection = self.db.collection('cost_tracking')
+        rollup_collection = self.db.collection(COST_ROLLUP_COLLECTION)
+        refs = {entry.request_id: collection.document(entry.request_id) for entry in entries}
+
+        @firestore.transactional
+        def _apply(transaction) -> int:
+            existing = {doc.id for doc in self.db.get_all(list(refs.values()), transaction=transaction) if doc.exists}
+            rollups: Dict[str, Dict[str, Any]] = {}
+            written = 0
+
+            for cost_entry in entries:
+                if cost_entry.request_id in existing:
+                    continue
+                transaction.set(refs[cost_entry.request_id], self._cost_entry_to_doc(cost_entry))
+                written += 1
+
+                delta = self._rollup_delta(cost_entry)
+                for period_key in (_day_key(cost_entry.timestamp), _month_key(cost_entry.timestamp)):
+                    rollup = rollups.setdefault(
+                        f"{cost_entry.user_id}__{period_key}",
+                        {'user_id': cost_entry.user_id, 'period': period_key, 'counts': {}}
+                    )
+                    _merge_counts(rollup['counts'], delta)
+
+            now = datetime.now(timezone.utc)
+            for doc_id, rollup in rollups.items():
+                transaction.set(
+                    rollup_collection.document(doc_id),
+                    {
+                        'user_id': rollup['user_id'],
+                        'period': rollup['period'],
+                        'counts': _as_increments(rollup['counts']),
+                        'updated_at': now
+                    },
+                    merge=True
+                )
+            return written
+
+        written = _apply(self.db.transaction())
+        if written < len(entries):
+            logger.info(f"Skipped {len(entries) - written} cost entries already committed")
+
+    def backfill_rollups(self, since: Optional[datetime] = None) -> int:
+        """
+        Build cost rollup docs from cost_tracking history (one full scan).
 
-                doc_ref = self.db.collection('cost_tracking').document()
-                batch.set(doc_ref, cost_data)
+        Usage and limit checks read only the rollups, so run this once right
+        after deploying them; until then history before the cutover reads as
+        zero. Each rollup doc it covers is overwritten with a full recount,
+        so entries committed while the scan runs can be missed; running it
+        again afterwards reconciles them. ``since`` is widened to the start
+        of its month so the month doc is complete.
 
+        Returns:
+            Number of rollup documents written
+        """
+        if not self.db:
+            return 0
+
+        query = self.db.collection('cost_tracking')
+        if since:
+            since = since.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            query = query.where('timestamp', '>=', since)
+
+        rollups: Dict[str, Dict[str, Any]] = {}
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            if not data.get('user_id') or not data.get('timestamp'):
+                continue
+            cost_entry = self._cost_entry_from_doc(data)
+            delta = self._rollup_delta(cost_entry)
+            for period_key in (_day_key(cost_entry.timestamp), _month_key(cost_entry.timestamp)):
+                rollup = rollups.setdefault(
+                    f"{cost_entry.user_id}__{period_key}",
+                    {'user_id': cost_entry.user_id, 'period': period_key, 'counts': {}}
+                )
+                _merge_counts(rollup['counts'], delta)
+
+        rollup_collection = self.db.collection(COST_ROLLUP_COLLECTION)
+        now = datetime.now(timezone.utc)
+        items = list(rollups.items())
+        for offset in range(0, len(items), FIRESTORE_MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for doc_id, rollup in items[offset:offset + FIRESTORE_MAX_BATCH_WRITES]:
+                batch.set(rollup_collection.document(doc_id), {**rollup, 'updated_at': now})
             batch.commit()
-            logger.info(f"Flushed {len(self.cost_entries)} cost entries to Firestore")
 
-            # Clear cache
-            self.cost_entries = []
+        logger.info(f"Backfilled {len(items)} cost rollup documents")
+        return len(items)
+
+    @staticmethod
+    def _cost_entry_from_doc(data: Dict[str, Any]) -> CostEntry:
+        return CostEntry(
+            user_id=data['user_id'],
+            provider=data.get('provider', 'unknown'),
+            model=data.get('model', 'unknown'),
+            tokens_used=int(data.get('tokens_used', 0)),
+            cost=Decimal(str(data.get('cost', 0))),
+            timestamp=data['timestamp'],
+            request_id=data.get('request_id', ''),
+            endpoint=data.get('endpoint', ''),
+            metadata=data.get('metadata') or {}
+        )
 
-        except Exception as e:
-            logger.error(f"Error flushing cost entries: {e}")
+    def _flush_cost_entries(self):
+        """
+        Flush pending cost entries to Firestore in batch
+        """
+        if not self.db:
+            return
+
+        self.ledger.flush()
+
+    def close(self):
+        """Flush pending cost entries and stop the background writer"""
+        self.ledger.close()
 
     def get_cost_breakdown(self, user_id: str, days: int = 30) -> Dict[str, Any]:
         """
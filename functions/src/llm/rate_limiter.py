@@ -1,13 +1,18 @@
 """
-Rate Limiter - Sliding window rate limiting with Redis backend
+Rate Limiter - Multi-window GCRA (cell-rate) rate limiting with Redis backend
+
+Each window (minute/hour/day/burst) is a token bucket expressed as a GCRA
+"theoretical arrival time" (TAT). A key therefore costs one small Redis hash
+(one float per window) no matter how many requests it has seen, and all
+windows are checked and consumed together in one atomic Lua script (or one
+transaction when the external cache is the backend).
 """
+import math
 import time
-import json
 import logging
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-import hashlib
+from datetime import datetime
 
 # Cache imports
 try:
@@ -25,6 +30,69 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on the in-process "known denied" cache
+MAX_DENY_CACHE_ENTRIES = 10000
+
+# Deny cache key: the rate limit key plus the tier's windows, so a denial under
+# one tier never rejects the same user/endpoint checked against another tier
+DenyKey = Tuple[str, Tuple[Tuple[str, float, int], ...]]
+
+# Checks and consumes every window atomically.
+# KEYS[1] = hash holding one TAT per window
+# ARGV[1] = cost, then (name, period_seconds, limit) per window
+# Returns {allowed, limiting_window_index, seconds (retry_after or reset_after), remaining}
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local n = (#ARGV - 1) / 3
+
+local names, tats = {}, {}
+local retry_after, limiting = 0, 0
+local remaining, reset_after = -1, 0
+
+for i = 1, n do
+  local name = ARGV[(i - 1) * 3 + 2]
+  local period = tonumber(ARGV[(i - 1) * 3 + 3])
+  local limit = tonumber(ARGV[(i - 1) * 3 + 4])
+  local interval = period / limit
+
+  local tat = tonumber(redis.call('HGET', KEYS[1], name)) or now
+  if tat < now then tat = now end
+  local new_tat = tat + interval * cost
+  local allow_at = new_tat - period
+
+  if allow_at > now then
+    if allow_at - now > retry_after then
+      retry_after = allow_at - now
+      limiting = i
+    end
+  else
+    local rem = math.floor((period - (new_tat - now)) / interval)
+    if remaining < 0 or rem < remaining then
+      remaining = rem
+      reset_after = new_tat - now
+    end
+  end
+
+  names[i] = name
+  tats[i] = new_tat
+end
+
+if limiting > 0 then
+  return {0, limiting, tostring(retry_after), 0}
+end
+
+local ttl = 0
+for i = 1, n do
+  redis.call('HSET', KEYS[1], names[i], tostring(tats[i]))
+  if tats[i] - now > ttl then ttl = tats[i] - now end
+end
+redis.call('PEXPIRE', KEYS[1], math.ceil(ttl * 1000) + 1000)
+
+return {1, 0, tostring(reset_after), remaining}
+"""
+
 @dataclass
 class RateLimit:
     requests_per_minute: int
@@ -41,14 +109,69 @@ class RateLimitResult:
     retry_after: Optional[int] = None
     limit_type: str = "minute"
 
+
+def gcra_consume(
+    tats: Dict[str, float],
+    windows: List[Tuple[str, float, int]],
+    now: float,
+    cost: int = 1
+) -> Tuple[bool, int, float, int]:
+    """
+    Check and consume ``cost`` cells across all windows (local mirror of _GCRA_LUA)
+
+    Args:
+        tats: Per-window theoretical arrival times; updated in place when allowed
+        windows: (name, period_seconds, limit) tuples
+        now: Current time in seconds
+        cost: Number of cells to consume
+
+    Returns:
+        (allowed, limiting_window_index (1-based, 0 if allowed),
+         retry_after or reset_after seconds, remaining requests)
+    """
+    new_tats: Dict[str, float] = {}
+    retry_after, limiting = 0.0, 0
+    remaining, reset_after = -1, 0.0
+
+    for i, (name, period, limit) in enumerate(windows, start=1):
+        interval = period / limit
+        tat = max(tats.get(name, now), now)
+        new_tat = tat + interval * cost
+        allow_at = new_tat - period
+
+        if allow_at > now:
+            if allow_at - now > retry_after:
+                retry_after = allow_at - now
+                limiting = i
+        else:
+            rem = int((period - (new_tat - now)) // interval)
+            if remaining < 0 or rem < remaining:
+                remaining = rem
+                reset_after = new_tat - now
+
+        new_tats[name] = new_tat
+
+    if limiting:
+        return False, limiting, retry_after, 0
+
+    tats.update(new_tats)
+    return True, 0, reset_after, remaining
+
+
 class RateLimiter:
     """
-    Sliding window rate limiter with Redis backend
+    Multi-window GCRA rate limiter with Redis backend
+
+    Before touching Redis, callers that were recently denied are rejected
+    from an in-process cache until their retry_after has passed: a TAT never
+    moves backwards, so that denial is still valid.
     """
     
     def __init__(self, redis_url: Optional[str] = None):
         self.redis_client = None
-        self.local_cache = {}  # Fallback for when external cache is not available
+        self._gcra_script = None
+        self.local_cache: Dict[str, Dict[str, float]] = {}  # key -> window TATs when no Redis
+        self._deny_until: Dict[DenyKey, Tuple[float, str]] = {}  # (key, windows) -> (monotonic deadline, limit_type)
         self.use_external_cache = False
 
         # Try Firebase cache first
@@ -70,6 +193,7 @@ class RateLimiter:
                 self.redis_client = redis.from_url(redis_url, decode_responses=True)
                 # Test connection
                 self.redis_client.ping()
+                self._gcra_script = self.redis_client.register_script(_GCRA_LUA)
                 logger.info("Redis connection established for rate limiting")
             except Exception as e:
                 logger.warning(f"Failed to connect to Redis: {e}. Using local cache fallback.")
@@ -77,6 +201,17 @@ class RateLimiter:
 
         if not self.use_external_cache and not self.redis_client:
             logger.info("Using local memory cache for rate limiting")
+
+    @staticmethod
+    def _windows(rate_limit: RateLimit) -> List[Tuple[str, float, int]]:
+        windows = [
+            ("minute", 60, rate_limit.requests_per_minute),
+            ("hour", 3600, rate_limit.requests_per_hour),
+            ("day", 86400, rate_limit.requests_per_day)
+        ]
+        if rate_limit.burst_limit:
+            windows.append(("burst", rate_limit.burst_window, rate_limit.burst_limit))
+        return windows
     
     async def check_rate_limit(
         self,
@@ -91,271 +226,160 @@ class RateLimiter:
         
         # Create unique key for this user/endpoint combination
         key_base = f"rate_limit:{user_id}:{endpoint}"
-        
-        # Check different time windows
-        minute_result = await self._check_window(key_base, "minute", 60, rate_limit.requests_per_minute, current_time)
-        if not minute_result.allowed:
-            return minute_result
-
-        hour_result = await self._check_window(key_base, "hour", 3600, rate_limit.requests_per_hour, current_time)
-        if not hour_result.allowed:
-            return hour_result
-
-        day_result = await self._check_window(key_base, "day", 86400, rate_limit.requests_per_day, current_time)
-        if not day_result.allowed:
-            return day_result
-        
-        # Check burst limit if specified
-        if rate_limit.burst_limit:
-            burst_result = await self._check_window(
-                key_base, "burst", rate_limit.burst_window,
-                rate_limit.burst_limit, current_time
+        windows = self._windows(rate_limit)
+
+        # Fast path: caller is known to be over this tier's limit, no backend round trip
+        deny_key = (key_base, tuple(windows))
+        denied = self._check_deny_cache(deny_key, current_time)
+        if denied:
+            return denied
+
+        if self.use_external_cache:
+            outcome = await self._consume_external(key_base, windows, current_time)
+        elif self.redis_client:
+            outcome = self._consume_redis(key_base, windows, current_time)
+        else:
+            outcome = self._consume_local(key_base, windows, current_time)
+
+        allowed, limiting, seconds, remaining = outcome
+        if not allowed:
+            limit_type = windows[limiting - 1][0]
+            self._remember_denial(deny_key, seconds, limit_type)
+            return RateLimitResult(
+                allowed=False,
+                remaining_requests=0,
+                reset_time=datetime.fromtimestamp(current_time + seconds),
+                retry_after=max(1, int(seconds + 0.999)),
+                limit_type=limit_type
             )
-            if not burst_result.allowed:
-                return burst_result
-        
-        # All checks passed, increment counters
-        self._increment_counters(key_base, current_time)
-        
+
         return RateLimitResult(
             allowed=True,
-            remaining_requests=min(
-                minute_result.remaining_requests,
-                hour_result.remaining_requests,
-                day_result.remaining_requests
-            ),
-            reset_time=min(minute_result.reset_time, hour_result.reset_time, day_result.reset_time),
+            remaining_requests=remaining,
+            reset_time=datetime.fromtimestamp(current_time + seconds),
             limit_type="allowed"
         )
-    
-    async def _check_window(
+
+    def _check_deny_cache(self, deny_key: DenyKey, current_time: float) -> Optional[RateLimitResult]:
+        entry = self._deny_until.get(deny_key)
+        if entry is None:
+            return None
+
+        deadline, limit_type = entry
+        retry_after = deadline - time.monotonic()
+        if retry_after <= 0:
+            self._deny_until.pop(deny_key, None)
+            return None
+
+        return RateLimitResult(
+            allowed=False,
+            remaining_requests=0,
+            reset_time=datetime.fromtimestamp(current_time + retry_after),
+            retry_after=max(1, int(retry_after + 0.999)),
+            limit_type=limit_type
+        )
+
+    def _remember_denial(self, deny_key: DenyKey, retry_after: float, limit_type: str):
+        if len(self._deny_until) >= MAX_DENY_CACHE_ENTRIES:
+            now = time.monotonic()
+            self._deny_until = {k: v for k, v in self._deny_until.items() if v[0] > now}
+            if len(self._deny_until) >= MAX_DENY_CACHE_ENTRIES:
+                self._deny_until.clear()
+        self._deny_until[deny_key] = (time.monotonic() + retry_after, limit_type)
+
+    def _consume_redis(
         self,
         key_base: str,
-        window_type: str,
-        window_seconds: int,
-        limit: int,
+        windows: List[Tuple[str, float, int]],
         current_time: float
-    ) -> RateLimitResult:
-        """
-        Check rate limit for a specific time window
-        """
-        key = f"{key_base}:{window_type}"
-        window_start = current_time - window_seconds
-        
-        if self.use_external_cache:
-            return await self._check_window_external(key, window_start, current_time, limit, window_type, window_seconds)
-        elif self.redis_client:
-            return self._check_window_redis(key, window_start, current_time, limit, window_type, window_seconds)
-        else:
-            return self._check_window_local(key, window_start, current_time, limit, window_type, window_seconds)
-    
-    def _check_window_redis(
-        self, 
-        key: str, 
-        window_start: float, 
-        current_time: float, 
-        limit: int, 
-        window_type: str, 
-        window_seconds: int
-    ) -> RateLimitResult:
+    ) -> Tuple[bool, int, float, int]:
         """
-        Check rate limit using Redis sliding window
+        Check and consume all windows in one atomic Redis script call
         """
+        args: List[Any] = [1]
+        for name, period, limit in windows:
+            args.extend([name, period, limit])
+
         try:
-            pipe = self.redis_client.pipeline()
-            
-            # Remove old entries
-            pipe.zremrangebyscore(key, 0, window_start)
-            
-            # Count current entries
-            pipe.zcard(key)
-            
-            # Set expiration
-            pipe.expire(key, window_seconds + 1)
-            
-            results = pipe.execute()
-            current_count = results[1]
-            
-            remaining = max(0, limit - current_count)
-            reset_time = datetime.fromtimestamp(current_time + window_seconds)
-            
-            if current_count >= limit:
-                return RateLimitResult(
-                    allowed=False,
-                    remaining_requests=0,
-                    reset_time=reset_time,
-                    retry_after=int(window_seconds),
-                    limit_type=window_type
-                )
-            
-            return RateLimitResult(
-                allowed=True,
-                remaining_requests=remaining,
-                reset_time=reset_time,
-                limit_type=window_type
-            )
-            
+            allowed, limiting, seconds, remaining = self._gcra_script(keys=[key_base], args=args)
+            return bool(int(allowed)), int(limiting), float(seconds), int(remaining)
         except Exception as e:
             logger.error(f"Redis rate limit check failed: {e}")
-            # Fallback to local cache
-            return self._check_window_local(key, window_start, current_time, limit, window_type, window_seconds)
+            # The script did not run, so nothing was consumed yet
+            return self._consume_local(key_base, windows, current_time)
 
-    async def _check_window_external(
+    def _consume_local(
         self,
-        key: str,
-        window_start: float,
-        current_time: float,
-        limit: int,
-        window_type: str,
-        window_seconds: int
-    ) -> RateLimitResult:
+        key_base: str,
+        windows: List[Tuple[str, float, int]],
+        current_time: float
+    ) -> Tuple[bool, int, float, int]:
         """
-        Check rate limit using external cache (Firebase/etc)
+        Check and consume all windows in process memory (fallback)
         """
-        try:
-            # Get current count
-            current_count = await cache.get(key) or 0
-
-            # Check if we're over the limit
-            if current_count >= limit:
-                reset_time = datetime.fromtimestamp(current_time + window_seconds)
-                return RateLimitResult(
-                    allowed=False,
-                    remaining_requests=0,
-                    reset_time=reset_time,
-                    retry_after=int(window_seconds),
-                    limit_type=window_type
-                )
-
-            # Increment counter
-            new_count = await cache.increment(key, 1, window_seconds)
-            remaining = max(0, limit - new_count)
-            reset_time = datetime.fromtimestamp(current_time + window_seconds)
+        tats = self.local_cache.setdefault(key_base, {})
+        return gcra_consume(tats, windows, current_time)
 
-            return RateLimitResult(
-                allowed=True,
-                remaining_requests=remaining,
-                reset_time=reset_time,
-                limit_type=window_type
-            )
+    async def _consume_external(
+        self,
+        key_base: str,
+        windows: List[Tuple[str, float, int]],
+        current_time: float
+    ) -> Tuple[bool, int, float, int]:
+        """
+        Check and consume all windows in one external cache transaction
 
+        The window TATs live in a single cache value that is read and written
+        atomically, so concurrent instances never both spend the last cell and
+        a denial leaves every window untouched.
+        """
+        def _update(stored):
+            tats = dict(stored or {})
+            return tats, gcra_consume(tats, windows, time.time())
+
+        # A TAT is never more than one period ahead, so it is stale after that
+        ttl_seconds = int(max(period for _, period, _ in windows)) + 1
+        try:
+            return await cache.atomic_update(key_base, _update, ttl_seconds)
         except Exception as e:
             logger.error(f"External cache rate limit check failed: {e}")
-            # Fallback to local cache
-            return self._check_window_local(key, window_start, current_time, limit, window_type, window_seconds)
-
-    def _check_window_local(
-        self, 
-        key: str, 
-        window_start: float, 
-        current_time: float, 
-        limit: int, 
-        window_type: str, 
-        window_seconds: int
-    ) -> RateLimitResult:
-        """
-        Check rate limit using local cache (fallback)
-        """
-        if key not in self.local_cache:
-            self.local_cache[key] = []
-        
-        # Remove old entries
-        self.local_cache[key] = [
-            timestamp for timestamp in self.local_cache[key] 
-            if timestamp > window_start
-        ]
-        
-        current_count = len(self.local_cache[key])
-        remaining = max(0, limit - current_count)
-        reset_time = datetime.fromtimestamp(current_time + window_seconds)
-        
-        if current_count >= limit:
-            return RateLimitResult(
-                allowed=False,
-                remaining_requests=0,
-                reset_time=reset_time,
-                retry_after=int(window_seconds),
-                limit_type=window_type
-            )
-        
-        return RateLimitResult(
-            allowed=True,
-            remaining_requests=remaining,
-            reset_time=reset_time,
-            limit_type=window_type
-        )
+            # The transaction did not commit, so nothing was consumed yet
+            return self._consume_local(key_base, windows, current_time)
     
-    def _increment_counters(self, key_base: str, current_time: float):
-        """
-        Increment rate limit counters for all windows
-        """
-        windows = [
-            ("minute", 60),
-            ("hour", 3600),
-            ("day", 86400),
-            ("burst", 10)
-        ]
-        
-        for window_type, window_seconds in windows:
-            key = f"{key_base}:{window_type}"
-            
-            if self.redis_client:
-                try:
-                    pipe = self.redis_client.pipeline()
-                    pipe.zadd(key, {str(current_time): current_time})
-                    pipe.expire(key, window_seconds + 1)
-                    pipe.execute()
-                except Exception as e:
-                    logger.error(f"Failed to increment Redis counter: {e}")
-                    # Fallback to local cache
-                    if key not in self.local_cache:
-                        self.local_cache[key] = []
-                    self.local_cache[key].append(current_time)
-            else:
-                if key not in self.local_cache:
-                    self.local_cache[key] = []
-                self.local_cache[key].append(current_time)
-    
-    def get_rate_limit_status(self, user_id: str, endpoint: str = "default") -> Dict[str, Any]:
+    def get_rate_limit_status(
+        self,
+        user_id: str,
+        endpoint: str = "default",
+        rate_limit: Optional[RateLimit] = None
+    ) -> Dict[str, Any]:
         """
         Get current rate limit status for a user
+
+        ``current_count`` is the number of requests still counted against each
+        window's bucket, derived from the stored TAT and the window's rate.
         """
+        rate_limit = rate_limit or DEFAULT_RATE_LIMITS["free"]
         current_time = time.time()
         key_base = f"rate_limit:{user_id}:{endpoint}"
-        
+
+        if self.redis_client:
+            try:
+                tats = {k: float(v) for k, v in (self.redis_client.hgetall(key_base) or {}).items()}
+            except Exception:
+                tats = {}
+        else:
+            tats = self.local_cache.get(key_base, {})
+
         status = {}
-        windows = [
-            ("minute", 60),
-            ("hour", 3600),
-            ("day", 86400)
-        ]
-        
-        for window_type, window_seconds in windows:
-            key = f"{key_base}:{window_type}"
+        for window_type, window_seconds, limit in self._windows(rate_limit)[:3]:
             window_start = current_time - window_seconds
-            
-            if self.redis_client:
-                try:
-                    self.redis_client.zremrangebyscore(key, 0, window_start)
-                    count = self.redis_client.zcard(key)
-                except Exception:
-                    count = 0
-            else:
-                if key in self.local_cache:
-                    self.local_cache[key] = [
-                        timestamp for timestamp in self.local_cache[key] 
-                        if timestamp > window_start
-                    ]
-                    count = len(self.local_cache[key])
-                else:
-                    count = 0
-            
+            backlog = max(0.0, tats.get(window_type, current_time) - current_time)
             status[window_type] = {
-                "current_count": count,
+                "current_count": math.ceil(backlog / (window_seconds / limit)),
                 "window_start": datetime.fromtimestamp(window_start).isoformat(),
                 "window_end": datetime.fromtimestamp(current_time).isoformat()
             }
-        
+
         return status
     
     def reset_rate_limit(self, user_id: str, endpoint: str = "default"):
@@ -363,20 +387,15 @@ class RateLimiter:
         Reset rate limit for a user (admin function)
         """
         key_base = f"rate_limit:{user_id}:{endpoint}"
-        
-        windows = ["minute", "hour", "day", "burst"]
-        
-        for window_type in windows:
-            key = f"{key_base}:{window_type}"
-            
-            if self.redis_client:
-                try:
-                    self.redis_client.delete(key)
-                except Exception as e:
-                    logger.error(f"Failed to reset Redis rate limit: {e}")
-            
-            if key in self.local_cache:
-                del self.local_cache[key]
+
+        if self.redis_client:
+            try:
+                self.redis_client.delete(key_base)
+            except Exception as e:
+                logger.error(f"Failed to reset Redis rate limit: {e}")
+
+        self.local_cache.pop(key_base, None)
+        self._deny_until = {k: v for k, v in self._deny_until.items() if k[0] != key_base}
         
         logger.info(f"Rate limit reset for user {user_id}, endpoint {endpoint}")
 
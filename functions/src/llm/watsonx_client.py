@@ -10,6 +10,14 @@ import re
 from datetime import datetime, timezone, timedelta
 from langchain_core.runnables import Runnable
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+from langchain_core.runnables.config import ensure_config, get_async_callback_manager_for_config
+
+try:
+    # Handlers that consume token streams (e.g. LangGraph stream_mode="messages")
+    from langchain_core.tracers._streaming import _StreamingCallbackHandler
+except ImportError:
+    _StreamingCallbackHandler = None
 
 logger = logging.getLogger(__name__)
 
@@ -444,17 +452,9 @@ class WatsonxGraniteClient:
                                         total_tokens += tokens_generated
                                         total_chars += len(text)
 
-                                        # CLIENT-SIDE CHUNKING for better UX
-                                        # Watsonx returns the full response in one chunk, so we split it
-                                        # into smaller pieces to simulate streaming for better perceived performance
-                                        words = text.split()
-                                        chunk_size = 5  # Words per chunk
-
-                                        for i in range(0, len(words), chunk_size):
-                                            chunk = " ".join(words[i:i + chunk_size])
-                                            if i + chunk_size < len(words):
-                                                chunk += " "  # Add trailing space except for last chunk
-                                            yield chunk
+                                        # Each event carries the newly generated text delta;
+                                        # yield it verbatim so whitespace and newlines survive
+                                        yield text
 
                                     # Log completion with diagnostic info
                                     if stop_reason and stop_reason != "not_finished":
@@ -577,6 +577,12 @@ class WatsonxGraniteLangChain(Runnable):
         # Format messages for Granite
         prompt = self._client._format_messages_for_granite(message_list)
 
+        # Stream tokens to callbacks when a caller is consuming them
+        # (LangGraph "messages" stream mode); otherwise do a single request
+        config = ensure_config(config)
+        if self.streaming and self._has_streaming_handler(config):
+            return await self._astream_with_callbacks(message_list, prompt, config, **kwargs)
+
         # Generate response
         result = await self._client.generate(prompt, **kwargs)
 
@@ -590,6 +596,72 @@ class WatsonxGraniteLangChain(Runnable):
             }
         )
 
+    @staticmethod
+    def _has_streaming_handler(config: Dict[str, Any]) -> bool:
+        """Check whether any callback attached to this run consumes token streams."""
+        if _StreamingCallbackHandler is None:
+            return False
+        callbacks = config.get("callbacks")
+        handlers = getattr(callbacks, "handlers", callbacks) or []
+        return any(isinstance(h, _StreamingCallbackHandler) for h in handlers)
+
+    async def _astream_with_callbacks(
+        self,
+        message_list: List[Any],
+        prompt: str,
+        config: Dict[str, Any],
+        **kwargs
+    ) -> AIMessage:
+        """
+        Generate via the streaming endpoint, reporting each delta as a chat model token.
+
+        This is what lets LangGraph's "messages" stream mode surface tokens from
+        inside a graph node, while the node itself still receives the full AIMessage.
+
+        Args:
+            message_list: Messages the prompt was built from
+            prompt: Formatted Granite prompt
+            config: Runnable config carrying the callback handlers
+
+        Returns:
+            The complete AIMessage
+        """
+        callback_manager = get_async_callback_manager_for_config(config)
+        run_managers = await callback_manager.on_chat_model_start(
+            {"name": self.__class__.__name__},
+            [message_list],
+            invocation_params={
+                "model": self.model_name,
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+            },
+            name=config.get("run_name"),
+            run_id=config.pop("run_id", None),
+        )
+        run_manager = run_managers[0]
+        # Chunks and the final message share an id so stream consumers can dedupe
+        message_id = f"run-{run_manager.run_id}"
+
+        parts: List[str] = []
+        try:
+            async for text in self._client.generate_stream(prompt, **kwargs):
+                parts.append(text)
+                await run_manager.on_llm_new_token(
+                    text,
+                    chunk=ChatGenerationChunk(message=AIMessageChunk(content=text, id=message_id)),
+                )
+        except BaseException as e:
+            await run_manager.on_llm_error(e)
+            raise
+
+        message = AIMessage(
+            content="".join(parts),
+            id=message_id,
+            response_metadata={"model": self.model_name, "finish_reason": "stop"}
+        )
+        await run_manager.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+        return message
+
     async def astream(self, messages: List[Dict[str, str]], **kwargs):
         """
         Stream model responses (LangChain interface).
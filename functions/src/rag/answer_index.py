@@ -0,0 +1,429 @@
+"""
+Answer Index - Precomputed answers for high-frequency marketing questions
+
+An offline build (scripts/build_answer_index.py) collects the most frequent
+queries from the `query_embeddings` drift collection plus the golden
+datasets, generates answers with the marketing agent, applies the same
+PII / personalization / quality gates as IntelligentResponseCache and writes
+a versioned snapshot:
+
+    answer_index/answer_index_v20261018T120000Z.json
+    {
+        "version": "20261018T120000Z",
+        "kb_hash": "<sha256 of MARKETING_KB_CONTENT>",
+        "embedding_model": "all-MiniLM-L6-v2",
+        "entries": [{"query", "normalized_query", "response", "quality_score", "embedding", ...}]
+    }
+
+At container startup the newest snapshot is loaded into an in-memory table
+(exact normalized-query dict + normalized embedding matrix). A snapshot built
+against different KB content, or whose embeddings come from a different model
+than the runtime query embedder, is rejected, so stale answers are never served.
+Lookups never touch the LLM or Firestore.
+
+Entries are keyed by query only, not page_context: the agent's answer text
+does not depend on the page (page_context only selects follow-up questions
+and monitoring labels, which precomputed responses do not carry).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ANSWER_INDEX_DIR = Path(os.getenv(
+    "ANSWER_INDEX_DIR",
+    str(Path(__file__).resolve().parent.parent.parent / "answer_index")
+))
+# Stricter than the response cache (0.75): precomputed answers skip the agent entirely
+ANSWER_INDEX_SIMILARITY = float(os.getenv("ANSWER_INDEX_SIMILARITY", "0.9"))
+ANSWER_INDEX_ENABLED = os.getenv("ANSWER_INDEX_ENABLED", "true").lower() != "false"
+# Model behind the response cache's query embeddings; snapshots must be built
+# with it. Defined here so the preloading master can check snapshots without
+# importing cache_manager (whose Firestore client must not cross the fork)
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+SNAPSHOT_PREFIX = "answer_index_v"
+DRIFT_COLLECTION = "query_embeddings"
+
+
+def normalize_query(query: str) -> str:
+    """Same normalization as the response cache key (lowercase, collapsed whitespace)"""
+    return ' '.join(query.lower().strip().split())
+
+
+def compute_kb_content_hash(kb_content: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Content hash of the marketing KB.
+
+    Args:
+        kb_content: KB documents (defaults to MARKETING_KB_CONTENT)
+
+    Returns:
+        sha256 hex digest, or None if the KB module is unavailable
+    """
+    if kb_content is None:
+        try:
+            from src.ai_agent.marketing.marketing_kb_content import MARKETING_KB_CONTENT
+        except ImportError:
+            try:
+                from ai_agent.marketing.marketing_kb_content import MARKETING_KB_CONTENT
+            except ImportError:
+                logger.warning("Marketing KB content unavailable, cannot compute KB hash")
+                return None
+        kb_content = MARKETING_KB_CONTENT
+
+    canonical = json.dumps(kb_content, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnswerIndex:
+    """
+    In-memory table of precomputed answers.
+
+    Usage:
+        answer_index.load_latest(kb_hash=compute_kb_content_hash(),
+                                 embedding_model=EMBEDDING_MODEL_NAME)
+        hit = answer_index.lookup(query, embed=intelligent_response_cache._generate_embedding)
+    """
+
+    def __init__(self, similarity_threshold: float = ANSWER_INDEX_SIMILARITY):
+        self.similarity_threshold = similarity_threshold
+        self.version: Optional[str] = None
+        self.kb_hash: Optional[str] = None
+        self.embedding_model: Optional[str] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._exact: Dict[str, int] = {}
+        self._matrix = None
+        self._matrix_rows: List[int] = []
+        self._lock = threading.Lock()
+        self.stats = {
+            'exact_hits': 0,
+            'semantic_hits': 0,
+            'misses': 0,
+            'stale_snapshots': 0,
+            'embedding_mismatches': 0,
+        }
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._entries)
+
+    def reset_after_fork(self):
+        """Per-worker state for a forked child; the loaded table stays shared"""
+        self._lock = threading.Lock()
+        self.stats = {key: 0 for key in self.stats}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load_snapshot(self,
+                      snapshot: Dict[str, Any],
+                      kb_hash: Optional[str] = None,
+                      embedding_model: Optional[str] = None) -> bool:
+        """
+        Build the in-memory table from a snapshot dict.
+
+        Args:
+            snapshot: Parsed snapshot
+            kb_hash: Current KB content hash; a snapshot built against a
+                different hash is rejected
+            embedding_model: Model of the runtime query embedder; a snapshot
+                whose entry embeddings come from another model is rejected
+
+        Returns:
+            True if the snapshot was loaded
+        """
+        snapshot_hash = snapshot.get("kb_hash")
+        if kb_hash and snapshot_hash != kb_hash:
+            logger.warning(
+                f"Answer index {snapshot.get('version')} is stale "
+                f"(kb_hash {str(snapshot_hash)[:12]} != {kb_hash[:12]}), not loading"
+            )
+            self.stats['stale_snapshots'] += 1
+            self.invalidate()
+            return False
+
+        snapshot_model = snapshot.get("embedding_model")
+        has_embeddings = any(e.get("embedding") for e in snapshot.get("entries", []))
+        if embedding_model and has_embeddings and snapshot_model != embedding_model:
+            # Cosine scores across different embedding spaces are meaningless
+            logger.warning(
+                f"Answer index {snapshot.get('version')} was embedded with {snapshot_model}, "
+                f"runtime uses {embedding_model}, not loading"
+            )
+            self.stats['embedding_mismatches'] += 1
+            self.invalidate()
+            return False
+
+        entries = [e for e in snapshot.get("entries", []) if e.get("query") and e.get("response")]
+        exact: Dict[str, int] = {}
+        vectors = []
+        rows = []
+        for i, entry in enumerate(entries):
+            exact.setdefault(entry.get("normalized_query") or normalize_query(entry["query"]), i)
+            if entry.get("embedding"):
+                vectors.append(entry["embedding"])
+                rows.append(i)
+
+        matrix = None
+        if vectors and NUMPY_AVAILABLE:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+
+        with self._lock:
+            self.version = snapshot.get("version")
+            self.kb_hash = snapshot_hash
+            self.embedding_model = snapshot_model
+            self._entries = entries
+            self._exact = exact
+            self._matrix = matrix
+            self._matrix_rows = rows
+
+        logger.info(
+            f"Loaded answer index {self.version}: {len(entries)} answers "
+            f"({len(rows)} with embeddings)"
+        )
+        return True
+
+    def load(self, path: Path, kb_hash: Optional[str] = None, embedding_model: Optional[str] = None) -> bool:
+        """Load a snapshot file (see load_snapshot)"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read answer index {path}: {e}")
+            return False
+        return self.load_snapshot(snapshot, kb_hash=kb_hash, embedding_model=embedding_model)
+
+    def load_latest(self,
+                    directory: Path = ANSWER_INDEX_DIR,
+                    kb_hash: Optional[str] = None,
+                    embedding_model: Optional[str] = None) -> bool:
+        """Load the newest versioned snapshot in ``directory``"""
+        path = latest_snapshot_path(directory)
+        if path is None:
+            logger.info(f"No answer index snapshot in {directory}")
+            return False
+        return self.load(path, kb_hash=kb_hash, embedding_model=embedding_model)
+
+    def invalidate(self):
+        """Drop all answers (e.g. when the KB content changes)"""
+        with self._lock:
+            self.version = None
+            self.kb_hash = None
+            self.embedding_model = None
+            self._entries = []
+            self._exact = {}
+            self._matrix = None
+            self._matrix_rows = []
+
+    def lookup(self,
+               query: str,
+               embed: Optional[Callable[[str], Optional[Sequence[float]]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find a precomputed answer for ``query``.
+
+        Args:
+            query: User query
+            embed: Optional query embedder for semantic matching (must be the
+                snapshot's embedding model)
+
+        Returns:
+            Answer entry (with 'similarity' and 'index_version') or None
+        """
+        if not self._entries:
+            return None
+
+        with self._lock:
+            entries = self._entries
+            row = self._exact.get(normalize_query(query))
+            matrix = self._matrix
+            rows = self._matrix_rows
+            version = self.version
+
+        if row is not None:
+            self.stats['exact_hits'] += 1
+            return {**entries[row], 'similarity': 1.0, 'index_version': version}
+
+        if matrix is not None and embed is not None:
+            embedding = embed(query)
+            if embedding:
+                vector = np.asarray(embedding, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                if norm > 0:
+                    scores = matrix @ (vector / norm)
+                    best = int(np.argmax(scores))
+                    score = float(scores[best])
+                    if score >= self.similarity_threshold:
+                        self.stats['semantic_hits'] += 1
+                        return {**entries[rows[best]], 'similarity': score, 'index_version': version}
+
+        self.stats['misses'] += 1
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['exact_hits'] + self.stats['semantic_hits'] + self.stats['misses']
+        hits = lookups - self.stats['misses']
+        return {
+            **self.stats,
+            'version': self.version,
+            'entries': len(self._entries),
+            'hit_rate_percent': round(hits / lookups * 100, 2) if lookups else 0.0,
+        }
+
+
+def latest_snapshot_path(directory: Path = ANSWER_INDEX_DIR) -> Optional[Path]:
+    """Newest snapshot file (versions are UTC timestamps, so they sort lexically)"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return None
+    snapshots = sorted(directory.glob(f"{SNAPSHOT_PREFIX}*.json"))
+    return snapshots[-1] if snapshots else None
+
+
+# ============================================================================
+# Offline build
+# ============================================================================
+
+def collect_drift_queries(db, limit: int = 100, max_docs: int = 5000) -> List[Tuple[str, int]]:
+    """
+    Most frequent queries recorded by the data drift monitor.
+
+    Args:
+        db: Firestore client
+        limit: Number of queries to return
+        max_docs: Most recent drift documents to scan
+
+    Returns:
+        [(query, count)] ordered by frequency
+    """
+    counts: Counter = Counter()
+    first_seen: Dict[str, str] = {}
+    docs = (
+        db.collection(DRIFT_COLLECTION)
+        .order_by("timestamp", direction="DESCENDING")
+        .limit(max_docs)
+        .stream()
+    )
+    for doc in docs:
+        query = (doc.to_dict() or {}).get("query_text") or ""
+        # Redacted / hashed queries cannot be answered meaningfully
+        if not query or "[" in query:
+            continue
+        normalized = normalize_query(query)
+        counts[normalized] += 1
+        first_seen.setdefault(normalized, query.strip())
+
+    return [(first_seen[q], n) for q, n in counts.most_common(limit)]
+
+
+def load_golden_queries(paths: Iterable[Path]) -> List[str]:
+    """Queries from golden dataset files (lists of objects with a 'query' field)"""
+    queries = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping golden dataset {path}: {e}")
+            continue
+        queries.extend(item["query"] for item in data if isinstance(item, dict) and item.get("query"))
+    return queries
+
+
+def merge_queries(*sources: Iterable[str], limit: Optional[int] = None) -> List[str]:
+    """Deduplicate by normalized query, keeping the first spelling and source order"""
+    seen = set()
+    merged = []
+    for source in sources:
+        for query in source:
+            normalized = normalize_query(query)
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                merged.append(query.strip())
+    return merged[:limit] if limit else merged
+
+
+async def build_snapshot(queries: Sequence[str],
+                         answer: Callable[[str], Awaitable[str]],
+                         response_cache,
+                         kb_hash: Optional[str],
+                         embed: Optional[Callable[[str], Optional[Sequence[float]]]] = None,
+                         embedding_model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Generate and quality-gate answers for ``queries``.
+
+    Args:
+        queries: Queries to precompute
+        answer: Async function returning the agent response for a query
+        response_cache: IntelligentResponseCache whose gates decide admission
+        kb_hash: KB content hash the answers were generated against
+        embed: Query embedder (the runtime cache's model)
+        embedding_model: Name of the embedder's model
+
+    Returns:
+        Snapshot dict (see module docstring); rejected queries are listed
+        under 'rejected' with their reason
+    """
+    entries = []
+    rejected = []
+    for query in queries:
+        try:
+            response = await answer(query)
+        except Exception as e:
+            logger.warning(f"Answer generation failed for '{query[:50]}': {e}")
+            rejected.append({"query": query, "reason": "error"})
+            continue
+
+        rejection, quality_score = response_cache.evaluate_cacheability(response or "")
+        if not response or rejection:
+            rejected.append({"query": query, "reason": rejection or "empty"})
+            continue
+
+        entries.append({
+            "query": query,
+            "normalized_query": normalize_query(query),
+            "response": response,
+            "quality_score": round(quality_score, 3),
+            "embedding": embed(query) if embed else None,
+        })
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "kb_hash": kb_hash,
+        "embedding_model": embedding_model,
+        "entries": entries,
+        "rejected": rejected,
+    }
+
+
+def write_snapshot(snapshot: Dict[str, Any], directory: Path = ANSWER_INDEX_DIR) -> Path:
+    """Write ``snapshot`` as answer_index_v<version>.json (atomic rename)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{SNAPSHOT_PREFIX}{snapshot['version']}.json"
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+answer_index = AnswerIndex()
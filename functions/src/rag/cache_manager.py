@@ -12,6 +12,8 @@ from datetime import datetime, timezone, timedelta
 from collections import OrderedDict
 import threading
 
+from .answer_index import EMBEDDING_MODEL_NAME
+
 # Redis import (conditional)
 try:
     import redis
@@ -72,7 +74,13 @@ class LRUCache:
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         with self.lock:
-            if key in self.cache:
+            entry = self.cache.get(key)
+            if entry is not None and entry.expires_at and entry.expires_at < datetime.now(timezone.utc):
+                del self.cache[key]
+                self.stats['total_size_bytes'] -= entry.size_bytes
+                entry = None
+
+            if entry is not None:
                 # Move to end (most recently used)
                 entry = self.cache.pop(key)
                 self.cache[key] = entry
@@ -464,7 +472,7 @@ class IntelligentResponseCache(MultiLevelCacheManager):
 
         # Lazy loading of embedding model (only load when needed)
         self._embedding_model = None
-        self._embedding_model_name = 'all-MiniLM-L6-v2'  # Lightweight, fast model
+        self._embedding_model_name = EMBEDDING_MODEL_NAME  # Lightweight, fast model
 
         # Statistics tracking
         self.response_stats = {
@@ -675,6 +683,27 @@ class IntelligentResponseCache(MultiLevelCacheManager):
 
         return max(0.0, min(1.0, score))
 
+    def evaluate_cacheability(self, response: str) -> Tuple[Optional[str], float]:
+        """
+        Apply the caching gates to a response without storing it.
+
+        Shared by cache_response_safe and the offline answer index build
+        so both accept exactly the same responses.
+
+        Returns:
+            (rejection_reason, quality_score) where rejection_reason is
+            'pii', 'personalized', 'quality' or None if the response is cacheable
+        """
+        if self._contains_pii(response):
+            return 'pii', 0.0
+        if self._is_personalized(response):
+            return 'personalized', 0.0
+
+        quality_score = self._calculate_quality_score(response)
+        if quality_score < self.quality_threshold:
+            return 'quality', quality_score
+        return None, quality_score
+
     def cache_response_safe(self,
                            query: str,
                            response: str,
@@ -698,21 +727,17 @@ class IntelligentResponseCache(MultiLevelCacheManager):
             # Step 1: Redact PII from query
             clean_query = redact_pii_from_text(query) if PII_DETECTION_AVAILABLE else query
 
-            # Step 2: Check if response contains PII
-            if self._contains_pii(response):
+            # Steps 2-4: PII, personalization and quality gates
+            rejection, quality_score = self.evaluate_cacheability(response)
+            if rejection == 'pii':
                 logger.warning("Response contains PII, not caching")
                 self.response_stats['pii_rejections'] += 1
                 return False
-
-            # Step 3: Check if response is personalized
-            if self._is_personalized(response):
+            if rejection == 'personalized':
                 logger.info("Response is personalized, not caching")
                 self.response_stats['pii_rejections'] += 1  # Count as PII-related
                 return False
-
-            # Step 4: Validate quality
-            quality_score = self._calculate_quality_score(response)
-            if quality_score < self.quality_threshold:
+            if rejection == 'quality':
                 logger.warning(f"Low quality response (score: {quality_score:.2f}), not caching")
                 self.response_stats['quality_rejections'] += 1
                 return False
@@ -802,13 +827,15 @@ class IntelligentResponseCache(MultiLevelCacheManager):
 
     def get_similar_cached_response(self,
                                    query: str,
-                                   page_context: str = "") -> Optional[Dict]:
+                                   page_context: str = "",
+                                   query_embedding: Optional[List[float]] = None) -> Optional[Dict]:
         """
         Retrieve cached response using semantic similarity.
 
         Args:
             query: User query
             page_context: Page/section context (optional filter)
+            query_embedding: Embedding of ``query`` if the caller already computed one
 
         Returns:
             Cached response data if found and similarity > threshold, None otherwise
@@ -819,7 +846,8 @@ class IntelligentResponseCache(MultiLevelCacheManager):
             return exact_match
 
         # 2. Generate embedding for query
-        query_embedding = self._generate_embedding(query)
+        if query_embedding is None:
+            query_embedding = self._generate_embedding(query)
         if not query_embedding:
             return None
 
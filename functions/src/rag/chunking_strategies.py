@@ -2,15 +2,37 @@
 Chunking Strategies - Intelligent document chunking for RAG
 """
 import re
+import zlib
+import base64
+import bisect
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 import math
 from datetime import datetime
 
+import numpy as np
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Used when tiktoken has no mapping for the embedding model (e.g. Google
+# models); cl100k token counts are close to theirs for English text
+DEFAULT_TOKEN_ENCODING = "cl100k_base"
+# Tokens kept free below an embedding model's max_tokens
+MODEL_LIMIT_MARGIN = 16
+# iter_chunks: new text collected before tokenizing, and tokens held back
+# from the end of the buffer because boundaries there may still change
+STREAM_BUFFER_CHARS = 64 * 1024
+STREAM_LOOKAHEAD_TOKENS = 64
+
 @dataclass
 class Chunk:
     content: str
@@ -501,6 +523,344 @@ class SlidingWindowChunking(ChunkingStrategy):
             }
         )
 
+class TokenizedText:
+    """
+    A text tokenized once, with the character offset of every token
+
+    Uses the tiktoken encoding for ``model`` when tiktoken is installed.
+    Otherwise falls back to a regex pre-tokenizer that splits ASCII words
+    into pieces of at most 4 characters and every other non-space character
+    into its own token, which counts at least as many tokens as BPE does
+    for English text.
+    """
+
+    _FALLBACK_PATTERN = re.compile(r"\s+(?=\S)|\s+$|\s+|[A-Za-z0-9]{1,4}|[^\sA-Za-z0-9]")
+
+    def __init__(self, text: str, model: Optional[str] = None):
+        self.text = text
+        encoding = _get_encoding(model)
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            decoded, starts = encoding.decode_with_offsets(tokens)
+            if decoded != text:
+                # Invalid surrogates etc. don't round-trip; offsets would drift
+                encoding, starts = None, None
+        if encoding is None:
+            starts = [m.start() for m in self._FALLBACK_PATTERN.finditer(text)]
+        self.tokenizer = encoding.name if encoding is not None else "regex"
+        self.starts: List[int] = list(starts)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def char_offset(self, token_index: int) -> int:
+        """Character offset where token ``token_index`` starts (len(text) at the end)"""
+        if token_index >= len(self.starts):
+            return len(self.text)
+        return self.starts[token_index]
+
+    def token_text(self, token_index: int) -> str:
+        return self.text[self.char_offset(token_index):self.char_offset(token_index + 1)]
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: Optional[str]):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_TOKEN_ENCODING)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_TOKEN_ENCODING)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable ({e}); using regex token counts")
+        return None
+
+
+@dataclass
+class _ChunkCursor:
+    """Where TokenAwareChunking is in a document, relative to its text buffer"""
+    start: int = 0                  # token index of the next chunk in the buffer
+    base_char: int = 0              # document offsets of the buffer start
+    base_token: int = 0
+    chunk_index: int = 0
+    previous_end: int = 0           # end token of the last chunk, in the buffer
+    section: Optional[str] = None   # section in effect at the buffer start
+    pending: Optional[Chunk] = None # held until overlap_with_next is known
+
+    def advance(self, chars: int) -> None:
+        """Rebase on a buffer that now begins at the next chunk start"""
+        self.base_char += chars
+        self.base_token += self.start
+        self.previous_end -= self.start
+        self.start = 0
+
+
+class TokenAwareChunking(ChunkingStrategy):
+    """
+    Single-pass chunking on exact token budgets
+
+    Tokenizes the text once, finds section, paragraph and sentence boundaries
+    in the same walk over the tokens, and cuts each chunk at the strongest
+    boundary that fits in ``chunk_size`` tokens (a hard cut when none does).
+    ``chunk_size`` is capped below the embedding model's ``max_tokens``.
+    Chunks carry exact character and token offsets.
+    """
+
+    SECTION, PARAGRAPH, SENTENCE = 3, 2, 1
+    BOUNDARY_NAMES = {3: 'section', 2: 'paragraph', 1: 'sentence', 0: 'hard'}
+    ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "e.g", "i.e", "etc"}
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200, model: Optional[str] = None,
+                 max_tokens: Optional[int] = None, min_chunk_tokens: Optional[int] = None):
+        super().__init__(chunk_size, overlap)
+        self.model = model
+        self.max_tokens = max_tokens
+        # Don't cut at a boundary that leaves a chunk smaller than this
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def effective_chunk_size(self) -> int:
+        if self.max_tokens:
+            return max(1, min(self.chunk_size, self.max_tokens - MODEL_LIMIT_MARGIN))
+        return max(1, self.chunk_size)
+
+    def chunk(self, text: str, metadata: Optional[Dict[str, Any]] = None) -> ChunkingResult:
+        """Chunk text on token budgets at the strongest available boundaries"""
+        metadata = metadata or {}
+        tokens = TokenizedText(text, self.model)
+        cursor = _ChunkCursor()
+        positions, levels, sections, stats = self._scan_boundaries(tokens)
+        chunks = list(self._cut_chunks(tokens, positions, levels, sections, cursor, metadata, final=True))
+        budget, overlap, _ = self._limits()
+
+        return ChunkingResult(
+            chunks=chunks,
+            total_chunks=len(chunks),
+            total_tokens=sum(chunk.token_count for chunk in chunks),
+            strategy_used='token_aware',
+            metadata={
+                'chunk_size': budget,
+                'overlap': overlap,
+                'model': self.model,
+                'max_tokens': self.max_tokens,
+                'tokenizer': tokens.tokenizer,
+                'document_tokens': len(tokens),
+                **stats
+            }
+        )
+
+    def iter_chunks(self, text_stream: Iterable[str], metadata: Optional[Dict[str, Any]] = None) -> Iterator[Chunk]:
+        """
+        Chunk text as it arrives, yielding each chunk once it is final
+
+        Only the unchunked tail of the text is kept: the current chunk window,
+        its overlap and a short lookahead, plus whatever has arrived since the
+        last cut (tokenized every STREAM_BUFFER_CHARS). Chunks, offsets and
+        section titles match ``chunk()`` on the joined text, except where
+        tokenizing from a chunk start splits a token differently.
+
+        Args:
+            text_stream: Pieces of the document in order (pages, paragraphs, ...)
+            metadata: Metadata copied onto every chunk
+
+        Yields:
+            Chunk objects in document order
+        """
+        metadata = metadata or {}
+        cursor = _ChunkCursor()
+        buffer = ""
+        carried = 0
+
+        for piece in text_stream:
+            buffer += piece
+            if len(buffer) - carried < STREAM_BUFFER_CHARS:
+                continue
+            tokens = TokenizedText(buffer, self.model)
+            positions, levels, sections, _ = self._scan_boundaries(tokens, cursor.section)
+            yield from self._cut_chunks(tokens, positions, levels, sections, cursor, metadata, final=False)
+
+            # Drop everything before the next chunk start
+            consumed = tokens.char_offset(cursor.start)
+            cursor.section = self._section_at(positions, sections, cursor.start) or cursor.section
+            cursor.advance(consumed)
+            buffer = buffer[consumed:]
+            carried = len(buffer)
+
+        tokens = TokenizedText(buffer, self.model)
+        positions, levels, sections, _ = self._scan_boundaries(tokens, cursor.section)
+        yield from self._cut_chunks(tokens, positions, levels, sections, cursor, metadata, final=True)
+
+    def _limits(self) -> Tuple[int, int, int]:
+        budget = self.effective_chunk_size()
+        overlap = min(self.overlap, budget // 2)
+        min_tokens = self.min_chunk_tokens if self.min_chunk_tokens is not None else budget // 4
+        return budget, overlap, max(1, min_tokens)
+
+    def _cut_chunks(self, tokens: TokenizedText, positions: List[int], levels: List[int],
+                    sections: List[Optional[str]], cursor: "_ChunkCursor", metadata: Dict[str, Any],
+                    final: bool) -> Iterator[Chunk]:
+        """
+        Cut chunks from ``cursor.start`` onwards, advancing the cursor
+
+        Unless ``final``, stops before a chunk window that reaches into the
+        last STREAM_LOOKAHEAD_TOKENS, where boundaries may still change.
+        """
+        text = tokens.text
+        doc_id = metadata.get('document_id', 'doc')
+        budget, overlap, min_tokens = self._limits()
+
+        start = cursor.start
+        while start < len(tokens):
+            limit = min(start + budget, len(tokens))
+            if not final and limit + STREAM_LOOKAHEAD_TOKENS > len(tokens):
+                break
+            if limit == len(tokens):
+                end, level = limit, self.SECTION
+            else:
+                end, level = self._best_cut(positions, levels, start + min_tokens, limit)
+
+            start_char, end_char = tokens.char_offset(start), tokens.char_offset(end)
+            content = text[start_char:end_char]
+            if content.strip():
+                chunk_index = cursor.chunk_index
+                chunk_start_char = cursor.base_char + start_char
+                chunk = Chunk(
+                    content=content,
+                    metadata={
+                        **metadata,
+                        'chunk_index': chunk_index,
+                        'chunk_type': 'token_aware',
+                        'start_char': chunk_start_char,
+                        'end_char': cursor.base_char + end_char,
+                        'start_token': cursor.base_token + start,
+                        'end_token': cursor.base_token + end,
+                        'boundary': self.BOUNDARY_NAMES[level],
+                        'section_title': self._section_at(positions, sections, start) or cursor.section,
+                        'tokenizer': tokens.tokenizer
+                    },
+                    chunk_id=self.create_chunk_id(doc_id, chunk_index),
+                    start_index=chunk_start_char,
+                    end_index=cursor.base_char + end_char,
+                    token_count=end - start,
+                    overlap_with_previous=max(0, cursor.previous_end - start) if chunk_index else 0
+                )
+                cursor.chunk_index += 1
+                cursor.previous_end = end
+                if cursor.pending is not None:
+                    cursor.pending.overlap_with_next = chunk.overlap_with_previous
+                    yield cursor.pending
+                cursor.pending = chunk
+
+            if end >= len(tokens):
+                start = end
+                break
+            # Sections start clean: no overlap back into the previous one
+            start = end if level == self.SECTION else self._next_start(positions, start, end, overlap)
+
+        cursor.start = start
+        if final and cursor.pending is not None:
+            yield cursor.pending
+            cursor.pending = None
+
+    def _scan_boundaries(self, tokens: TokenizedText, section: Optional[str] = None):
+        """
+        One walk over the tokens recording where a chunk may start
+
+        Returns boundary token positions (ascending), their levels, the
+        section title in effect at each boundary, and structure counts.
+        """
+        text = tokens.text
+        positions: List[int] = []
+        levels: List[int] = []
+        sections: List[Optional[str]] = []
+        counts = {self.SECTION: 0, self.PARAGRAPH: 0, self.SENTENCE: 0}
+        headers = 0
+
+        last_end = None  # end of the last non-whitespace character seen
+        for i in range(len(tokens)):
+            token = tokens.token_text(i)
+            if not token.strip():
+                continue
+            offset = tokens.char_offset(i)
+            content_start = offset + len(token) - len(token.lstrip())
+
+            if last_end is None:
+                level = self.SECTION
+                title = self._header_title(text, content_start)
+            else:
+                gap = text[last_end:content_start]
+                level, title = 0, None
+                if "\n" in gap:
+                    title = self._header_title(text, content_start)
+                    if title is not None:
+                        level = self.SECTION
+                    elif gap.count("\n") >= 2:
+                        level = self.PARAGRAPH
+                if not level and gap and self._ends_sentence(text, last_end):
+                    level = self.SENTENCE
+
+            if level:
+                if title is not None:
+                    section = title
+                    headers += 1
+                positions.append(i)
+                levels.append(level)
+                sections.append(section)
+                counts[level] += 1
+            last_end = offset + len(token.rstrip())
+
+        stats = {
+            'sentence_count': sum(counts.values()),
+            'paragraph_count': counts[self.SECTION] + counts[self.PARAGRAPH],
+            'sections_detected': headers,
+        }
+        stats['has_structure'] = stats['sections_detected'] > 2
+        return positions, levels, sections, stats
+
+    def _ends_sentence(self, text: str, end: int) -> bool:
+        """Text up to ``end`` finishes a sentence (and not on an abbreviation)"""
+        if text[end - 1] not in ".!?":
+            return False
+        if text[end - 1] == ".":
+            words = text[max(0, end - 10):end - 1].split()
+            if words and words[-1].lower() in self.ABBREVIATIONS:
+                return False
+        return True
+
+    @staticmethod
+    def _header_title(text: str, line_start: int) -> Optional[str]:
+        """Title of a markdown header line starting at ``line_start``"""
+        if not text.startswith("#", line_start):
+            return None
+        line_end = text.find("\n", line_start)
+        line = text[line_start:line_end if line_end != -1 else len(text)]
+        title = line.lstrip("#").strip()
+        return title if line.lstrip("#")[:1] in (" ", "\t") and title else None
+
+    @staticmethod
+    def _best_cut(positions: List[int], levels: List[int], low: int, high: int) -> Tuple[int, int]:
+        """Latest boundary of the strongest level in (low, high], else a hard cut at high"""
+        best, best_level = high, 0
+        for j in range(bisect.bisect_left(positions, low), bisect.bisect_right(positions, high)):
+            if levels[j] >= best_level:
+                best, best_level = positions[j], levels[j]
+        return best, best_level
+
+    @staticmethod
+    def _next_start(positions: List[int], start: int, end: int, overlap: int) -> int:
+        """Start of the next chunk: ``overlap`` tokens back, snapped forward to a boundary"""
+        if overlap <= 0:
+            return end
+        target = max(start + 1, end - overlap)
+        j = bisect.bisect_left(positions, target)
+        if j < len(positions) and positions[j] < end:
+            return positions[j]
+        return target
+
+    @staticmethod
+    def _section_at(positions: List[int], sections: List[Optional[str]], token_index: int) -> Optional[str]:
+        j = bisect.bisect_right(positions, token_index) - 1
+        return sections[j] if j >= 0 else None
+
 class ChunkingManager:
     """
     Manager for different chunking strategies with automatic strategy selection
@@ -511,7 +871,8 @@ class ChunkingManager:
             'fixed_size': FixedSizeChunking(),
             'semantic': SemanticChunking(),
             'hierarchical': HierarchicalChunking(),
-            'sliding_window': SlidingWindowChunking()
+            'sliding_window': SlidingWindowChunking(),
+            'token_aware': TokenAwareChunking()
         }
 
         # Strategy selection rules
@@ -589,12 +950,32 @@ class ChunkingManager:
         strategy: Optional[str] = None,
         metadata: Optional[Dict[str, Any]] = None,
         chunk_size: int = 1000,
-        overlap: int = 200
+        overlap: int = 200,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None
     ) -> ChunkingResult:
-        """Chunk document using specified or auto-selected strategy"""
-
-        # Auto-select strategy if not specified
+        """
+        Chunk document using specified or auto-selected strategy
+
+        Args:
+            text: Document text
+            strategy: Strategy name; None uses single-pass 'token_aware'
+                chunking, 'auto' picks one with the text heuristics
+            metadata: Metadata copied onto every chunk
+            chunk_size: Target chunk size in tokens
+            overlap: Overlap between chunks in tokens
+            model: Embedding model, for its tokenizer ('token_aware' only)
+            max_tokens: Embedding model input limit ('token_aware' only)
+
+        Returns:
+            ChunkingResult
+        """
+
+        # Token-aware chunking detects structure while chunking, so there is
+        # no separate selection pass over the text
         if strategy is None:
+            strategy = 'token_aware'
+        elif strategy == 'auto':
             strategy = self.auto_select_strategy(text, metadata)
 
         # Get strategy instance
@@ -602,13 +983,16 @@ class ChunkingManager:
             logger.warning(f"Unknown strategy '{strategy}', using default")
             strategy = 'semantic'
 
-        chunker = self.strategies[strategy]
+        if strategy == 'token_aware':
+            chunker = TokenAwareChunking(chunk_size, overlap, model=model, max_tokens=max_tokens)
+        else:
+            chunker = self.strategies[strategy]
 
-        # Update chunker parameters if provided
-        if chunk_size != 1000:
-            chunker.chunk_size = chunk_size
-        if overlap != 200:
-            chunker.overlap = overlap
+            # Update chunker parameters if provided
+            if chunk_size != 1000:
+                chunker.chunk_size = chunk_size
+            if overlap != 200:
+                chunker.overlap = overlap
 
         # Perform chunking
         try:
@@ -636,6 +1020,37 @@ class ChunkingManager:
 
             return result
 
+    def iter_chunks(
+        self,
+        text_stream: Iterable[str],
+        metadata: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 1000,
+        overlap: int = 200,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None
+    ) -> Iterator[Chunk]:
+        """
+        Chunk a document incrementally with token-aware chunking
+
+        Consumes ``text_stream`` (e.g. DocumentProcessor.iter_text) as it is
+        produced and yields chunks in bounded memory, so embedding can start
+        before extraction finishes. There is no ChunkingResult and no
+        fallback strategy: the whole text is never held at once.
+
+        Args:
+            text_stream: Pieces of the document in order
+            metadata: Metadata copied onto every chunk
+            chunk_size: Target chunk size in tokens
+            overlap: Overlap between chunks in tokens
+            model: Embedding model, for its tokenizer
+            max_tokens: Embedding model input limit
+
+        Yields:
+            Chunk objects in document order
+        """
+        chunker = TokenAwareChunking(chunk_size, overlap, model=model, max_tokens=max_tokens)
+        return chunker.iter_chunks(text_stream, metadata)
+
     def _calculate_efficiency(self, result: ChunkingResult) -> float:
         """Calculate chunking efficiency score"""
         if result.total_chunks == 0:
@@ -710,15 +1125,146 @@ def semantic_chunker(
     return sc.chunk(text, metadata or {})
 
 
-# Simple deduplication for chunks based on content hashing and Jaccard similarity
+# Chunk deduplication: content hashing, then MinHash LSH for near duplicates
+# with exact Jaccard similarity on the candidate pairs
 from hashlib import md5
 
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHIFT = np.uint64(32)
+MINHASH_NUM_PERM = 128
+MINHASH_SEED = 1
+# Required chance that a pair exactly at the threshold becomes a candidate
+MINHASH_MIN_RECALL = 0.99
+
+
 def _token_set(text: str) -> set[str]:
     return set(w.strip(".,;:!?").lower() for w in text.split() if w.strip())
 
-def deduplicate_chunks(chunks: List[Chunk], similarity_threshold: float = 0.9) -> List[Chunk]:
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+class MinHashLSH:
+    """
+    MinHash signatures with LSH banding, for near-duplicate candidate search
+
+    Tokens are hashed with crc32 (stable across processes, unlike ``hash()``)
+    and permuted with multiply-shift hashing, ``(a * x + b) mod 2**64 >> 32``,
+    which needs no modulo. Signatures are therefore deterministic for a given
+    ``num_perm`` and ``seed`` and can be stored with a chunk and compared across
+    documents. ``to_dict`` and ``from_dict`` persist an index; band buckets
+    are rebuilt on load.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = MINHASH_NUM_PERM, seed: int = MINHASH_SEED):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.seed = seed
+        self.rows = self._choose_rows(threshold, num_perm)
+        self.bands = num_perm // self.rows
+
+        generator = np.random.RandomState(seed)
+        high = np.iinfo(np.uint64).max
+        self._a = generator.randint(0, high, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = generator.randint(0, high, size=num_perm, dtype=np.uint64)
+
+        self.signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+
+    @staticmethod
+    def _choose_rows(threshold: float, num_perm: int) -> int:
+        """Most rows per band (fewest false candidates) that keep recall at the threshold"""
+        rows = 1
+        for candidate in range(1, num_perm + 1):
+            bands = num_perm // candidate
+            if 1 - (1 - threshold ** candidate) ** bands >= MINHASH_MIN_RECALL:
+                rows = candidate
+        return rows
+
+    def signature(self, tokens: set[str]) -> np.ndarray:
+        """MinHash signature of a token set (uint32 per permutation)"""
+        if not tokens:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(t.encode("utf-8", errors="ignore")) for t in tokens),
+                             dtype=np.uint64, count=len(tokens))
+        # uint64 products wrap, which is the mod 2**64 of multiply-shift
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) >> _SHIFT
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows].tobytes()
+
+    def insert(self, key: str, signature: np.ndarray) -> None:
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def query(self, signature: np.ndarray) -> set[str]:
+        """Keys sharing at least one band with ``signature``"""
+        candidates: set[str] = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        return candidates
+
+    def estimate_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
+        """Jaccard estimate from the fraction of agreeing permutations"""
+        return float(np.mean(a == b))
+
+    @staticmethod
+    def encode_signature(signature: np.ndarray) -> str:
+        return base64.b64encode(signature.astype("<u4").tobytes()).decode("ascii")
+
+    @staticmethod
+    def decode_signature(encoded: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(encoded), dtype="<u4").astype(np.uint64)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'threshold': self.threshold,
+            'num_perm': self.num_perm,
+            'seed': self.seed,
+            'signatures': {key: self.encode_signature(sig) for key, sig in self.signatures.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MinHashLSH":
+        index = cls(data['threshold'], data['num_perm'], data['seed'])
+        for key, encoded in data['signatures'].items():
+            index.insert(key, cls.decode_signature(encoded))
+        return index
+
+
+def deduplicate_chunks(
+    chunks: List[Chunk],
+    similarity_threshold: float = 0.9,
+    index: Optional[MinHashLSH] = None
+) -> List[Chunk]:
+    """
+    Drop exact and near-duplicate chunks, keeping the first occurrence
+
+    Each chunk is tokenized and MinHashed once. LSH banding finds candidate
+    pairs, which are confirmed with exact Jaccard similarity; candidates that
+    only exist in a persisted ``index`` (other documents) are compared by
+    signature estimate. Kept chunks are added to ``index`` under their
+    chunk_id and carry their encoded signature in ``metadata['minhash']``.
+
+    Args:
+        chunks: Chunks in document order
+        similarity_threshold: Jaccard similarity at which chunks are duplicates
+        index: Existing MinHashLSH for cross-document deduplication
+
+    Returns:
+        Chunks that are not duplicates of an earlier chunk
+    """
+    if index is None:
+        index = MinHashLSH(similarity_threshold)
     filtered: List[Chunk] = []
     seen_hashes: set[str] = set()
+    kept_tokens: Dict[str, set[str]] = {}
 
     for ch in chunks:
         content = ch.content or ""
@@ -726,22 +1272,28 @@ def deduplicate_chunks(chunks: List[Chunk], similarity_threshold: float = 0.9) -
         if h in seen_hashes:
             continue
 
-        duplicate = False
         toks = _token_set(content)
-        for kept in filtered:
-            ktoks = _token_set(kept.content)
-            if not toks or not ktoks:
+        signature = None
+        if toks:
+            signature = index.signature(toks)
+            duplicate = False
+            for key in index.query(signature):
+                if key in kept_tokens:
+                    sim = _jaccard(toks, kept_tokens[key])
+                else:
+                    sim = index.estimate_similarity(signature, index.signatures[key])
+                if sim >= similarity_threshold:
+                    duplicate = True
+                    break
+            if duplicate:
                 continue
-            inter = len(toks & ktoks)
-            union = len(toks | ktoks)
-            sim = inter / union if union else 0.0
-            if sim >= similarity_threshold:
-                duplicate = True
-                break
 
-        if not duplicate:
-            filtered.append(ch)
-            seen_hashes.add(h)
+        filtered.append(ch)
+        seen_hashes.add(h)
+        if signature is not None:
+            kept_tokens[ch.chunk_id] = toks
+            index.insert(ch.chunk_id, signature)
+            ch.metadata['minhash'] = MinHashLSH.encode_signature(signature)
 
     return filtered
 
@@ -4,7 +4,7 @@ Document Extractors - Extract text content from various file formats
 import logging
 import io
 import re
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, Iterator, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import mimetypes
@@ -87,6 +87,22 @@ class DocumentExtractor:
         """Extract content from file"""
         raise NotImplementedError("Subclasses must implement extract method")
 
+    def iter_text(self, file_content: bytes, filename: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield the extracted text in document order, for incremental chunking
+
+        Joining the pieces gives the same text as ``extract``. Extractors that
+        can read a file piece by piece override this; the default extracts the
+        whole document and yields it once.
+
+        Raises:
+            ValueError: If extraction fails
+        """
+        result = self.extract(file_content, filename)
+        if not result.success or not result.document:
+            raise ValueError(result.error or "Extraction failed")
+        yield result.document.content
+
     def _detect_encoding(self, content: bytes) -> str:
         """Detect text encoding"""
         if CHARDET_AVAILABLE:
@@ -176,33 +192,10 @@ class PDFExtractor(DocumentExtractor):
         warnings: List[str] = []
 
         try:
-            # Check file size
-            if len(file_content) > self.max_file_size:
-                return ExtractionResult(
-                    success=False,
-                    error=f"File too large: {len(file_content)} bytes (max: {self.max_file_size})"
-                )
-
-            # Create PDF reader
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-
-            # Handle encryption gracefully
-            encrypted = False
             try:
-                if getattr(pdf_reader, 'is_encrypted', False):
-                    encrypted = True
-                    try:
-                        # Best-effort empty password decrypt
-                        result = pdf_reader.decrypt("")
-                        if result == 0:  # decrypt failed
-                            return ExtractionResult(success=False, error="Encrypted PDF: decryption required")
-                        else:
-                            warnings.append("Encrypted PDF decrypted with empty password")
-                    except Exception:
-                        return ExtractionResult(success=False, error="Encrypted PDF: unable to decrypt")
-            except Exception as e:
-                warnings.append(f"Encryption check failed: {e}")
+                pdf_reader, encrypted = self._open_reader(file_content, warnings)
+            except ValueError as e:
+                return ExtractionResult(success=False, error=str(e))
 
             # Extract text page by page with fallbacks
             page_count = len(pdf_reader.pages)
@@ -210,30 +203,11 @@ class PDFExtractor(DocumentExtractor):
             ocr_used_pages: List[int] = []
             tables_extracted = 0
 
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = ''
-                try:
-                    raw = page.extract_text() or ''
-                    page_text = raw.strip()
-                except Exception as e:
-                    warnings.append(f"Failed PyPDF2 extract on page {page_num + 1}: {e}")
-                    page_text = ''
-
-                # If no text, try OCR fallback (if available)
-                if not page_text:
-                    ocr_text = self._ocr_page_with_plumber(file_content, page_num)
-                    if ocr_text.strip():
-                        page_text = ocr_text.strip()
-                        ocr_used_pages.append(page_num + 1)
-                    else:
-                        warnings.append(f"No text found on page {page_num + 1}")
-
-                # Attempt table extraction and append below text (if available)
-                table_text = self._extract_tables_with_plumber(file_content, page_num)
-                if table_text.strip():
-                    page_text = (page_text + '\n' + table_text).strip() if page_text else table_text
+            for page_num, page_text, used_ocr, has_table in self._iter_pages(pdf_reader, file_content, warnings):
+                if used_ocr:
+                    ocr_used_pages.append(page_num + 1)
+                if has_table:
                     tables_extracted += 1
-
                 if page_text:
                     text_content.append(page_text)
 
@@ -291,6 +265,90 @@ class PDFExtractor(DocumentExtractor):
             logger.error(f"PDF extraction failed: {e}")
             return ExtractionResult(success=False, error=f"PDF extraction failed: {str(e)}")
 
+    def iter_text(self, file_content: bytes, filename: Optional[str] = None) -> Iterator[str]:
+        """Yield cleaned text page by page; pages are joined by a single space as in ``extract``"""
+        if not PDF_AVAILABLE:
+            raise ValueError("PyPDF2 not available for PDF extraction")
+
+        warnings: List[str] = []
+        pdf_reader, _ = self._open_reader(file_content, warnings)
+        separator = ''
+        for _, page_text, _, _ in self._iter_pages(pdf_reader, file_content, warnings):
+            cleaned = self._clean_text(page_text)
+            if cleaned:
+                yield separator + cleaned
+                separator = ' '
+        for warning in warnings:
+            logger.debug(f"PDF extraction warning ({filename}): {warning}")
+
+    def _open_reader(self, file_content: bytes, warnings: List[str]) -> Tuple[Any, bool]:
+        """
+        Open a PdfReader, decrypting with the empty password when needed
+
+        Returns:
+            (reader, encrypted)
+
+        Raises:
+            ValueError: If the file is too large or cannot be decrypted
+        """
+        # Check file size
+        if len(file_content) > self.max_file_size:
+            raise ValueError(f"File too large: {len(file_content)} bytes (max: {self.max_file_size})")
+
+        # Create PDF reader
+        pdf_file = io.BytesIO(file_content)
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+
+        # Handle encryption gracefully
+        encrypted = False
+        try:
+            if getattr(pdf_reader, 'is_encrypted', False):
+                encrypted = True
+                try:
+                    # Best-effort empty password decrypt
+                    result = pdf_reader.decrypt("")
+                except Exception:
+                    raise ValueError("Encrypted PDF: unable to decrypt")
+                if result == 0:  # decrypt failed
+                    raise ValueError("Encrypted PDF: decryption required")
+                warnings.append("Encrypted PDF decrypted with empty password")
+        except ValueError:
+            raise
+        except Exception as e:
+            warnings.append(f"Encryption check failed: {e}")
+
+        return pdf_reader, encrypted
+
+    def _iter_pages(self, pdf_reader: Any, file_content: bytes,
+                    warnings: List[str]) -> Iterator[Tuple[int, str, bool, bool]]:
+        """Yield (page_num, page_text, used_ocr, has_table) with per-page fallbacks"""
+        for page_num, page in enumerate(pdf_reader.pages):
+            page_text = ''
+            used_ocr = False
+            try:
+                raw = page.extract_text() or ''
+                page_text = raw.strip()
+            except Exception as e:
+                warnings.append(f"Failed PyPDF2 extract on page {page_num + 1}: {e}")
+                page_text = ''
+
+            # If no text, try OCR fallback (if available)
+            if not page_text:
+                ocr_text = self._ocr_page_with_plumber(file_content, page_num)
+                if ocr_text.strip():
+                    page_text = ocr_text.strip()
+                    used_ocr = True
+                else:
+                    warnings.append(f"No text found on page {page_num + 1}")
+
+            # Attempt table extraction and append below text (if available)
+            table_text = self._extract_tables_with_plumber(file_content, page_num)
+            has_table = bool(table_text.strip())
+            if has_table:
+                page_text = (page_text + '\n' + table_text).strip() if page_text else table_text
+
+            yield page_num, page_text, used_ocr, has_table
+
 class DOCXExtractor(DocumentExtractor):
     """
     Extract text from DOCX files
@@ -669,6 +727,24 @@ class DocumentProcessor:
                 error=f"Document processing failed: {str(e)}"
             )
 
+    def iter_text(
+        self,
+        file_content: bytes,
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Extract a document's text incrementally, for ChunkingManager.iter_chunks
+
+        Raises:
+            ValueError: If no extractor handles the file type or extraction fails
+        """
+        file_type = self.get_file_type(filename, mime_type)
+        extractor = self.extractors.get(file_type)
+        if not extractor:
+            raise ValueError(f"No extractor available for file type: {file_type}")
+        return extractor.iter_text(file_content, filename)
+
     def get_supported_types(self) -> List[str]:
         """Get list of supported file types"""
         return list(self.type_mappings.keys())
@@ -258,6 +258,7 @@ class DocumentProcessingPipeline:
             self._update_job_status(job, ProcessingStatus.CHUNKING, "chunking")
             job.steps[1].start_time = datetime.now(timezone.utc)
 
+            model_config = embedding_service.model_configs.get(config['embedding_model'], {})
             chunking_result = chunking_manager.chunk_document(
                 extraction_result.document.content,
                 strategy=config.get('chunking_strategy'),
@@ -267,7 +268,9 @@ class DocumentProcessingPipeline:
                     'user_id': job.user_id
                 },
                 chunk_size=config['chunk_size'],
-                overlap=config['chunk_overlap']
+                overlap=config['chunk_overlap'],
+                model=config['embedding_model'],
+                max_tokens=model_config.get('max_tokens')
             )
 
             job.total_chunks = chunking_result.total_chunks
@@ -320,7 +323,9 @@ class DocumentProcessingPipeline:
                         'user_id': job.user_id,
                         'filename': job.filename,
                         'chunk_index': chunk.metadata.get('chunk_index', 0),
-                        'token_count': chunk.token_count
+                        'token_count': chunk.token_count,
+                        'start_char': chunk.start_index,
+                        'end_char': chunk.end_index
                     }
 
                     vectors.append((
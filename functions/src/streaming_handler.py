@@ -5,17 +5,32 @@ Task 1.6: Implement Streaming Response Support
 This module provides streaming response handling for Firebase Cloud Functions.
 Since Firebase Cloud Functions (2nd gen) don't natively support SSE streaming,
 we implement a chunked response approach.
+
+Chunks are persisted in batches to a ``chunk_batches`` subcollection of the
+execution document (one small doc per flush) instead of an ever-growing
+``chunks`` array, and are flushed on a time/size cadence that mirrors the SSE
+flush cadence in ``api/cloud_run_main.py``.
 """
 
 import logging
 import asyncio
-import json
-from typing import Dict, Any, AsyncIterator, Optional
+import os
+import threading
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional
 from datetime import datetime, timezone
 from firebase_admin import firestore
 
 logger = logging.getLogger(__name__)
 
+CHUNK_BATCHES_COLLECTION = 'chunk_batches'
+
+# Flush cadence controls (same knobs/defaults style as the SSE endpoint)
+STREAM_FLUSH_INTERVAL_MS = int(os.getenv('STREAM_FLUSH_INTERVAL_MS', '250'))
+STREAM_MAX_BATCH_CHUNKS = int(os.getenv('STREAM_MAX_BATCH_CHUNKS', '64'))
+STREAM_MAX_BATCH_CHARS = int(os.getenv('STREAM_MAX_BATCH_CHARS', '4000'))
+STREAM_CANCEL_CHECK_INTERVAL_S = float(os.getenv('STREAM_CANCEL_CHECK_INTERVAL_S', '1.0'))
+
 
 class StreamingResponseHandler:
     """
@@ -32,6 +47,16 @@ class StreamingResponseHandler:
     def __init__(self, firestore_client):
         self.db = firestore_client
 
+    def _execution_ref(self, user_id: str, prompt_id: str, execution_id: str):
+        return (
+            self.db.collection('users')
+            .document(user_id)
+            .collection('prompts')
+            .document(prompt_id)
+            .collection('executions')
+            .document(execution_id)
+        )
+
     async def create_streaming_execution(
         self,
         user_id: str,
@@ -60,8 +85,8 @@ class StreamingResponseHandler:
 
         execution_data = {
             'status': 'streaming',
-            'chunks': [],
             'total_chunks': 0,
+            'total_batches': 0,
             'started_at': datetime.now(timezone.utc),
             'updated_at': datetime.now(timezone.utc),
             'completed': False
@@ -111,13 +136,70 @@ class StreamingResponseHandler:
             'metadata': metadata or {}
         }
 
-        # Update execution with new chunk
+        # Store the chunk as a single-entry batch doc keyed by its index
+        execution_ref.collection(CHUNK_BATCHES_COLLECTION).document(f"{chunk_index:08d}").set({
+            'start_index': chunk_index,
+            'end_index': chunk_index,
+            'chunks': [chunk_data]
+        })
         execution_ref.update({
-            'chunks': firestore.ArrayUnion([chunk_data]),
             'total_chunks': chunk_index + 1,
             'updated_at': datetime.now(timezone.utc)
         })
 
+    async def append_chunks(
+        self,
+        user_id: str,
+        prompt_id: str,
+        execution_id: str,
+        chunks: List[Dict[str, Any]]
+    ):
+        """
+        Persist a batch of chunks in a single Firestore write batch
+
+        The batch becomes one document in the ``chunk_batches`` subcollection
+        (named by its first chunk index so documents sort in stream order) and
+        the execution counters are updated in the same commit.
+
+        Args:
+            user_id: User ID
+            prompt_id: Prompt ID
+            execution_id: Execution ID
+            chunks: Chunk dicts with 'index', 'content', 'timestamp', 'metadata'
+        """
+        if not chunks:
+            return
+
+        # Firestore client calls are blocking; keep them off the event loop
+        await asyncio.to_thread(self._commit_chunk_batch, user_id, prompt_id, execution_id, chunks)
+
+    def _commit_chunk_batch(
+        self,
+        user_id: str,
+        prompt_id: str,
+        execution_id: str,
+        chunks: List[Dict[str, Any]]
+    ):
+        execution_ref = self._execution_ref(user_id, prompt_id, execution_id)
+        start_index = chunks[0]['index']
+        end_index = chunks[-1]['index']
+
+        batch = self.db.batch()
+        batch.set(
+            execution_ref.collection(CHUNK_BATCHES_COLLECTION).document(f"{start_index:08d}"),
+            {
+                'start_index': start_index,
+                'end_index': end_index,
+                'chunks': chunks
+            }
+        )
+        batch.update(execution_ref, {
+            'total_chunks': end_index + 1,
+            'total_batches': firestore.Increment(1),
+            'updated_at': datetime.now(timezone.utc)
+        })
+        batch.commit()
+
     async def complete_streaming_execution(
         self,
         user_id: str,
@@ -237,13 +319,26 @@ class StreamingResponseHandler:
             }
 
         execution_data = execution_doc.to_dict()
-        all_chunks = execution_data.get('chunks', [])
+
+        # Legacy executions stored chunks inline in a 'chunks' array
+        all_chunks = list(execution_data.get('chunks', []))
+
+        # Batched executions store chunks in the subcollection; only batches
+        # that end at or after from_index need to be read
+        batch_docs = (
+            execution_ref.collection(CHUNK_BATCHES_COLLECTION)
+            .where('end_index', '>=', from_index)
+            .order_by('end_index')
+            .stream()
+        )
+        for batch_doc in batch_docs:
+            all_chunks.extend((batch_doc.to_dict() or {}).get('chunks', []))
 
         # Filter chunks from specified index
-        new_chunks = [
-            chunk for chunk in all_chunks
-            if chunk.get('index', 0) >= from_index
-        ]
+        new_chunks = sorted(
+            (chunk for chunk in all_chunks if chunk.get('index', 0) >= from_index),
+            key=lambda chunk: chunk.get('index', 0)
+        )
 
         return {
             'execution_id': execution_id,
@@ -255,6 +350,165 @@ class StreamingResponseHandler:
         }
 
 
+class ChunkBatchWriter:
+    """
+    Coalescing writer for streamed chunks
+
+    Buffers chunks in memory and flushes them as one Firestore batch when
+    either the flush interval has elapsed or the buffer exceeds the size
+    limits. The interval is enforced by a timer armed at the first buffered
+    chunk, so a stalled LLM stream still gets its buffered tokens written.
+    Flushes run as background tasks (the Firestore commit itself runs in a
+    worker thread), and at most one flush is in flight at a time so batches
+    land in order.
+    """
+
+    def __init__(
+        self,
+        handler: StreamingResponseHandler,
+        user_id: str,
+        prompt_id: str,
+        execution_id: str,
+        flush_interval_ms: int = STREAM_FLUSH_INTERVAL_MS,
+        max_batch_chunks: int = STREAM_MAX_BATCH_CHUNKS,
+        max_batch_chars: int = STREAM_MAX_BATCH_CHARS
+    ):
+        self.handler = handler
+        self.user_id = user_id
+        self.prompt_id = prompt_id
+        self.execution_id = execution_id
+        self.flush_interval_ms = flush_interval_ms
+        self.max_batch_chunks = max_batch_chunks
+        self.max_batch_chars = max_batch_chars
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_chars = 0
+        self._last_flush = time.monotonic()
+        self._pending: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.Task] = None
+        self.batches_written = 0
+
+    async def add(self, chunk_data: Dict[str, Any]):
+        """Buffer a chunk and schedule a flush if the cadence is due"""
+        self._buffer.append(chunk_data)
+        self._buffer_chars += len(chunk_data.get('content') or '')
+
+        elapsed_ms = (time.monotonic() - self._last_flush) * 1000
+        if (
+            elapsed_ms >= self.flush_interval_ms
+            or len(self._buffer) >= self.max_batch_chunks
+            or self._buffer_chars >= self.max_batch_chars
+        ):
+            await self._schedule_flush()
+        elif self._timer is None:
+            delay_ms = max(0.0, self.flush_interval_ms - elapsed_ms)
+            self._timer = asyncio.create_task(self._flush_after(delay_ms / 1000))
+
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        self._timer = None
+        # A failed write is left for the next add()/flush() to raise
+        await self._schedule_flush(raise_errors=False)
+
+    def _cancel_timer(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+    async def _schedule_flush(self, raise_errors: bool = True):
+        self._cancel_timer()
+        if not self._buffer:
+            return
+
+        # Keep batches ordered: wait for the previous flush before starting
+        # the next one. Usually it finished long ago. Loop because the timer
+        # and add() may both be waiting here.
+        while self._pending is not None and not self._pending.done():
+            await asyncio.wait([self._pending])
+        pending = self._pending
+        if pending is not None and (pending.cancelled() or pending.exception() is not None):
+            if not raise_errors:
+                return
+            await pending
+        if not self._buffer:
+            return
+
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_chars = 0
+        self._last_flush = time.monotonic()
+        self._pending = asyncio.create_task(self._write(batch))
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        await self.handler.append_chunks(self.user_id, self.prompt_id, self.execution_id, batch)
+        self.batches_written += 1
+
+    async def flush(self):
+        """Flush buffered chunks and wait for all writes to land"""
+        await self._schedule_flush()
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            await pending
+
+
+class CancellationWatcher:
+    """
+    Tracks whether an execution has been cancelled without a read per chunk
+
+    Prefers a Firestore snapshot listener (pushes the status change to us);
+    if listeners are unavailable it falls back to a periodic status read at
+    most once every ``check_interval_s`` seconds.
+    """
+
+    def __init__(self, execution_ref, check_interval_s: float = STREAM_CANCEL_CHECK_INTERVAL_S):
+        self.execution_ref = execution_ref
+        self.check_interval_s = check_interval_s
+        self._cancelled = threading.Event()
+        self._watch = None
+        self._last_check = time.monotonic()
+
+    def start(self):
+        """Attach the snapshot listener (best effort)"""
+        try:
+            self._watch = self.execution_ref.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            logger.debug(f"Snapshot listener unavailable, using periodic checks: {e}")
+            self._watch = None
+
+    def _on_snapshot(self, doc_snapshot, changes, read_time):
+        for doc in doc_snapshot:
+            if doc.exists and (doc.to_dict() or {}).get('status') == 'cancelled':
+                self._cancelled.set()
+
+    async def is_cancelled(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        if self._watch is not None:
+            return False
+
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval_s:
+            return False
+        self._last_check = now
+
+        try:
+            doc = await asyncio.to_thread(self.execution_ref.get)
+            if doc.exists and (doc.to_dict() or {}).get('status') == 'cancelled':
+                self._cancelled.set()
+        except Exception:
+            # If status check fails, continue streaming to avoid breaking user experience
+            pass
+        return self._cancelled.is_set()
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+
+
 class SimpleStreamCollector:
     """
     Simple collector for streaming responses
@@ -308,54 +562,45 @@ async def stream_to_firestore(
     await handler.create_streaming_execution(user_id, prompt_id, execution_id)
 
     chunk_index = 0
-    full_content = ""
+    content_parts = []
+
+    writer = ChunkBatchWriter(handler, user_id, prompt_id, execution_id)
+    watcher = CancellationWatcher(handler._execution_ref(user_id, prompt_id, execution_id))
+    watcher.start()
 
     try:
         async for chunk in stream_iterator:
-            # Check for client cancellation before appending next chunk
-            try:
-                exec_ref = (
-                    firestore_client.collection('users')
-                    .document(user_id)
-                    .collection('prompts')
-                    .document(prompt_id)
-                    .collection('executions')
-                    .document(execution_id)
-                )
-                exec_doc = exec_ref.get()
-                if exec_doc.exists:
-                    exec_data = exec_doc.to_dict()
-                    if exec_data.get('status') == 'cancelled':
-                        logger.info(f"Execution {execution_id} marked as cancelled. Stopping stream.")
-                        # Do not mark completed; partial chunks already saved
-                        return
-            except Exception as _:
-                # If status check fails, continue streaming to avoid breaking user experience
-                pass
-
-            # Append chunk to Firestore
-            await handler.append_chunk(
-                user_id,
-                prompt_id,
-                execution_id,
-                chunk.content,
-                chunk_index,
-                metadata={
+            # Check for client cancellation before buffering next chunk
+            if await watcher.is_cancelled():
+                logger.info(f"Execution {execution_id} marked as cancelled. Stopping stream.")
+                # Do not mark completed; persist the partial chunks we have
+                await writer.flush()
+                return
+
+            await writer.add({
+                'index': chunk_index,
+                'content': chunk.content,
+                'timestamp': datetime.now(timezone.utc),
+                'metadata': {
                     'finish_reason': chunk.finish_reason,
                     'model': chunk.model
                 }
-            )
+            })
 
-            full_content += chunk.content
+            content_parts.append(chunk.content)
             chunk_index += 1
 
             # Log progress
-            if chunk_index % 10 == 0:
+            if chunk_index % 100 == 0:
                 logger.info(f"Streamed {chunk_index} chunks for execution {execution_id}")
 
+        await writer.flush()
+        full_content = "".join(content_parts)
+
         # Mark as complete
         final_metadata = {
             'total_chunks': chunk_index,
+            'total_batches': writer.batches_written,
             'total_length': len(full_content),
             'completed_at': datetime.now(timezone.utc).isoformat()
         }
@@ -376,15 +621,14 @@ async def stream_to_firestore(
     except Exception as e:
         logger.error(f"Error during streaming: {str(e)}")
 
+        # Persist whatever was generated before the failure
+        try:
+            await writer.flush()
+        except Exception as flush_error:
+            logger.warning(f"Failed to flush partial chunks for {execution_id}: {flush_error}")
+
         # Mark execution as failed
-        execution_ref = (
-            firestore_client.collection('users')
-            .document(user_id)
-            .collection('prompts')
-            .document(prompt_id)
-            .collection('executions')
-            .document(execution_id)
-        )
+        execution_ref = handler._execution_ref(user_id, prompt_id, execution_id)
 
         execution_ref.update({
             'status': 'failed',
@@ -393,3 +637,6 @@ async def stream_to_firestore(
         })
 
         raise
+
+    finally:
+        watcher.stop()
@@ -0,0 +1,66 @@
+"""
+Tests for the cached local KB grounding scorer
+"""
+import pytest
+
+from src.ai_agent.marketing.grounding import GroundingScorer, split_chunks, tokenize
+
+CONTEXT = (
+    "[1] Smart Business Assistant: Plans start at $1,500 per month and include 24/7 support.\n"
+    "[2] System Integration: We connect CRM, ERP and ticketing systems for Australian businesses.\n"
+)
+
+
+@pytest.fixture
+def scorer():
+    return GroundingScorer(max_chunks=8)
+
+
+class TestGroundingScorer:
+    """Tests for local scoring and the per-chunk token cache"""
+
+    def test_chunks_are_split_and_cached(self, scorer):
+        assert len(split_chunks(CONTEXT)) == 2
+
+        scorer.context_tokens([CONTEXT])
+        scorer.context_tokens([CONTEXT])
+
+        assert scorer.stats == {"hits": 2, "misses": 2}
+
+    def test_cache_is_bounded(self):
+        scorer = GroundingScorer(max_chunks=1)
+
+        scorer.context_tokens([CONTEXT])
+
+        assert len(scorer._chunks) == 1
+
+    def test_supported_answer_is_accepted_locally(self, scorer):
+        result = scorer.score(
+            "The Smart Business Assistant plans start at $1,500 per month with 24/7 support.",
+            [CONTEXT]
+        )
+
+        assert result.conclusive
+        assert result.score >= 0.6
+        assert result.unsupported_figures == []
+
+    def test_invented_price_is_never_auto_accepted(self, scorer):
+        result = scorer.score("Smart Business Assistant plans start at $900 per month.", [CONTEXT])
+
+        assert result.unsupported_figures == ["900"]
+        assert not result.conclusive
+
+    def test_unrelated_answer_is_rejected_locally(self, scorer):
+        result = scorer.score("Our quantum blockchain platform revolutionises agriculture on Mars.", [CONTEXT])
+
+        assert result.conclusive
+        assert result.score < 0.15
+
+    def test_small_talk_has_nothing_to_ground(self, scorer):
+        result = scorer.score("Happy to help! What would you like to know?", [CONTEXT])
+
+        assert result.conclusive
+        assert result.score == 1.0
+
+    def test_tokens_drop_stopwords_and_normalise_figures(self):
+        assert tokenize("The $1,500 plan is for you") == {"1500", "plan"}
@@ -0,0 +1,265 @@
+"""
+Tests for the coalescing Firestore checkpointer used by the marketing agent
+"""
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph import StateGraph, MessagesState, START, END
+
+from src.ai_agent.marketing.firestore_checkpointer import FirestoreCheckpointer
+
+
+class _Ref:
+    """Document/collection reference backed by a dict keyed by path"""
+
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def collection(self, name):
+        return _Ref(self.db, f"{self.path}/{name}")
+
+    def document(self, doc_id):
+        return _Ref(self.db, f"{self.path}/{doc_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        data = self.db.docs.get(self.path)
+        return MagicMock(id=self.path.rsplit("/", 1)[-1], exists=data is not None, to_dict=lambda: dict(data or {}))
+
+    def delete(self):
+        self.db.docs.pop(self.path, None)
+
+    def stream(self):
+        prefix = self.path + "/"
+        for path in sorted(self.db.docs):
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                yield MagicMock(to_dict=lambda p=path: dict(self.db.docs[p]), reference=_Ref(self.db, path))
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data):
+        self.ops.append(("set", ref.path, data))
+
+    def delete(self, ref):
+        self.ops.append(("delete", ref.path, None))
+
+    def commit(self):
+        if self.db.fail_commits:
+            self.db.fail_commits -= 1
+            raise RuntimeError("commit failed")
+        self.db.commits.append(self.ops)
+        for op, path, data in self.ops:
+            if op == "set":
+                self.db.docs[path] = data
+            else:
+                self.db.docs.pop(path, None)
+
+
+class _FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.commits = []
+        self.fail_commits = 0
+
+    def collection(self, name):
+        return _Ref(self, name)
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+    def segments(self, thread_id):
+        prefix = f"agent_checkpoints/{thread_id}/segments/"
+        return {path[len(prefix):]: data for path, data in self.docs.items() if path.startswith(prefix)}
+
+
+def _build_graph(checkpointer):
+    """Two-step graph: a 'tool' step and a final answer, i.e. three checkpoints per turn"""
+    def tool(state):
+        return {"messages": [AIMessage(content="looking it up")]}
+
+    def answer(state):
+        return {"messages": [AIMessage(content=f"answer {len(state['messages'])}")]}
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("tool", tool)
+    workflow.add_node("answer", answer)
+    workflow.add_edge(START, "tool")
+    workflow.add_edge("tool", "answer")
+    workflow.add_edge("answer", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def _transactional(fn):
+    """Stand-in for firestore.transactional: commit unless fn raises"""
+    def run(transaction):
+        result = fn(transaction)
+        transaction.commit()
+        return result
+    return run
+
+
+@pytest.fixture(autouse=True)
+def fake_transactions():
+    with patch("src.ai_agent.marketing.firestore_checkpointer.firestore.transactional", _transactional):
+        yield
+
+
+@pytest.fixture
+def db():
+    return _FakeFirestore()
+
+
+@pytest.fixture
+def config():
+    return {"configurable": {"thread_id": "conv-1"}}
+
+
+class TestCoalescingCheckpointer:
+    """Tests for hot tier, write coalescing and delta segments"""
+
+    @pytest.mark.asyncio
+    async def test_turn_is_persisted_as_single_commit(self, db, config):
+        checkpointer = FirestoreCheckpointer(db, flush_delay=60)
+        graph = _build_graph(checkpointer)
+
+        await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        assert db.commits == []
+
+        await checkpointer.aflush(config)
+        assert len(db.commits) == 1
+
+        # Reads during the next turn are served from the hot tier
+        state = await graph.aget_state(config)
+        assert [m.content for m in state.values["messages"]] == ["hi", "looking it up", "answer 2"]
+
+    @pytest.mark.asyncio
+    async def test_next_turn_writes_only_new_messages(self, db, config):
+        checkpointer = FirestoreCheckpointer(db, flush_delay=60)
+        graph = _build_graph(checkpointer)
+
+        await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await checkpointer.aflush(config)
+        await graph.ainvoke({"messages": [HumanMessage(content="more")]}, config)
+        await checkpointer.aflush(config)
+
+        segments = db.segments("conv-1")
+        assert [segment_id[:8] for segment_id in sorted(segments)] == ["00000000", "00000001"]
+        delta = checkpointer._load(segments[sorted(segments)[1]]["values"]["messages"])
+        assert [m.content for m in delta] == ["more", "looking it up", "answer 5"]
+
+    @pytest.mark.asyncio
+    async def test_cold_instance_restores_history(self, db, config):
+        first = FirestoreCheckpointer(db, flush_delay=60)
+        graph = _build_graph(first)
+        await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await first.aflush(config)
+        await graph.ainvoke({"messages": [HumanMessage(content="more")]}, config)
+        await first.aflush(config)
+
+        restarted = _build_graph(FirestoreCheckpointer(db, flush_delay=60))
+        state = await restarted.aget_state(config)
+
+        assert [m.content for m in state.values["messages"]] == [
+            "hi", "looking it up", "answer 2", "more", "looking it up", "answer 5"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_removed_messages_rebase_segments(self, db, config):
+        checkpointer = FirestoreCheckpointer(db, flush_delay=60)
+        graph = _build_graph(checkpointer)
+        await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await checkpointer.aflush(config)
+
+        state = await graph.aget_state(config)
+        first_id = state.values["messages"][0].id
+        await graph.aupdate_state(config, {"messages": [RemoveMessage(id=first_id)]})
+        await checkpointer.aflush(config)
+
+        segments = db.segments("conv-1")
+        assert [segment_id[:8] for segment_id in segments] == ["00000001"]
+        restored = await FirestoreCheckpointer(db).aget_tuple(config)
+        assert [m.content for m in restored.checkpoint["channel_values"]["messages"]] == [
+            "looking it up", "answer 2"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_evicted_dirty_thread_is_persisted(self, db):
+        checkpointer = FirestoreCheckpointer(db, max_threads=1, flush_delay=60)
+        graph = _build_graph(checkpointer)
+
+        await graph.ainvoke({"messages": [HumanMessage(content="a")]}, {"configurable": {"thread_id": "t1"}})
+        await graph.ainvoke({"messages": [HumanMessage(content="b")]}, {"configurable": {"thread_id": "t2"}})
+        await checkpointer.aflush()
+
+        assert list(checkpointer._hot) == [("t2", "")]
+        assert "agent_checkpoints/t1" in db.docs
+        assert "agent_checkpoints/t2" in db.docs
+
+    @pytest.mark.asyncio
+    async def test_idle_thread_is_flushed_by_timer(self, db, config):
+        checkpointer = FirestoreCheckpointer(db, flush_delay=0.01, max_flush_delay=0.05)
+        graph = _build_graph(checkpointer)
+
+        await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await asyncio.sleep(0.2)
+
+        assert len(db.commits) == 1
+        assert "agent_checkpoints/conv-1" in db.docs
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_retried(self, db, config):
+        checkpointer = FirestoreCheckpointer(db, flush_delay=0.01, max_flush_delay=0.05)
+        graph = _build_graph(checkpointer)
+        db.fail_commits = 2
+
+        await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await asyncio.sleep(0.3)
+
+        assert len(db.commits) == 1
+        assert not checkpointer._hot[("conv-1", "")].dirty
+
+
+class TestMultiInstanceCheckpointer:
+    """Instances sharing a thread must not overwrite each other's checkpoints"""
+
+    @pytest.mark.asyncio
+    async def test_stale_hot_tier_is_reloaded(self, db, config):
+        first, second = FirestoreCheckpointer(db, flush_delay=60), FirestoreCheckpointer(db, flush_delay=60)
+        await _build_graph(first).ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await first.aflush(config)
+        await _build_graph(second).ainvoke({"messages": [HumanMessage(content="more")]}, config)
+        await second.aflush(config)
+
+        state = await _build_graph(first).aget_state(config)
+
+        assert [m.content for m in state.values["messages"]] == [
+            "hi", "looking it up", "answer 2", "more", "looking it up", "answer 5"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_losing_commit_is_discarded(self, db, config):
+        first, second = FirestoreCheckpointer(db, flush_delay=60), FirestoreCheckpointer(db, flush_delay=60)
+        await _build_graph(first).ainvoke({"messages": [HumanMessage(content="hi")]}, config)
+        await first.aflush(config)
+        await second.aget_tuple(config)
+
+        await _build_graph(first).ainvoke({"messages": [HumanMessage(content="from first")]}, config)
+        await _build_graph(second).ainvoke({"messages": [HumanMessage(content="from second")]}, config)
+        await second.aflush(config)
+        await first.aflush(config)
+
+        assert ("conv-1", "") not in first._hot
+        restored = await FirestoreCheckpointer(db).aget_tuple(config)
+        contents = [m.content for m in restored.checkpoint["channel_values"]["messages"]]
+        assert "from second" in contents
+        assert "from first" not in contents
@@ -0,0 +1,68 @@
+"""
+Tests for the shared Aho-Corasick keyword matcher and its call sites
+"""
+import pytest
+
+from src.ai_agent.common.pattern_matcher import PatternMatcher, get_matcher
+from src.ai_agent.marketing.intent_classifier import classify_intent, get_intents, is_exit_signal
+
+
+class TestPatternMatcher:
+    """Tests for the automaton itself"""
+
+    def test_finds_overlapping_patterns_in_one_pass(self):
+        matcher = PatternMatcher({"a": ["he", "she", "hers"], "b": ["his"]})
+
+        hits = [(m.pattern, m.start, m.end) for m in matcher.find_all("ushers")]
+
+        assert hits == [("she", 1, 4), ("he", 2, 4), ("hers", 2, 6)]
+
+    def test_word_boundaries(self):
+        matcher = PatternMatcher({"greeting": ["hi"], "pricing": ["price"]})
+
+        hits = {m.pattern: m for m in matcher.find_all("HIPAA prices, hi!")}
+
+        assert not matcher.search("HIPAA", whole_word=True)
+        assert hits["hi"].whole_word
+        assert hits["price"].word_start and not hits["price"].word_end
+
+    def test_shared_pattern_reports_all_labels(self):
+        matcher = PatternMatcher({"roi": ["value"], "pricing": ["value", "cost"]})
+
+        assert matcher.labels("what value do I get") == {"roi", "pricing"}
+
+    def test_patterns_with_punctuation_edges(self):
+        matcher = PatternMatcher({"repr": ["AIMessageChunk("]})
+
+        assert matcher.search("AIMessageChunk(content='x')").word_start
+        assert not matcher.search("MyAIMessageChunk(").word_start
+
+    def test_get_matcher_reuses_compiled_automaton(self):
+        groups = {"forbidden": ["delve", "tapestry"]}
+
+        assert get_matcher(groups) is get_matcher({"forbidden": ["delve", "tapestry"]})
+        assert get_matcher(groups) is not get_matcher({"forbidden": ["delve"]})
+
+
+class TestIntentClassification:
+    """Intent call sites backed by the shared matcher"""
+
+    def test_greeting_requires_whole_word(self):
+        assert classify_intent("hi")[0] == "greeting"
+        assert classify_intent("Is it HIPAA compliant?")[0] == "technical"
+
+    def test_multi_intent_query(self):
+        intents = [name for name, _ in get_intents("What services do you offer and how much does it cost?")]
+
+        assert intents[:2] == ["pricing", "services"]
+
+    @pytest.mark.parametrize("query,expected", [
+        ("cheers mate", True),
+        ("thanks, got it", True),
+        ("That helps, legend!", True),
+        ("tell me about your data platform", False),
+        ("what services do you offer", False),
+        ("not yet, thanks", False),
+    ])
+    def test_exit_signal(self, query, expected):
+        assert is_exit_signal(query) is expected
@@ -0,0 +1,79 @@
+"""
+Tests for prefix-cache-friendly prompt assembly
+"""
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src.ai_agent.marketing.prompts.marketing_prompts import (
+    PRICING_POLICY,
+    PrefixStabilityTracker,
+    build_prompt_messages,
+    get_prefix_tracker,
+    get_system_prompt,
+    leading_prefix_fingerprint,
+)
+
+
+class TestPromptAssembly:
+    """The static prefix must be byte-identical; per-request content goes last"""
+
+    def test_prefix_is_identical_across_requests(self):
+        first = build_prompt_messages([HumanMessage(content="How much does it cost?")])
+        second = build_prompt_messages([
+            HumanMessage(content="hi"),
+            AIMessage(content="Hello!"),
+            HumanMessage(content="Tell me about your prompt library"),
+        ])
+
+        assert isinstance(first[0], SystemMessage)
+        assert first[0].content == second[0].content == get_system_prompt()
+
+    def test_dynamic_policies_are_appended_last(self):
+        messages = [HumanMessage(content="What is the pricing?")]
+
+        assembled = build_prompt_messages(messages)
+
+        assert assembled[1:-1] == messages
+        assert isinstance(assembled[-1], SystemMessage)
+        assert assembled[-1].content == PRICING_POLICY.strip()
+        assert PRICING_POLICY.strip() not in assembled[0].content
+
+    def test_no_suffix_without_matching_policy(self):
+        messages = [HumanMessage(content="hello there")]
+
+        assert build_prompt_messages(messages)[1:] == messages
+
+    def test_assembled_prefix_is_recorded(self):
+        tracker = get_prefix_tracker()
+        before = tracker.stats()["requests"]
+
+        assembled = build_prompt_messages([HumanMessage(content="hello there")])
+        build_prompt_messages([HumanMessage(content="What is the pricing?")])
+
+        stats = tracker.stats()
+        assert stats["requests"] == before + 2
+        assert stats["current_fingerprint"] == leading_prefix_fingerprint(assembled)
+
+
+class TestPrefixFingerprint:
+    """Tests for the prefix fingerprint metric"""
+
+    def test_covers_leading_system_messages_only(self):
+        base = build_prompt_messages([HumanMessage(content="hi")])
+        other_turn = build_prompt_messages([HumanMessage(content="bye"), AIMessage(content="Bye!")])
+        leaked = [SystemMessage(content=get_system_prompt()), SystemMessage(content="user 42 context"),
+                  HumanMessage(content="hi")]
+
+        assert leading_prefix_fingerprint(base) == leading_prefix_fingerprint(other_turn)
+        assert leading_prefix_fingerprint(base) != leading_prefix_fingerprint(leaked)
+
+    def test_reports_stability_and_distinct_prefixes(self):
+        tracker = PrefixStabilityTracker()
+        for fingerprint in ["a", "a", "a", "b", "b"]:
+            tracker.record(fingerprint)
+
+        stats = tracker.stats()
+
+        assert stats["requests"] == 5
+        assert stats["prefix_stability"] == 0.75
+        assert stats["distinct_prefixes"] == 2
+        assert stats["current_fingerprint"] == "b"
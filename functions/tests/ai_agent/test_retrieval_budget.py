@@ -0,0 +1,122 @@
+"""
+Tests for the adaptive retrieval budget controller
+"""
+import asyncio
+
+import pytest
+
+from src.ai_agent.marketing.retrieval_budget import RetrievalBudget
+
+
+@pytest.fixture
+def budget():
+    return RetrievalBudget(rerank_concurrency=1, rerank_queue_high=2, warmth_window=4)
+
+
+class TestRetrievalPlan:
+    """Plan selection from intent, warmth and load"""
+
+    @pytest.mark.parametrize("query", ["hi", "Hello!", "cheers mate", "thanks, got it", "ok"])
+    def test_small_talk_skips_retrieval(self, budget, query):
+        plan = budget.plan(query, 4)
+
+        assert plan.skip
+        assert plan.fetch_k == 0
+
+    @pytest.mark.parametrize("query", ["hi, what services do you offer?", "What is this?", "Do you know HubSpot?"])
+    def test_substantive_queries_are_not_skipped(self, budget, query):
+        assert not budget.plan(query, 4).skip
+
+    @pytest.mark.parametrize("query", [
+        "no I want to know how it connects with our CRM",
+        "ok so what happens after onboarding",
+        "sure, walk me through setup",
+        "thanks, but what about data residency in australia",
+    ])
+    def test_small_talk_prefix_does_not_skip_a_real_question(self, budget, query):
+        plan = budget.plan(query, 4)
+
+        assert not plan.skip
+        assert plan.fetch_k > 0
+
+    @pytest.mark.parametrize("query", ["hi there", "ok, thanks so much", "yes please"])
+    def test_small_talk_with_fillers(self, budget, query):
+        assert budget.plan(query, 4).skip
+
+    def test_idle_plan_is_full_rerank(self, budget):
+        plan = budget.plan("What services do you offer?", 4)
+
+        assert plan.reason == "full"
+        assert plan.rerank and plan.use_bm25
+        assert plan.fetch_k == 12
+
+    def test_simple_query_degrades_under_load(self, budget):
+        budget._rerank_pending = 2
+
+        plan = budget.plan("What services do you offer?", 4)
+
+        assert plan.reason == "degraded"
+        assert not plan.rerank
+        assert not plan.use_bm25
+        assert plan.fetch_k == 4
+
+    def test_keyword_query_keeps_bm25_under_load(self, budget):
+        budget._rerank_pending = 2
+
+        assert budget.plan("How much does it cost?", 4).use_bm25
+
+    def test_complex_query_reranks_fewer_candidates_under_load(self, budget):
+        budget._rerank_pending = 2
+        query = "Can you explain how your system integration works with our existing CRM and ticketing tools?"
+
+        plan = budget.plan(query, 7)
+
+        assert plan.rerank
+        assert plan.fetch_k == 14
+
+    def test_cold_reranker_is_only_loaded_for_complex_queries(self, budget):
+        simple = budget.plan("What services do you offer?", 4, reranker_loaded=False)
+        complex_ = budget.plan(
+            "Can you explain how your system integration works with our existing CRM tools?", 5,
+            reranker_loaded=False
+        )
+
+        assert simple.reason == "cold_reranker" and not simple.rerank
+        assert complex_.rerank
+
+    def test_cold_cache_degrades_earlier(self, budget):
+        budget._rerank_pending = 1
+        assert budget.plan("What services do you offer?", 4).reason == "full"
+
+        for _ in range(4):
+            budget.record_cache_lookup(False)
+
+        assert budget.cache_hit_ratio == 0.0
+        assert budget.plan("What services do you offer?", 4).reason == "degraded"
+
+    def test_hybrid_disabled_by_caller(self, budget):
+        assert not budget.plan("How much does it cost?", 4, use_hybrid=False).use_bm25
+
+
+class TestRerankSlots:
+    """Queue depth tracking around the bounded rerank slots"""
+
+    @pytest.mark.asyncio
+    async def test_waiting_reranks_count_towards_queue_depth(self, budget):
+        release = asyncio.Event()
+        depths = []
+
+        async def rerank():
+            async with budget.rerank_slot():
+                depths.append(budget.rerank_queue_depth)
+                await release.wait()
+
+        tasks = [asyncio.create_task(rerank()) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        assert budget.rerank_queue_depth == 3
+        assert len(depths) == 1  # one slot held, two waiting
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert budget.rerank_queue_depth == 0
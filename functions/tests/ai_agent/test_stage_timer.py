@@ -0,0 +1,54 @@
+"""
+Tests for per-request stage timing
+"""
+import asyncio
+
+import pytest
+
+from src.ai_agent.common.stage_timer import collect_stage_timings, stage
+
+
+class TestStageTimer:
+    """Timings are per request and only recorded while collecting"""
+
+    def test_no_collection_records_nothing(self):
+        with stage("retrieve"):
+            pass
+
+        with collect_stage_timings() as timings:
+            pass
+
+        assert timings == {}
+
+    def test_repeated_stages_accumulate(self):
+        with collect_stage_timings() as timings:
+            with stage("generate"):
+                pass
+            with stage("generate"):
+                pass
+            with stage("reflect"):
+                pass
+
+        assert set(timings) == {"generate", "reflect"}
+        assert timings["generate"] >= 0.0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_are_isolated(self):
+        async def request(stages):
+            with collect_stage_timings() as timings:
+                for name in stages:
+                    with stage(name):
+                        await asyncio.sleep(0)
+                # Child tasks and worker threads record into the parent's request
+                await asyncio.create_task(asyncio.to_thread(_rerank))
+            return timings
+
+        first, second = await asyncio.gather(request(["retrieve"]), request(["generate", "reflect"]))
+
+        assert set(first) == {"retrieve", "rerank"}
+        assert set(second) == {"generate", "reflect", "rerank"}
+
+
+def _rerank():
+    with stage("rerank"):
+        pass
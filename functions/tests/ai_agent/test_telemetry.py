@@ -0,0 +1,151 @@
+"""
+Tests for the off-request-path telemetry sink
+"""
+import contextvars
+import logging
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.ai_agent.common import telemetry
+from src.ai_agent.common.telemetry import TelemetrySink, FIRESTORE_BATCH_LIMIT
+from src.ai_agent.marketing.data_drift_monitor import DataDriftMonitor
+from src.ai_agent.marketing.rag_quality_metrics import RAGQualityMetrics
+
+
+@pytest.fixture
+def sink():
+    # Large interval so the worker only runs when a test flushes explicitly
+    sink = TelemetrySink(max_queue=1000, batch_size=1000, flush_interval=60)
+    yield sink
+    sink.close()
+
+
+class TestTelemetrySink:
+    """Tests for queueing, batching and backpressure"""
+
+    def test_documents_are_written_in_one_batch(self, sink):
+        db = MagicMock()
+        for i in range(5):
+            assert sink.write(db, "retrieval_quality", {"n": i}, doc_id=f"doc-{i}")
+
+        db.batch.assert_not_called()
+        assert sink.flush() == 5
+
+        db.batch.assert_called_once()
+        assert db.batch.return_value.set.call_count == 5
+        db.batch.return_value.commit.assert_called_once()
+        assert sink.stats["written"] == 5
+
+    def test_batches_respect_firestore_limit(self):
+        sink = TelemetrySink(max_queue=2000, batch_size=2000, flush_interval=60)
+        db = MagicMock()
+        for i in range(FIRESTORE_BATCH_LIMIT + 1):
+            sink.write(db, "query_embeddings", {"n": i})
+
+        sink.flush()
+        sink.close()
+
+        assert db.batch.return_value.commit.call_count == 2
+
+    def test_full_queue_drops_events(self):
+        sink = TelemetrySink(max_queue=2, batch_size=100, flush_interval=60, pressure_watermark=1.0)
+        db = MagicMock()
+
+        results = [sink.write(db, "c", {"n": i}) for i in range(3)]
+        sink.close()
+
+        assert results == [True, True, False]
+        assert sink.stats["dropped"] == 1
+
+    def test_pressure_samples_non_priority_events(self):
+        sink = TelemetrySink(
+            max_queue=10, batch_size=100, flush_interval=60,
+            pressure_watermark=0.5, pressure_sample_rate=0.0
+        )
+        db = MagicMock()
+        for i in range(5):
+            sink.write(db, "c", {"n": i})
+
+        assert not sink.write(db, "c", {"n": 5})
+        assert sink.write(db, "c", {"n": 6}, priority=True)
+        sink.close()
+        assert sink.stats["sampled_out"] == 1
+
+    def test_prepare_runs_on_flush(self, sink):
+        db = MagicMock()
+        prepare = MagicMock(side_effect=lambda data: {**data, "redacted": True})
+
+        sink.write(db, "query_embeddings", {"query_text": "x"}, prepare=prepare)
+        prepare.assert_not_called()
+
+        sink.flush()
+        prepare.assert_called_once()
+        assert db.batch.return_value.set.call_args.args[1]["redacted"] is True
+
+    def test_logs_are_emitted_on_flush(self, sink):
+        log = MagicMock(spec=logging.Logger)
+        log.isEnabledFor.return_value = True
+
+        sink.log(log, logging.INFO, {"monitoring": {"event": "request_start"}})
+        log.log.assert_not_called()
+
+        sink.flush()
+        log.log.assert_called_once_with(logging.INFO, {"monitoring": {"event": "request_start"}})
+
+    def test_logs_keep_the_request_context(self, sink):
+        request_id = contextvars.ContextVar("request_id", default=None)
+        seen = []
+        log = MagicMock(spec=logging.Logger)
+        log.isEnabledFor.return_value = True
+        log.log.side_effect = lambda level, payload: seen.append(request_id.get())
+
+        token = request_id.set("req-123")
+        sink.log(log, logging.INFO, {"monitoring": {}})
+        request_id.reset(token)
+
+        worker = threading.Thread(target=sink.flush)
+        worker.start()
+        worker.join()
+        assert seen == ["req-123"]
+
+    def test_commit_errors_are_counted(self, sink):
+        db = MagicMock()
+        db.batch.return_value.commit.side_effect = Exception("unavailable")
+        sink.write(db, "c", {"n": 1})
+
+        sink.flush()
+        assert sink.stats["errors"] == 1
+        assert sink.depth() == 0
+
+
+class TestDriftTrackingIsDeferred:
+    """DataDriftMonitor.track_query must not touch Firestore on the request path"""
+
+    @pytest.mark.asyncio
+    async def test_track_query_only_enqueues(self, sink):
+        db = MagicMock()
+        monitor = DataDriftMonitor(db=db, sink=sink)
+
+        with patch("src.ai_agent.marketing.data_drift_monitor._redact_query_doc", side_effect=lambda d: d) as redact:
+            await monitor.track_query("How much does Enterprise pricing cost?", "conv-1")
+            db.batch.assert_not_called()
+            redact.assert_not_called()
+
+            sink.flush()
+            redact.assert_called_once()
+
+        db.collection.assert_called_with("query_embeddings")
+        assert db.batch.return_value.set.call_args.args[1]["conversation_id"] == "conv-1"
+
+
+def test_default_sink_follows_reset_after_fork(monkeypatch):
+    monkeypatch.setattr(telemetry, "_telemetry_sink", None)
+    metrics = RAGQualityMetrics(db=MagicMock())
+    parent_sink = metrics.sink
+
+    telemetry.reset_telemetry_sink_after_fork()
+
+    assert metrics.sink is not parent_sink
+    assert metrics.sink is telemetry.get_telemetry_sink()
+    assert DataDriftMonitor().sink is metrics.sink
@@ -0,0 +1,183 @@
+"""
+Tests for the shared response cache middleware
+"""
+import asyncio
+import hashlib
+import json
+
+import pytest
+
+from src.api.middleware import CacheMiddleware, _CachedResponse
+
+
+class FakeAsyncRedis:
+    """The few redis.asyncio commands CacheMiddleware uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class CountingApp:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        body = json.dumps({"status": "healthy", "call": self.calls}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+            (b"x-request-id", b"req-%d" % self.calls),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _scope(path="/health/detailed", query=b"", headers=()):
+    return {"type": "http", "method": "GET", "path": path, "query_string": query,
+            "headers": [(b"accept-encoding", b"gzip")] + list(headers)}
+
+
+async def _call(middleware, scope=None):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    await middleware(scope or _scope(), receive, send)
+    headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    return messages[0]["status"], headers, messages[1].get("body", b"")
+
+
+@pytest.fixture
+def redis_client():
+    return FakeAsyncRedis()
+
+
+class TestCacheKey:
+    """Keys are stable digests that separate callers and encodings"""
+
+    def test_key_is_stable_and_order_insensitive(self):
+        middleware = CacheMiddleware(CountingApp())
+
+        key = middleware._generate_cache_key(_scope(query=b"a=1&b=2"))
+
+        assert key == middleware._generate_cache_key(_scope(query=b"b=2&a=1"))
+        # hash() is salted per process; the digest must not be
+        assert key == "cache:" + hashlib.sha256(b"/health/detailed\nanonymous\na=1&b=2\ngzip").hexdigest()
+
+    def test_key_separates_credentials_and_encodings(self):
+        middleware = CacheMiddleware(CountingApp())
+        keys = {
+            middleware._generate_cache_key(_scope()),
+            middleware._generate_cache_key(_scope(headers=[(b"authorization", b"Bearer a")])),
+            middleware._generate_cache_key(_scope(headers=[(b"authorization", b"Bearer b")])),
+            middleware._generate_cache_key({**_scope(), "headers": [(b"accept-encoding", b"identity")]}),
+        }
+
+        assert len(keys) == 4
+
+
+class TestCacheMiddleware:
+    """Binary storage, ETag revalidation, single-flight and stale-while-revalidate"""
+
+    @pytest.mark.asyncio
+    async def test_miss_then_hit_from_binary_entry(self, redis_client):
+        app = CountingApp()
+        middleware = CacheMiddleware(app, redis_client=redis_client)
+
+        status, miss_headers, miss_body = await _call(middleware)
+        _, hit_headers, hit_body = await _call(middleware)
+
+        assert app.calls == 1
+        assert (status, miss_headers["x-cache"], hit_headers["x-cache"]) == (200, "MISS", "HIT")
+        assert hit_body == miss_body
+        assert hit_headers["etag"] == miss_headers["etag"]
+        assert "x-request-id" not in hit_headers
+        (stored,) = redis_client.data.values()
+        assert isinstance(stored, bytes) and stored.endswith(miss_body)
+
+    @pytest.mark.asyncio
+    async def test_if_none_match_returns_304(self, redis_client):
+        middleware = CacheMiddleware(CountingApp(), redis_client=redis_client)
+        _, headers, _ = await _call(middleware)
+
+        status, not_modified, body = await _call(
+            middleware, _scope(headers=[(b"if-none-match", f'W/{headers["etag"]}'.encode())])
+        )
+
+        assert (status, body) == (304, b"")
+        assert not_modified["etag"] == headers["etag"]
+        assert "content-length" not in not_modified
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_call(self, redis_client):
+        app = CountingApp(delay=0.02)
+        middleware = CacheMiddleware(app, redis_client=redis_client)
+
+        results = await asyncio.gather(*[_call(middleware) for _ in range(20)])
+
+        assert app.calls == 1
+        assert len({body for _, _, body in results}) == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_entry_served_while_one_refresh_runs(self, redis_client):
+        app = CountingApp(delay=0.01)
+        middleware = CacheMiddleware(app, redis_client=redis_client, default_ttl=60, stale_ttl=60)
+        await _call(middleware)
+        key = next(iter(redis_client.data))
+        stale = _CachedResponse.from_bytes(redis_client.data[key])
+        stale.stored_at -= 90
+        redis_client.data[key] = stale.to_bytes()
+
+        results = await asyncio.gather(*[_call(middleware) for _ in range(10)])
+        await asyncio.sleep(0.05)
+        _, headers, body = await _call(middleware)
+
+        assert {headers["x-cache"] for _, headers, _ in results} == {"STALE"}
+        assert app.calls == 2
+        assert (headers["x-cache"], json.loads(body)["call"]) == ("HIT", 2)
+
+    @pytest.mark.asyncio
+    async def test_peer_worker_lock_waits_for_its_entry(self, redis_client):
+        app = CountingApp()
+        middleware = CacheMiddleware(app, redis_client=redis_client, lock_wait=1.0)
+        key = middleware._generate_cache_key(_scope())
+        redis_client.data[f"{key}:lock"] = b"1"
+
+        async def peer_finishes():
+            await asyncio.sleep(0.1)
+            redis_client.data[key] = _CachedResponse(200, [], b'{"from": "peer"}').to_bytes()
+
+        (_, _, body), _ = await asyncio.gather(_call(middleware), peer_finishes())
+
+        assert body == b'{"from": "peer"}'
+        assert app.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_redis_errors_fall_through_to_app(self):
+        class BrokenRedis:
+            async def get(self, *args, **kwargs):
+                raise ConnectionError("down")
+            set = delete = get
+
+        app = CountingApp()
+        status, _, _ = await _call(CacheMiddleware(app, redis_client=BrokenRedis()))
+
+        assert status == 200
+        assert app.calls == 1
@@ -0,0 +1,103 @@
+"""
+Tests for the pure-ASGI response compression middleware
+"""
+import gzip
+import zlib
+
+import pytest
+
+from src.api.middleware import BROTLI_AVAILABLE, CompressionMiddleware
+
+JSON_BODY = b'{"items": [' + b",".join(b'{"id": %d, "name": "prompt"}' % i for i in range(200)) + b"]}"
+
+
+def _app(content_type, chunks):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode())]
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+async def _call(middleware, accept_encoding="gzip, deflate"):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    await middleware(scope, receive, send)
+    headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    return headers, [m.get("body", b"") for m in messages[1:]]
+
+
+class TestCompressionMiddleware:
+    """One-shot and streaming compression, negotiation and skips"""
+
+    @pytest.mark.asyncio
+    async def test_compresses_single_body_with_exact_length(self):
+        middleware = CompressionMiddleware(_app("application/json", [JSON_BODY]), thread_threshold=0)
+
+        headers, bodies = await _call(middleware)
+
+        assert headers["content-encoding"] == "gzip"
+        assert headers["vary"] == "Accept-Encoding"
+        assert headers["content-length"] == str(len(bodies[0]))
+        assert gzip.decompress(bodies[0]) == JSON_BODY
+
+    @pytest.mark.asyncio
+    async def test_small_and_non_text_bodies_untouched(self):
+        small, _ = await _call(CompressionMiddleware(_app("application/json", [b'{"ok": true}'])))
+        binary, _ = await _call(CompressionMiddleware(_app("image/png", [JSON_BODY])))
+        refused, _ = await _call(CompressionMiddleware(_app("application/json", [JSON_BODY])), "gzip;q=0")
+
+        assert "content-encoding" not in small
+        assert "content-encoding" not in binary
+        assert "content-encoding" not in refused
+
+    @pytest.mark.asyncio
+    async def test_event_streams_skipped_by_default(self):
+        events = [b"data: token %d\n\n" % i for i in range(5)]
+
+        headers, bodies = await _call(CompressionMiddleware(_app("text/event-stream", events)))
+
+        assert "content-encoding" not in headers
+        assert bodies == events
+
+    @pytest.mark.asyncio
+    async def test_streamed_chunks_are_decodable_as_they_arrive(self):
+        events = [b"data: token %d\n\n" % i for i in range(5)]
+        middleware = CompressionMiddleware(_app("text/event-stream", events), compress_event_streams=True)
+
+        headers, bodies = await _call(middleware)
+
+        assert headers["content-encoding"] == "gzip"
+        assert "content-length" not in headers
+        decoder = zlib.decompressobj(31)
+        # Every event is fully decodable from the bytes sent so far
+        assert [decoder.decompress(body) for body in bodies] == events
+        assert decoder.eof
+
+    @pytest.mark.skipif(not BROTLI_AVAILABLE, reason="brotli not installed")
+    @pytest.mark.asyncio
+    async def test_prefers_brotli_when_accepted(self):
+        import brotli
+
+        headers, bodies = await _call(CompressionMiddleware(_app("application/json", [JSON_BODY])), "gzip, br")
+
+        assert headers["content-encoding"] == "br"
+        assert brotli.decompress(bodies[0]) == JSON_BODY
+
+    def test_negotiation_honours_q_values(self):
+        negotiate = CompressionMiddleware._negotiate_encoding
+
+        assert negotiate("gzip, deflate") == "gzip"
+        assert negotiate("identity") is None
+        assert negotiate("*;q=0.5") in ("gzip", "br")
+        assert negotiate("br;q=0, gzip;q=0") is None
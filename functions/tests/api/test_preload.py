@@ -0,0 +1,134 @@
+"""
+Tests for fork-after-load preloading and the shared/private memory report
+"""
+import os
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.ai_agent.common import telemetry
+from src.api.preload import (
+    MASTER_PID_ENV, child_pids, memory_report, preload_shared_state, read_memory_usage, reset_worker_state
+)
+from src.rag.answer_index import AnswerIndex
+
+SMAPS_AVAILABLE = Path("/proc/self/smaps_rollup").exists() and hasattr(os, "fork")
+
+
+def _write_smaps(proc_root, pid, rss, pss, shared, private, children=()):
+    task_dir = proc_root / str(pid) / "task" / str(pid)
+    task_dir.mkdir(parents=True)
+    (proc_root / str(pid) / "smaps_rollup").write_text(
+        "00400000-7ffd0000 ---p 00000000 00:00 0  [rollup]\n"
+        f"Rss:            {rss} kB\n"
+        f"Pss:            {pss} kB\n"
+        f"Shared_Clean:   {shared} kB\n"
+        "Shared_Dirty:        0 kB\n"
+        f"Private_Clean:  {private // 2} kB\n"
+        f"Private_Dirty:  {private - private // 2} kB\n"
+        "Swap:                0 kB\n"
+    )
+    (task_dir / "children").write_text(" ".join(str(c) for c in children))
+
+
+class TestMemoryReport:
+    """smaps_rollup parsing and master/worker aggregation"""
+
+    def test_splits_shared_and_private(self, tmp_path):
+        _write_smaps(tmp_path, 10, rss=900, pss=500, shared=800, private=100)
+
+        assert read_memory_usage(10, tmp_path) == {
+            "rss_kb": 900, "pss_kb": 500, "shared_kb": 800, "private_kb": 100
+        }
+        assert read_memory_usage(11, tmp_path) is None
+
+    def test_report_covers_master_and_workers(self, tmp_path):
+        _write_smaps(tmp_path, 1, rss=1000, pss=400, shared=900, private=100, children=(2, 3))
+        _write_smaps(tmp_path, 2, rss=1100, pss=500, shared=900, private=200)
+        _write_smaps(tmp_path, 3, rss=1050, pss=450, shared=900, private=150)
+
+        report = memory_report(master_pid=1, proc_root=tmp_path)
+
+        assert child_pids(1, tmp_path) == [2, 3]
+        assert report["processes"]["1"]["role"] == "master"
+        assert report["total_rss_kb"] == 3150
+        assert report["total_pss_kb"] == 1350
+        assert report["shared_savings_kb"] == 1800
+        assert report["worker_shared_kb"] == 1800
+        assert report["worker_private_kb"] == 350
+
+    def test_unavailable_without_procfs(self, tmp_path):
+        report = memory_report(master_pid=1, proc_root=tmp_path)
+
+        assert report["available"] is False
+        assert report["processes"] == {}
+
+    @pytest.mark.skipif(not SMAPS_AVAILABLE, reason="requires Linux procfs and fork")
+    def test_state_loaded_before_fork_is_shared_in_child(self):
+        preloaded = os.urandom(32 * 1024 * 1024)  # noqa: F841 - kept alive across the fork
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            usage = read_memory_usage()
+            os.write(write_fd, str(usage["shared_kb"] if usage else -1).encode())
+            os._exit(0)
+
+        os.close(write_fd)
+        shared_kb = int(os.read(read_fd, 64))
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        assert shared_kb >= 32 * 1024
+
+
+class TestPreloadSharedState:
+    """What the master loads before fork"""
+
+    def test_answer_index_loads_without_the_response_cache(self):
+        answer_index_module = MagicMock(ANSWER_INDEX_ENABLED=True, EMBEDDING_MODEL_NAME="model-x")
+        answer_index_module.compute_kb_content_hash.return_value = "kb"
+        answer_index_module.answer_index.load_latest.return_value = True
+        modules = {
+            "rag": MagicMock(),
+            "rag.answer_index": answer_index_module,
+            # Importing the cache manager would build its Firestore client in the master
+            "rag.cache_manager": None,
+            "ai_agent": MagicMock(),
+            "ai_agent.marketing": MagicMock(),
+            "ai_agent.marketing.marketing_retriever": MagicMock(),
+            "ai_agent.marketing.prompts": MagicMock(),
+            "ai_agent.marketing.prompts.marketing_prompts": MagicMock(),
+        }
+
+        with patch.dict(sys.modules, modules), patch.dict(os.environ), patch("src.api.preload.gc.freeze"):
+            results = preload_shared_state()
+            assert os.environ[MASTER_PID_ENV] == str(os.getpid())
+
+        assert results["answer_index"] is True
+        answer_index_module.answer_index.load_latest.assert_called_once_with(kb_hash="kb", embedding_model="model-x")
+
+
+class TestResetWorkerState:
+    """Per-worker mutable state is rebuilt after fork; loaded data is kept"""
+
+    def test_answer_index_keeps_entries_and_resets_lock(self):
+        index = AnswerIndex()
+        index._entries = [{"query": "q", "response": "a"}]
+        index.stats["misses"] = 3
+        lock = index._lock
+
+        index.reset_after_fork()
+
+        assert index.loaded
+        assert index._lock is not lock
+        assert index.stats["misses"] == 0
+
+    def test_telemetry_sink_is_recreated(self):
+        sink = telemetry.get_telemetry_sink()
+
+        reset_worker_state()
+
+        assert telemetry.get_telemetry_sink() is not sink
@@ -0,0 +1,112 @@
+"""
+Unit tests for the sliding-window API rate limiter
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.api.rate_limiter import (
+    RateLimiter, RateLimitBackend, InMemoryRateLimitBackend, FirestoreRateLimitBackend
+)
+
+
+@pytest.fixture
+def backend():
+    return InMemoryRateLimitBackend()
+
+
+class TestSlidingWindowRateLimiter:
+    """Tests for RateLimiter with the in-memory backend"""
+
+    @pytest.mark.asyncio
+    async def test_allows_up_to_limit(self, backend):
+        limiter = RateLimiter(MagicMock(), limit=3, window_hours=1, backend=backend)
+
+        with patch("src.api.rate_limiter.time.time", return_value=3600 * 10):
+            results = [await limiter.check_rate_limit("user-1") for _ in range(4)]
+
+        assert [allowed for allowed, _ in results] == [True, True, True, False]
+        info = results[-1][1]
+        assert info.limit == 3
+        assert info.remaining == 0
+        assert info.retry_after >= 60
+
+    @pytest.mark.asyncio
+    async def test_previous_window_is_weighted(self, backend):
+        limiter = RateLimiter(MagicMock(), limit=10, window_hours=1, backend=backend)
+
+        # Use the full budget at the end of one window
+        with patch("src.api.rate_limiter.time.time", return_value=3600 * 10 + 3599):
+            for _ in range(10):
+                assert (await limiter.check_rate_limit("user-1"))[0]
+
+        # Halfway through the next window half of it still counts
+        with patch("src.api.rate_limiter.time.time", return_value=3600 * 11 + 1800):
+            results = [(await limiter.check_rate_limit("user-1"))[0] for _ in range(6)]
+
+        assert results == [True, True, True, True, True, False]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_do_not_over_admit(self, backend):
+        limiter = RateLimiter(MagicMock(), limit=20, window_hours=1, backend=backend)
+
+        with patch("src.api.rate_limiter.time.time", return_value=3600 * 10):
+            results = await asyncio.gather(
+                *[limiter.check_rate_limit("user-1") for _ in range(50)]
+            )
+
+        assert sum(1 for allowed, _ in results if allowed) == 20
+
+    @pytest.mark.asyncio
+    async def test_users_are_isolated(self, backend):
+        limiter = RateLimiter(MagicMock(), limit=1, window_hours=1, backend=backend)
+
+        assert (await limiter.check_rate_limit("user-1"))[0]
+        assert (await limiter.check_rate_limit("user-2"))[0]
+        assert not (await limiter.check_rate_limit("user-1"))[0]
+
+    @pytest.mark.asyncio
+    async def test_backend_error_fails_open(self):
+        failing = MagicMock()
+        failing.increment.side_effect = Exception("backend down")
+        limiter = RateLimiter(MagicMock(), limit=1, window_hours=1, backend=failing)
+
+        assert await limiter.check_rate_limit("user-1") == (True, None)
+
+
+class TestFirestoreRateLimitBackend:
+    """Tests for the sharded Firestore counter backend"""
+
+    @pytest.mark.asyncio
+    async def test_increments_one_shard_and_sums_both_windows(self):
+        db = MagicMock()
+        shards = [
+            MagicMock(exists=True, to_dict=MagicMock(return_value={"windowId": 42, "count": 3})),
+            MagicMock(exists=False),
+            MagicMock(exists=True, to_dict=MagicMock(return_value={"windowId": 42, "count": 2})),
+            MagicMock(exists=True, to_dict=MagicMock(return_value={"windowId": 41, "count": 7})),
+        ]
+        db.get_all.return_value = shards
+
+        with patch("src.api.rate_limiter.firestore.Increment", side_effect=lambda n: ("increment", n)):
+            result = await FirestoreRateLimitBackend(db, shards=2).increment("user-1", 42, 3600)
+
+        assert result == (5, 7)
+        ref = db.collection.return_value.document
+        written = ref.return_value.set.call_args
+        assert written.kwargs == {"merge": True}
+        assert written.args[0]["count"] == ("increment", 1)
+        assert written.args[0]["windowId"] == 42
+        assert ref.call_args_list[0].args[0] in {"user-1__42__0", "user-1__42__1"}
+        assert [c.args[0] for c in ref.call_args_list[1:]] == [
+            "user-1__42__0", "user-1__42__1", "user-1__41__0", "user-1__41__1"
+        ]
+        db.transaction.assert_not_called()
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoIncrement(RateLimitBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoIncrement()
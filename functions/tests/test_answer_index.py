@@ -0,0 +1,113 @@
+"""
+Tests for the precomputed answer index
+"""
+import pytest
+
+from src.rag.answer_index import (
+    AnswerIndex,
+    build_snapshot,
+    compute_kb_content_hash,
+    latest_snapshot_path,
+    merge_queries,
+    write_snapshot,
+)
+from src.rag.cache_manager import IntelligentResponseCache
+
+GOOD_ANSWER = (
+    "We offer intelligent application development and system integration "
+    "services for Australian businesses, with pricing tailored to each project."
+)
+VOCAB = ["pricing", "services", "integration", "cost"]
+
+
+def fake_embed(text):
+    """Bag-of-words embedding over a tiny vocabulary"""
+    lowered = text.lower()
+    return [float(word in lowered) for word in VOCAB]
+
+
+def _snapshot(kb_hash="kb1", version="20261018T000000Z"):
+    return {
+        "version": version,
+        "kb_hash": kb_hash,
+        "entries": [
+            {"query": "What services do you offer?", "response": GOOD_ANSWER,
+             "embedding": fake_embed("services")},
+            {"query": "How much does integration cost?", "response": "Integration is quoted per project.",
+             "embedding": fake_embed("integration cost")},
+        ],
+    }
+
+
+class TestAnswerIndex:
+    """Lookup and invalidation of the in-memory answer table"""
+
+    def test_exact_lookup_is_normalized(self):
+        index = AnswerIndex()
+        index.load_snapshot(_snapshot(), kb_hash="kb1")
+
+        hit = index.lookup("  what SERVICES do you   offer? ")
+
+        assert hit["response"] == GOOD_ANSWER
+        assert hit["similarity"] == 1.0
+        assert hit["index_version"] == "20261018T000000Z"
+
+    def test_semantic_lookup_respects_threshold(self):
+        index = AnswerIndex(similarity_threshold=0.9)
+        index.load_snapshot(_snapshot(), kb_hash="kb1")
+
+        assert index.lookup("integration cost please", embed=fake_embed)["query"] == "How much does integration cost?"
+        assert index.lookup("pricing", embed=fake_embed) is None
+        assert index.get_stats()["semantic_hits"] == 1
+
+    def test_stale_snapshot_is_rejected(self):
+        index = AnswerIndex()
+
+        assert not index.load_snapshot(_snapshot(kb_hash="old"), kb_hash="new")
+        assert not index.loaded
+        assert index.lookup("What services do you offer?") is None
+
+    def test_snapshot_from_another_embedding_model_is_rejected(self):
+        index = AnswerIndex()
+
+        assert not index.load_snapshot(
+            {**_snapshot(), "embedding_model": "other-model"}, kb_hash="kb1", embedding_model="all-MiniLM-L6-v2"
+        )
+        assert not index.loaded
+        assert index.get_stats()["embedding_mismatches"] == 1
+        assert index.load_snapshot(
+            {**_snapshot(), "embedding_model": "all-MiniLM-L6-v2"}, kb_hash="kb1", embedding_model="all-MiniLM-L6-v2"
+        )
+
+    def test_kb_hash_is_order_independent(self):
+        assert compute_kb_content_hash({"a": 1, "b": 2}) == compute_kb_content_hash({"b": 2, "a": 1})
+        assert compute_kb_content_hash({"a": 1}) != compute_kb_content_hash({"a": 2})
+
+
+class TestAnswerIndexBuild:
+    """Offline build uses the response cache gates"""
+
+    @pytest.mark.asyncio
+    async def test_build_gates_answers_and_round_trips(self, tmp_path):
+        answers = {
+            "What services do you offer?": GOOD_ANSWER,
+            "Is this right for us?": "Based on your team size, the Smart Business Assistant is a strong fit.",
+            "Huh?": "I don't know.",
+        }
+
+        async def answer(query):
+            return answers[query]
+
+        queries = merge_queries(["What services do you offer?", "what services do you offer?"], answers)
+        snapshot = await build_snapshot(queries, answer, IntelligentResponseCache(), kb_hash="kb1", embed=fake_embed)
+        write_snapshot({**snapshot, "version": "1"}, tmp_path)
+        path = write_snapshot({**snapshot, "version": "2"}, tmp_path)
+
+        assert [e["query"] for e in snapshot["entries"]] == ["What services do you offer?"]
+        assert {r["reason"] for r in snapshot["rejected"]} == {"personalized", "quality"}
+        assert latest_snapshot_path(tmp_path) == path
+
+        index = AnswerIndex()
+        assert index.load_latest(tmp_path, kb_hash="kb1")
+        assert index.version == "2"
+        assert index.lookup("What services do you offer?")["response"] == GOOD_ANSWER
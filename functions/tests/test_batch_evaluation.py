@@ -0,0 +1,136 @@
+"""
+Tests for the concurrent batch evaluation runner
+"""
+import asyncio
+import importlib
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from evaluation.batch_runner import (
+    BatchEvaluationRunner,
+    OfflineKBSearch,
+    PromptCache,
+    ReplayChatModel,
+    mock_reply,
+    prompt_hash,
+)
+from src.ai_agent.common.stage_timer import stage
+
+try:
+    importlib.import_module("src.ai_agent.marketing.marketing_retriever")
+    RETRIEVER_AVAILABLE = True
+except ImportError:
+    RETRIEVER_AVAILABLE = False
+
+TOOL_OUTPUT = (
+    "[1] Smart Business Assistant: Our assistant answers customer questions around the clock. "
+    "It connects to your existing CRM and ticketing tools.\n"
+)
+
+
+class TestReplayChatModel:
+    """Deterministic mock replies and the on-disk prompt cache"""
+
+    def test_prompt_hash_tracks_prompt_model_and_tools(self):
+        messages = [SystemMessage(content="prefix"), HumanMessage(content="hi")]
+
+        assert prompt_hash(messages, "m") == prompt_hash(list(messages), "m")
+        assert prompt_hash(messages, "m") != prompt_hash(messages, "other")
+        assert prompt_hash(messages, "m") != prompt_hash(messages, "m", ["search_kb"])
+
+    def test_mock_calls_search_then_answers_from_tool_output(self):
+        question = [SystemMessage(content="prefix"), HumanMessage(content="What do you offer?"),
+                    SystemMessage(content="policy suffix")]
+
+        call = mock_reply(question, ["search_kb"], "abc123")
+        answer = mock_reply(
+            question + [call, ToolMessage(content=TOOL_OUTPUT, tool_call_id=call.tool_calls[0]["id"])],
+            ["search_kb"], "def456"
+        )
+
+        assert call.tool_calls[0]["args"] == {"query": "What do you offer?"}
+        assert answer.content.startswith("Our assistant answers customer questions around the clock.")
+        assert "You might also want to know:\n1." in answer.content
+
+    def test_mock_confirms_grounding_checks(self):
+        assert mock_reply([HumanMessage(content="Verify grounding. Is this ...")], [], "k").content == "Yes"
+
+    @pytest.mark.asyncio
+    async def test_replay_serves_recorded_responses(self, tmp_path):
+        messages = [HumanMessage(content="What do you offer?")]
+        cache = PromptCache(tmp_path)
+        cache.put(prompt_hash(messages, "granite"), AIMessage(content="Recorded answer"))
+
+        replay = ReplayChatModel(mode="replay", model_name="granite", prompt_cache=cache)
+
+        assert (await replay.ainvoke(messages)).content == "Recorded answer"
+        assert (await replay.ainvoke([HumanMessage(content="new")])).content  # miss falls back to mock
+        assert cache.stats == {"hits": 1, "misses": 1, "writes": 1}
+
+
+@pytest.mark.skipif(not RETRIEVER_AVAILABLE, reason="marketing retriever dependencies not available")
+class TestOfflineKBSearch:
+    """In-memory retrieval used for offline runs"""
+
+    @pytest.mark.asyncio
+    async def test_ranks_by_token_overlap_and_filters_category(self):
+        search = OfflineKBSearch([
+            {"id": "pricing", "title": "Pricing", "content": "Custom quotation for every project.",
+             "metadata": {"category": "engagement", "page": "pricing"}},
+            {"id": "assistant", "title": "Smart Assistant", "content": "Answers customer questions.\n\nCRM integration.",
+             "metadata": {"category": "offerings", "page": "assistant"}},
+        ])
+
+        results = await search.search("customer questions assistant", top_k=5)
+        filtered = await search.search("customer questions", top_k=5, category_filter="engagement")
+
+        assert [r.document_id for r in results] == ["assistant", "assistant"]
+        assert results[0].text == "Answers customer questions."
+        assert filtered == []
+
+
+class _FakeAgent:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def chat(self, message, context):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        with stage("retrieve"):
+            await asyncio.sleep(0.01)
+        with stage("generate"):
+            await asyncio.sleep(0)
+        self.in_flight -= 1
+        return {
+            "response": "We offer custom quotation pricing. You might also want to know: 1. More?",
+            "metadata": {"tools_used": ["get_pricing"]},
+        }
+
+
+class TestBatchEvaluationRunner:
+    """Concurrency, scoring and latency reporting"""
+
+    @pytest.mark.asyncio
+    async def test_runs_cases_concurrently_with_stage_latency(self, tmp_path):
+        dataset = tmp_path / "golden.json"
+        dataset.write_text(json.dumps([
+            {"id": f"pricing_{i}", "category": "pricing", "query": "How much?",
+             "expected_content": ["quotation"], "expected_tools": ["get_pricing"]}
+            for i in range(6)
+        ]))
+        agent = _FakeAgent()
+
+        runner = BatchEvaluationRunner(agent, dataset, concurrency=3)
+        aggregated = await runner.run()
+        runner.save_results(str(tmp_path / "results"))
+
+        assert agent.max_in_flight == 3
+        assert aggregated["summary"]["total_tests"] == 6
+        assert aggregated["metrics"]["avg_content_coverage"] == 1.0
+        assert aggregated["latency_ms"]["retrieve"]["count"] == 6
+        assert aggregated["latency_ms"]["total"]["p95"] >= aggregated["latency_ms"]["retrieve"]["p50"]
+        assert "generate" in runner.results[0]["latency_ms"]
+        assert (tmp_path / "results" / "latency_report.json").exists()
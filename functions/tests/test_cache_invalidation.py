@@ -11,13 +11,15 @@ from src.cache.cache_invalidation_service import (
     InvalidationReason,
     InvalidationEvent
 )
+from src.cache.firebase_cache import FirebaseCache
 from src.cache.ttl_config import DataType, CacheLayer
 
 
 @pytest.fixture
 def invalidation_service():
-    """Create cache invalidation service instance"""
-    return CacheInvalidationService()
+    """Create cache invalidation service instance (no Firebase connection)"""
+    with patch.object(FirebaseCache, "_initialize_firebase"):
+        return CacheInvalidationService()
 
 
 @pytest.mark.asyncio
@@ -241,3 +243,230 @@ def test_cache_stats_reporting(invalidation_service):
     assert stats['hits'] >= 0
     assert stats['misses'] >= 0
 
+
+
+class FakeRedisPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        self.redis.pipelines.append([name for name, _, _ in self.commands])
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeRedis:
+    """Just the redis.asyncio commands the tag index uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.pipelines = []
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(m.encode() for m in members)
+
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def unlink(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+def test_pattern_matching_checks_every_segment(invalidation_service):
+    """Test glob patterns with several wildcards"""
+    matches = invalidation_service._matches_pattern
+
+    assert matches("a:x:b:y:c", "a*b*c")
+    assert not matches("a:x:c", "a*b*c")
+    assert not matches("ab", "a*b*b")
+    assert matches("user:1.2:data", "user:1.2:*")
+    assert not matches("user:132:data", "user:1.2:*")
+
+
+@pytest.mark.asyncio
+async def test_tag_invalidation_in_memory(invalidation_service):
+    """Test tag invalidation removes exactly the tagged memory keys"""
+    layers = [CacheLayer.MEMORY]
+    await invalidation_service.set_with_ttl("prompt:abc", {"v": 1}, DataType.PROMPT_CONTENT, layers, tags=["prompt:abc"])
+    await invalidation_service.set_with_ttl("prompt:abc:metadata", {"v": 2}, DataType.PROMPT_CONTENT, layers,
+                                            tags=["prompt:abc", "user:123"])
+    await invalidation_service.set_with_ttl("prompt:abcd", {"v": 3}, DataType.PROMPT_CONTENT, layers, tags=["prompt:abcd"])
+
+    count = await invalidation_service.invalidate_tag("prompt:abc", DataType.PROMPT_CONTENT, layers=layers)
+
+    assert count == 2
+    assert invalidation_service.memory_cache.get("prompt:abc") is None
+    assert invalidation_service.memory_cache.get("prompt:abc:metadata") is None
+    assert invalidation_service.memory_cache.get("prompt:abcd") == {"v": 3}
+    assert "user:123" not in invalidation_service.tag_index
+    assert invalidation_service.invalidation_history[-1].key == "tag:prompt:abc"
+
+
+@pytest.mark.asyncio
+async def test_tag_invalidation_across_redis_and_firestore(invalidation_service):
+    """Test tag invalidation unlinks Redis members and deletes tagged Firestore docs"""
+    redis = FakeRedis()
+    invalidation_service.redis_cache = redis
+    invalidation_service.firestore_cache.set = AsyncMock(return_value=True)
+    invalidation_service.firestore_cache.delete_entries = AsyncMock(return_value=["user:123:prompts:1", "user:123:old"])
+
+    for i in range(3):
+        await invalidation_service.set_with_ttl(
+            f"user:123:prompts:{i}", [i], DataType.PROMPT_CONTENT,
+            layers=[CacheLayer.FIRESTORE, CacheLayer.REDIS], tags=["user:123:prompts"]
+        )
+    await invalidation_service.set_with_ttl("user:456:prompts:0", [0], DataType.PROMPT_CONTENT,
+                                            layers=[CacheLayer.REDIS], tags=["user:456:prompts"])
+
+    assert invalidation_service.firestore_cache.set.call_args.kwargs["tags"] == ["user:123:prompts"]
+    assert await invalidation_service.get_with_fallback("user:456:prompts:0", DataType.PROMPT_CONTENT) == [0]
+
+    redis.pipelines.clear()
+    count = await invalidation_service.invalidate_tag("user:123:prompts", DataType.PROMPT_CONTENT)
+
+    assert count == 4  # three Redis keys plus one Firestore-only key
+    assert redis.pipelines == [["smembers", "unlink"], ["unlink"]]
+    assert set(redis.data) == {"user:456:prompts:0", "cache_tag:user:456:prompts"}
+    invalidation_service.firestore_cache.delete_entries.assert_awaited_once_with(set(), {"user:123:prompts"})
+
+
+@pytest.mark.asyncio
+async def test_event_rules_invalidate_by_tag():
+    """Test default rules resolve dependency tags from document data"""
+    from src.cache.event_based_invalidation import EventBasedInvalidationService, EventType
+
+    service = EventBasedInvalidationService()
+    with patch("src.cache.event_based_invalidation.cache_invalidation_service") as cache_service:
+        cache_service.invalidate = AsyncMock(return_value=True)
+        cache_service.invalidate_tag = AsyncMock(return_value=1)
+
+        await service.handle_firestore_event(EventType.DELETE, "documents", "doc1", {"user_id": "u1"})
+        await service.handle_firestore_event(EventType.UPDATE, "prompts", "p1", {})
+
+    tags = [call.kwargs["tag"] for call in cache_service.invalidate_tag.call_args_list]
+    assert tags == ["document:doc1", "user:u1:documents", "vector_index", "prompt:p1:metadata", "prompt:p1:executions"]
+    cache_service.invalidate_pattern.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_worker_coalesces_queued_events():
+    """Test queued events are deduplicated into one invalidation per window"""
+    from src.cache.event_based_invalidation import EventBasedInvalidationService, EventType
+
+    service = EventBasedInvalidationService(coalesce_window_ms=50)
+    with patch("src.cache.event_based_invalidation.cache_invalidation_service") as cache_service:
+        cache_service.invalidate_many = AsyncMock(return_value=10)
+        for i in range(1000):
+            await service.queue_invalidation(EventType.UPDATE, "prompts", f"p{i % 10}", {"user_id": "u1"})
+        assert service.get_metrics()["queue_depth"] == 1000
+
+        await service.start_worker()
+        await asyncio.wait_for(service.invalidation_queue.join(), timeout=5)
+        await service.stop_worker()
+
+    cache_service.invalidate_many.assert_awaited_once()
+    call = cache_service.invalidate_many.call_args.kwargs
+    assert call["keys"] == {f"prompt:p{i}" for i in range(10)}
+    assert len(call["tags"]) == 21  # metadata + executions per prompt, one user:u1:prompts
+    metrics = service.get_metrics()
+    assert (metrics["events_processed"], metrics["windows"], metrics["queue_depth"]) == (1000, 1, 0)
+    assert metrics["coalescing_ratio"] == pytest.approx(4000 / 31)
+
+
+@pytest.mark.asyncio
+async def test_batch_update_is_one_pipelined_delete(invalidation_service):
+    """Test a bulk update issues one Redis pipeline however many documents repeat"""
+    from src.cache.event_based_invalidation import EventBasedInvalidationService
+
+    redis = FakeRedis()
+    invalidation_service.redis_cache = redis
+    service = EventBasedInvalidationService()
+    updates = [{"doc_id": f"doc{i % 50}", "data": {"user_id": "u1"}} for i in range(2000)]
+
+    with patch("src.cache.event_based_invalidation.cache_invalidation_service", invalidation_service):
+        await service.handle_batch_update("documents", updates)
+
+    assert redis.pipelines == [["smembers", "unlink"] * 151, ["unlink"]]
+    assert service.metrics["unique"] == 50 + 151
+
+
+@pytest.mark.asyncio
+async def test_window_survives_an_event_that_fails_to_plan():
+    """Test one unplannable event does not drop the other events' deletes and handlers"""
+    from src.cache.event_based_invalidation import EventBasedInvalidationService, EventType
+
+    service = EventBasedInvalidationService()
+    handled = []
+    service.register_event_handler("prompts", lambda event_type, doc_id, data, old_data: handled.append(doc_id))
+    events = [
+        {"event_type": EventType.UPDATE, "collection": "prompts", "doc_id": "p1", "data": {"user_id": "u1"}},
+        {"event_type": EventType.UPDATE, "collection": "prompts", "doc_id": "bad", "data": None},
+        {"event_type": EventType.UPDATE, "collection": "prompts", "doc_id": "p2", "data": {"user_id": "u1"}},
+    ]
+    original_plan = service._plan_event
+
+    def plan_event(plan, event_type, collection, doc_id, data):
+        if doc_id == "bad":
+            raise ValueError("malformed event")
+        return original_plan(plan, event_type, collection, doc_id, data)
+
+    with patch("src.cache.event_based_invalidation.cache_invalidation_service") as cache_service, \
+            patch.object(service, "_plan_event", side_effect=plan_event):
+        cache_service.invalidate_many = AsyncMock(return_value=2)
+        await service._process_window(events)
+
+    assert cache_service.invalidate_many.call_args.kwargs["keys"] == {"prompt:p1", "prompt:p2"}
+    assert handled == ["p1", "bad", "p2"]
+    assert service.metrics["plan_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_firestore_atomic_update_reads_aware_expiry():
+    """Test atomic_update handles the timezone-aware expires_at Firestore returns"""
+    import json
+    from datetime import timezone
+    from unittest.mock import MagicMock
+    from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+    with patch.object(FirebaseCache, "_initialize_firebase"):
+        cache = FirebaseCache()
+    cache.db = MagicMock()
+    doc = cache.db.collection.return_value.document.return_value.get.return_value
+    doc.exists = True
+    live = DatetimeWithNanoseconds.now(timezone.utc) + timedelta(minutes=5)
+    doc.to_dict.return_value = {"value": json.dumps({"tat": 1.5}), "expires_at": live}
+    transaction = cache.db.transaction.return_value
+
+    with patch("src.cache.firebase_cache.firestore.transactional", lambda fn: fn):
+        result = await cache.atomic_update("rl:u1", lambda current: ({"tat": 2.0}, current))
+
+        assert result == {"tat": 1.5}
+        written = transaction.set.call_args.args[1]
+        assert written["value"] == json.dumps({"tat": 2.0})
+        assert written["expires_at"].tzinfo is not None
+
+        doc.to_dict.return_value["expires_at"] = live - timedelta(minutes=10)
+        assert await cache.atomic_update("rl:u1", lambda current: ({}, current)) is None
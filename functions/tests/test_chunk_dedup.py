@@ -1,4 +1,4 @@
-from src.rag.chunking_strategies import Chunk, ChunkingResult, deduplicate_chunks
+from src.rag.chunking_strategies import Chunk, ChunkingResult, MinHashLSH, _token_set, deduplicate_chunks
 
 
 def _mk(content: str, idx: int) -> Chunk:
@@ -30,3 +30,36 @@ def test_deduplicate_near_duplicates_by_jaccard():
     contents = [c.content for c in out]
     assert len(out) == 2
     assert (base in contents) ^ (near in contents)
+
+
+def test_minhash_signatures_are_stable_and_persistable():
+    index = MinHashLSH(0.9)
+    tokens = _token_set("This is a simple sentence for testing purposes.")
+    signature = index.signature(tokens)
+
+    assert (signature == MinHashLSH(0.9).signature(tokens)).all()
+    assert (MinHashLSH.decode_signature(MinHashLSH.encode_signature(signature)) == signature).all()
+
+    index.insert("doc_chunk_0000", signature)
+    restored = MinHashLSH.from_dict(index.to_dict())
+    assert restored.query(signature) == {"doc_chunk_0000"}
+
+
+def test_deduplicate_across_documents_with_persisted_index():
+    words = " ".join(f"word{i}" for i in range(60))
+    index = MinHashLSH(0.9)
+    first = deduplicate_chunks([_mk(words + ".", 0)], index=index)
+    assert "minhash" in first[0].metadata
+
+    restored = MinHashLSH.from_dict(index.to_dict())
+    second = deduplicate_chunks([_mk(words + " extra.", 1), _mk("Completely unrelated content.", 2)],
+                                index=restored)
+
+    assert [c.content for c in second] == ["Completely unrelated content."]
+
+
+def test_lsh_bands_keep_recall_at_threshold():
+    for threshold in (0.5, 0.75, 0.9):
+        index = MinHashLSH(threshold)
+        recall = 1 - (1 - threshold ** index.rows) ** index.bands
+        assert recall >= 0.99
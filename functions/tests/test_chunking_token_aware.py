@@ -0,0 +1,164 @@
+"""
+Tests for single-pass, token-budgeted chunking
+"""
+import pytest
+
+from src.rag import chunking_strategies, document_extractors
+from src.rag.document_extractors import DocumentProcessor, PDFExtractor
+from src.rag.chunking_strategies import (
+    MODEL_LIMIT_MARGIN,
+    TokenAwareChunking,
+    TokenizedText,
+    chunking_manager,
+)
+
+DOCUMENT = "\n\n".join([
+    "# Intro",
+    "Dr. Smith wrote this guide. It covers campaign planning in detail! Is it useful?",
+    "## Details",
+    " ".join(f"Sentence number {i} explains one more step of the launch plan." for i in range(60)),
+    "## Summary",
+    "Measure results weekly. Adjust the budget when needed.",
+])
+
+
+class TestTokenizedText:
+    """Token offsets map back to the original characters"""
+
+    def test_tokens_cover_text_exactly(self):
+        tokens = TokenizedText(DOCUMENT)
+
+        assert "".join(tokens.token_text(i) for i in range(len(tokens))) == DOCUMENT
+        assert tokens.char_offset(len(tokens)) == len(DOCUMENT)
+
+    def test_empty_text(self):
+        assert len(TokenizedText("")) == 0
+
+
+class TestTokenAwareChunking:
+    """Budgets, offsets, boundaries and section titles"""
+
+    def test_chunks_never_exceed_budget(self):
+        strategy = TokenAwareChunking(chunk_size=60, overlap=10)
+
+        result = strategy.chunk(DOCUMENT, {"document_id": "doc1"})
+
+        assert len(result.chunks) > 3
+        for chunk in result.chunks:
+            assert chunk.token_count <= 60
+            assert chunk.token_count == len(TokenizedText(chunk.content))
+
+    def test_offsets_match_content_and_cover_text(self):
+        result = TokenAwareChunking(chunk_size=60, overlap=10).chunk(DOCUMENT)
+
+        for chunk in result.chunks:
+            assert DOCUMENT[chunk.metadata["start_char"]:chunk.metadata["end_char"]] == chunk.content
+            assert (chunk.start_index, chunk.end_index) == (chunk.metadata["start_char"], chunk.metadata["end_char"])
+        assert result.chunks[0].start_index == 0
+        assert result.chunks[-1].end_index == len(DOCUMENT)
+        for previous, current in zip(result.chunks, result.chunks[1:]):
+            assert current.start_index <= previous.end_index
+
+    def test_cuts_prefer_boundaries_and_track_sections(self):
+        result = TokenAwareChunking(chunk_size=60, overlap=10).chunk(DOCUMENT)
+
+        assert result.chunks[0].metadata["section_title"] == "Intro"
+        assert result.chunks[-1].metadata["section_title"] == "Summary"
+        assert {c.metadata["boundary"] for c in result.chunks[:-1]} <= {"section", "paragraph", "sentence"}
+        # A new section starts a new chunk without overlap from the previous one
+        summary = next(c for c in result.chunks if c.content.startswith("## Summary"))
+        assert summary.overlap_with_previous == 0
+
+    def test_chunk_size_capped_by_model_limit(self):
+        strategy = TokenAwareChunking(chunk_size=1000, overlap=0, max_tokens=64)
+
+        result = strategy.chunk(DOCUMENT)
+
+        assert strategy.effective_chunk_size() == 64 - MODEL_LIMIT_MARGIN
+        assert max(c.token_count for c in result.chunks) <= 64 - MODEL_LIMIT_MARGIN
+
+    def test_hard_cut_without_boundaries_always_progresses(self):
+        text = "x" * 500
+
+        result = TokenAwareChunking(chunk_size=10, overlap=0, min_chunk_tokens=0).chunk(text)
+
+        assert "".join(c.content for c in result.chunks) == text
+        assert {c.metadata["boundary"] for c in result.chunks[:-1]} == {"hard"}
+
+    def test_empty_text_has_no_chunks(self):
+        assert TokenAwareChunking().chunk("   ").chunks == []
+
+
+class TestChunkingManagerDefault:
+    """chunk_document uses token-aware chunking unless told otherwise"""
+
+    def test_default_strategy_is_token_aware(self):
+        result = chunking_manager.chunk_document(DOCUMENT, chunk_size=80, overlap=10, max_tokens=2048)
+
+        assert result.strategy == "token_aware"
+        assert all(c.token_count <= 80 for c in result.chunks)
+
+    def test_auto_keeps_heuristic_selection(self):
+        result = chunking_manager.chunk_document(DOCUMENT, strategy="auto", chunk_size=200, overlap=20)
+
+        assert result.strategy in {"fixed_size", "semantic", "hierarchical", "sliding_window"}
+
+
+def _fingerprint(chunks):
+    return [(c.chunk_id, c.content, c.start_index, c.metadata["start_token"], c.metadata["section_title"],
+             c.overlap_with_previous, c.overlap_with_next) for c in chunks]
+
+
+class TestIterChunks:
+    """Streaming chunking matches chunk() while holding only a small buffer"""
+
+    @pytest.mark.parametrize("buffer_chars", [50, 2000])
+    def test_streamed_chunks_match_whole_document(self, monkeypatch, buffer_chars):
+        monkeypatch.setattr(chunking_strategies, "STREAM_BUFFER_CHARS", buffer_chars)
+        document = "\n\n".join(DOCUMENT.replace("# Intro", f"# Part {i}") for i in range(5))
+        strategy = TokenAwareChunking(chunk_size=60, overlap=10)
+        pieces = [document[i:i + 37] for i in range(0, len(document), 37)]
+
+        streamed = list(strategy.iter_chunks(iter(pieces), {"document_id": "doc1"}))
+
+        assert _fingerprint(streamed) == _fingerprint(strategy.chunk(document, {"document_id": "doc1"}).chunks)
+        assert streamed[-1].metadata["section_title"] == "Summary"
+
+    def test_chunks_yielded_before_stream_ends(self, monkeypatch):
+        monkeypatch.setattr(chunking_strategies, "STREAM_BUFFER_CHARS", 200)
+        consumed = []
+
+        def pages():
+            for i in range(50):
+                consumed.append(i)
+                yield f"Page {i} has a sentence about the launch plan. " * 10
+
+        first = next(chunking_manager.iter_chunks(pages(), chunk_size=80, overlap=10))
+
+        assert first.start_index == 0
+        assert len(consumed) < 50
+
+    def test_empty_stream_yields_nothing(self):
+        assert list(TokenAwareChunking().iter_chunks(iter([]))) == []
+
+
+class TestExtractorIterText:
+    """Extractors feed iter_chunks piece by piece"""
+
+    def test_default_iter_text_yields_extracted_content(self):
+        processor = DocumentProcessor()
+        content = b"First paragraph of the file.\n\nSecond paragraph."
+
+        pieces = list(processor.iter_text(content, "notes.txt"))
+
+        assert "".join(pieces) == processor.process_document(content, "notes.txt").document.content
+
+    def test_pdf_pages_stream_with_extract_spacing(self, monkeypatch):
+        extractor = PDFExtractor()
+        monkeypatch.setattr(document_extractors, "PDF_AVAILABLE", True)
+        monkeypatch.setattr(extractor, "_open_reader", lambda content, warnings: (object(), False))
+        monkeypatch.setattr(extractor, "_iter_pages", lambda reader, content, warnings: iter([
+            (0, "Page one\ntext.", False, False), (1, "", False, False), (2, "Page three.", False, False),
+        ]))
+
+        assert list(extractor.iter_text(b"%PDF")) == ["Page one text.", " Page three."]
@@ -3,13 +3,27 @@ Unit tests for cost tracker module
 """
 import pytest
 from decimal import Decimal
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from unittest.mock import MagicMock, AsyncMock, patch
 from src.llm.cost_tracker import (
-    CostTracker, CostEntry, UsageStats, CostLimit
+    CostTracker, CostEntry, CostLedger, UsageStats, CostLimit
 )
 
 
+def _entry(request_id: str) -> CostEntry:
+    return CostEntry(
+        user_id="user-123",
+        provider="openai",
+        model="gpt-3.5-turbo",
+        tokens_used=100,
+        cost=Decimal("0.000150"),
+        timestamp=datetime.now(timezone.utc),
+        request_id=request_id,
+        endpoint="execute_prompt",
+        metadata={}
+    )
+
+
 class TestCostCalculation:
     """Test cost calculation"""
     
@@ -156,6 +170,202 @@ class TestCostTracking:
         assert entry.metadata["test"] is True
 
 
+class TestCostLedger:
+    """Test the write-behind cost ledger"""
+
+    def test_track_usage_does_not_write_synchronously(self):
+        """track_usage only enqueues; Firestore is written on flush"""
+        mock_db = MagicMock()
+        tracker = CostTracker(firestore_client=mock_db)
+
+        tracker.track_usage(
+            user_id="user-123",
+            provider="openai",
+            model="gpt-3.5-turbo",
+            input_tokens=100,
+            request_id="req-1"
+        )
+
+        mock_db.collection.return_value.add.assert_not_called()
+        mock_db.transaction.assert_not_called()
+        assert len(tracker.cost_entries) == 1
+
+        with patch("src.llm.cost_tracker.firestore.transactional", lambda fn: fn):
+            tracker.close()
+
+        mock_db.transaction.assert_called_once()
+        mock_db.collection.return_value.document.assert_any_call("req-1")
+        assert tracker.cost_entries == []
+
+    def test_dedupes_by_request_id(self):
+        """Pending and recently flushed request_ids are not written twice"""
+        commit = MagicMock()
+        ledger = CostLedger(commit, batch_size=100, flush_interval=60)
+
+        assert ledger.enqueue(_entry("req-1")) is True
+        assert ledger.enqueue(_entry("req-1")) is False
+        ledger.flush()
+        assert ledger.enqueue(_entry("req-1")) is False
+
+        assert commit.call_count == 1
+        assert len(commit.call_args.args[0]) == 1
+        assert ledger.stats["duplicates"] == 2
+        ledger.close()
+
+    def test_failed_flush_requeues_entries(self):
+        """Entries survive a failed commit and are written on the next flush"""
+        commit = MagicMock(side_effect=[Exception("unavailable"), None])
+        ledger = CostLedger(commit, batch_size=100, flush_interval=60)
+
+        ledger.enqueue(_entry("req-1"))
+        ledger.enqueue(_entry("req-2"))
+
+        assert ledger.flush() == 0
+        assert [e.request_id for e in ledger.pending_entries()] == ["req-1", "req-2"]
+        assert ledger.flush() == 2
+        assert ledger.pending_entries() == []
+        ledger.close()
+
+    def test_full_queue_sheds_oldest_without_inline_commit(self):
+        """Reaching max_pending drops the oldest entry instead of committing on the caller"""
+        commit = MagicMock(side_effect=Exception("unavailable"))
+        ledger = CostLedger(commit, batch_size=100, flush_interval=60, max_pending=3)
+
+        for i in range(5):
+            assert ledger.enqueue(_entry(f"req-{i}")) is True
+
+        commit.assert_not_called()
+        assert [e.request_id for e in ledger.pending_entries()] == ["req-2", "req-3", "req-4"]
+        assert ledger.stats["dropped"] == 2
+        commit.side_effect = None
+        ledger.close()
+
+
+class TestCostRollups:
+    """Test rollup-backed usage stats"""
+
+    def test_flush_increments_day_and_month_rollups(self):
+        """Each flush writes rollup docs for the entry's day and month"""
+        mock_db = MagicMock()
+        tracker = CostTracker(firestore_client=mock_db)
+
+        tracker.ledger.enqueue(_entry("req-1"))
+        tracker.ledger.enqueue(_entry("req-2"))
+        with patch("src.llm.cost_tracker.firestore.transactional", lambda fn: fn):
+            tracker.ledger.flush()
+
+        now = datetime.now(timezone.utc)
+        doc_ids = [c.args[0] for c in mock_db.collection.return_value.document.call_args_list]
+        assert f"user-123__day_{now:%Y-%m-%d}" in doc_ids
+        assert f"user-123__month_{now:%Y-%m}" in doc_ids
+
+        rollup_writes = [
+            c for c in mock_db.transaction.return_value.set.call_args_list
+            if c.kwargs.get("merge")
+        ]
+        assert len(rollup_writes) == 2
+        tracker.close()
+
+    def test_retry_after_ambiguous_commit_does_not_recount(self):
+        """Entries whose docs already exist are neither rewritten nor added to rollups"""
+        mock_db = MagicMock()
+        tracker = CostTracker(firestore_client=mock_db)
+        transaction = mock_db.transaction.return_value
+        # req-1 was applied by a commit whose response was lost
+        mock_db.get_all.return_value = [MagicMock(id="req-1", exists=True), MagicMock(id="req-2", exists=False)]
+
+        with patch("src.llm.cost_tracker.firestore.transactional", lambda fn: fn):
+            tracker._commit_cost_entries([_entry("req-1"), _entry("req-2")])
+
+        assert mock_db.get_all.call_args.kwargs["transaction"] is transaction
+        entry_writes = [c for c in transaction.set.call_args_list if not c.kwargs.get("merge")]
+        rollup_writes = [c for c in transaction.set.call_args_list if c.kwargs.get("merge")]
+        assert [c.args[1]["request_id"] for c in entry_writes] == ["req-2"]
+        assert len(rollup_writes) == 2
+        assert all(c.args[1]["counts"]["total_requests"].value == 1 for c in rollup_writes)
+
+        mock_db.get_all.return_value = [MagicMock(id="req-1", exists=True), MagicMock(id="req-2", exists=True)]
+        transaction.set.reset_mock()
+        with patch("src.llm.cost_tracker.firestore.transactional", lambda fn: fn):
+            tracker._commit_cost_entries([_entry("req-1"), _entry("req-2")])
+
+        transaction.set.assert_not_called()
+        tracker.close()
+
+    def test_check_cost_limits_reads_two_rollup_docs(self):
+        """Limit checks read today's and this month's rollups plus the tail"""
+        mock_db = MagicMock()
+        now = datetime.now(timezone.utc)
+        month_doc = MagicMock(exists=True, id=f"user-123__month_{now:%Y-%m}")
+        month_doc.to_dict.return_value = {
+            "period": f"month_{now:%Y-%m}",
+            "counts": {"total_requests": 10, "total_tokens": 1000, "total_cost": 2.5}
+        }
+        mock_db.get_all.return_value = [month_doc]
+
+        tracker = CostTracker(firestore_client=mock_db)
+        tracker.ledger.enqueue(CostEntry(
+            user_id="user-123", provider="openai", model="gpt-4",
+            tokens_used=100, cost=Decimal("0.50"), timestamp=now,
+            request_id="req-tail", endpoint="execute_prompt", metadata={}
+        ))
+
+        result = tracker.check_cost_limits("user-123", "free")
+
+        mock_db.get_all.assert_called_once()
+        assert len(mock_db.get_all.call_args.args[0]) == 2
+        mock_db.collection.return_value.where.assert_not_called()
+        assert result["daily"]["used"] == pytest.approx(0.5)
+        assert result["monthly"]["used"] == pytest.approx(3.0)
+        assert result["within_limits"] is True
+        tracker.close()
+
+    def test_rollup_keys_use_whole_months(self):
+        """Whole months in the period are served by one monthly doc"""
+        start = datetime(2025, 1, 30, 12, tzinfo=timezone.utc)
+        end = datetime(2025, 3, 2, 8, tzinfo=timezone.utc)
+
+        keys = CostTracker._rollup_keys_for_period(start, end)
+
+        assert keys == [
+            "day_2025-01-30", "day_2025-01-31", "month_2025-02",
+            "day_2025-03-01", "day_2025-03-02"
+        ]
+
+    def test_rollup_keys_current_month_is_whole(self):
+        """The in-progress month is read as a single doc"""
+        now = datetime.now(timezone.utc)
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        assert CostTracker._rollup_keys_for_period(month_start, now) == [f"month_{now:%Y-%m}"]
+
+
+    def test_backfill_recounts_history_into_rollups(self):
+        """Existing cost_tracking docs are summed into day and month rollups"""
+        mock_db = MagicMock()
+        tracker = CostTracker(firestore_client=mock_db)
+        ts = datetime(2025, 3, 14, 9, tzinfo=timezone.utc)
+        history = [
+            {**tracker._cost_entry_to_doc(_entry(f"req-{i}")), "timestamp": ts + timedelta(days=i)}
+            for i in range(3)
+        ]
+        query = mock_db.collection.return_value.where.return_value
+        query.stream.return_value = [MagicMock(to_dict=MagicMock(return_value=doc)) for doc in history]
+
+        assert tracker.backfill_rollups(since=ts) == 4
+
+        mock_db.collection.return_value.where.assert_called_once_with(
+            "timestamp", ">=", datetime(2025, 3, 1, tzinfo=timezone.utc)
+        )
+        writes = {c.args[1]["period"]: c.args[1] for c in mock_db.batch.return_value.set.call_args_list}
+        assert set(writes) == {"day_2025-03-14", "day_2025-03-15", "day_2025-03-16", "month_2025-03"}
+        assert writes["month_2025-03"]["counts"]["total_requests"] == 3
+        assert writes["month_2025-03"]["counts"]["total_cost"] == pytest.approx(0.00045)
+        assert writes["day_2025-03-15"]["user_id"] == "user-123"
+        mock_db.batch.return_value.commit.assert_called_once()
+        tracker.close()
+
+
 class TestCostLimits:
     """Test cost limit checking"""
     
@@ -190,6 +190,89 @@ class TestMessageTypeFiltering:
         assert total_length == len("Hello world!")
 
 
+@pytest.mark.asyncio
+class TestTokenStreaming:
+    """Test token-level streaming through the LangGraph llm node"""
+
+    def make_llm(self, tokens):
+        from unittest.mock import MagicMock
+        from src.llm.watsonx_client import WatsonxGraniteLangChain
+
+        llm = WatsonxGraniteLangChain(watsonx_api_key="test-key", watsonx_project_id="test-project")
+
+        async def fake_stream(prompt, **kwargs):
+            for token in tokens:
+                yield token
+
+        llm._client.generate_stream = MagicMock(side_effect=fake_stream)
+        llm._client.generate = MagicMock(side_effect=AssertionError("generate() should not be called"))
+        return llm
+
+    def make_graph(self, llm):
+        from functools import partial
+        from langgraph.graph import StateGraph, END
+        from src.ai_agent.marketing.agent_state import MarketingAgentState
+        from src.ai_agent.marketing.workflow_nodes import llm_node
+
+        workflow = StateGraph(MarketingAgentState)
+        workflow.add_node("llm", partial(llm_node, llm=llm))
+        workflow.set_entry_point("llm")
+        workflow.add_edge("llm", END)
+        return workflow.compile()
+
+    async def test_messages_mode_yields_tokens_from_llm_node(self):
+        """Verify each generated delta reaches the stream as its own chunk"""
+        from langchain_core.messages import AIMessageChunk
+
+        tokens = ["Hello", " there", "!\n\n", "- Pricing starts at $500"]
+        graph = self.make_graph(self.make_llm(tokens))
+
+        chunks = []
+        async for msg, metadata in graph.astream(
+            {"messages": [("user", "hi")]},
+            stream_mode="messages"
+        ):
+            assert metadata["langgraph_node"] == "llm"
+            chunks.append(msg)
+
+        assert [c.content for c in chunks] == tokens
+        assert all(isinstance(c, AIMessageChunk) for c in chunks)
+        # All chunks belong to the same response message
+        assert len({c.id for c in chunks}) == 1
+
+    async def test_node_receives_full_message(self):
+        """Verify the node state still gets the complete response while streaming"""
+        graph = self.make_graph(self.make_llm(["Hello", " world"]))
+
+        result = None
+        async for mode, payload in graph.astream(
+            {"messages": [("user", "hi")]},
+            stream_mode=["messages", "values"]
+        ):
+            if mode == "values":
+                result = payload
+
+        assert result["messages"][-1].content == "Hello world"
+        assert result["next_action"] == "reflect"
+
+    async def test_ainvoke_without_stream_consumer_uses_single_request(self):
+        """Verify plain ainvoke() does not hit the streaming endpoint"""
+        from unittest.mock import AsyncMock
+
+        llm = self.make_llm([])
+        llm._client.generate = AsyncMock(return_value={
+            "text": "Full answer",
+            "model": "ibm/granite-4-h-small",
+            "usage": {"total_tokens": 3},
+            "finish_reason": "stop",
+        })
+
+        response = await llm.ainvoke([("user", "hi")])
+
+        assert response.content == "Full answer"
+        llm._client.generate_stream.assert_not_called()
+
+
 if __name__ == "__main__":
     # Run tests
     import sys
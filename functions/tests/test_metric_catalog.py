@@ -0,0 +1,160 @@
+"""
+Tests for the time series metric catalog
+"""
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src.analytics.metric_catalog import MetricCatalog, catalog_doc_id, merge_catalog_update, metric_names_in_range
+
+T0 = datetime(2026, 3, 2, 10, 0, 0)
+
+
+class TestMetricCatalog:
+    """Only first sightings produce updates; limits reject tag explosions"""
+
+    def test_only_first_sightings_produce_updates(self):
+        catalog = MetricCatalog()
+        catalog.load([])
+
+        admitted, first = catalog.observe("latency_ms", {"model": "a"}, T0)
+        _, repeat = catalog.observe("latency_ms", {"model": "a"}, T0 + timedelta(minutes=5))
+        _, new_value = catalog.observe("latency_ms", {"model": "b"}, T0 + timedelta(minutes=6))
+        _, next_day = catalog.observe("latency_ms", {"model": "b"}, T0 + timedelta(days=1))
+
+        assert admitted
+        assert first == {"metric_name": "latency_ms", "first_seen": T0,
+                         "tags": {"model": ["a"]}, "last_seen_date": "2026-03-02"}
+        assert repeat is None
+        assert new_value == {"metric_name": "latency_ms", "tags": {"model": ["b"]}}
+        assert next_day == {"metric_name": "latency_ms", "last_seen_date": "2026-03-03"}
+
+    def test_seeded_from_existing_catalog(self):
+        catalog = MetricCatalog()
+        catalog.load([{"metric_name": "cost", "tags": {"model": ["a"]}, "last_seen_date": "2026-03-02"}])
+
+        assert catalog.observe("cost", {"model": "a"}, T0) == (True, None)
+
+    def test_limits_reject_points_without_recording_them(self):
+        catalog = MetricCatalog(max_metrics=2, max_tag_keys=2, max_tag_values=2)
+        catalog.load([])
+        catalog.observe("m1", {"user": "u1"}, T0)
+        catalog.observe("m1", {"user": "u2"}, T0)
+
+        assert catalog.observe("m1", {"user": "u3"}, T0) == (False, None)
+        assert catalog.observe("m1", {"user": "u1", "a": "1", "b": "2"}, T0) == (False, None)
+        assert catalog.observe("m1", {"user": "u2"}, T0) == (True, None)
+        catalog.observe("m2", {}, T0)
+        assert catalog.observe("m3", {}, T0) == (False, None)
+        assert catalog.stats["rejected"] == 3
+
+    def test_names_filtered_by_activity_range(self):
+        docs = [
+            {"metric_name": "old", "first_seen": T0 - timedelta(days=30), "last_seen_date": "2026-02-01"},
+            {"metric_name": "new", "first_seen": T0 + timedelta(days=3), "last_seen_date": "2026-03-05"},
+            {"metric_name": "active", "first_seen": T0 - timedelta(days=30), "last_seen_date": "2026-03-02"},
+        ]
+
+        assert metric_names_in_range(docs) == ["active", "new", "old"]
+        assert metric_names_in_range(docs, T0, T0 + timedelta(days=1)) == ["active"]
+
+    def test_doc_ids_are_firestore_safe(self):
+        assert "/" not in catalog_doc_id("api/latency")
+
+    def test_merge_never_regresses_stored_document(self):
+        stored = {"metric_name": "cost", "first_seen": T0, "last_seen_date": "2026-03-05", "tags": {"model": ["a"]}}
+        stale = {"metric_name": "cost", "first_seen": T0 + timedelta(days=2),
+                 "last_seen_date": "2026-03-04", "tags": {"model": ["a", "b"]}}
+
+        assert merge_catalog_update(stored, stale) == {"tags": {"model": ["b"]}}
+        assert merge_catalog_update({}, stale) == {"metric_name": "cost", **stale}
+        assert merge_catalog_update(stored, {"metric_name": "cost", "first_seen": T0 - timedelta(days=1)}) == {
+            "first_seen": T0 - timedelta(days=1)
+        }
+
+
+@pytest.fixture
+def storage():
+    with patch("google.cloud.firestore.AsyncClient"):
+        from src.analytics.time_series_storage import TimeSeriesStorage
+
+    client = MagicMock()
+    client.batch.return_value.commit = AsyncMock()
+    client.collection.return_value.get = AsyncMock(return_value=[])
+    client.collection.return_value.document.return_value.set = AsyncMock()
+    client.collection.return_value.document.return_value.get = AsyncMock(return_value=MagicMock(exists=False))
+    with patch("src.analytics.time_series_storage.firestore.async_transactional", lambda fn: fn):
+        yield TimeSeriesStorage(firestore_client=client)
+
+
+async def _stream(docs):
+    for doc in docs:
+        yield doc
+
+
+class TestTimeSeriesStorageCatalog:
+    """Writes maintain the catalog; discovery reads only the catalog"""
+
+    @pytest.mark.asyncio
+    async def test_catalog_written_on_first_sighting_only(self, storage):
+        from src.analytics.time_series_storage import TimeSeriesPoint
+
+        points = [TimeSeriesPoint(T0 + timedelta(seconds=i), "latency_ms", i, {"model": "a"}, {}) for i in range(5)]
+        await storage.write_points(points)
+        await storage.write_point(TimeSeriesPoint(T0 + timedelta(seconds=9), "latency_ms", 9, {"model": "a"}, {}))
+
+        catalog_writes = storage.firestore_client.transaction.return_value.set.call_args_list
+        assert len(catalog_writes) == 1
+        assert catalog_writes[0].args[1]["first_seen"] == T0
+        assert catalog_writes[0].kwargs == {"merge": True}
+        # Second write had nothing new: plain single-document write, no catalog transaction
+        assert storage.firestore_client.transaction.call_count == 1
+        storage.firestore_client.collection.return_value.document.return_value.set.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_stale_process_does_not_regress_catalog(self, storage):
+        from src.analytics.time_series_storage import TimeSeriesPoint
+
+        stored = MagicMock(exists=True)
+        stored.to_dict.return_value = {"metric_name": "latency_ms", "first_seen": T0 - timedelta(days=9),
+                                       "last_seen_date": "2026-03-09", "tags": {"model": ["a"]}}
+        storage.firestore_client.collection.return_value.document.return_value.get = AsyncMock(return_value=stored)
+
+        await storage.write_point(TimeSeriesPoint(T0, "latency_ms", 1, {"model": "a"}, {}))
+
+        storage.firestore_client.transaction.return_value.set.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_backfill_builds_catalog_from_stored_points(self, storage):
+        day_doc = MagicMock()
+        day_doc.to_dict.return_value = {"metric_name": "cost", "tags": {"model": "a"}, "timestamp": T0}
+        raw_doc = MagicMock()
+        raw_doc.to_dict.return_value = {"metric_name": "cost", "tags": {"model": "b"},
+                                        "timestamp": T0 + timedelta(days=3)}
+        storage.firestore_client.collection.return_value.order_by.return_value.stream.side_effect = [
+            _stream([day_doc]), _stream([raw_doc])
+        ]
+
+        # Another test module replaces google.cloud.firestore, so do not rely
+        # on the real ArrayUnion's attributes
+        with patch("src.analytics.time_series_storage.firestore.ArrayUnion", side_effect=set):
+            assert await storage.backfill_catalog() == 1
+
+        (call,) = storage.firestore_client.transaction.return_value.set.call_args_list
+        assert call.args[1]["first_seen"] == T0
+        assert call.args[1]["last_seen_date"] == "2026-03-05"
+        assert call.args[1]["tags"]["model"] == {"a", "b"}
+
+    @pytest.mark.asyncio
+    async def test_discovery_reads_catalog_collection(self, storage):
+        catalog_doc = MagicMock(exists=True)
+        catalog_doc.to_dict.return_value = {"metric_name": "latency_ms", "tags": {"model": ["b", "a"]}}
+        storage.firestore_client.collection.return_value.get = AsyncMock(return_value=[catalog_doc])
+        storage.firestore_client.collection.return_value.document.return_value.get = AsyncMock(
+            return_value=catalog_doc
+        )
+
+        assert await storage.get_metric_names() == ["latency_ms"]
+        assert await storage.get_metric_tags("latency_ms") == {"model": ["a", "b"]}
+        assert {call.args[0] for call in storage.firestore_client.collection.call_args_list} == {"timeseries_catalog"}
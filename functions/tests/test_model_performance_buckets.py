@@ -0,0 +1,169 @@
+"""
+Tests for hourly model performance buckets and cached recommendations
+"""
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+with patch("firebase_admin.firestore.client"):
+    from src.analytics.model_performance_tracker import (
+        ModelPerformanceStats,
+        ModelPerformanceTracker,
+        PerformanceAggregate,
+    )
+    from src.analytics.model_recommendation import ModelRecommendationEngine, UserPreferences
+
+NOW = datetime(2026, 3, 2, 10, 30, tzinfo=timezone.utc)
+
+
+def _record(latency, success=True, rating=None, cost=0.01):
+    return {"latency_ms": latency, "cost_usd": cost, "success": success, "input_tokens": 60,
+            "output_tokens": 40, "total_tokens": 100, "user_rating": rating}
+
+
+def _increment_values(value):
+    """Increment transforms -> plain numbers, for assertions"""
+    if isinstance(value, dict):
+        return {key: _increment_values(item) for key, item in value.items()}
+    return getattr(value, "value", value)
+
+
+class TestPerformanceAggregate:
+    """Bucket merges reproduce whole-window statistics"""
+
+    def test_merged_buckets_match_single_pass(self):
+        records = [_record(100 + 10 * i, success=i % 10 != 0, rating=(i % 5) + 1 if i % 3 == 0 else None)
+                   for i in range(100)]
+        whole, first_hour, second_hour = PerformanceAggregate(), PerformanceAggregate(), PerformanceAggregate()
+        for i, record in enumerate(records):
+            whole.add_record(record)
+            (first_hour if i < 40 else second_hour).add_record(record)
+
+        merged = PerformanceAggregate()
+        merged.merge_bucket(first_hour.to_bucket_fields())
+        merged.merge_bucket(second_hour.to_bucket_fields())
+
+        expected = whole.to_stats("m", "m", "24h", NOW, NOW)
+        stats = merged.to_stats("m", "m", "24h", NOW, NOW)
+        assert (stats.total_executions, stats.failed_executions, stats.total_ratings) == (100, 10, 34)
+        assert stats.avg_latency_ms == pytest.approx(expected.avg_latency_ms)
+        assert stats.p95_latency_ms == expected.p95_latency_ms
+        assert stats.p95_latency_ms == pytest.approx(1050, rel=0.01)
+        assert stats.rating_distribution == expected.rating_distribution
+        assert stats.quality_score == pytest.approx(expected.quality_score)
+
+
+@pytest.fixture
+def tracker():
+    return ModelPerformanceTracker(db=MagicMock())
+
+
+class TestModelPerformanceTracker:
+    """record_execution increments the hourly bucket; stats merge buckets"""
+
+    @pytest.mark.asyncio
+    async def test_record_execution_increments_hour_bucket(self, tracker):
+        await tracker.record_execution("openai/gpt-4o", "GPT-4o", "exec-1", "u1", latency_ms=850,
+                                       cost_usd=0.02, success=True, input_tokens=70, output_tokens=30)
+
+        batch = tracker.db.batch.return_value
+        (record_call, bucket_call) = batch.set.call_args_list
+        batch.commit.assert_called_once()
+        assert record_call.args[1]["execution_id"] == "exec-1"
+        assert bucket_call.kwargs == {"merge": True}
+        tracker.db.collection.assert_any_call("model_performance_hourly")
+        assert "/" not in tracker.db.collection.return_value.document.call_args.args[0]
+
+        bucket = _increment_values(bucket_call.args[1])
+        assert bucket["hour_start"].minute == 0
+        assert (bucket["executions"], bucket["successes"], bucket["failures"]) == (1, 1, 0)
+        assert bucket["latency_sum_ms"] == 850
+        assert sum(bucket["latency_sketch"]["positive"].values()) == 1
+        assert "ratings" not in bucket  # empty maps would overwrite the stored distribution
+
+    @pytest.mark.asyncio
+    async def test_rerating_moves_rating_within_bucket(self, tracker):
+        doc = MagicMock()
+        doc.to_dict.return_value = {"model_id": "m", "model_name": "m", "timestamp": NOW, "user_rating": 2}
+        tracker.db.collection.return_value.where.return_value.limit.return_value.stream.return_value = [doc]
+
+        assert await tracker.update_user_feedback("exec-1", 5)
+
+        bucket = _increment_values(tracker.db.batch.return_value.set.call_args.args[1])
+        assert (bucket["rating_sum"], bucket["rating_count"]) == (3, 0)
+        assert bucket["ratings"] == {"5": 1, "2": -1}
+
+    @pytest.mark.asyncio
+    async def test_calculate_stats_merges_hour_buckets(self, tracker):
+        buckets = []
+        for latencies in ([100, 200], [300]):
+            aggregate = PerformanceAggregate()
+            for latency in latencies:
+                aggregate.add_record(_record(latency))
+            buckets.append(MagicMock(to_dict=MagicMock(return_value={
+                "model_id": "m", "model_name": "Model", **aggregate.to_bucket_fields()
+            })))
+        tracker.db.collection.return_value.where.return_value.where.return_value.stream.return_value = buckets
+
+        stats = await tracker.calculate_stats("m", "7d")
+
+        tracker.db.collection.assert_any_call("model_performance_hourly")
+        assert stats.model_name == "Model"
+        assert stats.total_executions == 3
+        assert stats.avg_latency_ms == pytest.approx(200)
+
+
+def _stats(model_id, quality):
+    return ModelPerformanceStats(
+        model_id=model_id, model_name=model_id, time_period="7d", total_executions=100,
+        successful_executions=99, failed_executions=1, success_rate=0.99, avg_latency_ms=900,
+        median_latency_ms=850, p95_latency_ms=1400, p99_latency_ms=1800, total_cost_usd=1.0,
+        avg_cost_per_execution=0.01, cost_per_1k_tokens=0.01, total_tokens=100000,
+        avg_tokens_per_execution=1000.0, avg_input_tokens=600.0, avg_output_tokens=400.0,
+        avg_user_rating=4.5, total_ratings=50, rating_distribution={1: 0, 2: 0, 3: 5, 4: 20, 5: 25},
+        tokens_per_second=120.0, cost_efficiency_score=0.01, quality_score=quality,
+        calculated_at=NOW, data_from=NOW, data_to=NOW,
+    )
+
+
+class _CountingTracker:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_all_models_stats(self, time_period="7d"):
+        self.calls += 1
+        return [_stats("model-a", 95.0), _stats("model-b", 80.0)]
+
+
+class TestRecommendationCache:
+    """recommend_models serves repeats from a short-TTL cache"""
+
+    @pytest.mark.asyncio
+    async def test_repeated_recommendations_do_not_refetch_stats(self):
+        tracker = _CountingTracker()
+        engine = ModelRecommendationEngine(performance_tracker=tracker, cache_ttl=60)
+
+        first = await engine.recommend_models(top_k=2)
+        first[0].reasoning.append("mutated by caller")
+        second = await engine.recommend_models(top_k=2)
+        boosted = await engine.recommend_models(top_k=2, user_preferences=UserPreferences(preferred_models=["model-b"]))
+
+        assert tracker.calls == 1
+        assert "mutated by caller" not in second[0].reasoning
+        assert [r.model_id for r in second] == ["model-a", "model-b"]
+        assert [r.model_id for r in boosted] == ["model-b", "model-a"]
+
+        engine.invalidate_cache()
+        await engine.recommend_models(top_k=2)
+        assert tracker.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_zero_ttl_disables_cache(self):
+        tracker = _CountingTracker()
+        engine = ModelRecommendationEngine(performance_tracker=tracker, cache_ttl=0)
+
+        await engine.recommend_models()
+        await engine.recommend_models()
+
+        assert tracker.calls == 2
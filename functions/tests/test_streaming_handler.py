@@ -1,11 +1,13 @@
 """
 Unit tests for streaming handler
 """
+import asyncio
 import pytest
 from unittest.mock import MagicMock, AsyncMock
 from datetime import datetime, timezone
 from src.streaming_handler import (
-    StreamingResponseHandler, SimpleStreamCollector, stream_to_firestore
+    StreamingResponseHandler, SimpleStreamCollector, stream_to_firestore,
+    ChunkBatchWriter
 )
 
 
@@ -163,6 +165,58 @@ class TestStreamingResponseHandler:
         assert result["chunks"][0]["index"] == 2
 
 
+class TestChunkBatchWriter:
+    """Test ChunkBatchWriter coalescing"""
+
+    @pytest.mark.asyncio
+    async def test_flushes_on_size(self):
+        """Chunks are written in batches bounded by max_batch_chunks"""
+        handler = MagicMock()
+        handler.append_chunks = AsyncMock()
+
+        writer = ChunkBatchWriter(
+            handler, "user-123", "prompt-123", "exec-123",
+            flush_interval_ms=60_000, max_batch_chunks=4, max_batch_chars=10_000
+        )
+        for i in range(10):
+            await writer.add({"index": i, "content": "x", "metadata": {}})
+        await writer.flush()
+
+        batches = [call.args[3] for call in handler.append_chunks.await_args_list]
+        assert [len(b) for b in batches] == [4, 4, 2]
+        assert [c["index"] for b in batches for c in b] == list(range(10))
+        assert writer.batches_written == 3
+
+    @pytest.mark.asyncio
+    async def test_stalled_stream_flushes_on_interval(self):
+        """Buffered chunks are written within the interval even if no more arrive"""
+        handler = MagicMock()
+        handler.append_chunks = AsyncMock()
+
+        writer = ChunkBatchWriter(handler, "user-123", "prompt-123", "exec-123", flush_interval_ms=20)
+        await writer.add({"index": 0, "content": "x", "metadata": {}})
+        await writer.add({"index": 1, "content": "y", "metadata": {}})
+        handler.append_chunks.assert_not_awaited()
+
+        await asyncio.sleep(0.06)
+
+        handler.append_chunks.assert_awaited_once()
+        assert [c["index"] for c in handler.append_chunks.await_args.args[3]] == [0, 1]
+        await writer.flush()
+        assert writer.batches_written == 1
+
+    @pytest.mark.asyncio
+    async def test_flush_without_chunks_is_noop(self):
+        """Flushing an empty writer does not write"""
+        handler = MagicMock()
+        handler.append_chunks = AsyncMock()
+
+        writer = ChunkBatchWriter(handler, "user-123", "prompt-123", "exec-123")
+        await writer.flush()
+
+        handler.append_chunks.assert_not_awaited()
+
+
 class TestSimpleStreamCollector:
     """Test SimpleStreamCollector"""
     
@@ -246,6 +300,42 @@ class TestStreamToFirestore:
         )
         
         assert completion_called
+
+        # All three chunks coalesced into a single batch commit, no per-chunk reads
+        mock_doc_ref = mock_db.collection.return_value.document.return_value.collection.return_value.document.return_value.collection.return_value.document.return_value
+        mock_db.batch.return_value.commit.assert_called_once()
+        mock_doc_ref.get.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stream_to_firestore_stops_when_cancelled(self):
+        """Cancellation pushed by the snapshot listener stops the stream"""
+        mock_db = MagicMock()
+        mock_doc_ref = mock_db.collection.return_value.document.return_value.collection.return_value.document.return_value.collection.return_value.document.return_value
+
+        cancelled_doc = MagicMock()
+        cancelled_doc.exists = True
+        cancelled_doc.to_dict.return_value = {"status": "cancelled"}
+
+        def on_snapshot(callback):
+            callback([cancelled_doc], [], None)
+            return MagicMock()
+
+        mock_doc_ref.on_snapshot.side_effect = on_snapshot
+
+        async def mock_stream():
+            yield MagicMock(content="Hello", finish_reason=None, model="gpt-3.5")
+
+        on_complete = MagicMock()
+        await stream_to_firestore(
+            stream_iterator=mock_stream(),
+            user_id="user-123",
+            prompt_id="prompt-123",
+            execution_id="exec-123",
+            firestore_client=mock_db,
+            on_complete=on_complete
+        )
+
+        on_complete.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_stream_to_firestore_error(self):
@@ -0,0 +1,187 @@
+"""
+Tests for streaming time series rollups
+"""
+import random
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src.analytics.rollups import DDSketch, RollupAccumulator, StreamingRollups, merge_rollup_docs
+
+T0 = datetime(2026, 3, 2, 10, 0, 0)
+
+
+class TestDDSketch:
+    """Relative accuracy and exact merging"""
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(5, 1.5) for _ in range(20000)]
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        ordered = sorted(values)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            assert abs(sketch.quantile(q) - exact) / exact <= 0.011
+
+    def test_merge_equals_single_sketch(self):
+        values = [-3.0, 0.0, 0.5, 2.0, 40.0, 125.0, 900.0]
+        whole, left, right = DDSketch(), DDSketch(), DDSketch()
+        for i, value in enumerate(values):
+            whole.add(value)
+            (left if i % 2 else right).add(value)
+
+        left.merge(right)
+
+        assert left.count == whole.count
+        assert [left.quantile(q) for q in (0, 0.25, 0.5, 0.75, 1)] == \
+            [whole.quantile(q) for q in (0, 0.25, 0.5, 0.75, 1)]
+        assert DDSketch.from_dict(left.to_dict()).quantile(0.5) == whole.quantile(0.5)
+
+    def test_bins_are_bounded(self):
+        sketch = DDSketch(max_bins=16)
+        for exponent in range(200):
+            sketch.add(1.1 ** exponent)
+
+        assert len(sketch.positive) <= 16
+        assert sketch.count == 200
+        assert sketch.quantile(1.0) == pytest.approx(1.1 ** 199, rel=0.01)
+
+
+class TestStreamingRollups:
+    """Bucket close, cascade and read-side merging"""
+
+    def test_minute_closes_after_grace_and_feeds_hour_and_day(self):
+        rollups = StreamingRollups(flush_grace_seconds=10)
+        for second in range(0, 60, 10):
+            rollups.add("latency_ms", {"model": "m"}, T0 + timedelta(seconds=second), second)
+        rollups.add("latency_ms", {"model": "m"}, T0 + timedelta(minutes=1), 100)
+
+        assert rollups.collect_closed(T0 + timedelta(seconds=65)) == {}
+
+        closed = rollups.collect_closed(T0 + timedelta(seconds=70))
+        (minute,) = closed["minute"]
+        assert minute["timestamp"] == T0
+        assert (minute["count"], minute["sum"], minute["min"], minute["max"]) == (6, 150.0, 0.0, 50.0)
+        assert rollups.open_buckets() == {"minute": 1, "hour": 1, "day": 0}
+
+        closed = rollups.collect_closed(T0 + timedelta(days=1, minutes=1))
+        assert [len(closed[g]) for g in ("minute", "hour", "day")] == [1, 1, 1]
+        (day,) = closed["day"]
+        assert day["timestamp"] == datetime(2026, 3, 2)
+        assert day["count"] == 7
+        assert day["max"] == 100.0
+        assert rollups.open_buckets() == {"minute": 0, "hour": 0, "day": 0}
+
+    def test_series_are_keyed_by_metric_and_tags(self):
+        rollups = StreamingRollups()
+        rollups.add("latency_ms", {"model": "a"}, T0, 1)
+        rollups.add("latency_ms", {"model": "b"}, T0, 2)
+        rollups.add("cost", {"model": "a"}, T0, 3)
+
+        docs = rollups.collect_closed(T0, force=True)["minute"]
+
+        assert sorted((d["metric_name"], d["tags"]["model"], d["sum"]) for d in docs) == [
+            ("cost", "a", 3.0), ("latency_ms", "a", 1.0), ("latency_ms", "b", 2.0)
+        ]
+
+    def test_merge_rollup_docs_combines_partials_and_finer_buckets(self):
+        first, second = RollupAccumulator(), RollupAccumulator()
+        for value in (10, 20):
+            first.add(value)
+        for value in (30, 1000):
+            second.add(value)
+        docs = [
+            {"timestamp": T0, **first.to_fields()},
+            {"timestamp": T0 + timedelta(minutes=5), **second.to_fields()},
+        ]
+
+        assert merge_rollup_docs(docs, "count", "hour") == [(T0, 4)]
+        assert merge_rollup_docs(docs, "avg", "hour") == [(T0, 265.0)]
+        assert merge_rollup_docs(docs, "p99", "hour")[0][1] == pytest.approx(1000, rel=0.01)
+        assert [t for t, _ in merge_rollup_docs(docs, "max", "minute")] == [T0, T0 + timedelta(minutes=5)]
+
+
+@pytest.fixture
+def storage():
+    with patch("google.cloud.firestore.AsyncClient"):
+        from src.analytics.time_series_storage import TimeSeriesStorage
+
+    client = MagicMock()
+    client.batch.return_value.commit = AsyncMock()
+    client.collection.return_value.get = AsyncMock(return_value=[])  # empty metric catalog
+    return TimeSeriesStorage(firestore_client=client)
+
+
+class TestTimeSeriesStorageRollups:
+    """Rollups are written once per closed bucket and queried from rollup collections"""
+
+    @pytest.mark.asyncio
+    async def test_points_are_rolled_up_on_write_and_flushed_in_batches(self, storage):
+        from src.analytics.time_series_storage import TimeSeriesPoint, TimeSeriesQuery
+
+        await storage.write_points([
+            TimeSeriesPoint(T0 + timedelta(seconds=i), "latency_ms", i, {"model": "m"}, {})
+            for i in range(30)
+        ])
+
+        assert await storage.flush_rollups(T0 + timedelta(seconds=30)) == 0
+        assert await storage.flush_rollups(T0 + timedelta(days=2)) == 3
+
+        written = [call.args[1] for call in storage.firestore_client.batch.return_value.set.call_args_list
+                   if call.args[1].get("granularity")]
+        assert [doc["granularity"] for doc in written] == ["minute", "hour", "day"]
+        assert all(doc["count"] == 30 and doc["writer"] == storage._writer_id for doc in written)
+
+        docs = [MagicMock(to_dict=MagicMock(return_value=doc)) for doc in written[:1]]
+        firestore_query = storage.firestore_client.collection.return_value
+        firestore_query.where.return_value = firestore_query
+        firestore_query.order_by.return_value = firestore_query
+        firestore_query.get = AsyncMock(return_value=docs)
+
+        result = await storage.query(TimeSeriesQuery(
+            "latency_ms", T0, T0 + timedelta(hours=2), aggregation="sum", granularity="hour"
+        ))
+
+        storage.firestore_client.collection.assert_called_with("timeseries_hour")
+        assert result.data_points == [(T0, float(sum(range(30))))]
+
+    @pytest.mark.asyncio
+    async def test_failed_rollup_commit_is_retried(self, storage):
+        from src.analytics.time_series_storage import TimeSeriesPoint
+
+        await storage.write_points([TimeSeriesPoint(T0, "latency_ms", 5, {"model": "m"}, {})])
+        batch = storage.firestore_client.batch.return_value
+        batch.commit = AsyncMock(side_effect=[RuntimeError("unavailable"), None])
+        batch.set.reset_mock()
+
+        assert await storage.flush_rollups(T0 + timedelta(minutes=5)) == 0
+        assert await storage.flush_rollups(T0 + timedelta(minutes=6)) == 1
+
+        first, retried = [call.args[0] for call in batch.set.call_args_list]
+        assert first == retried
+        assert batch.set.call_args_list[1].args[1]["granularity"] == "minute"
+        assert storage._pending_rollups == {}
+
+    @pytest.mark.asyncio
+    async def test_series_in_one_bucket_get_distinct_ids(self, storage):
+        from src.analytics.time_series_storage import TimeSeriesPoint
+
+        await storage.write_points([
+            TimeSeriesPoint(T0, "latency_ms", 1, {"model": f"m{i}", "region": region}, {})
+            for i in range(150) for region in ("eu", "us", "ap")
+        ])
+        document = storage.firestore_client.collection.return_value.document
+        batch = storage.firestore_client.batch.return_value
+        document.reset_mock()
+        batch.set.reset_mock()
+
+        await storage.flush_rollups(T0 + timedelta(minutes=5))
+
+        minute_ids = {doc_call.args[0] for doc_call, set_call in zip(document.call_args_list, batch.set.call_args_list)
+                      if set_call.args[1]["granularity"] == "minute"}
+        assert len(minute_ids) == 450
+        assert storage._tags_digest({"region": "eu", "model": "m1"}) == storage._tags_digest({"model": "m1", "region": "eu"})